@@ -0,0 +1,389 @@
+"""
+Backups do Banco SQLite
+Cópias consistentes feitas com a API de backup online do SQLite (em passos de
+páginas, sem segurar o lock do banco durante a cópia inteira), comprimidas com
+zstd (se o pacote zstandard estiver instalado) ou gzip e gravadas em BACKUP_DIR.
+
+Cada backup tem um arquivo de metadados ao lado (<arquivo>.json) com o SHA-256
+do arquivo comprimido, tamanhos e o estado da verificação. A verificação
+(checksum + PRAGMA integrity_check na cópia descomprimida) roda em segundo
+plano, em um worker dedicado, para não atrasar a resposta.
+
+Os mesmos metadados ficam no catálogo (BACKUP_DIR/catalogo.db, tabela indexada
+por data), atualizado ao criar, verificar e remover backups: a listagem é uma
+consulta paginada, sem glob + stat de cada arquivo. Se o catálogo não existir
+ele é reconstruído a partir dos arquivos .json.
+
+Configuração (variáveis de ambiente):
+- BACKUP_COMPRESSION: "zstd", "gzip" ou "none" (padrão: zstd se disponível, senão gzip)
+- BACKUP_PAGES_PER_STEP: páginas copiadas por passo da API de backup (padrão 1024)
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import zstandard
+except ImportError:  # compressão zstd é opcional
+    zstandard = None
+
+EXTENSOES = {"zstd": ".db.zst", "gzip": ".db.gz", "none": ".db"}
+
+PAGINAS_POR_PASSO = int(os.getenv("BACKUP_PAGES_PER_STEP", "1024"))
+# Pausa entre os passos: deixa escritores concorrentes avançarem
+PAUSA_ENTRE_PASSOS = 0.005
+
+BLOCO = 1024 * 1024
+
+CATALOGO = "catalogo.db"
+
+_verificador = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backup-verificacao")
+
+def compressao_padrao() -> str:
+    escolhida = os.getenv("BACKUP_COMPRESSION", "").lower()
+    if escolhida in EXTENSOES and (escolhida != "zstd" or zstandard is not None):
+        return escolhida
+    return "zstd" if zstandard is not None else "gzip"
+
+def compressao_do_arquivo(nome: str) -> str:
+    for compressao, extensao in EXTENSOES.items():
+        if compressao != "none" and nome.endswith(extensao):
+            return compressao
+    return "none"
+
+# ============================================================================
+# COMPRESSÃO
+# ============================================================================
+
+def _abrir_escrita(caminho: Path, compressao: str):
+    if compressao == "zstd":
+        return zstandard.ZstdCompressor(level=10, threads=-1).stream_writer(open(caminho, "wb"), closefd=True)
+    if compressao == "gzip":
+        return gzip.open(caminho, "wb", compresslevel=6)
+    return open(caminho, "wb")
+
+def _abrir_leitura(caminho: Path):
+    compressao = compressao_do_arquivo(caminho.name)
+    if compressao == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Backup zstd requer o pacote zstandard")
+        return zstandard.ZstdDecompressor().stream_reader(open(caminho, "rb"), closefd=True)
+    if compressao == "gzip":
+        return gzip.open(caminho, "rb")
+    return open(caminho, "rb")
+
+def sha256_arquivo(caminho: Path) -> str:
+    resumo = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(BLOCO), b""):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+def descomprimir(origem: Path, destino: Path) -> None:
+    with _abrir_leitura(origem) as entrada, open(destino, "wb") as saida:
+        shutil.copyfileobj(entrada, saida, BLOCO)
+
+# ============================================================================
+# METADADOS
+# ============================================================================
+
+def caminho_metadados(arquivo: Path) -> Path:
+    return arquivo.with_name(arquivo.name + ".json")
+
+def ler_metadados(arquivo: Path) -> Dict[str, Any]:
+    try:
+        return json.loads(caminho_metadados(arquivo).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def _gravar_metadados(arquivo: Path, metadados: Dict[str, Any]) -> None:
+    # Grava em arquivo temporário e renomeia: leitores nunca veem JSON pela metade
+    destino = caminho_metadados(arquivo)
+    temporario = destino.with_name(destino.name + ".tmp")
+    temporario.write_text(json.dumps(metadados, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(temporario, destino)
+
+# ============================================================================
+# CÓPIA ONLINE
+# ============================================================================
+
+def copiar_online(origem: Path, destino: Path, paginas_por_passo: int = PAGINAS_POR_PASSO) -> int:
+    """Copia o banco com a API de backup do SQLite, em passos. Retorna o total de páginas."""
+    total = {"paginas": 0}
+
+    def _progresso(status, restantes, paginas):
+        total["paginas"] = paginas
+
+    with closing(sqlite3.connect(str(origem))) as fonte, closing(sqlite3.connect(str(destino))) as copia:
+        fonte.backup(copia, pages=paginas_por_passo, progress=_progresso, sleep=PAUSA_ENTRE_PASSOS)
+    return total["paginas"]
+
+def versao_dados(caminho: Path) -> Optional[int]:
+    """Soma das versões de dados (tabela versoes_dados) na cópia: identifica o estado de origem do backup."""
+    with closing(sqlite3.connect(str(caminho))) as conn:
+        try:
+            return conn.execute("SELECT coalesce(sum(versao), 0) FROM versoes_dados").fetchone()[0]
+        except sqlite3.OperationalError:
+            return None
+
+def criar_backup_online(db_path: Path, backup_dir: Path, compressao: Optional[str] = None,
+                        prefixo: str = "backup") -> Dict[str, Any]:
+    """
+    Cria backup consistente do banco (mesmo com escritas em andamento), comprimido,
+    com checksum; agenda a verificação em segundo plano.
+    """
+    if not db_path.exists():
+        raise FileNotFoundError(f"Banco de dados não encontrado: {db_path}")
+
+    compressao = compressao or compressao_padrao()
+    inicio = time.perf_counter()
+    agora = datetime.now()
+    timestamp = agora.strftime("%Y%m%d_%H%M%S")
+    nome = f"{prefixo}_{timestamp}{EXTENSOES[compressao]}"
+    destino = backup_dir / nome
+    if destino.exists():
+        # Dois backups no mesmo segundo
+        nome = f"{prefixo}_{timestamp}_{agora.microsecond:06d}{EXTENSOES[compressao]}"
+        destino = backup_dir / nome
+
+    with tempfile.TemporaryDirectory(dir=backup_dir, prefix=".backup_") as tmp:
+        snapshot = Path(tmp) / "snapshot.db"
+        paginas = copiar_online(db_path, snapshot)
+        tamanho_original = snapshot.stat().st_size
+        versao = versao_dados(snapshot)
+
+        # Comprime em streaming; o arquivo só aparece com o nome final quando está completo
+        parcial = destino.with_name(destino.name + ".parcial")
+        with open(snapshot, "rb") as entrada, _abrir_escrita(parcial, compressao) as saida:
+            shutil.copyfileobj(entrada, saida, BLOCO)
+        os.replace(parcial, destino)
+
+    checksum = sha256_arquivo(destino)
+    duracao = time.perf_counter() - inicio
+    tamanho = destino.stat().st_size
+    metadados = {
+        "filename": nome,
+        "compressao": compressao,
+        "sha256": checksum,
+        "size": tamanho,
+        "tamanho_original": tamanho_original,
+        "paginas": paginas,
+        "versao_dados": versao,
+        "created_at": agora.isoformat(),
+        "verificacao": {"status": "pendente"}
+    }
+    _gravar_metadados(destino, metadados)
+    registrar_no_catalogo(backup_dir, metadados)
+    agendar_verificacao(destino)
+
+    return {
+        "success": True,
+        "filename": nome,
+        "path": str(destino),
+        "size": tamanho,
+        "size_mb": round(tamanho / (1024 * 1024), 2),
+        "tamanho_original": tamanho_original,
+        "taxa_compressao": round(tamanho / tamanho_original, 4) if tamanho_original else None,
+        "compressao": compressao,
+        "sha256": checksum,
+        "paginas": paginas,
+        "versao_dados": versao,
+        "duracao_s": round(duracao, 3),
+        "throughput_mb_s": round(tamanho_original / (1024 * 1024) / duracao, 2) if duracao > 0 else None,
+        "verificacao": "pendente",
+        "timestamp": timestamp,
+        "created_at": agora.isoformat()
+    }
+
+# ============================================================================
+# VERIFICAÇÃO
+# ============================================================================
+
+def verificar_backup(arquivo: Path) -> Dict[str, Any]:
+    """Confere o checksum e roda PRAGMA integrity_check na cópia descomprimida. Grava o resultado nos metadados."""
+    metadados = ler_metadados(arquivo)
+    inicio = time.perf_counter()
+    try:
+        esperado = metadados.get("sha256")
+        if esperado and sha256_arquivo(arquivo) != esperado:
+            resultado = {"status": "falhou", "detalhe": "checksum não confere"}
+        else:
+            with tempfile.TemporaryDirectory(dir=arquivo.parent, prefix=".verificacao_") as tmp:
+                copia = Path(tmp) / "verificacao.db"
+                descomprimir(arquivo, copia)
+                with closing(sqlite3.connect(str(copia))) as conn:
+                    linhas = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+            ok = linhas == ["ok"]
+            resultado = {"status": "ok" if ok else "falhou", "detalhe": "; ".join(linhas[:10])}
+    except Exception as e:
+        resultado = {"status": "falhou", "detalhe": str(e)}
+
+    resultado["verificado_em"] = datetime.now().isoformat()
+    resultado["duracao_s"] = round(time.perf_counter() - inicio, 3)
+    if arquivo.exists():
+        metadados["verificacao"] = resultado
+        _gravar_metadados(arquivo, metadados)
+        atualizar_verificacao_no_catalogo(arquivo, resultado)
+    if resultado["status"] != "ok":
+        print(f"✗ Verificação do backup {arquivo.name} falhou: {resultado['detalhe']}")
+    return resultado
+
+def agendar_verificacao(arquivo: Path) -> Future:
+    return _verificador.submit(verificar_backup, arquivo)
+
+def aguardar_verificacoes() -> None:
+    """Bloqueia até as verificações já agendadas terminarem (testes e scripts)."""
+    _verificador.submit(lambda: None).result()
+
+# ============================================================================
+# LISTAGEM / LIMPEZA / RESTAURAÇÃO
+# ============================================================================
+
+def arquivos_de_backup(backup_dir: Path) -> List[Path]:
+    """Arquivos de backup (qualquer compressão), do mais recente para o mais antigo."""
+    arquivos = [
+        p for p in backup_dir.glob("backup_*")
+        if p.is_file() and any(p.name.endswith(ext) for ext in EXTENSOES.values())
+    ]
+    return sorted(arquivos, key=lambda p: p.name, reverse=True)
+
+def remover_backup(arquivo: Path) -> None:
+    arquivo.unlink()
+    caminho_metadados(arquivo).unlink(missing_ok=True)
+    remover_do_catalogo(arquivo)
+
+def restaurar_online(arquivo: Path, db_path: Path) -> None:
+    """
+    Restaura o backup sobre o banco em uso pela API de backup do SQLite: as
+    conexões abertas passam a ver os dados restaurados, sem trocar o arquivo.
+    """
+    with tempfile.TemporaryDirectory(dir=arquivo.parent, prefix=".restauracao_") as tmp:
+        origem = Path(tmp) / "restauracao.db"
+        if compressao_do_arquivo(arquivo.name) == "none":
+            shutil.copyfile(arquivo, origem)
+        else:
+            descomprimir(arquivo, origem)
+        copiar_online(origem, db_path)
+
+# ============================================================================
+# CATÁLOGO
+# ============================================================================
+
+_COLUNAS_CATALOGO = (
+    "filename", "created_at", "compressao", "sha256", "size", "tamanho_original",
+    "taxa_compressao", "paginas", "versao_dados", "verificacao", "verificacao_detalhe", "verificado_em"
+)
+
+def _abrir_catalogo(backup_dir: Path) -> sqlite3.Connection:
+    caminho = backup_dir / CATALOGO
+    novo = not caminho.exists()
+    conn = sqlite3.connect(str(caminho), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS backups (
+            filename TEXT PRIMARY KEY,
+            created_at TEXT NOT NULL,
+            compressao TEXT,
+            sha256 TEXT,
+            size INTEGER,
+            tamanho_original INTEGER,
+            taxa_compressao REAL,
+            paginas INTEGER,
+            versao_dados INTEGER,
+            verificacao TEXT,
+            verificacao_detalhe TEXT,
+            verificado_em TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_backups_created_at ON backups (created_at)")
+    if novo:
+        _importar_arquivos(conn, backup_dir)
+    conn.commit()
+    return conn
+
+def _linha_catalogo(metadados: Dict[str, Any]) -> tuple:
+    verificacao = metadados.get("verificacao") or {}
+    tamanho, original = metadados.get("size"), metadados.get("tamanho_original")
+    return (
+        metadados["filename"], metadados["created_at"], metadados.get("compressao"),
+        metadados.get("sha256"), tamanho, original,
+        round(tamanho / original, 4) if tamanho and original else None,
+        metadados.get("paginas"), metadados.get("versao_dados"), verificacao.get("status"),
+        verificacao.get("detalhe"), verificacao.get("verificado_em")
+    )
+
+def _inserir(conn: sqlite3.Connection, linhas: List[tuple]) -> None:
+    marcadores = ", ".join("?" * len(_COLUNAS_CATALOGO))
+    conn.executemany(
+        f"INSERT OR REPLACE INTO backups ({', '.join(_COLUNAS_CATALOGO)}) VALUES ({marcadores})", linhas
+    )
+
+def _importar_arquivos(conn: sqlite3.Connection, backup_dir: Path) -> int:
+    """Cataloga os backups em disco a partir dos .json (ou do nome/stat, para backups antigos sem metadados)."""
+    linhas = []
+    for arquivo in arquivos_de_backup(backup_dir):
+        metadados = ler_metadados(arquivo)
+        if "created_at" not in metadados:
+            stat = arquivo.stat()
+            try:
+                criado = datetime.strptime(arquivo.name.replace("backup_", "")[:15], "%Y%m%d_%H%M%S")
+            except ValueError:
+                criado = datetime.fromtimestamp(stat.st_mtime)
+            metadados = {
+                "size": stat.st_size,
+                "compressao": compressao_do_arquivo(arquivo.name),
+                **metadados,
+                "created_at": criado.isoformat()
+            }
+        metadados["filename"] = arquivo.name
+        linhas.append(_linha_catalogo(metadados))
+    _inserir(conn, linhas)
+    return len(linhas)
+
+def reconstruir_catalogo(backup_dir: Path) -> int:
+    """Refaz o catálogo a partir dos arquivos em disco. Retorna o total catalogado."""
+    with closing(_abrir_catalogo(backup_dir)) as conn, conn:
+        conn.execute("DELETE FROM backups")
+        return _importar_arquivos(conn, backup_dir)
+
+def registrar_no_catalogo(backup_dir: Path, metadados: Dict[str, Any]) -> None:
+    with closing(_abrir_catalogo(backup_dir)) as conn, conn:
+        _inserir(conn, [_linha_catalogo(metadados)])
+
+def atualizar_verificacao_no_catalogo(arquivo: Path, verificacao: Dict[str, Any]) -> None:
+    with closing(_abrir_catalogo(arquivo.parent)) as conn, conn:
+        conn.execute(
+            "UPDATE backups SET verificacao = ?, verificacao_detalhe = ?, verificado_em = ? WHERE filename = ?",
+            (verificacao.get("status"), verificacao.get("detalhe"), verificacao.get("verificado_em"), arquivo.name)
+        )
+
+def remover_do_catalogo(arquivo: Path) -> None:
+    with closing(_abrir_catalogo(arquivo.parent)) as conn, conn:
+        conn.execute("DELETE FROM backups WHERE filename = ?", (arquivo.name,))
+
+def consultar_catalogo(backup_dir: Path, limite: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
+    """Página do catálogo (mais recentes primeiro) com total e espaço ocupado por todos os backups."""
+    with closing(_abrir_catalogo(backup_dir)) as conn:
+        total, tamanho_total = conn.execute("SELECT count(*), coalesce(sum(size), 0) FROM backups").fetchone()
+        linhas = conn.execute(
+            f"SELECT {', '.join(_COLUNAS_CATALOGO)} FROM backups ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (limite if limite is not None else -1, offset)
+        ).fetchall()
+    return {"total": total, "tamanho_total": tamanho_total, "backups": [dict(linha) for linha in linhas]}
+
+def backups_anteriores_a(backup_dir: Path, limite: datetime) -> List[Path]:
+    with closing(_abrir_catalogo(backup_dir)) as conn:
+        nomes = conn.execute(
+            "SELECT filename FROM backups WHERE created_at < ? ORDER BY created_at", (limite.isoformat(),)
+        ).fetchall()
+    return [backup_dir / nome for (nome,) in nomes]
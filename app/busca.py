@@ -0,0 +1,317 @@
+"""
+Busca Textual
+Busca por fornecedor/observação em lançamentos, observações de pagamento das
+parcelas e lançamentos recorrentes.
+
+- SQLite: tabelas virtuais FTS5 de conteúdo externo (busca_lancamentos,
+  busca_parcelas, busca_recorrentes), mantidas em sincronia por triggers de
+  INSERT/UPDATE/DELETE, com ranking BM25, prefixo e sem acentos ("agua" acha "Água").
+  O filtro de fornecedor da listagem procura o texto inteiro, com pontuação, em
+  qualquer posição ("mercado" acha "Supermercado", "C&A" só acha "C&A ...") pela
+  tabela FTS5 trigram busca_fornecedores (textos com menos de 3 caracteres usam
+  ILIKE); textos só de palavras também valem como prefixos sem acentos ("agua"
+  acha "Água").
+- PostgreSQL: extensão pg_trgm + índices GIN (gin_trgm_ops), que atendem ILIKE
+  '%termo%' por índice; ranking por word_similarity.
+- Outros bancos (ou SQLite sem FTS5): ILIKE simples, sem índice.
+
+A instalação é idempotente e roda após todo create_all (registrar_eventos).
+"""
+import re
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import event, or_, text, func, literal, column, Integer
+from sqlalchemy.orm import Session
+
+TOKENIZADOR_PALAVRAS = "unicode61 remove_diacritics 2"
+
+# Tabela FTS -> (tabela de conteúdo, colunas indexadas, indexa só linhas com a 1ª coluna preenchida, tokenizador)
+# busca_fornecedores vem primeiro: sem o tokenizador trigram (SQLite < 3.34) a instalação
+# falha antes de criar as demais e a busca inteira fica no ILIKE.
+TABELAS_FTS = {
+    "busca_fornecedores": ("lancamentos", ("fornecedor",), False, "trigram"),
+    "busca_lancamentos": ("lancamentos", ("fornecedor", "observacao"), False, TOKENIZADOR_PALAVRAS),
+    "busca_parcelas": ("parcelas", ("observacao_pagamento",), True, TOKENIZADOR_PALAVRAS),
+    "busca_recorrentes": ("lancamentos_recorrentes", ("fornecedor", "observacao"), False, TOKENIZADOR_PALAVRAS),
+}
+
+# Tamanho mínimo de texto atendido pelo índice trigram
+MIN_TRIGRAM = 3
+
+# Índices trigram no PostgreSQL: (nome, tabela, coluna)
+INDICES_TRGM = [
+    ("ix_lancamentos_fornecedor_trgm", "lancamentos", "fornecedor"),
+    ("ix_lancamentos_observacao_trgm", "lancamentos", "observacao"),
+    ("ix_parcelas_observacao_pagamento_trgm", "parcelas", "observacao_pagamento"),
+    ("ix_recorrentes_fornecedor_trgm", "lancamentos_recorrentes", "fornecedor"),
+    ("ix_recorrentes_observacao_trgm", "lancamentos_recorrentes", "observacao"),
+]
+
+# Tabelas FTS instaladas por URL do banco (evita consultar sqlite_master a cada busca)
+_FTS_ATIVO: Dict[str, Set[str]] = {}
+
+# ============================================================================
+# INSTALAÇÃO
+# ============================================================================
+
+def _sql_triggers_sqlite(fts: str, conteudo: str, colunas, so_preenchidas: bool) -> List[str]:
+    lista = ", ".join(colunas)
+    novos = ", ".join(f"new.{c}" for c in colunas)
+    antigos = ", ".join(f"old.{c}" for c in colunas)
+    cond_novo = f" WHERE new.{colunas[0]} IS NOT NULL" if so_preenchidas else ""
+    cond_antigo = f" WHERE old.{colunas[0]} IS NOT NULL" if so_preenchidas else ""
+    inserir = f"INSERT INTO {fts}(rowid, {lista}) SELECT new.id, {novos}{cond_novo};"
+    remover = f"INSERT INTO {fts}({fts}, rowid, {lista}) SELECT 'delete', old.id, {antigos}{cond_antigo};"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {conteudo} BEGIN {inserir} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {conteudo} BEGIN {remover} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {lista} ON {conteudo} "
+        f"BEGIN {remover} {inserir} END",
+    ]
+
+def instalar_sqlite(conn) -> bool:
+    """Cria tabelas FTS5 e triggers que faltarem; popula as tabelas recém-criadas."""
+    existentes = {row[0] for row in conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'table'"
+    )}
+    for fts, (conteudo, colunas, so_preenchidas, tokenizador) in TABELAS_FTS.items():
+        if conteudo not in existentes:
+            continue
+        if fts not in existentes:
+            conn.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5({', '.join(colunas)}, "
+                f"content='{conteudo}', content_rowid='id', tokenize='{tokenizador}')"
+            )
+            filtro = f" WHERE {colunas[0]} IS NOT NULL" if so_preenchidas else ""
+            conn.exec_driver_sql(
+                f"INSERT INTO {fts}(rowid, {', '.join(colunas)}) "
+                f"SELECT id, {', '.join(colunas)} FROM {conteudo}{filtro}"
+            )
+        for sql in _sql_triggers_sqlite(fts, conteudo, colunas, so_preenchidas):
+            conn.exec_driver_sql(sql)
+    return True
+
+def instalar_postgresql(conn) -> bool:
+    conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for nome, tabela, coluna in INDICES_TRGM:
+        conn.exec_driver_sql(
+            f"CREATE INDEX IF NOT EXISTS {nome} ON {tabela} USING gin ({coluna} gin_trgm_ops)"
+        )
+    return True
+
+def instalar_busca(conn) -> bool:
+    """Instala o índice de busca do dialeto. Retorna False se indisponível (usa ILIKE)."""
+    dialeto = conn.dialect.name
+    try:
+        if dialeto == "sqlite":
+            ativo = instalar_sqlite(conn)
+        elif dialeto == "postgresql":
+            # Em savepoint: sem permissão para a extensão, a transação do create_all segue
+            with conn.begin_nested():
+                ativo = instalar_postgresql(conn)
+        else:
+            ativo = False
+    except Exception as e:
+        print(f"✗ Índice de busca indisponível ({dialeto}): {e}")
+        ativo = False
+    _FTS_ATIVO[str(conn.engine.url)] = set(TABELAS_FTS) if ativo and dialeto == "sqlite" else set()
+    return ativo
+
+def remover_busca_sqlite(conn) -> None:
+    for fts in TABELAS_FTS:
+        for sufixo in ("ai", "ad", "au"):
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {fts}_{sufixo}")
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {fts}")
+
+def registrar_eventos(metadata) -> None:
+    """Instala a busca após cada create_all e remove as tabelas FTS antes de drop_all."""
+    @event.listens_for(metadata, "after_create")
+    def _apos_criar(target, connection, **kw):
+        instalar_busca(connection)
+
+    @event.listens_for(metadata, "before_drop")
+    def _antes_remover(target, connection, **kw):
+        if connection.dialect.name == "sqlite":
+            remover_busca_sqlite(connection)
+            _FTS_ATIVO.pop(str(connection.engine.url), None)
+
+def fts_ativo(db: Session, tabela: str = "busca_lancamentos") -> bool:
+    """True se o banco da sessão é SQLite com a tabela FTS5 `tabela` instalada."""
+    bind = db.get_bind()
+    if bind.dialect.name != "sqlite":
+        return False
+    chave = str(bind.engine.url) if hasattr(bind, "engine") else str(bind.url)
+    if chave not in _FTS_ATIVO:
+        _FTS_ATIVO[chave] = {row[0] for row in db.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )) if row[0] in TABELAS_FTS}
+    return tabela in _FTS_ATIVO[chave]
+
+# ============================================================================
+# CONSULTA
+# ============================================================================
+
+def termos_da_busca(texto: Optional[str]) -> List[str]:
+    """Palavras da busca (letras/números), sem operadores nem aspas."""
+    return re.findall(r"\w+", texto or "", flags=re.UNICODE)
+
+def expressao_fts(termos: List[str], coluna: Optional[str] = None) -> str:
+    """Expressão MATCH com prefixo em cada termo (todos obrigatórios)."""
+    expressao = " AND ".join(f'"{t}"*' for t in termos)
+    return f"{{{coluna}}} : ({expressao})" if coluna else expressao
+
+def frase_fts(texto: str) -> str:
+    """Texto como uma frase FTS5 (aspas internas dobradas)."""
+    return '"' + texto.replace('"', '""') + '"'
+
+def filtrar_fornecedor(db: Session, query, texto: str):
+    """
+    Aplica o filtro de fornecedor da listagem de lançamentos: o texto inteiro
+    (com pontuação) em qualquer posição do fornecedor ("mercado" acha
+    "Supermercado"). No SQLite, um texto só de palavras e espaços também acha
+    cada palavra como prefixo sem acentos ("agua" acha "Água"); com pontuação,
+    só o trecho literal vale ("C&A" não acha "Casa Amazon"). ILIKE nos demais
+    bancos (no PostgreSQL, atendido pelo índice trigram).
+    """
+    from app.main import Lancamento  # import local para evitar ciclo
+
+    texto = (texto or "").strip()
+    if not texto:
+        return query
+
+    if len(texto) >= MIN_TRIGRAM and fts_ativo(db, "busca_fornecedores"):
+        ids = text(
+            "SELECT rowid FROM busca_fornecedores WHERE busca_fornecedores MATCH :trecho"
+        ).bindparams(trecho=frase_fts(texto)).columns(column("rowid", Integer))
+        trecho = Lancamento.id.in_(ids)
+    else:
+        trecho = Lancamento.fornecedor.ilike(f"%{texto}%")
+
+    termos = termos_da_busca(texto)
+    so_palavras = " ".join(termos) == " ".join(texto.split())
+    if not termos or not so_palavras or not fts_ativo(db, "busca_lancamentos"):
+        return query.filter(trecho)
+
+    ids = text(
+        "SELECT rowid FROM busca_lancamentos WHERE busca_lancamentos MATCH :prefixo"
+    ).bindparams(prefixo=expressao_fts(termos, "fornecedor")).columns(column("rowid", Integer))
+    return query.filter(or_(trecho, Lancamento.id.in_(ids)))
+
+def _buscar_fts(db: Session, usuario_id: int, termos: List[str], limite: int) -> List[Dict[str, Any]]:
+    expr = expressao_fts(termos)
+    params = {"expr": expr, "u": usuario_id, "lim": limite}
+    resultados = []
+
+    for row in db.execute(text("""
+        SELECT l.id, l.fornecedor, l.observacao, l.data_lancamento, l.valor_total, l.tipo,
+               bm25(busca_lancamentos, 2.0, 1.0) AS score,
+               snippet(busca_lancamentos, -1, '[', ']', '…', 12) AS trecho
+        FROM busca_lancamentos JOIN lancamentos l ON l.id = busca_lancamentos.rowid
+        WHERE busca_lancamentos MATCH :expr AND l.usuario_id = :u
+        ORDER BY score LIMIT :lim
+    """), params):
+        resultados.append(_resultado("lancamento", row.id, row.id, row.fornecedor, row.trecho,
+                                     row.data_lancamento, row.valor_total, row.tipo, -row.score))
+
+    for row in db.execute(text("""
+        SELECT p.id, p.lancamento_id, p.numero_parcela, p.data_pagamento, p.valor_pago, p.valor,
+               l.fornecedor, l.tipo,
+               bm25(busca_parcelas) AS score,
+               snippet(busca_parcelas, -1, '[', ']', '…', 12) AS trecho
+        FROM busca_parcelas
+        JOIN parcelas p ON p.id = busca_parcelas.rowid
+        JOIN lancamentos l ON l.id = p.lancamento_id
+        WHERE busca_parcelas MATCH :expr AND p.usuario_id = :u
+        ORDER BY score LIMIT :lim
+    """), params):
+        resultados.append(_resultado("parcela", row.id, row.lancamento_id,
+                                     f"{row.fornecedor} - parcela {row.numero_parcela}", row.trecho,
+                                     row.data_pagamento, row.valor_pago or row.valor, row.tipo, -row.score))
+
+    for row in db.execute(text("""
+        SELECT r.id, r.fornecedor, r.data_inicio, r.valor_total, r.tipo,
+               bm25(busca_recorrentes, 2.0, 1.0) AS score,
+               snippet(busca_recorrentes, -1, '[', ']', '…', 12) AS trecho
+        FROM busca_recorrentes JOIN lancamentos_recorrentes r ON r.id = busca_recorrentes.rowid
+        WHERE busca_recorrentes MATCH :expr AND r.usuario_id = :u
+        ORDER BY score LIMIT :lim
+    """), params):
+        resultados.append(_resultado("recorrente", row.id, None, row.fornecedor, row.trecho,
+                                     row.data_inicio, row.valor_total, row.tipo, -row.score))
+    return resultados
+
+def _buscar_ilike(db: Session, usuario_id: int, termos: List[str], limite: int) -> List[Dict[str, Any]]:
+    """PostgreSQL (índices trigram) e demais bancos: ILIKE por termo, ranking por word_similarity."""
+    from app.main import Lancamento, Parcela, LancamentoRecorrente  # import local para evitar ciclo
+
+    postgres = db.get_bind().dialect.name == "postgresql"
+    consulta = " ".join(termos)
+
+    def _score(*colunas):
+        if not postgres:
+            return literal(0.0)
+        return func.greatest(*[func.word_similarity(consulta, func.coalesce(c, "")) for c in colunas])
+
+    def _todos_os_termos(*colunas):
+        return [or_(*[c.ilike(f"%{t}%") for c in colunas]) for t in termos]
+
+    resultados = []
+    score = _score(Lancamento.fornecedor, Lancamento.observacao).label("score")
+    for l, s in db.query(Lancamento, score).filter(
+        Lancamento.usuario_id == usuario_id,
+        *_todos_os_termos(Lancamento.fornecedor, Lancamento.observacao)
+    ).order_by(score.desc(), Lancamento.id.desc()).limit(limite):
+        trecho = l.fornecedor if not l.observacao else f"{l.fornecedor} — {l.observacao}"
+        resultados.append(_resultado("lancamento", l.id, l.id, l.fornecedor, trecho,
+                                     l.data_lancamento, l.valor_total, l.tipo, s))
+
+    score = _score(Parcela.observacao_pagamento).label("score")
+    for p, fornecedor, tipo, s in db.query(Parcela, Lancamento.fornecedor, Lancamento.tipo, score).join(
+        Lancamento, Parcela.lancamento_id == Lancamento.id
+    ).filter(
+        Parcela.usuario_id == usuario_id,
+        *_todos_os_termos(Parcela.observacao_pagamento)
+    ).order_by(score.desc(), Parcela.id.desc()).limit(limite):
+        resultados.append(_resultado("parcela", p.id, p.lancamento_id,
+                                     f"{fornecedor} - parcela {p.numero_parcela}", p.observacao_pagamento,
+                                     p.data_pagamento, p.valor_pago or p.valor, tipo, s))
+
+    score = _score(LancamentoRecorrente.fornecedor, LancamentoRecorrente.observacao).label("score")
+    for r, s in db.query(LancamentoRecorrente, score).filter(
+        LancamentoRecorrente.usuario_id == usuario_id,
+        *_todos_os_termos(LancamentoRecorrente.fornecedor, LancamentoRecorrente.observacao)
+    ).order_by(score.desc(), LancamentoRecorrente.id.desc()).limit(limite):
+        trecho = r.fornecedor if not r.observacao else f"{r.fornecedor} — {r.observacao}"
+        resultados.append(_resultado("recorrente", r.id, None, r.fornecedor, trecho,
+                                     r.data_inicio, r.valor_total, r.tipo, s))
+    return resultados
+
+def _resultado(origem, id_, lancamento_id, titulo, trecho, data, valor, natureza, relevancia) -> Dict[str, Any]:
+    return {
+        "origem": origem,
+        "id": id_,
+        "lancamento_id": lancamento_id,
+        "titulo": titulo,
+        "trecho": trecho,
+        "data": data.isoformat() if hasattr(data, "isoformat") else data,
+        "valor": float(valor) if valor is not None else None,
+        "tipo": natureza,
+        "relevancia": round(float(relevancia or 0), 6),
+    }
+
+def buscar(db: Session, usuario_id: int, texto: str, limite: int = 20) -> Dict[str, Any]:
+    """Busca em lançamentos, parcelas e recorrentes; junta tudo por relevância."""
+    termos = termos_da_busca(texto)
+    if not termos:
+        return {"q": texto, "motor": None, "total": 0, "resultados": []}
+
+    if fts_ativo(db):
+        motor = "fts5"
+        resultados = _buscar_fts(db, usuario_id, termos, limite)
+    else:
+        motor = "pg_trgm" if db.get_bind().dialect.name == "postgresql" else "ilike"
+        resultados = _buscar_ilike(db, usuario_id, termos, limite)
+
+    resultados.sort(key=lambda r: r["relevancia"], reverse=True)
+    resultados = resultados[:limite]
+    return {"q": texto, "motor": motor, "total": len(resultados), "resultados": resultados}
@@ -0,0 +1,265 @@
+"""
+Cache de Respostas dos Relatórios
+Cache em memória (LRU + TTL) para os endpoints analíticos, que são funções puras
+de (usuário, parâmetros, dados). A chave inclui a versão dos dados do usuário
+(app.versao_dados), então qualquer escrita invalida as entradas dele sem
+precisar apagar nada: as antigas simplesmente deixam de ser consultadas e saem
+por LRU/TTL.
+
+Com RESPONSE_CACHE_PATH definido, há também um nível compartilhado em arquivo
+SQLite, consultado quando a memória não tem a entrada (útil com vários workers).
+
+Configuração (variáveis de ambiente):
+- RESPONSE_CACHE_MAX: número máximo de entradas em memória (padrão 512; 0 desliga o cache)
+- RESPONSE_CACHE_TTL: validade das entradas em segundos (padrão 300)
+- RESPONSE_CACHE_PATH: arquivo do nível compartilhado (padrão: desligado)
+"""
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+# Parâmetros que são listas separadas por vírgula: a ordem não muda o resultado
+PARAMETROS_LISTA = {"tipos"}
+
+# Argumentos do handler que não fazem parte da chave
+ARGUMENTOS_IGNORADOS = {"db", "current_user", "request"}
+
+# ============================================================================
+# NÍVEL COMPARTILHADO (SQLITE)
+# ============================================================================
+
+class CacheCompartilhado:
+    """Nível compartilhado entre processos, em um arquivo SQLite (chave -> JSON)."""
+
+    def __init__(self, caminho: str, max_entradas: int):
+        self.caminho = caminho
+        self.max_entradas = max_entradas
+        self._escritas = 0
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_respostas ("
+                " chave TEXT PRIMARY KEY, valor TEXT NOT NULL,"
+                " expira_em REAL NOT NULL, usado_em REAL NOT NULL)"
+            )
+
+    def _conectar(self):
+        return sqlite3.connect(self.caminho, timeout=5)
+
+    def obter(self, chave: str) -> Optional[Any]:
+        agora = time.time()
+        with self._conectar() as conn:
+            row = conn.execute(
+                "SELECT valor FROM cache_respostas WHERE chave = ? AND expira_em > ?", (chave, agora)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE cache_respostas SET usado_em = ? WHERE chave = ?", (agora, chave))
+        return json.loads(row[0])
+
+    def guardar(self, chave: str, valor: Any, ttl: float) -> int:
+        """Grava a entrada; a cada 100 escritas remove expiradas e o excesso. Retorna quantas removeu."""
+        agora = time.time()
+        removidas = 0
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_respostas (chave, valor, expira_em, usado_em) VALUES (?, ?, ?, ?)",
+                (chave, json.dumps(valor), agora + ttl, agora)
+            )
+            self._escritas += 1
+            if self._escritas % 100 == 0:
+                removidas += conn.execute("DELETE FROM cache_respostas WHERE expira_em <= ?", (agora,)).rowcount
+                removidas += conn.execute(
+                    "DELETE FROM cache_respostas WHERE chave IN ("
+                    " SELECT chave FROM cache_respostas ORDER BY usado_em DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entradas,)
+                ).rowcount
+        return removidas
+
+    def limpar(self) -> None:
+        with self._conectar() as conn:
+            conn.execute("DELETE FROM cache_respostas")
+
+# ============================================================================
+# CACHE EM MEMÓRIA (LRU + TTL)
+# ============================================================================
+
+class CacheRespostas:
+    """LRU com TTL, seguro entre threads, com contadores para monitoramento."""
+
+    def __init__(self, max_entradas: int = 512, ttl: float = 300,
+                 compartilhado: Optional[CacheCompartilhado] = None):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.compartilhado = compartilhado
+        self._entradas: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._zerar_contadores()
+
+    def _zerar_contadores(self) -> None:
+        self.hits = 0
+        self.hits_compartilhado = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expiracoes = 0
+
+    @property
+    def ativo(self) -> bool:
+        return self.max_entradas > 0
+
+    def obter(self, chave: str) -> Tuple[bool, Any]:
+        """Retorna (encontrado, valor)."""
+        agora = time.monotonic()
+        with self._lock:
+            item = self._entradas.get(chave)
+            if item is not None:
+                expira_em, valor = item
+                if expira_em > agora:
+                    self._entradas.move_to_end(chave)
+                    self.hits += 1
+                    return True, valor
+                del self._entradas[chave]
+                self.expiracoes += 1
+
+        if self.compartilhado is not None:
+            try:
+                valor = self.compartilhado.obter(chave)
+            except sqlite3.Error as e:
+                print(f"Cache compartilhado indisponível: {e}")
+                valor = None
+            if valor is not None:
+                with self._lock:
+                    self.hits_compartilhado += 1
+                    self._inserir(chave, valor, agora)
+                return True, valor
+
+        with self._lock:
+            self.misses += 1
+        return False, None
+
+    def guardar(self, chave: str, valor: Any) -> None:
+        with self._lock:
+            self._inserir(chave, valor, time.monotonic())
+        if self.compartilhado is not None:
+            try:
+                removidas = self.compartilhado.guardar(chave, valor, self.ttl)
+            except sqlite3.Error as e:
+                print(f"Cache compartilhado indisponível: {e}")
+                return
+            if removidas:
+                with self._lock:
+                    self.evictions += removidas
+
+    def _inserir(self, chave: str, valor: Any, agora: float) -> None:
+        # Chamado com o lock adquirido
+        self._entradas[chave] = (agora + self.ttl, valor)
+        self._entradas.move_to_end(chave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+            self.evictions += 1
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self._zerar_contadores()
+        if self.compartilhado is not None:
+            self.compartilhado.limpar()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            consultas = self.hits + self.hits_compartilhado + self.misses
+            return {
+                "ativo": self.ativo,
+                "compartilhado": self.compartilhado.caminho if self.compartilhado else None,
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "ttl_segundos": self.ttl,
+                "hits": self.hits,
+                "hits_compartilhado": self.hits_compartilhado,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expiracoes": self.expiracoes,
+                "taxa_acerto": round((self.hits + self.hits_compartilhado) / consultas, 4) if consultas else None,
+            }
+
+def _criar_cache() -> CacheRespostas:
+    max_entradas = int(os.getenv("RESPONSE_CACHE_MAX", "512"))
+    ttl = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+    caminho = os.getenv("RESPONSE_CACHE_PATH")
+    compartilhado = None
+    if caminho and max_entradas > 0:
+        try:
+            compartilhado = CacheCompartilhado(caminho, max_entradas * 4)
+        except sqlite3.Error as e:
+            print(f"Cache compartilhado desativado ({caminho}): {e}")
+    return CacheRespostas(max_entradas=max_entradas, ttl=ttl, compartilhado=compartilhado)
+
+CACHE = _criar_cache()
+
+# ============================================================================
+# USO NOS ENDPOINTS
+# ============================================================================
+
+def normalizar_parametros(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Remove vazios e ordena listas separadas por vírgula, para chaves estáveis."""
+    normalizados = {}
+    for nome, valor in params.items():
+        if isinstance(valor, str):
+            valor = valor.strip()
+            if nome in PARAMETROS_LISTA:
+                valor = ",".join(sorted({v.strip() for v in valor.split(",") if v.strip()}))
+        if valor is None or valor == "":
+            continue
+        normalizados[nome] = valor
+    return normalizados
+
+def montar_chave(endpoint: str, usuario_id: int, versao: int, params: Dict[str, Any]) -> str:
+    # A data entra na chave porque vários relatórios usam date.today() como período padrão
+    conteudo = json.dumps(
+        [endpoint, usuario_id, versao, date.today().isoformat(), normalizar_parametros(params)],
+        sort_keys=True, default=str
+    )
+    return hashlib.sha1(conteudo.encode("utf-8")).hexdigest()
+
+def cache_por_versao(endpoint: str) -> Callable:
+    """
+    Decorator para handlers síncronos que recebem `current_user` e `db`:
+    devolve a resposta em cache para (usuário, parâmetros, versão dos dados)
+    ou calcula e guarda. O valor guardado já está codificado em JSON (jsonable_encoder).
+    """
+    def decorador(func: Callable) -> Callable:
+        assinatura = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not CACHE.ativo:
+                return func(*args, **kwargs)
+
+            from app.versao_dados import obter_versao  # import local para evitar ciclo
+
+            # Também aceita chamadas diretas com argumentos posicionais (ex.: geração do PDF)
+            argumentos = assinatura.bind(*args, **kwargs)
+            argumentos.apply_defaults()
+            db = argumentos.arguments["db"]
+            usuario_id = argumentos.arguments["current_user"].id
+            params = {k: v for k, v in argumentos.arguments.items() if k not in ARGUMENTOS_IGNORADOS}
+            chave = montar_chave(endpoint, usuario_id, obter_versao(db, usuario_id), params)
+
+            encontrado, valor = CACHE.obter(chave)
+            if encontrado:
+                return valor
+            valor = jsonable_encoder(func(*args, **kwargs))
+            CACHE.guardar(chave, valor)
+            return valor
+        return wrapper
+    return decorador
@@ -0,0 +1,170 @@
+"""
+Cronograma de parcelas
+Gerador único dos vencimentos e valores das parcelas, usado na criação e na
+edição de lançamentos e na geração dos recorrentes (manual e agendada).
+
+- Valores exatos em centavos: o total é dividido em centavos inteiros, cada
+  parcela recebe o valor médio arredondado e a diferença de arredondamento é
+  distribuída, um centavo por parcela, nas últimas parcelas; a soma é sempre
+  igual ao total.
+- Vencimentos calculados em uma passada com aritmética de mês (ano, mês) e o dia
+  limitado ao fim do mês, a mesma regra de relativedelta(months=i).
+- Gravação com um único INSERT em lote (RETURNING das linhas para a resposta).
+  Como não passa pelo flush do ORM, marca os pendentes de integridade e avança a
+  versão dos dados explicitamente.
+- Edição por diferença (sincronizar_parcelas): as parcelas existentes são
+  comparadas com o novo cronograma pelo número; só as que mudaram recebem
+  UPDATE (vencimento e valor, mantendo o pagamento), e só a cauda é inserida ou
+  removida quando o número de parcelas muda. Ids e pagamentos são preservados.
+"""
+import calendar
+from datetime import date
+from decimal import Decimal, ROUND_HALF_EVEN
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.orm import Session
+
+CENTAVO = Decimal("0.01")
+
+class ParcelaPrevista(NamedTuple):
+    numero_parcela: int
+    data_vencimento: date
+    valor: Decimal
+
+@lru_cache(maxsize=None)
+def _dias_no_mes(ano: int, mes: int) -> int:
+    return calendar.monthrange(ano, mes)[1]
+
+def datas_de_vencimento(primeiro: date, quantidade: int, meses: int = 1) -> List[date]:
+    """`quantidade` vencimentos a partir de `primeiro`, a cada `meses` meses."""
+    datas = []
+    base = primeiro.year * 12 + primeiro.month - 1
+    for i in range(quantidade):
+        ano, mes = divmod(base + i * meses, 12)
+        mes += 1
+        datas.append(date(ano, mes, min(primeiro.day, _dias_no_mes(ano, mes))))
+    return datas
+
+def dividir_valor(valor_total, quantidade: int) -> List[Decimal]:
+    """
+    Divide o total em `quantidade` parcelas exatas em centavos: o valor médio
+    arredondado em todas e o ajuste (±1 centavo) nas últimas.
+    """
+    total = Decimal(str(valor_total)).quantize(CENTAVO)
+    medio = (total / quantidade).quantize(CENTAVO, rounding=ROUND_HALF_EVEN)
+    restantes = int((total - medio * quantidade) / CENTAVO)
+    ajuste = CENTAVO if restantes > 0 else -CENTAVO
+    sem_ajuste = quantidade - abs(restantes)
+    return [medio] * sem_ajuste + [medio + ajuste] * abs(restantes)
+
+def gerar_cronograma(valor_total, primeiro_vencimento: date, quantidade: int, meses: int = 1) -> List[ParcelaPrevista]:
+    """Parcelas (número, vencimento, valor) de um lançamento, em uma passada."""
+    return [
+        ParcelaPrevista(numero, vencimento, valor)
+        for numero, (vencimento, valor) in enumerate(
+            zip(datas_de_vencimento(primeiro_vencimento, quantidade, meses), dividir_valor(valor_total, quantidade)),
+            start=1
+        )
+    ]
+
+def linhas_de_parcelas(usuario_id: int, lancamento_id: int, cronograma: Sequence[ParcelaPrevista]) -> List[dict]:
+    """Parâmetros do INSERT em lote das parcelas de um lançamento."""
+    return [
+        {
+            "usuario_id": usuario_id,
+            "lancamento_id": lancamento_id,
+            "numero_parcela": parcela.numero_parcela,
+            "data_vencimento": parcela.data_vencimento,
+            "valor": parcela.valor,
+            "paga": 0,
+        }
+        for parcela in cronograma
+    ]
+
+def inserir_parcelas(db: Session, usuario_id: int, lancamento_id: int, cronograma: Sequence[ParcelaPrevista]) -> list:
+    """
+    Grava as parcelas com um único INSERT em lote e retorna as linhas gravadas
+    (com id), na ordem do cronograma. Não faz commit.
+    """
+    from app.main import Parcela  # import local para evitar ciclo
+    from app.integridade import marcar_pendentes
+    from app.versao_dados import incrementar_versao
+
+    if not cronograma:
+        return []
+    tabela = Parcela.__table__
+    linhas = db.execute(
+        insert(tabela).returning(*tabela.c, sort_by_parameter_order=True),
+        linhas_de_parcelas(usuario_id, lancamento_id, cronograma)
+    ).all()
+    marcar_pendentes(db, [(usuario_id, lancamento_id)])
+    incrementar_versao(db, usuario_id)
+    return linhas
+
+def parcelas_do_lancamento(db: Session, lancamento_id: int) -> list:
+    """
+    Parcelas do lançamento (linhas, por número) para a resposta. Linhas não
+    expiram no commit, ao contrário de objetos ORM (um SELECT por parcela depois).
+    """
+    from app.main import Parcela  # import local para evitar ciclo
+
+    tabela = Parcela.__table__
+    return db.execute(
+        select(tabela).where(tabela.c.lancamento_id == lancamento_id).order_by(tabela.c.numero_parcela)
+    ).all()
+
+def sincronizar_parcelas(db: Session, usuario_id: int, lancamento_id: int,
+                         cronograma: Sequence[ParcelaPrevista]) -> Tuple[list, Dict[str, int]]:
+    """
+    Leva as parcelas do lançamento ao novo cronograma com o mínimo de escritas.
+    Parcelas pagas podem mudar de vencimento e valor, mas não ser removidas
+    (HTTPException 400). Retorna (linhas finais por número, contagens). Não faz commit.
+    """
+    from fastapi import HTTPException
+    from app.main import Parcela  # import local para evitar ciclo
+    from app.integridade import marcar_pendentes
+    from app.versao_dados import incrementar_versao
+
+    tabela = Parcela.__table__
+    existentes = db.execute(
+        select(tabela.c.id, tabela.c.numero_parcela, tabela.c.data_vencimento, tabela.c.valor, tabela.c.paga)
+        .where(tabela.c.lancamento_id == lancamento_id)
+        .order_by(tabela.c.numero_parcela)
+    ).all()
+    por_numero = {linha.numero_parcela: linha for linha in existentes}
+    previstas = {parcela.numero_parcela: parcela for parcela in cronograma}
+
+    remover = [linha for numero, linha in por_numero.items() if numero not in previstas]
+    pagas = [str(linha.numero_parcela) for linha in remover if linha.paga]
+    if pagas:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Não é possível remover parcelas já pagas ({', '.join(pagas)}); estorne o pagamento antes"
+        )
+
+    alterar = [
+        {"_id": linha.id, "_vencimento": parcela.data_vencimento, "_valor": parcela.valor}
+        for numero, parcela in previstas.items()
+        if (linha := por_numero.get(numero)) is not None
+        and (linha.data_vencimento != parcela.data_vencimento or Decimal(str(linha.valor)) != parcela.valor)
+    ]
+    inserir = [parcela for numero, parcela in previstas.items() if numero not in por_numero]
+
+    if alterar:
+        db.execute(
+            update(tabela).where(tabela.c.id == bindparam("_id"))
+            .values(data_vencimento=bindparam("_vencimento"), valor=bindparam("_valor")),
+            alterar
+        )
+    if remover:
+        db.execute(delete(tabela).where(tabela.c.id.in_([linha.id for linha in remover])))
+    if inserir:
+        db.execute(insert(tabela), linhas_de_parcelas(usuario_id, lancamento_id, inserir))
+
+    contagens = {"atualizadas": len(alterar), "inseridas": len(inserir), "removidas": len(remover)}
+    if alterar or remover or inserir:
+        marcar_pendentes(db, [(usuario_id, lancamento_id)])
+        incrementar_versao(db, usuario_id)
+    return parcelas_do_lancamento(db, lancamento_id), contagens
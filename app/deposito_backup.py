@@ -0,0 +1,305 @@
+"""
+Depósito Incremental de Backups
+Snapshots do banco guardados em blocos endereçados pelo conteúdo: o snapshot
+(cópia consistente pela API de backup do SQLite, ver app.backup) é dividido em
+blocos de N páginas, cada bloco é identificado pelo SHA-256 e gravado uma única
+vez. Cada snapshot é só um manifesto com a lista de blocos; snapshots seguidos
+de um banco grande custam apenas as páginas que mudaram.
+
+Estrutura em BACKUP_DIR/deposito:
+- blocos/ab/abcdef...(.zst|.gz): blocos comprimidos
+- manifestos/snapshot_AAAAMMDD_HHMMSS_ffffff.json
+
+Retenção avô-pai-filho (GFS): mantém os N snapshots mais recentes e o mais
+recente de cada um dos últimos dias, semanas e meses; blocos que nenhum
+manifesto restante usa são apagados em seguida.
+
+Configuração (variáveis de ambiente):
+- BACKUP_CHUNK_PAGES: páginas por bloco (padrão 64, ou seja 256 KB com páginas de 4 KB)
+- BACKUP_RETENTION: "recentes,diarios,semanais,mensais" (padrão "24,7,4,12")
+"""
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app import backup
+
+PAGINAS_POR_BLOCO = int(os.getenv("BACKUP_CHUNK_PAGES", "64"))
+
+def _retencao_configurada() -> Dict[str, int]:
+    valores = [int(v) for v in os.getenv("BACKUP_RETENTION", "24,7,4,12").split(",")]
+    return dict(zip(("recentes", "diarios", "semanais", "mensais"), valores))
+
+RETENCAO = _retencao_configurada()
+
+EXTENSOES_BLOCO = {"zstd": ".zst", "gzip": ".gz"}
+
+# Um snapshot/limpeza por vez no processo
+_lock = threading.Lock()
+
+# ============================================================================
+# BLOCOS
+# ============================================================================
+
+class Deposito:
+    """Depósito de blocos e manifestos em um diretório."""
+
+    def __init__(self, raiz: Path):
+        self.raiz = raiz
+        self.blocos = raiz / "blocos"
+        self.manifestos = raiz / "manifestos"
+        self.blocos.mkdir(parents=True, exist_ok=True)
+        self.manifestos.mkdir(parents=True, exist_ok=True)
+
+    def _caminho_bloco(self, hash_bloco: str, compressao: str) -> Path:
+        return self.blocos / hash_bloco[:2] / (hash_bloco + EXTENSOES_BLOCO[compressao])
+
+    def localizar_bloco(self, hash_bloco: str) -> Optional[Path]:
+        for compressao in EXTENSOES_BLOCO:
+            caminho = self._caminho_bloco(hash_bloco, compressao)
+            if caminho.exists():
+                return caminho
+        return None
+
+    def guardar_bloco(self, dados: bytes, compressao: str) -> Tuple[str, int]:
+        """Grava o bloco se ainda não existe. Retorna (hash, bytes gravados)."""
+        hash_bloco = hashlib.sha256(dados).hexdigest()
+        if self.localizar_bloco(hash_bloco) is not None:
+            return hash_bloco, 0
+        destino = self._caminho_bloco(hash_bloco, compressao)
+        destino.parent.mkdir(exist_ok=True)
+        if compressao == "zstd":
+            comprimido = backup.zstandard.ZstdCompressor(level=10).compress(dados)
+        else:
+            comprimido = gzip.compress(dados, compresslevel=6)
+        temporario = destino.with_name(destino.name + ".tmp")
+        temporario.write_bytes(comprimido)
+        os.replace(temporario, destino)
+        return hash_bloco, len(comprimido)
+
+    def ler_bloco(self, hash_bloco: str) -> bytes:
+        caminho = self.localizar_bloco(hash_bloco)
+        if caminho is None:
+            raise FileNotFoundError(f"Bloco ausente no depósito: {hash_bloco}")
+        comprimido = caminho.read_bytes()
+        if caminho.suffix == EXTENSOES_BLOCO["zstd"]:
+            if backup.zstandard is None:
+                raise RuntimeError("Bloco zstd requer o pacote zstandard")
+            dados = backup.zstandard.ZstdDecompressor().decompress(comprimido)
+        else:
+            dados = gzip.decompress(comprimido)
+        if hashlib.sha256(dados).hexdigest() != hash_bloco:
+            raise ValueError(f"Bloco corrompido: {hash_bloco}")
+        return dados
+
+    # ------------------------------------------------------------------------
+    # Manifestos
+    # ------------------------------------------------------------------------
+
+    def caminho_manifesto(self, nome: str) -> Path:
+        if "/" in nome or "\\" in nome or not nome.startswith("snapshot_"):
+            raise ValueError(f"Nome de snapshot inválido: {nome}")
+        return self.manifestos / f"{nome}.json"
+
+    def ler_manifesto(self, nome: str) -> Dict[str, Any]:
+        caminho = self.caminho_manifesto(nome)
+        if not caminho.exists():
+            raise FileNotFoundError(f"Snapshot não encontrado: {nome}")
+        return json.loads(caminho.read_text(encoding="utf-8"))
+
+    def listar_manifestos(self) -> List[Dict[str, Any]]:
+        """Manifestos do mais recente para o mais antigo."""
+        manifestos = []
+        for caminho in sorted(self.manifestos.glob("snapshot_*.json"), reverse=True):
+            try:
+                manifestos.append(json.loads(caminho.read_text(encoding="utf-8")))
+            except (OSError, ValueError) as e:
+                print(f"✗ Manifesto ilegível {caminho.name}: {e}")
+        return manifestos
+
+    def _gravar_manifesto(self, manifesto: Dict[str, Any]) -> None:
+        destino = self.caminho_manifesto(manifesto["nome"])
+        temporario = destino.with_name(destino.name + ".tmp")
+        temporario.write_text(json.dumps(manifesto, indent=1), encoding="utf-8")
+        os.replace(temporario, destino)
+
+    # ------------------------------------------------------------------------
+    # Snapshot / restauração
+    # ------------------------------------------------------------------------
+
+    def criar_snapshot(self, db_path: Path, compressao: Optional[str] = None,
+                       paginas_por_bloco: int = PAGINAS_POR_BLOCO) -> Dict[str, Any]:
+        """Copia o banco (API de backup) e guarda só os blocos que o depósito ainda não tem."""
+        if not db_path.exists():
+            raise FileNotFoundError(f"Banco de dados não encontrado: {db_path}")
+        compressao = compressao or backup.compressao_padrao()
+        if compressao not in EXTENSOES_BLOCO or (compressao == "zstd" and backup.zstandard is None):
+            # Blocos são sempre comprimidos; sem zstandard fica gzip
+            compressao = "gzip"
+
+        with _lock:
+            inicio = time.perf_counter()
+            agora = datetime.now()
+            nome = f"snapshot_{agora.strftime('%Y%m%d_%H%M%S_%f')}"
+
+            with tempfile.TemporaryDirectory(dir=self.raiz, prefix=".snapshot_") as tmp:
+                copia = Path(tmp) / "snapshot.db"
+                backup.copiar_online(db_path, copia)
+                with closing(sqlite3.connect(str(copia))) as conn:
+                    tamanho_pagina = conn.execute("PRAGMA page_size").fetchone()[0]
+                tamanho_bloco = tamanho_pagina * paginas_por_bloco
+
+                blocos: List[str] = []
+                vistos: Set[str] = set()
+                novos = 0
+                bytes_novos = 0
+                total = hashlib.sha256()
+                tamanho = 0
+                with open(copia, "rb") as f:
+                    for dados in iter(lambda: f.read(tamanho_bloco), b""):
+                        total.update(dados)
+                        tamanho += len(dados)
+                        hash_bloco, gravados = self.guardar_bloco(dados, compressao)
+                        blocos.append(hash_bloco)
+                        if gravados and hash_bloco not in vistos:
+                            novos += 1
+                            bytes_novos += gravados
+                        vistos.add(hash_bloco)
+
+            manifesto = {
+                "nome": nome,
+                "created_at": agora.isoformat(),
+                "tamanho": tamanho,
+                "tamanho_pagina": tamanho_pagina,
+                "tamanho_bloco": tamanho_bloco,
+                "compressao": compressao,
+                "sha256": total.hexdigest(),
+                "blocos": blocos,
+                "blocos_novos": novos,
+                "bytes_novos": bytes_novos,
+            }
+            self._gravar_manifesto(manifesto)
+            duracao = time.perf_counter() - inicio
+
+        return {
+            "success": True,
+            "nome": nome,
+            "created_at": manifesto["created_at"],
+            "tamanho": tamanho,
+            "total_blocos": len(blocos),
+            "blocos_unicos": len(vistos),
+            "blocos_novos": novos,
+            "bytes_novos": bytes_novos,
+            "duracao_s": round(duracao, 3),
+            "throughput_mb_s": round(tamanho / (1024 * 1024) / duracao, 2) if duracao > 0 else None,
+        }
+
+    def remontar(self, nome: str, destino: Path) -> Dict[str, Any]:
+        """Reconstrói o arquivo do snapshot, conferindo cada bloco e o SHA-256 final."""
+        manifesto = self.ler_manifesto(nome)
+        total = hashlib.sha256()
+        with open(destino, "wb") as saida:
+            for hash_bloco in manifesto["blocos"]:
+                dados = self.ler_bloco(hash_bloco)
+                total.update(dados)
+                saida.write(dados)
+        if total.hexdigest() != manifesto["sha256"]:
+            raise ValueError(f"Snapshot {nome} remontado não confere com o manifesto")
+        return manifesto
+
+    def restaurar(self, nome: str, db_path: Path) -> Dict[str, Any]:
+        """Remonta o snapshot e copia sobre o banco em uso pela API de backup."""
+        with tempfile.TemporaryDirectory(dir=self.raiz, prefix=".restauracao_") as tmp:
+            remontado = Path(tmp) / "restauracao.db"
+            manifesto = self.remontar(nome, remontado)
+            backup.copiar_online(remontado, db_path)
+        return manifesto
+
+    # ------------------------------------------------------------------------
+    # Retenção
+    # ------------------------------------------------------------------------
+
+    def aplicar_retencao(self, retencao: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """Remove os snapshots fora da política GFS e os blocos que ficaram sem uso."""
+        with _lock:
+            manifestos = self.listar_manifestos()
+            manter = selecionar_gfs(
+                [(m["nome"], datetime.fromisoformat(m["created_at"])) for m in manifestos],
+                retencao or RETENCAO
+            )
+            removidos = []
+            for m in manifestos:
+                if m["nome"] not in manter:
+                    self.caminho_manifesto(m["nome"]).unlink(missing_ok=True)
+                    removidos.append(m["nome"])
+            usados = set()
+            for m in manifestos:
+                if m["nome"] in manter:
+                    usados.update(m["blocos"])
+            blocos_removidos, bytes_liberados = self._coletar_blocos(usados)
+        return {
+            "snapshots_mantidos": len(manter),
+            "snapshots_removidos": removidos,
+            "blocos_removidos": blocos_removidos,
+            "bytes_liberados": bytes_liberados,
+        }
+
+    def _coletar_blocos(self, usados: Set[str]) -> Tuple[int, int]:
+        removidos = 0
+        liberados = 0
+        for caminho in self.blocos.glob("*/*"):
+            hash_bloco = caminho.name.split(".")[0]
+            if hash_bloco not in usados:
+                liberados += caminho.stat().st_size
+                caminho.unlink()
+                removidos += 1
+        return removidos, liberados
+
+    def estatisticas(self) -> Dict[str, Any]:
+        arquivos = [p for p in self.blocos.glob("*/*") if p.is_file()]
+        manifestos = self.listar_manifestos()
+        return {
+            "snapshots": len(manifestos),
+            "blocos": len(arquivos),
+            "bytes_armazenados": sum(p.stat().st_size for p in arquivos),
+            "bytes_logicos": sum(m["tamanho"] for m in manifestos),
+        }
+
+# ============================================================================
+# POLÍTICA GFS
+# ============================================================================
+
+def selecionar_gfs(snapshots: Iterable[Tuple[str, datetime]], retencao: Dict[str, int]) -> Set[str]:
+    """
+    Nomes a manter entre (nome, datahora): os `recentes` mais novos e o mais novo
+    de cada um dos últimos `diarios` dias, `semanais` semanas ISO e `mensais` meses
+    (contando só períodos que têm snapshot).
+    """
+    ordenados = sorted(snapshots, key=lambda s: s[1], reverse=True)
+    manter = {nome for nome, _ in ordenados[:retencao.get("recentes", 0)]}
+
+    periodos = {
+        "diarios": lambda d: d.date(),
+        "semanais": lambda d: d.isocalendar()[:2],
+        "mensais": lambda d: (d.year, d.month),
+    }
+    for chave, periodo in periodos.items():
+        limite = retencao.get(chave, 0)
+        vistos = set()
+        for nome, quando in ordenados:
+            if len(vistos) >= limite:
+                break
+            p = periodo(quando)
+            if p not in vistos:
+                vistos.add(p)
+                manter.add(nome)
+    return manter
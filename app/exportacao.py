@@ -0,0 +1,148 @@
+"""
+Exportação dos Dados do Usuário
+Exportação em streaming para o /api/exportar/json: as linhas de cada tabela do
+usuário são lidas em lotes (yield_per, sem passar pelo identity map do ORM) e
+escritas conforme chegam, em NDJSON (um objeto JSON por linha) ou em um zip com
+um arquivo .ndjson por tabela. A memória fica constante, qualquer que seja o
+volume de dados.
+
+O gerador abre a própria sessão: a resposta continua sendo enviada depois que
+o handler terminou e a sessão da requisição foi fechada. Todas as tabelas são
+lidas na mesma transação, então a exportação é um retrato consistente.
+"""
+import json
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+FORMATOS = {"ndjson": "application/x-ndjson", "zip": "application/zip"}
+VERSAO_FORMATO = "2.0"
+
+TAMANHO_LOTE = 1000
+# Bytes acumulados antes de enviar um pedaço da resposta
+TAMANHO_PEDACO = 64 * 1024
+
+def _tabelas():
+    """Tabelas exportadas, na ordem de dependência (tipos antes de lançamentos etc.)."""
+    from app.main import (  # import local para evitar ciclo
+        TipoLancamento, SubtipoLancamento, FormaPagamento, Lancamento, Parcela,
+        LancamentoRecorrente, Meta
+    )
+    return [m.__table__ for m in (
+        TipoLancamento, SubtipoLancamento, FormaPagamento, Lancamento, Parcela,
+        LancamentoRecorrente, Meta
+    )]
+
+def _serializar(valor: Any) -> Any:
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return valor
+
+def linhas_do_usuario(db, tabela, usuario_id: int) -> Iterator[Dict[str, Any]]:
+    """Linhas da tabela do usuário (sem a coluna usuario_id), lidas em lotes de TAMANHO_LOTE."""
+    colunas = [c for c in tabela.columns if c.name != "usuario_id"]
+    resultado = db.execute(
+        select(*colunas)
+        .where(tabela.c.usuario_id == usuario_id)
+        .order_by(tabela.c.id)
+        .execution_options(yield_per=TAMANHO_LOTE)
+    )
+    nomes = [c.name for c in colunas]
+    for linha in resultado:
+        yield {nome: _serializar(valor) for nome, valor in zip(nomes, linha)}
+
+def _cabecalho(usuario_id: int) -> Dict[str, Any]:
+    return {
+        "tipo": "cabecalho",
+        "export_date": datetime.now().isoformat(),
+        "version": VERSAO_FORMATO,
+        "usuario_id": usuario_id
+    }
+
+def _json(obj: Dict[str, Any]) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+# ============================================================================
+# FORMATOS
+# ============================================================================
+
+def _ndjson(db, usuario_id: int, progresso: Callable) -> Iterator[bytes]:
+    """Cabeçalho, uma linha {"tabela", "dados"} por registro e um resumo com as contagens."""
+    yield _json(_cabecalho(usuario_id))
+    stats = {}
+    pedaco = bytearray()
+    tabelas = _tabelas()
+    for indice, tabela in enumerate(tabelas):
+        progresso(100 * indice // len(tabelas), f"Exportando {tabela.name}")
+        stats[tabela.name] = 0
+        for dados in linhas_do_usuario(db, tabela, usuario_id):
+            pedaco += _json({"tabela": tabela.name, "dados": dados})
+            stats[tabela.name] += 1
+            if len(pedaco) >= TAMANHO_PEDACO:
+                yield bytes(pedaco)
+                pedaco.clear()
+    pedaco += _json({"tipo": "resumo", "stats": stats})
+    yield bytes(pedaco)
+
+class _Saida:
+    """Destino não-posicionável para o zipfile: acumula o que foi escrito até ser drenado."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, dados) -> int:
+        self.buffer += dados
+        return len(dados)
+
+    def flush(self) -> None:
+        pass
+
+    def drenar(self) -> bytes:
+        dados = bytes(self.buffer)
+        self.buffer.clear()
+        return dados
+
+def _zip(db, usuario_id: int, progresso: Callable) -> Iterator[bytes]:
+    """Zip com <tabela>.ndjson por tabela e manifest.json (cabeçalho + contagens) no fim."""
+    saida = _Saida()
+    stats = {}
+    tabelas = _tabelas()
+    with zipfile.ZipFile(saida, "w", compression=zipfile.ZIP_DEFLATED) as arquivo:
+        for indice, tabela in enumerate(tabelas):
+            progresso(100 * indice // len(tabelas), f"Exportando {tabela.name}")
+            stats[tabela.name] = 0
+            with arquivo.open(f"{tabela.name}.ndjson", "w", force_zip64=True) as entrada:
+                for dados in linhas_do_usuario(db, tabela, usuario_id):
+                    entrada.write(_json(dados))
+                    stats[tabela.name] += 1
+                    if len(saida.buffer) >= TAMANHO_PEDACO:
+                        yield saida.drenar()
+            yield saida.drenar()
+        manifesto = {**_cabecalho(usuario_id), "stats": stats}
+        arquivo.writestr("manifest.json", json.dumps(manifesto, ensure_ascii=False, indent=2))
+    yield saida.drenar()
+
+def _sem_progresso(percentual: int, mensagem: str) -> None:
+    pass
+
+def exportar(bind, usuario_id: int, formato: str = "ndjson",
+             progresso: Callable = _sem_progresso) -> Iterator[bytes]:
+    """
+    Gerador com o conteúdo da exportação, para StreamingResponse. Abre e fecha a
+    própria sessão no engine `bind` (o mesmo da sessão da requisição).
+    `progresso(percentual, mensagem)` é chamado no início de cada tabela (jobs).
+    """
+    gerar = _zip if formato == "zip" else _ndjson
+    with Session(bind=bind) as db:
+        yield from gerar(db, usuario_id, progresso)
+
+def nome_arquivo(usuario_id: int, formato: str) -> Tuple[str, str]:
+    """(nome do arquivo, media type) da exportação."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"export_{usuario_id}_{timestamp}.{formato}", FORMATOS[formato]
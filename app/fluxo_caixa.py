@@ -0,0 +1,182 @@
+"""
+Fluxo de Caixa
+Motor vetorizado (NumPy) do /api/fluxo-caixa: os valores são agregados por dia no
+banco, convertidos para centavos (int64) e distribuídos nos períodos (dia, semana
+ou mês) com np.bincount; o saldo acumulado sai de um np.cumsum. A resposta é
+colunar (uma lista por série), pronta para os gráficos.
+
+Opcionalmente inclui a projeção dos lançamentos recorrentes ativos: as ocorrências
+futuras que ainda não viraram parcelas (ver projetar_recorrentes).
+"""
+from datetime import date, timedelta
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.recorrentes import MESES_POR_FREQUENCIA, primeiro_vencimento_apos
+
+GRANULARIDADES = ("dia", "semana", "mes")
+
+# ============================================================================
+# PERÍODOS
+# ============================================================================
+
+def periodos(inicio: date, fim: date, granularidade: str) -> Tuple[np.ndarray, List[str]]:
+    """
+    Retorna (periodo_do_dia, rotulos): para cada dia de [inicio, fim], o índice do
+    período a que pertence, e a data inicial (ISO) de cada período.
+    Semanas começam na segunda-feira; meses no dia 1 (o primeiro período pode
+    começar antes de `inicio`).
+    """
+    dias = np.arange(np.datetime64(inicio, "D"), np.datetime64(fim, "D") + 1)
+    if granularidade == "dia":
+        inicio_periodo = dias
+    elif granularidade == "semana":
+        # 1970-01-01 foi quinta-feira: (dias desde a época + 3) % 7 == 0 na segunda
+        dia_semana = (dias.astype("int64") + 3) % 7
+        inicio_periodo = dias - dia_semana.astype("timedelta64[D]")
+    else:
+        inicio_periodo = dias.astype("datetime64[M]").astype("datetime64[D]")
+
+    novo = np.empty(len(dias), dtype=bool)
+    novo[0] = True
+    novo[1:] = inicio_periodo[1:] != inicio_periodo[:-1]
+    periodo_do_dia = np.cumsum(novo) - 1
+    rotulos = inicio_periodo[novo].astype(str).tolist()
+    return periodo_do_dia, rotulos
+
+def somar_por_periodo(deslocamentos: np.ndarray, centavos: np.ndarray,
+                      periodo_do_dia: np.ndarray, n_periodos: int) -> np.ndarray:
+    """Soma centavos por período (deslocamentos = dias desde o início)."""
+    if len(deslocamentos) == 0:
+        return np.zeros(n_periodos, dtype=np.int64)
+    somas = np.bincount(periodo_do_dia[deslocamentos], weights=centavos, minlength=n_periodos)
+    return np.rint(somas).astype(np.int64)
+
+# ============================================================================
+# DADOS
+# ============================================================================
+
+def _em_centavos(valor) -> int:
+    return int(round(float(valor or 0) * 100))
+
+def parcelas_em_aberto(db: Session, usuario_id: int, inicio: date, fim: date) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """Parcelas não pagas agregadas por (dia, natureza) no banco: {natureza: (deslocamentos, centavos)}."""
+    from app.main import Lancamento, Parcela  # import local para evitar ciclo
+
+    linhas = db.query(
+        Parcela.data_vencimento, Lancamento.tipo, func.sum(Parcela.valor)
+    ).join(
+        Lancamento, Parcela.lancamento_id == Lancamento.id
+    ).filter(
+        Parcela.paga == 0,
+        Parcela.usuario_id == usuario_id,
+        Parcela.data_vencimento >= inicio,
+        Parcela.data_vencimento <= fim
+    ).group_by(Parcela.data_vencimento, Lancamento.tipo).all()
+    return _colunas(linhas, inicio)
+
+def _colunas(linhas, inicio: date) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """Separa (data, natureza, valor) em arrays por natureza; despesa é tudo que não é receita."""
+    colunas = {"receita": ([], []), "despesa": ([], [])}
+    for data, natureza, valor in linhas:
+        desloc, cents = colunas["receita" if natureza == "receita" else "despesa"]
+        desloc.append((data - inicio).days)
+        cents.append(_em_centavos(valor))
+    return {
+        natureza: (np.array(desloc, dtype=np.int64), np.array(cents, dtype=np.int64))
+        for natureza, (desloc, cents) in colunas.items()
+    }
+
+def projetar_recorrentes(db: Session, usuario_id: int, inicio: date, fim: date,
+                         hoje: date = None) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Ocorrências futuras dos recorrentes ativos, a partir de amanhã, que ainda não
+    existem como parcelas. Cada geração cria `numero_parcelas` parcelas espaçadas
+    pela frequência a partir do primeiro vencimento após `ultima_geracao`; a projeção
+    continua depois da última delas, com valor_total / numero_parcelas por ocorrência.
+    """
+    from dateutil.relativedelta import relativedelta
+    from app.main import LancamentoRecorrente  # import local para evitar ciclo
+
+    hoje = hoje or date.today()
+    linhas = []
+    recorrentes = db.query(LancamentoRecorrente).filter(
+        LancamentoRecorrente.usuario_id == usuario_id,
+        LancamentoRecorrente.ativo == 1
+    ).all()
+    for r in recorrentes:
+        meses = MESES_POR_FREQUENCIA.get(r.frequencia, 12)
+        n = max(1, r.numero_parcelas or 1)
+        if r.ultima_geracao:
+            primeiro = primeiro_vencimento_apos(r.ultima_geracao, r.dia_vencimento, meses)
+            proximo = primeiro + relativedelta(months=meses * n)
+        else:
+            proximo = primeiro_vencimento_apos(max(hoje, r.data_inicio - timedelta(days=1)),
+                                                r.dia_vencimento, meses)
+        valor = float(r.valor_total) / n
+
+        # Avança até o início da janela sem gerar datas fora dela
+        passo = 0
+        base = proximo
+        while proximo < inicio or proximo <= hoje:
+            passo += 1
+            proximo = base + relativedelta(months=meses * passo)
+        while proximo <= fim:
+            linhas.append((proximo, r.tipo, valor))
+            passo += 1
+            proximo = base + relativedelta(months=meses * passo)
+    return _colunas(linhas, inicio)
+
+# ============================================================================
+# FLUXO
+# ============================================================================
+
+def _reais(centavos: np.ndarray) -> List[float]:
+    return (centavos / 100.0).round(2).tolist()
+
+def calcular_fluxo(db: Session, usuario_id: int, inicio: date, fim: date,
+                   saldo_inicial: float = 0.0, granularidade: str = "dia",
+                   incluir_recorrentes: bool = False) -> Dict[str, Any]:
+    periodo_do_dia, rotulos = periodos(inicio, fim, granularidade)
+    n = len(rotulos)
+
+    abertas = parcelas_em_aberto(db, usuario_id, inicio, fim)
+    receitas = somar_por_periodo(*abertas["receita"], periodo_do_dia, n)
+    despesas = somar_por_periodo(*abertas["despesa"], periodo_do_dia, n)
+    saldo_periodo = receitas - despesas
+
+    series = {
+        "data": rotulos,
+        "receitas": _reais(receitas),
+        "despesas": _reais(despesas),
+    }
+    resumo = {
+        "total_receitas": float(receitas.sum()) / 100,
+        "total_despesas": float(despesas.sum()) / 100,
+    }
+
+    if incluir_recorrentes:
+        projetadas = projetar_recorrentes(db, usuario_id, inicio, fim)
+        receitas_proj = somar_por_periodo(*projetadas["receita"], periodo_do_dia, n)
+        despesas_proj = somar_por_periodo(*projetadas["despesa"], periodo_do_dia, n)
+        saldo_periodo = saldo_periodo + receitas_proj - despesas_proj
+        series["receitas_projetadas"] = _reais(receitas_proj)
+        series["despesas_projetadas"] = _reais(despesas_proj)
+        resumo["total_receitas_projetadas"] = float(receitas_proj.sum()) / 100
+        resumo["total_despesas_projetadas"] = float(despesas_proj.sum()) / 100
+
+    saldo_acumulado = _em_centavos(saldo_inicial) + np.cumsum(saldo_periodo)
+    series["saldo_periodo"] = _reais(saldo_periodo)
+    series["saldo_acumulado"] = _reais(saldo_acumulado)
+    resumo["saldo_inicial"] = saldo_inicial
+    resumo["saldo_final"] = series["saldo_acumulado"][-1]
+
+    return {
+        "granularidade": granularidade,
+        "incluir_recorrentes": incluir_recorrentes,
+        "series": series,
+        "resumo": resumo,
+    }
@@ -0,0 +1,233 @@
+"""
+Verificação de Integridade
+Verificações do /api/diagnostico expressas como consultas sobre conjuntos, por
+usuário, devolvendo os ids problemáticos (ex.: soma das parcelas diferente do
+valor_total vira um GROUP BY lancamento_id HAVING abs(diferença) > 0.01).
+
+Modo incremental: cada flush que toca um lançamento ou parcela registra o
+lançamento em integridade_pendentes; a verificação incremental refaz as
+consultas só para esses lançamentos e combina com o resultado guardado da
+última execução (verificacoes_integridade). Escritas em massa que não passam
+pelo flush chamam marcar_pendentes() explicitamente.
+"""
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import case, event, exists, func, or_
+from sqlalchemy.orm import Session
+
+# (tipo, severidade, descrição) na ordem em que aparecem na resposta
+VERIFICACOES = (
+    ("parcelas_orfas", "alta", "{n} parcelas sem lançamento correspondente"),
+    ("valores_negativos", "media", "{n} lançamentos com valor negativo"),
+    ("inconsistencia_valores", "alta", "{n} lançamentos com diferença entre valor_total e soma das parcelas"),
+    ("parcelas_pagas_invalidas", "media", "{n} parcelas marcadas como pagas sem data/valor de pagamento"),
+)
+
+# Verificações cujos ids são de parcelas (as demais devolvem ids de lançamentos)
+TIPOS_POR_PARCELA = ("parcelas_orfas", "parcelas_pagas_invalidas")
+
+# Tolerância de arredondamento entre valor_total e a soma das parcelas
+TOLERANCIA = 0.01
+
+# Ids por problema devolvidos na resposta (o resultado guardado tem todos)
+LIMITE_IDS = 100
+
+# Lançamentos por consulta no modo incremental (limite de parâmetros do SQLite)
+TAMANHO_LOTE = 500
+
+# ============================================================================
+# PENDENTES
+# ============================================================================
+
+def marcar_pendentes(db: Session, pares: Iterable[Tuple[int, int]]) -> None:
+    """Registra (usuario_id, lancamento_id) para a próxima verificação incremental. Não faz commit."""
+    from app.main import IntegridadePendente  # import local para evitar ciclo
+
+    linhas = [{"usuario_id": u, "lancamento_id": l} for u, l in set(pares) if u is not None and l is not None]
+    if not linhas:
+        return
+    tabela = IntegridadePendente.__table__
+    conn = db.connection()
+    dialeto = conn.dialect.name
+    if dialeto in ("sqlite", "postgresql"):
+        if dialeto == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as insert_dialeto
+        else:
+            from sqlalchemy.dialects.postgresql import insert as insert_dialeto
+        conn.execute(insert_dialeto(tabela).on_conflict_do_nothing(), linhas)
+        return
+
+    # Outros bancos: insere só os que ainda não existem
+    for linha in linhas:
+        existe = conn.execute(
+            tabela.select().where(
+                tabela.c.usuario_id == linha["usuario_id"],
+                tabela.c.lancamento_id == linha["lancamento_id"]
+            )
+        ).first()
+        if existe is None:
+            conn.execute(tabela.insert().values(**linha))
+
+@event.listens_for(Session, "after_flush")
+def _registrar_no_flush(session: Session, flush_context) -> None:
+    """Marca como pendentes os lançamentos gravados e os donos das parcelas gravadas."""
+    pares = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tabela = getattr(obj, "__tablename__", None)
+        if tabela == "lancamentos":
+            pares.add((obj.usuario_id, obj.id))
+        elif tabela == "parcelas":
+            pares.add((obj.usuario_id, obj.lancamento_id))
+    if pares:
+        marcar_pendentes(session, pares)
+
+# ============================================================================
+# VERIFICAÇÕES
+# ============================================================================
+
+def _problemas(db: Session, usuario_id: int, lancamento_ids: Optional[List[int]] = None) -> Dict[str, Set[int]]:
+    """Ids problemáticos de cada verificação, opcionalmente restritos a alguns lançamentos."""
+    from app.main import Lancamento, Parcela  # import local para evitar ciclo
+
+    def restringir(query, coluna):
+        return query if lancamento_ids is None else query.filter(coluna.in_(lancamento_ids))
+
+    orfas = restringir(db.query(Parcela.id).filter(
+        Parcela.usuario_id == usuario_id,
+        ~exists().where(Lancamento.id == Parcela.lancamento_id)
+    ), Parcela.lancamento_id)
+
+    negativos = restringir(db.query(Lancamento.id).filter(
+        Lancamento.usuario_id == usuario_id,
+        Lancamento.valor_total < 0
+    ), Lancamento.id)
+
+    inconsistentes = restringir(db.query(Lancamento.id).outerjoin(
+        Parcela, Parcela.lancamento_id == Lancamento.id
+    ).filter(
+        Lancamento.usuario_id == usuario_id
+    ), Lancamento.id).group_by(
+        Lancamento.id, Lancamento.valor_total
+    ).having(
+        func.abs(Lancamento.valor_total - func.coalesce(func.sum(Parcela.valor), 0)) > TOLERANCIA
+    )
+
+    pagas_invalidas = restringir(db.query(Parcela.id).filter(
+        Parcela.usuario_id == usuario_id,
+        Parcela.paga == 1,
+        or_(Parcela.data_pagamento.is_(None), Parcela.valor_pago.is_(None))
+    ), Parcela.lancamento_id)
+
+    consultas = {
+        "parcelas_orfas": orfas,
+        "valores_negativos": negativos,
+        "inconsistencia_valores": inconsistentes,
+        "parcelas_pagas_invalidas": pagas_invalidas,
+    }
+    return {tipo: {row[0] for row in query.all()} for tipo, query in consultas.items()}
+
+def _estatisticas(db: Session, usuario_id: int) -> Dict[str, int]:
+    from app.main import Lancamento, Parcela, TipoLancamento  # import local para evitar ciclo
+
+    total_parcelas, pagas = db.query(
+        func.count(Parcela.id), func.sum(case((Parcela.paga == 1, 1), else_=0))
+    ).filter(Parcela.usuario_id == usuario_id).one()
+    return {
+        "total_lancamentos": db.query(func.count(Lancamento.id)).filter(Lancamento.usuario_id == usuario_id).scalar(),
+        "total_parcelas": total_parcelas,
+        "total_tipos": db.query(func.count(TipoLancamento.id)).filter(TipoLancamento.usuario_id == usuario_id).scalar(),
+        "parcelas_pagas": int(pagas or 0),
+        "parcelas_pendentes": total_parcelas - int(pagas or 0),
+    }
+
+def _montar_resposta(ids: Dict[str, List[int]], executada_em: datetime, modo: str,
+                     verificados: Optional[int], estatisticas: Dict[str, int]) -> Dict[str, Any]:
+    problemas = []
+    for tipo, severidade, descricao in VERIFICACOES:
+        encontrados = ids.get(tipo, [])
+        if encontrados:
+            problemas.append({
+                "tipo": tipo,
+                "severidade": severidade,
+                "quantidade": len(encontrados),
+                "descricao": descricao.format(n=len(encontrados)),
+                "ids": encontrados[:LIMITE_IDS]
+            })
+    return {
+        "data_verificacao": executada_em.isoformat(),
+        "modo": modo,
+        "lancamentos_verificados": verificados,
+        "status": "ok" if not problemas else "problemas_encontrados",
+        "total_problemas": len(problemas),
+        "problemas": problemas,
+        "estatisticas": estatisticas
+    }
+
+def verificar_integridade(db: Session, usuario_id: int, incremental: bool = False) -> Dict[str, Any]:
+    """
+    Executa as verificações do usuário e guarda o resultado. Faz commit.
+
+    incremental=True refaz só os lançamentos pendentes (alterados desde a última
+    execução); sem execução anterior, faz a verificação completa.
+    """
+    from app.main import IntegridadePendente, VerificacaoIntegridade  # import local para evitar ciclo
+
+    anterior = db.get(VerificacaoIntegridade, usuario_id)
+    pendentes_query = db.query(IntegridadePendente).filter(
+        IntegridadePendente.usuario_id == usuario_id
+    )
+
+    if incremental and anterior is not None:
+        modo = "incremental"
+        pendentes = sorted(row[0] for row in pendentes_query.with_entities(IntegridadePendente.lancamento_id))
+        ids = {tipo: set(v) for tipo, v in json.loads(anterior.resultado).items()}
+        for inicio in range(0, len(pendentes), TAMANHO_LOTE):
+            lote = pendentes[inicio:inicio + TAMANHO_LOTE]
+            novos = _problemas(db, usuario_id, lote)
+            # O resultado anterior desses lançamentos é substituído pelo novo
+            parcelas_do_lote = _parcelas_de(db, usuario_id, lote, ids)
+            for tipo, _, _ in VERIFICACOES:
+                descartar = parcelas_do_lote if tipo in TIPOS_POR_PARCELA else set(lote)
+                ids[tipo] = (ids.get(tipo, set()) - descartar) | novos[tipo]
+            pendentes_query.filter(IntegridadePendente.lancamento_id.in_(lote)).delete(synchronize_session=False)
+        verificados = len(pendentes)
+    else:
+        modo = "completo"
+        pendentes_query.delete(synchronize_session=False)
+        ids = _problemas(db, usuario_id)
+        verificados = None
+
+    ids = {tipo: sorted(v) for tipo, v in ids.items()}
+    executada_em = datetime.now()
+    if anterior is None:
+        anterior = VerificacaoIntegridade(usuario_id=usuario_id)
+        db.add(anterior)
+    anterior.executada_em = executada_em
+    anterior.resultado = json.dumps(ids)
+    estatisticas = _estatisticas(db, usuario_id)
+    db.commit()
+
+    return _montar_resposta(ids, executada_em, modo, verificados, estatisticas)
+
+def _parcelas_de(db: Session, usuario_id: int, lancamento_ids: List[int], ids: Dict[str, Set[int]]) -> Set[int]:
+    """
+    Parcelas já apontadas como problema que pertencem (ou pertenciam) aos lançamentos
+    do lote: as que ainda existem com esse lancamento_id e as que não existem mais.
+    """
+    from app.main import Parcela  # import local para evitar ciclo
+
+    apontadas = set().union(*(ids.get(tipo, set()) for tipo in TIPOS_POR_PARCELA))
+    if not apontadas:
+        return set()
+    apontadas = sorted(apontadas)
+    existentes = {}
+    for inicio in range(0, len(apontadas), TAMANHO_LOTE):
+        for parcela_id, lancamento_id in db.query(Parcela.id, Parcela.lancamento_id).filter(
+            Parcela.usuario_id == usuario_id,
+            Parcela.id.in_(apontadas[inicio:inicio + TAMANHO_LOTE])
+        ):
+            existentes[parcela_id] = lancamento_id
+    lote = set(lancamento_ids)
+    return {p for p in apontadas if p not in existentes or existentes[p] in lote}
@@ -0,0 +1,418 @@
+"""
+Jobs em segundo plano
+Trabalhos longos (exportação completa, backup, verificação de integridade,
+geração de lançamentos recorrentes) não seguram a conexão HTTP: a API grava o
+job na tabela `jobs` e responde 202 com a URL de acompanhamento
+(/api/jobs/{id}); threads de trabalho no próprio processo executam a fila.
+
+- Reivindicação atômica: UPDATE ... WHERE status = 'pendente', então o mesmo
+  job nunca roda em duas threads (nem em dois processos com o mesmo banco).
+- Progresso: a tarefa informa (percentual, mensagem) pelo Contexto; fica em
+  memória enquanto o job executa (sem escrita no banco a cada passo) e é
+  gravado na conclusão.
+- Retentativas: falhas inesperadas voltam para a fila com espera exponencial
+  (2, 4, 8... segundos) até JOBS_MAX_TENTATIVAS; ErroPermanente e
+  HTTPException 4xx falham na hora.
+- Artefatos: arquivos gerados ficam em <diretório>/<id>/ e, como o registro do
+  job, são removidos JOBS_TTL_HORAS após a conclusão.
+- Jobs que estavam executando quando o processo parou voltam para a fila na
+  próxima inicialização.
+- Jobs diários do sistema (AGENDA_DIARIA, ex.: geração dos recorrentes devidos)
+  são enfileirados uma vez por dia, a partir da hora configurada, com id
+  "<tipo>-<AAAAMMDD>": a chave primária garante uma única execução por dia
+  mesmo com vários processos. Pertencem ao usuário 0 (sistema).
+
+Configuração (variáveis de ambiente):
+- JOBS_WORKERS: threads de trabalho (padrão 2; 0 desliga, ex.: testes)
+- JOBS_TTL_HORAS: validade de jobs concluídos e artefatos (padrão 24)
+- JOBS_MAX_TENTATIVAS: tentativas por job (padrão 3)
+- JOBS_DIR: diretório dos artefatos (padrão jobs_artefatos/ na raiz do projeto)
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import update
+
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+JOBS_TTL_HORAS = float(os.getenv("JOBS_TTL_HORAS", "24"))
+JOBS_MAX_TENTATIVAS = int(os.getenv("JOBS_MAX_TENTATIVAS", "3"))
+
+# Intervalo de espera das threads sem trabalho, da agenda e da limpeza de expirados (segundos)
+INTERVALO_ESPERA = 5.0
+INTERVALO_AGENDA = 60.0
+INTERVALO_LIMPEZA = 600.0
+
+# Dono dos jobs agendados pelo sistema
+USUARIO_SISTEMA = 0
+
+class ErroPermanente(Exception):
+    """Falha que não adianta repetir (parâmetros inválidos, registro inexistente)."""
+
+class Tarefa(NamedTuple):
+    funcao: Callable
+    admin: bool
+
+TAREFAS: Dict[str, Tarefa] = {}
+
+def _hora_recorrentes() -> int:
+    from app.recorrentes import RECORRENTES_HORA
+    return RECORRENTES_HORA
+
+# Jobs diários do sistema: tipo -> hora do dia a partir da qual é enfileirado
+AGENDA_DIARIA: Dict[str, Callable[[], int]] = {
+    "recorrentes_agendados": _hora_recorrentes,
+}
+
+def tarefa(nome: str, admin: bool = False):
+    """Registra `funcao(db, contexto, parametros) -> resultado` como tipo de job."""
+    def registrar(funcao):
+        TAREFAS[nome] = Tarefa(funcao, admin)
+        return funcao
+    return registrar
+
+# Progresso dos jobs em execução neste processo: id -> (percentual, mensagem)
+_progresso: Dict[str, tuple] = {}
+_progresso_lock = threading.Lock()
+
+# Acorda as threads quando um job é enfileirado
+_sinal = threading.Event()
+_parar = threading.Event()
+_threads: List[threading.Thread] = []
+
+class Contexto:
+    """O que a tarefa recebe do job: usuário, progresso e onde gravar o artefato."""
+
+    def __init__(self, job_id: str, usuario_id: int, diretorio: Path):
+        self.job_id = job_id
+        self.usuario_id = usuario_id
+        self.diretorio = Path(diretorio) / job_id
+        self.artefato_caminho: Optional[Path] = None
+        self.artefato_nome: Optional[str] = None
+        self.artefato_media_type: Optional[str] = None
+
+    def progresso(self, percentual: int, mensagem: str = "") -> None:
+        with _progresso_lock:
+            _progresso[self.job_id] = (max(0, min(int(percentual), 100)), mensagem[:255])
+
+    def artefato(self, nome: str, media_type: str) -> Path:
+        """Caminho onde a tarefa grava o arquivo de resultado (um por job)."""
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self.artefato_caminho = self.diretorio / nome
+        self.artefato_nome = nome
+        self.artefato_media_type = media_type
+        return self.artefato_caminho
+
+# ============================================================================
+# FILA
+# ============================================================================
+
+def enfileirar(db, usuario, tipo: str, parametros: Optional[Dict[str, Any]] = None):
+    """Grava o job pendente e acorda as threads. Faz commit."""
+    from app.main import Job  # import local para evitar ciclo
+
+    definicao = TAREFAS.get(tipo)
+    if definicao is None:
+        raise HTTPException(status_code=400, detail=f"Tipo de job inválido. Use: {', '.join(sorted(TAREFAS))}")
+    if definicao.admin and not getattr(usuario, "admin", False):
+        raise HTTPException(status_code=403, detail="Acesso restrito a administradores")
+
+    agora = datetime.now()
+    job = Job(
+        id=uuid.uuid4().hex,
+        usuario_id=usuario.id,
+        tipo=tipo,
+        parametros=json.dumps(parametros or {}),
+        status="pendente",
+        progresso=0,
+        tentativas=0,
+        max_tentativas=JOBS_MAX_TENTATIVAS,
+        criado_em=agora,
+        disponivel_em=agora,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _sinal.set()
+    return job
+
+def _reivindicar(db) -> Optional[str]:
+    """Marca como executando o próximo job disponível. Retorna o id ou None."""
+    from app.main import Job  # import local para evitar ciclo
+
+    while True:
+        agora = datetime.now()
+        candidato = db.query(Job.id).filter(
+            Job.status == "pendente", Job.disponivel_em <= agora
+        ).order_by(Job.disponivel_em, Job.criado_em).first()
+        if candidato is None:
+            return None
+        resultado = db.execute(
+            update(Job)
+            .where(Job.id == candidato.id, Job.status == "pendente")
+            .values(status="executando", iniciado_em=agora, tentativas=Job.tentativas + 1)
+        )
+        db.commit()
+        if resultado.rowcount == 1:
+            return candidato.id
+        # Outra thread levou este job; tenta o próximo
+
+def _permanente(erro: Exception) -> bool:
+    if isinstance(erro, ErroPermanente):
+        return True
+    return isinstance(erro, HTTPException) and 400 <= erro.status_code < 500
+
+def processar_proximo(fabrica: Callable, diretorio: Path) -> Optional[str]:
+    """Executa um job da fila na sessão de `fabrica()`. Retorna o id processado ou None."""
+    from app.main import Job  # import local para evitar ciclo
+
+    with fabrica() as db:
+        job_id = _reivindicar(db)
+        if job_id is None:
+            return None
+        job = db.get(Job, job_id)
+        contexto = Contexto(job_id, job.usuario_id, diretorio)
+        try:
+            definicao = TAREFAS.get(job.tipo)
+            if definicao is None:
+                raise ErroPermanente(f"Tipo de job desconhecido: {job.tipo}")
+            resultado = definicao.funcao(db, contexto, json.loads(job.parametros or "{}"))
+        except Exception as e:
+            db.rollback()
+            job = db.get(Job, job_id)
+            job.erro = str(e.detail) if isinstance(e, HTTPException) else f"{type(e).__name__}: {e}"
+            shutil.rmtree(contexto.diretorio, ignore_errors=True)
+            if _permanente(e) or job.tentativas >= job.max_tentativas:
+                _finalizar(job, "falhou")
+                print(f"✗ Job {job.tipo} {job_id} falhou: {job.erro}")
+            else:
+                job.status = "pendente"
+                job.disponivel_em = datetime.now() + timedelta(seconds=2 ** job.tentativas)
+                print(f"✗ Job {job.tipo} {job_id} falhou (tentativa {job.tentativas}), nova tentativa em {2 ** job.tentativas}s")
+        else:
+            job.resultado = json.dumps(resultado, default=str) if resultado is not None else None
+            job.erro = None
+            if contexto.artefato_caminho is not None:
+                job.artefato = str(contexto.artefato_caminho)
+                job.artefato_nome = contexto.artefato_nome
+                job.artefato_media_type = contexto.artefato_media_type
+            job.progresso = 100
+            _finalizar(job, "concluido")
+        finally:
+            with _progresso_lock:
+                ultimo = _progresso.pop(job_id, None)
+        if job.status != "concluido" and ultimo:
+            job.progresso, job.mensagem = ultimo
+        db.commit()
+    return job_id
+
+def _finalizar(job, status: str) -> None:
+    job.status = status
+    job.concluido_em = datetime.now()
+    job.expira_em = job.concluido_em + timedelta(hours=JOBS_TTL_HORAS)
+
+def limpar_expirados(db, diretorio: Path, agora: Optional[datetime] = None) -> int:
+    """Remove jobs concluídos/falhos com validade vencida e seus artefatos. Faz commit."""
+    from app.main import Job  # import local para evitar ciclo
+
+    agora = agora or datetime.now()
+    expirados = db.query(Job.id).filter(Job.expira_em.isnot(None), Job.expira_em < agora).all()
+    ids = [job.id for job in expirados]
+    for job_id in ids:
+        shutil.rmtree(Path(diretorio) / job_id, ignore_errors=True)
+    if ids:
+        db.query(Job).filter(Job.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+    return len(ids)
+
+def recuperar_interrompidos(db) -> int:
+    """Jobs que estavam executando quando o processo parou voltam para a fila. Faz commit."""
+    from app.main import Job  # import local para evitar ciclo
+
+    resultado = db.execute(
+        update(Job).where(Job.status == "executando").values(status="pendente", disponivel_em=datetime.now())
+    )
+    db.commit()
+    return resultado.rowcount
+
+def enfileirar_agendados(db, agora: Optional[datetime] = None) -> List[str]:
+    """Enfileira os jobs diários ainda não criados hoje cuja hora já chegou. Faz commit."""
+    from sqlalchemy.exc import IntegrityError
+    from app.main import Job  # import local para evitar ciclo
+
+    agora = agora or datetime.now()
+    criados = []
+    for tipo, hora in AGENDA_DIARIA.items():
+        job_id = f"{tipo}-{agora:%Y%m%d}"
+        if agora.hour < hora() or db.get(Job, job_id) is not None:
+            continue
+        db.add(Job(
+            id=job_id, usuario_id=USUARIO_SISTEMA, tipo=tipo, parametros="{}",
+            status="pendente", progresso=0, tentativas=0, max_tentativas=JOBS_MAX_TENTATIVAS,
+            criado_em=agora, disponivel_em=agora,
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Outro processo enfileirou primeiro
+            db.rollback()
+            continue
+        criados.append(job_id)
+    if criados:
+        _sinal.set()
+    return criados
+
+def andamento(job_id: str) -> Optional[tuple]:
+    with _progresso_lock:
+        return _progresso.get(job_id)
+
+def job_out(job) -> Dict[str, Any]:
+    progresso, mensagem = job.progresso, job.mensagem
+    if job.status == "executando":
+        progresso, mensagem = andamento(job.id) or (progresso, mensagem)
+    return {
+        "id": job.id,
+        "tipo": job.tipo,
+        "status": job.status,
+        "progresso": progresso,
+        "mensagem": mensagem,
+        "parametros": json.loads(job.parametros or "{}"),
+        "resultado": json.loads(job.resultado) if job.resultado else None,
+        "erro": job.erro,
+        "tentativas": job.tentativas,
+        "artefato": f"/api/jobs/{job.id}/artefato" if job.artefato else None,
+        "criado_em": job.criado_em.isoformat() if job.criado_em else None,
+        "iniciado_em": job.iniciado_em.isoformat() if job.iniciado_em else None,
+        "concluido_em": job.concluido_em.isoformat() if job.concluido_em else None,
+        "expira_em": job.expira_em.isoformat() if job.expira_em else None,
+    }
+
+# ============================================================================
+# THREADS DE TRABALHO
+# ============================================================================
+
+def _trabalhar(fabrica: Callable, diretorio: Path, manutencao: bool) -> None:
+    ultima_agenda = ultima_limpeza = 0.0
+    while not _parar.is_set():
+        try:
+            agora = time.monotonic()
+            if manutencao and agora - ultima_agenda >= INTERVALO_AGENDA:
+                with fabrica() as db:
+                    enfileirar_agendados(db)
+                ultima_agenda = agora
+            if manutencao and agora - ultima_limpeza >= INTERVALO_LIMPEZA:
+                with fabrica() as db:
+                    limpar_expirados(db, diretorio)
+                ultima_limpeza = agora
+            if processar_proximo(fabrica, diretorio) is not None:
+                continue
+        except Exception as e:
+            print(f"✗ Erro na fila de jobs: {e}")
+        _sinal.wait(INTERVALO_ESPERA)
+        _sinal.clear()
+
+def iniciar(fabrica: Callable, diretorio: Path, workers: int = JOBS_WORKERS) -> None:
+    """Recupera jobs interrompidos e inicia as threads de trabalho (lifespan da API)."""
+    if workers <= 0 or _threads:
+        return
+    Path(diretorio).mkdir(parents=True, exist_ok=True)
+    with fabrica() as db:
+        recuperados = recuperar_interrompidos(db)
+    if recuperados:
+        print(f"✓ {recuperados} job(s) interrompido(s) de volta à fila")
+    _parar.clear()
+    for indice in range(workers):
+        # Só a primeira thread cuida da agenda e da limpeza periódica
+        thread = threading.Thread(
+            target=_trabalhar, args=(fabrica, Path(diretorio), indice == 0),
+            name=f"jobs-{indice}", daemon=True
+        )
+        thread.start()
+        _threads.append(thread)
+
+def encerrar(timeout: float = 10.0) -> None:
+    """Para as threads; o job em execução termina (ou volta à fila na próxima inicialização)."""
+    _parar.set()
+    _sinal.set()
+    for thread in _threads:
+        thread.join(timeout)
+    _threads.clear()
+
+# ============================================================================
+# TAREFAS
+# ============================================================================
+
+@tarefa("exportacao")
+def _exportacao(db, contexto: Contexto, parametros: Dict[str, Any]):
+    from app import exportacao  # import local para evitar ciclo
+
+    formato = parametros.get("formato", "zip")
+    if formato not in exportacao.FORMATOS:
+        raise ErroPermanente(f"Formato inválido. Use: {', '.join(exportacao.FORMATOS)}")
+    nome, media_type = exportacao.nome_arquivo(contexto.usuario_id, formato)
+    destino = contexto.artefato(nome, media_type)
+    with open(destino, "wb") as arquivo:
+        for pedaco in exportacao.exportar(db.get_bind(), contexto.usuario_id, formato, contexto.progresso):
+            arquivo.write(pedaco)
+    return {"arquivo": nome, "tamanho": destino.stat().st_size}
+
+@tarefa("backup", admin=True)
+def _backup(db, contexto: Contexto, parametros: Dict[str, Any]):
+    from app.main import criar_backup, limpar_backups_antigos  # import local para evitar ciclo
+
+    contexto.progresso(0, "Criando backup")
+    resultado = criar_backup()
+    if not resultado.get("success"):
+        raise RuntimeError(resultado.get("error"))
+    contexto.progresso(90, "Removendo backups antigos")
+    resultado["backups_removidos"] = len(limpar_backups_antigos(30))
+    return resultado
+
+@tarefa("integridade")
+def _integridade(db, contexto: Contexto, parametros: Dict[str, Any]):
+    from app.main import verificar_integridade  # import local para evitar ciclo
+
+    contexto.progresso(0, "Verificando integridade")
+    return verificar_integridade(db, contexto.usuario_id, incremental=bool(parametros.get("incremental", False)))
+
+@tarefa("recorrentes")
+def _recorrentes(db, contexto: Contexto, parametros: Dict[str, Any]):
+    """Gera o próximo lançamento de cada recorrente informado, numa única transação."""
+    from app.main import gerar_de_recorrente  # import local para evitar ciclo
+
+    ids = parametros.get("recorrente_ids")
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+        raise ErroPermanente("Informe recorrente_ids (lista de ids)")
+    gerados = []
+    for indice, recorrente_id in enumerate(ids):
+        contexto.progresso(100 * indice // len(ids), f"Recorrente {recorrente_id}")
+        gerados.append(gerar_de_recorrente(db, contexto.usuario_id, recorrente_id).id)
+    db.commit()
+    return {"lancamentos": gerados}
+
+@tarefa("recorrentes_agendados", admin=True)
+def _recorrentes_agendados(db, contexto: Contexto, parametros: Dict[str, Any]):
+    """
+    Gera as ocorrências devidas dos recorrentes de todos os usuários (ver app.recorrentes).
+    simular=True (com `data` opcional, AAAA-MM-DD) só calcula a prévia.
+    """
+    from datetime import date
+    from app.recorrentes import gerar_devidos  # import local para evitar ciclo
+
+    simular = bool(parametros.get("simular", False))
+    hoje = None
+    if parametros.get("data"):
+        if not simular:
+            raise ErroPermanente("data só pode ser informada com simular")
+        try:
+            hoje = date.fromisoformat(parametros["data"])
+        except (TypeError, ValueError):
+            raise ErroPermanente("data inválida (use AAAA-MM-DD)")
+    return gerar_devidos(db, hoje=hoje, simular=simular, progresso=contexto.progresso)
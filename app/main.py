@@ -3,18 +3,19 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, RedirectResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field, ValidationError
 from typing import Optional, List, Dict, Any
-from sqlalchemy import Column, Integer, String, Date, Numeric, DateTime, Boolean, create_engine, func
+from sqlalchemy import Column, Integer, String, Date, Numeric, DateTime, Boolean, Index, create_engine, func
 from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session
 import os
 import re
 from collections import defaultdict
 import traceback
-import shutil
-import json
 from datetime import datetime, date, timedelta
 from pathlib import Path
+from contextlib import asynccontextmanager
+import anyio
 
 # Importar módulos de autenticação
 from app import auth
@@ -24,10 +25,23 @@ from app.auth import (
     update_user, UserUpdate, create_access_token, list_users,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from app.resumo_mensal import (
+    garantir_resumo, recalcular_meses, meses_de, meses_do_lancamento
+)
 from app.middleware import (
-    get_current_user, get_current_admin_user, get_current_active_user,
-    get_optional_user, ensure_subscription
+    get_db, get_current_user, get_current_admin_user, get_current_active_user,
+    get_optional_user, ensure_subscription, carregar_assinatura,
+    billing_subscription_guard
 )
+from app.versao_dados import etag_condicional, listar_versoes, avancar_versoes, obter_versao, etag_confere
+from app.cache_respostas import cache_por_versao, CACHE as CACHE_RESPOSTAS
+from app.busca import registrar_eventos as registrar_busca, filtrar_fornecedor, buscar
+from app.integridade import verificar_integridade
+from app import backup as backups_sqlite
+from app.deposito_backup import Deposito
+from app import exportacao, planilhas, relatorios_pdf, jobs
+from app.recorrentes import cronograma_da_geracao, valor_medio
+from app.cronograma import gerar_cronograma, inserir_parcelas, parcelas_do_lancamento, sincronizar_parcelas
 
 # Configuração dos caminhos
 BASE_DIR = Path(__file__).resolve().parent
@@ -36,11 +50,22 @@ STATIC_DIR = BASE_DIR / "static"
 BACKUP_DIR = BASE_DIR.parent / "backups"
 
 DB_PATH = os.getenv("DB_PATH", "lancamentos.db")
+# Tamanho do pool de threads que executa os handlers síncronos (acesso ao banco)
+DB_THREADPOOL_SIZE = int(os.getenv("DB_THREADPOOL_SIZE", "40"))
 # Permitir uso de DATABASE_URL (ex.: PostgreSQL) com fallback para SQLite local
 DATABASE_URL = os.getenv("DATABASE_URL") or f"sqlite:///{DB_PATH}"
 
 # Criar diretórios necessários se não existirem
 BACKUP_DIR.mkdir(exist_ok=True)
+# Snapshots incrementais (blocos deduplicados, ver app/deposito_backup.py)
+DEPOSITO = Deposito(BACKUP_DIR / "deposito")
+# PDFs gerados, por versão dos dados (ver app/relatorios_pdf.py)
+CACHE_PDF = relatorios_pdf.CacheRelatorios(
+    Path(os.getenv("PDF_CACHE_DIR", str(BASE_DIR.parent / "cache_pdf"))),
+    relatorios_pdf.PDF_CACHE_MAX_MB * 1024 * 1024
+)
+# Artefatos dos jobs em segundo plano (ver app/jobs.py)
+JOBS_DIR = Path(os.getenv("JOBS_DIR", str(BASE_DIR.parent / "jobs_artefatos")))
 
 # Garantir que o diretório do banco de dados SQLite existe
 if not DATABASE_URL.startswith("postgresql") and not DATABASE_URL.startswith("mysql"):
@@ -120,11 +145,17 @@ class SubtipoLancamento(Base):
 
 class Lancamento(Base):
     __tablename__ = "lancamentos"
+    # Índices das consultas por período (dashboard por data de lançamento, listagens).
+    # Mantidos em sincronia com migrate_add_indices.py para bancos já existentes.
+    __table_args__ = (
+        Index("ix_lancamentos_usuario_data_lancamento", "usuario_id", "data_lancamento"),
+        Index("ix_lancamentos_usuario_valor_total", "usuario_id", "valor_total"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     usuario_id = Column(Integer, nullable=False, index=True)  # FK para User
     data_lancamento = Column(Date, nullable=False)
     tipo = Column(String(10), nullable=False)  # "despesa" | "receita"
-    tipo_lancamento_id = Column(Integer, nullable=True)
+    tipo_lancamento_id = Column(Integer, nullable=True, index=True)  # FK para TipoLancamento
     subtipo_lancamento_id = Column(Integer, nullable=True, index=True)  # FK para SubtipoLancamento
     fornecedor = Column(String(255), nullable=False)
     valor_total = Column(Numeric(14,2), nullable=False)
@@ -145,9 +176,18 @@ class Lancamento(Base):
 
 class Parcela(Base):
     __tablename__ = "parcelas"
+    # Índices dos caminhos quentes (mantidos em sincronia com migrate_add_indices.py):
+    # - a vencer / vencidas: usuario + paga + vencimento
+    # - dashboard, tabela anual e evolução por vencimento: usuario + vencimento
+    # - histórico e relatórios por data de pagamento: usuario + pagamento
+    __table_args__ = (
+        Index("ix_parcelas_usuario_paga_vencimento", "usuario_id", "paga", "data_vencimento"),
+        Index("ix_parcelas_usuario_vencimento", "usuario_id", "data_vencimento"),
+        Index("ix_parcelas_usuario_pagamento", "usuario_id", "data_pagamento"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     usuario_id = Column(Integer, nullable=False, index=True)  # FK para User
-    lancamento_id = Column(Integer, nullable=False)  # FK para Lancamento
+    lancamento_id = Column(Integer, nullable=False, index=True)  # FK para Lancamento
     numero_parcela = Column(Integer, nullable=False)  # 1, 2, 3...
     data_vencimento = Column(Date, nullable=False)
     valor = Column(Numeric(14,2), nullable=False)
@@ -198,18 +238,106 @@ class Meta(Base):
     created_at = Column(Date, nullable=False)
     updated_at = Column(Date, nullable=True)
 
-engine = create_engine(DATABASE_URL, echo=False, future=True)
+class ResumoMensal(Base):
+    """Totais mensais materializados por usuário/tipo/subtipo/natureza (ver app/resumo_mensal.py).
+
+    base: 'vencimento' (parcelas por data de vencimento), 'pagamento' (parcelas pagas
+    por data de pagamento, somando valor_pago) ou 'lancamento' (lançamentos por data).
+    """
+    __tablename__ = "resumo_mensal"
+    __table_args__ = (
+        Index("ix_resumo_mensal_usuario_base_periodo", "usuario_id", "base", "ano", "mes"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    usuario_id = Column(Integer, nullable=False)  # FK para User
+    base = Column(String(12), nullable=False)  # "vencimento" | "pagamento" | "lancamento"
+    ano = Column(Integer, nullable=False)
+    mes = Column(Integer, nullable=False)  # 1-12
+    tipo_lancamento_id = Column(Integer, nullable=True)  # FK para TipoLancamento
+    subtipo_lancamento_id = Column(Integer, nullable=True)  # FK para SubtipoLancamento
+    natureza = Column(String(10), nullable=False)  # "despesa" | "receita"
+    total = Column(Numeric(14,2), nullable=False)
+    quantidade = Column(Integer, nullable=False)  # parcelas (vencimento/pagamento) ou lançamentos
+
+class ResumoMensalEstado(Base):
+    """Marca os usuários cujo resumo mensal já foi construído (construção tardia na 1ª leitura)."""
+    __tablename__ = "resumo_mensal_estado"
+    usuario_id = Column(Integer, primary_key=True)  # FK para User
+    atualizado_em = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class VersaoDados(Base):
+    """Versão monotônica dos dados de cada usuário (base dos ETags das leituras, ver app.versao_dados)."""
+    __tablename__ = "versoes_dados"
+    usuario_id = Column(Integer, primary_key=True)  # FK para User
+    versao = Column(Integer, nullable=False, default=0)
+
+class VerificacaoIntegridade(Base):
+    """Resultado da última verificação de integridade de cada usuário (ver app.integridade)."""
+    __tablename__ = "verificacoes_integridade"
+    usuario_id = Column(Integer, primary_key=True)  # FK para User
+    executada_em = Column(DateTime, nullable=False)
+    resultado = Column(String, nullable=False)  # JSON com os ids problemáticos de cada verificação
+
+class IntegridadePendente(Base):
+    """Lançamentos alterados desde a última verificação de integridade do usuário."""
+    __tablename__ = "integridade_pendentes"
+    usuario_id = Column(Integer, primary_key=True)  # FK para User
+    lancamento_id = Column(Integer, primary_key=True)
+
+class Job(Base):
+    """Trabalho em segundo plano (exportação, backup, geração de recorrentes), ver app.jobs."""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index('idx_jobs_fila', 'status', 'disponivel_em'),
+        Index('idx_jobs_usuario', 'usuario_id', 'criado_em'),
+    )
+    id = Column(String(32), primary_key=True)  # uuid4 hex
+    usuario_id = Column(Integer, nullable=False)  # FK para User
+    tipo = Column(String(30), nullable=False)
+    parametros = Column(String, nullable=False, default="{}")  # JSON
+    status = Column(String(15), nullable=False, default="pendente")  # pendente | executando | concluido | falhou
+    progresso = Column(Integer, nullable=False, default=0)  # 0-100
+    mensagem = Column(String(255), nullable=True)
+    resultado = Column(String, nullable=True)  # JSON
+    erro = Column(String, nullable=True)
+    artefato = Column(String, nullable=True)  # caminho do arquivo gerado
+    artefato_nome = Column(String(255), nullable=True)
+    artefato_media_type = Column(String(100), nullable=True)
+    tentativas = Column(Integer, nullable=False, default=0)
+    max_tentativas = Column(Integer, nullable=False, default=3)
+    criado_em = Column(DateTime, nullable=False, default=datetime.now)
+    disponivel_em = Column(DateTime, nullable=False, default=datetime.now)  # adiado entre tentativas
+    iniciado_em = Column(DateTime, nullable=True)
+    concluido_em = Column(DateTime, nullable=True)
+    expira_em = Column(DateTime, nullable=True)  # após isso o job e o artefato são removidos
+
+# Pool de conexões dimensionado pelo pool de threads: cada requisição em execução
+# usa uma única sessão (ver app.middleware.get_db).
+engine = create_engine(
+    DATABASE_URL, echo=False, future=True,
+    pool_size=DB_THREADPOOL_SIZE, max_overflow=10
+)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
+# Índices de busca textual (FTS5/pg_trgm) instalados após cada create_all
+registrar_busca(Base.metadata)
 Base.metadata.create_all(bind=engine)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-app = FastAPI(title="API Lançamentos", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Handlers e dependências que usam o banco são síncronos (def) e rodam no
+    # pool de threads do anyio; limitamos o pool para não esgotar conexões.
+    anyio.to_thread.current_default_thread_limiter().total_tokens = DB_THREADPOOL_SIZE
+    jobs.iniciar(SessionLocal, JOBS_DIR)
+    yield
+    jobs.encerrar()
+    relatorios_pdf.encerrar()
+
+# O bloqueio por assinatura é uma dependência global: roda dentro da requisição,
+# compartilhando sessão e usuário autenticado com as demais dependências e o handler.
+app = FastAPI(
+    title="API Lançamentos", version="0.1.0", lifespan=lifespan,
+    dependencies=[Depends(billing_subscription_guard), Depends(etag_condicional)]
+)
 
 # ================= UTILITY FUNCTIONS FOR MULTI-TENANT ISOLATION =====================
 def apply_user_filter(query, model, user_id: int):
@@ -244,6 +372,16 @@ def get_user_record(db: Session, model, record_id: int, user_id: int):
         model.usuario_id == user_id
     ).first()
 
+# ================= INTERVALOS DE DATAS (filtros que usam os índices) =====================
+# Filtrar com extract('year'/'month') sobre a coluna impede o uso dos índices de data;
+# por isso os períodos são expressos como intervalos semiabertos [inicio, fim).
+
+def intervalo_meses(ano_inicio: int, mes_inicio: int, ano_fim: int, mes_fim: int):
+    """Retorna (inicio, fim) cobrindo do mês inicial ao mês final, com fim exclusivo."""
+    inicio = date(ano_inicio, mes_inicio, 1)
+    fim = date(ano_fim + 1, 1, 1) if mes_fim == 12 else date(ano_fim, mes_fim + 1, 1)
+    return inicio, fim
+
 def get_template_context(request: Request, **kwargs) -> dict:
     """
     Prepara contexto para templates incluindo CSP nonce.
@@ -347,6 +485,9 @@ async def validation_exception_handler(request: Request, exc: ValidationError):
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
+    # 304 (ver app.versao_dados.etag_condicional) não é erro e não tem corpo
+    if exc.status_code == 304:
+        return Response(status_code=304, headers=exc.headers)
     # Registrar último erro também para HTTPException (ex.: 400/404/500 com detail)
     try:
         global LAST_ERROR
@@ -359,8 +500,8 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         }
     except Exception:
         pass
-    # Garantir resposta JSON consistente
-    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+    # Garantir resposta JSON consistente (mantendo cabeçalhos como Retry-After)
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=exc.headers)
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
@@ -390,7 +531,8 @@ app.add_middleware(
     allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PATCH", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["Authorization", "Content-Type", "Accept"],
+    allow_headers=["Authorization", "Content-Type", "Accept", "If-None-Match"],
+    expose_headers=["ETag", "X-Next-After-Id", "X-Total-Count"],
 )
 
 # Configuração dos templates
@@ -401,80 +543,6 @@ if STATIC_DIR.exists():
     app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 
 
-# ========== MIDDLEWARE: BLOQUEIO POR ASSINATURA (somente usuários autenticados) ==========
-
-@app.middleware("http")
-async def billing_subscription_guard(request: Request, call_next):
-    try:
-        # Métodos que modificam estado
-        if request.method in ("POST", "PUT", "PATCH", "DELETE"):
-            path = request.url.path
-            # Rotas liberadas
-            allowed_prefixes = (
-                "/auth", "/api/billing", "/api/health", "/health", "/api/debug",
-                "/static", "/offline", "/sw.js"
-            )
-            if path.startswith(allowed_prefixes):
-                return await call_next(request)
-
-            # Tentar obter token do header ou cookie
-            token = None
-            auth_header = request.headers.get("Authorization")
-            if auth_header and auth_header.lower().startswith("bearer "):
-                token = auth_header.split(" ", 1)[1]
-            elif "access_token" in request.cookies:
-                token = request.cookies.get("access_token")
-
-            if token:
-                # Validar token e checar assinatura
-                token_data = auth.decode_access_token(token)
-                if token_data and token_data.user_id:
-                    db = SessionLocal()
-                    try:
-                        user = get_user_by_id(db, token_data.user_id)
-                        if user and user.ativo:
-                            sub = db.query(Assinatura).filter(Assinatura.usuario_id == user.id).first()
-                            hoje = date.today()
-                            if not sub:
-                                # cria trial automática de 14 dias
-                                trial_ate = hoje + timedelta(days=14)
-                                sub = Assinatura(
-                                    usuario_id=user.id,
-                                    status="trial",
-                                    data_inicio=hoje,
-                                    proximo_vencimento=trial_ate,
-                                    valor_mensal=None,
-                                    trial_ate=trial_ate,
-                                    created_at=hoje
-                                )
-                                db.add(sub)
-                                db.commit()
-                            else:
-                                # Bloquear se vencida e não cancelada
-                                if sub.proximo_vencimento and sub.proximo_vencimento < hoje and sub.status != "cancelada":
-                                    if sub.status != "inadimplente":
-                                        sub.status = "inadimplente"
-                                        db.commit()
-                                    return JSONResponse(
-                                        status_code=402,
-                                        content={
-                                            "detail": {
-                                                "message": "Assinatura vencida. Regularize o pagamento para continuar.",
-                                                "status": sub.status,
-                                                "proximo_vencimento": sub.proximo_vencimento.isoformat() if sub.proximo_vencimento else None,
-                                                "trial_ate": sub.trial_ate.isoformat() if sub.trial_ate else None
-                                            }
-                                        }
-                                    )
-                    finally:
-                        db.close()
-            # Se não houver token, não bloqueia (modo legado)
-        return await call_next(request)
-    except Exception as e:
-        # Em caso de erro no guard, não derruba a app, apenas prossegue
-        return await call_next(request)
-
-
 # ========== MIDDLEWARE: VERIFICAÇÃO DE ORIGIN/REFERER PARA MÉTODOS DE ESCRITA ==========
 
 @app.middleware("http")
@@ -532,100 +600,64 @@ async def get_last_error():
 # ========== FUNÇÕES DE BACKUP E VALIDAÇÃO ==========
 
 def criar_backup() -> Dict[str, Any]:
-    """Cria backup do banco de dados SQLite com timestamp"""
+    """Cria backup consistente e comprimido do banco SQLite (ver app/backup.py)"""
     try:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_filename = f"backup_{timestamp}.db"
-        backup_path = BACKUP_DIR / backup_filename
-        
-        # Copiar arquivo do banco
-        db_source = Path(DB_PATH)
-        if not db_source.exists():
-            raise FileNotFoundError(f"Banco de dados não encontrado: {DB_PATH}")
-        
-        shutil.copy2(db_source, backup_path)
-        
-        # Obter tamanho do arquivo
-        file_size = backup_path.stat().st_size
-        
-        return {
-            "success": True,
-            "filename": backup_filename,
-            "path": str(backup_path),
-            "size": file_size,
-            "size_mb": round(file_size / (1024 * 1024), 2),
-            "timestamp": timestamp,
-            "created_at": datetime.now().isoformat()
-        }
+        return backups_sqlite.criar_backup_online(Path(DB_PATH), BACKUP_DIR)
     except Exception as e:
         return {
             "success": False,
             "error": str(e)
         }
 
-def listar_backups() -> List[Dict[str, Any]]:
-    """Lista todos os backups disponíveis"""
-    backups = []
+def listar_backups(limite: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
+    """Lista os backups pelo catálogo (mais recentes primeiro), paginado"""
+    pagina = backups_sqlite.consultar_catalogo(BACKUP_DIR, limite, offset)
+    agora = datetime.now()
     
-    for backup_file in sorted(BACKUP_DIR.glob("backup_*.db"), reverse=True):
-        stat = backup_file.stat()
-        
-        # Extrair timestamp do nome do arquivo
-        filename = backup_file.name
-        timestamp_str = filename.replace("backup_", "").replace(".db", "")
-        
-        try:
-            created_date = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-        except:
-            created_date = datetime.fromtimestamp(stat.st_mtime)
-        
-        backups.append({
-            "filename": filename,
-            "path": str(backup_file),
-            "size": stat.st_size,
-            "size_mb": round(stat.st_size / (1024 * 1024), 2),
-            "created_at": created_date.isoformat(),
-            "age_days": (datetime.now() - created_date).days
-        })
+    for backup in pagina["backups"]:
+        backup["path"] = str(BACKUP_DIR / backup["filename"])
+        backup["size_mb"] = round((backup["size"] or 0) / (1024 * 1024), 2)
+        backup["age_days"] = (agora - datetime.fromisoformat(backup["created_at"])).days
     
-    return backups
+    return pagina
 
 def limpar_backups_antigos(dias: int = 30):
     """Remove backups mais antigos que N dias"""
     limite = datetime.now() - timedelta(days=dias)
     removidos = []
     
-    for backup_file in BACKUP_DIR.glob("backup_*.db"):
-        stat = backup_file.stat()
-        created = datetime.fromtimestamp(stat.st_mtime)
-        
-        if created < limite:
-            try:
-                backup_file.unlink()
-                removidos.append(backup_file.name)
-            except Exception as e:
-                print(f"Erro ao remover backup {backup_file.name}: {e}")
+    for backup_file in backups_sqlite.backups_anteriores_a(BACKUP_DIR, limite):
+        try:
+            if backup_file.exists():
+                backups_sqlite.remover_backup(backup_file)
+            else:
+                backups_sqlite.remover_do_catalogo(backup_file)
+            removidos.append(backup_file.name)
+        except Exception as e:
+            print(f"Erro ao remover backup {backup_file.name}: {e}")
     
     return removidos
 
-def restaurar_backup(backup_filename: str) -> Dict[str, Any]:
-    """Restaura banco de dados de um backup"""
+def _restaurar_sobre_banco(restaurar, origem: str) -> Dict[str, Any]:
+    """Cria backup do estado atual, aplica `restaurar(db_path)` e invalida as versões de dados"""
     try:
-        backup_path = BACKUP_DIR / backup_filename
-        
-        if not backup_path.exists():
-            raise FileNotFoundError(f"Backup não encontrado: {backup_filename}")
-        
         # Criar backup do estado atual antes de restaurar
         backup_atual = criar_backup()
+        with SessionLocal() as db:
+            versoes_anteriores = listar_versoes(db)
         
-        # Restaurar
-        db_dest = Path(DB_PATH)
-        shutil.copy2(backup_path, db_dest)
+        # Restaurar pela API de backup (as conexões abertas passam a ver os dados restaurados)
+        restaurar(Path(DB_PATH))
+        # Backups antigos podem não ter as tabelas mais novas (ex.: resumo_mensal,
+        # que é reconstruído na primeira leitura de cada usuário)
+        Base.metadata.create_all(bind=engine)
+        # Dados trocaram por inteiro: invalida os ETags já emitidos
+        with SessionLocal() as db:
+            avancar_versoes(db, versoes_anteriores)
         
         return {
             "success": True,
-            "restored_from": backup_filename,
+            "restored_from": origem,
             "backup_created": backup_atual.get("filename"),
             "message": "Banco restaurado com sucesso. Backup do estado anterior criado."
         }
@@ -635,172 +667,22 @@ def restaurar_backup(backup_filename: str) -> Dict[str, Any]:
             "error": str(e)
         }
 
-def exportar_dados_json(db: Session) -> Dict[str, Any]:
-    """Exporta todos os dados do banco em formato JSON"""
-    try:
-        # Buscar todos os tipos
-        tipos = db.query(TipoLancamento).all()
-        tipos_data = [{
-            "id": t.id,
-            "nome": t.nome,
-            "natureza": t.natureza,
-            "created_at": t.created_at.isoformat() if t.created_at else None
-        } for t in tipos]
-        
-        # Buscar todos os lançamentos
-        lancamentos = db.query(Lancamento).all()
-        lancamentos_data = [{
-            "id": l.id,
-            "data_lancamento": l.data_lancamento.isoformat() if l.data_lancamento else None,
-            "tipo": l.tipo,
-            "tipo_lancamento_id": l.tipo_lancamento_id,
-            "fornecedor": l.fornecedor,
-            "valor_total": float(l.valor_total),
-            "data_primeiro_vencimento": l.data_primeiro_vencimento.isoformat() if l.data_primeiro_vencimento else None,
-            "numero_parcelas": l.numero_parcelas,
-            "valor_medio_parcelas": float(l.valor_medio_parcelas),
-            "observacao": l.observacao
-        } for l in lancamentos]
-        
-        # Buscar todas as parcelas
-        parcelas = db.query(Parcela).all()
-        parcelas_data = [{
-            "id": p.id,
-            "lancamento_id": p.lancamento_id,
-            "numero_parcela": p.numero_parcela,
-            "data_vencimento": p.data_vencimento.isoformat() if p.data_vencimento else None,
-            "valor": float(p.valor),
-            "paga": p.paga,
-            "data_pagamento": p.data_pagamento.isoformat() if p.data_pagamento else None,
-            "valor_pago": float(p.valor_pago) if p.valor_pago else None
-        } for p in parcelas]
-        
-        # Buscar lançamentos recorrentes
-        recorrentes = db.query(LancamentoRecorrente).all()
-        recorrentes_data = [{
-            "id": r.id,
-            "tipo": r.tipo,
-            "tipo_lancamento_id": r.tipo_lancamento_id,
-            "fornecedor": r.fornecedor,
-            "valor_total": float(r.valor_total),
-            "dia_vencimento": r.dia_vencimento,
-            "numero_parcelas": r.numero_parcelas,
-            "frequencia": r.frequencia,
-            "ativo": r.ativo,
-            "data_inicio": r.data_inicio.isoformat() if r.data_inicio else None,
-            "ultima_geracao": r.ultima_geracao.isoformat() if r.ultima_geracao else None,
-            "observacao": r.observacao,
-            "created_at": r.created_at.isoformat() if r.created_at else None
-        } for r in recorrentes]
-        
-        export_data = {
-            "export_date": datetime.now().isoformat(),
-            "version": "1.0",
-            "tipos_lancamentos": tipos_data,
-            "lancamentos": lancamentos_data,
-            "parcelas": parcelas_data,
-            "lancamentos_recorrentes": recorrentes_data,
-            "stats": {
-                "total_tipos": len(tipos_data),
-                "total_lancamentos": len(lancamentos_data),
-                "total_parcelas": len(parcelas_data),
-                "total_recorrentes": len(recorrentes_data)
-            }
-        }
-        
-        return export_data
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao exportar dados: {str(e)}")
+def restaurar_backup(backup_filename: str) -> Dict[str, Any]:
+    """Restaura banco de dados de um backup"""
+    backup_path = BACKUP_DIR / backup_filename
+    if not backup_path.exists():
+        return {"success": False, "error": f"Backup não encontrado: {backup_filename}"}
+    return _restaurar_sobre_banco(
+        lambda db_path: backups_sqlite.restaurar_online(backup_path, db_path), backup_filename
+    )
 
-def validar_integridade(db: Session) -> Dict[str, Any]:
-    """Valida integridade dos dados no banco"""
-    problemas = []
-    
+def restaurar_snapshot(nome: str) -> Dict[str, Any]:
+    """Restaura banco de dados de um snapshot do depósito incremental"""
     try:
-        # 1. Verificar parcelas órfãs (sem lançamento)
-        parcelas_orfas = db.query(Parcela).filter(
-            ~Parcela.lancamento_id.in_(db.query(Lancamento.id))
-        ).count()
-        
-        if parcelas_orfas > 0:
-            problemas.append({
-                "tipo": "parcelas_orfas",
-                "severidade": "alta",
-                "quantidade": parcelas_orfas,
-                "descricao": f"{parcelas_orfas} parcelas sem lançamento correspondente"
-            })
-        
-        # 2. Verificar lançamentos com valores negativos
-        lancamentos_negativos = db.query(Lancamento).filter(
-            Lancamento.valor_total < 0
-        ).count()
-        
-        if lancamentos_negativos > 0:
-            problemas.append({
-                "tipo": "valores_negativos",
-                "severidade": "media",
-                "quantidade": lancamentos_negativos,
-                "descricao": f"{lancamentos_negativos} lançamentos com valor negativo"
-            })
-        
-        # 3. Verificar inconsistência entre valor_total e soma das parcelas
-        lancamentos = db.query(Lancamento).all()
-        inconsistencias = 0
-        
-        for lanc in lancamentos:
-            parcelas = db.query(Parcela).filter(Parcela.lancamento_id == lanc.id).all()
-            soma_parcelas = sum(float(p.valor) for p in parcelas)
-            
-            # Tolerar diferença de até 0.01 por arredondamento
-            if abs(float(lanc.valor_total) - soma_parcelas) > 0.01:
-                inconsistencias += 1
-        
-        if inconsistencias > 0:
-            problemas.append({
-                "tipo": "inconsistencia_valores",
-                "severidade": "alta",
-                "quantidade": inconsistencias,
-                "descricao": f"{inconsistencias} lançamentos com diferença entre valor_total e soma das parcelas"
-            })
-        
-        # 4. Verificar parcelas pagas sem data ou valor de pagamento
-        parcelas_pagas_invalidas = db.query(Parcela).filter(
-            Parcela.paga == 1,
-            (Parcela.data_pagamento == None) | (Parcela.valor_pago == None)
-        ).count()
-        
-        if parcelas_pagas_invalidas > 0:
-            problemas.append({
-                "tipo": "parcelas_pagas_invalidas",
-                "severidade": "media",
-                "quantidade": parcelas_pagas_invalidas,
-                "descricao": f"{parcelas_pagas_invalidas} parcelas marcadas como pagas sem data/valor de pagamento"
-            })
-        
-        # 5. Verificar tipos de lançamento órfãos
-        tipos_orfaos = db.query(TipoLancamento).filter(
-            ~TipoLancamento.id.in_(db.query(Lancamento.tipo_lancamento_id).distinct())
-        ).count()
-        
-        return {
-            "data_verificacao": datetime.now().isoformat(),
-            "status": "ok" if len(problemas) == 0 else "problemas_encontrados",
-            "total_problemas": len(problemas),
-            "problemas": problemas,
-            "estatisticas": {
-                "total_lancamentos": db.query(Lancamento).count(),
-                "total_parcelas": db.query(Parcela).count(),
-                "total_tipos": db.query(TipoLancamento).count(),
-                "parcelas_pagas": db.query(Parcela).filter(Parcela.paga == 1).count(),
-                "parcelas_pendentes": db.query(Parcela).filter(Parcela.paga == 0).count()
-            }
-        }
-    except Exception as e:
-        return {
-            "status": "erro",
-            "error": str(e)
-        }
-
+        DEPOSITO.ler_manifesto(nome)
+    except (FileNotFoundError, ValueError) as e:
+        return {"success": False, "error": str(e)}
+    return _restaurar_sobre_banco(lambda db_path: DEPOSITO.restaurar(nome, db_path), nome)
 
 class LancamentoIn(BaseModel):
     data_lancamento: str = Field(..., description="YYYY-MM-DD")
@@ -974,7 +856,7 @@ class LancamentoOut(BaseModel):
 # ======================
 
 @app.post("/auth/register", response_model=UserOut, status_code=201)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+def register(user_data: UserCreate, db: Session = Depends(get_db)):
     """
     Registra um novo usuário.
     """
@@ -996,7 +878,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Erro ao criar conta. Tente novamente.")
 
 @app.post("/auth/login", response_model=Token)
-async def login(
+def login(
     response: Response,
     login_data: LoginRequest,
     db: Session = Depends(get_db)
@@ -1055,7 +937,7 @@ async def get_me(current_user: User = Depends(get_current_active_user)):
     return current_user
 
 @app.patch("/auth/me", response_model=UserOut)
-async def update_me(
+def update_me(
     user_update: UserUpdate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -1072,7 +954,7 @@ class ChangePasswordRequest(BaseModel):
     senha_nova_confirmacao: str = Field(..., min_length=8, max_length=100)
 
 @app.post("/auth/change-password")
-async def change_password(
+def change_password(
     password_data: ChangePasswordRequest,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -1128,7 +1010,7 @@ async def change_password(
     return {"message": "Senha alterada com sucesso"}
 
 @app.get("/auth/users", response_model=List[UserOut])
-async def list_all_users(
+def list_all_users(
     skip: int = 0,
     limit: int = 100,
     current_user: User = Depends(get_current_admin_user),
@@ -1193,19 +1075,16 @@ class PagamentoOut(BaseModel):
         )
 
 @app.get("/api/billing/assinatura", response_model=AssinaturaOut)
-async def obter_minha_assinatura(
+def obter_minha_assinatura(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    sub = db.query(Assinatura).filter(Assinatura.usuario_id == current_user.id).first()
-    if not sub:
-        # Aproveita a lógica de ensure_subscription para criar trial
-        await ensure_subscription(current_user, db)  # type: ignore
-        sub = db.query(Assinatura).filter(Assinatura.usuario_id == current_user.id).first()
+    # Cria trial automaticamente no primeiro acesso
+    sub = carregar_assinatura(db, current_user.id)
     return AssinaturaOut.from_orm(sub)
 
 @app.post("/api/billing/assinatura/start", response_model=AssinaturaOut)
-async def iniciar_assinatura(
+def iniciar_assinatura(
     dados: AssinaturaStartIn,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -1234,17 +1113,14 @@ async def iniciar_assinatura(
     return AssinaturaOut.from_orm(sub)
 
 @app.post("/api/billing/pagamentos", response_model=PagamentoOut)
-async def registrar_pagamento(
+def registrar_pagamento(
     dados: PagamentoIn,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     from dateutil.relativedelta import relativedelta
     # Garantir assinatura existente
-    sub = db.query(Assinatura).filter(Assinatura.usuario_id == current_user.id).first()
-    if not sub:
-        await ensure_subscription(current_user, db)  # type: ignore
-        sub = db.query(Assinatura).filter(Assinatura.usuario_id == current_user.id).first()
+    sub = carregar_assinatura(db, current_user.id)
 
     hoje = date.today()
     # Calcular referência padrão YYYY-MM
@@ -1275,7 +1151,7 @@ async def registrar_pagamento(
     return PagamentoOut.from_orm(pagamento)
 
 @app.get("/api/billing/pagamentos", response_model=List[PagamentoOut])
-async def listar_pagamentos(
+def listar_pagamentos(
     limit: int = 12,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -1286,7 +1162,7 @@ async def listar_pagamentos(
     return [PagamentoOut.from_orm(p) for p in pagamentos]
 
 @app.get("/api/admin/billing/stats")
-async def admin_billing_stats(
+def admin_billing_stats(
     current_user: User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
 ):
@@ -1326,6 +1202,17 @@ async def admin_billing_stats(
         "data": hoje.isoformat()
     }
 
+@app.get("/api/admin/cache/stats")
+def admin_cache_stats(current_user: User = Depends(get_current_admin_user)):
+    """Contadores do cache de respostas dos relatórios (hits, misses, evictions)."""
+    return CACHE_RESPOSTAS.estatisticas()
+
+@app.delete("/api/admin/cache")
+def admin_limpar_cache(current_user: User = Depends(get_current_admin_user)):
+    """Esvazia o cache de respostas (memória e nível compartilhado) e zera os contadores."""
+    CACHE_RESPOSTAS.limpar()
+    return {"success": True}
+
 # ======================
 # ROTAS DE TEMPLATES
 # ======================
@@ -1452,7 +1339,7 @@ async def register_page(request: Request):
 # ======================
 
 @app.get("/api/formas-pagamento", response_model=List[FormaPagamentoOut])
-async def listar_formas_pagamento(
+def listar_formas_pagamento(
     incluir_inativas: bool = False,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -1467,7 +1354,7 @@ async def listar_formas_pagamento(
     return [FormaPagamentoOut.from_orm(f) for f in formas]
 
 @app.get("/api/formas-pagamento/{forma_id}", response_model=FormaPagamentoOut)
-async def obter_forma_pagamento(
+def obter_forma_pagamento(
     forma_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -1482,7 +1369,7 @@ async def obter_forma_pagamento(
     return FormaPagamentoOut.from_orm(forma)
 
 @app.post("/api/formas-pagamento", response_model=FormaPagamentoOut, status_code=201)
-async def criar_forma_pagamento(
+def criar_forma_pagamento(
     forma: FormaPagamentoIn,
     current_user: User = Depends(ensure_subscription),
     db: Session = Depends(get_db)
@@ -1524,7 +1411,7 @@ async def criar_forma_pagamento(
         raise HTTPException(status_code=500, detail=f"Erro ao criar forma de pagamento: {str(e)}")
 
 @app.put("/api/formas-pagamento/{forma_id}", response_model=FormaPagamentoOut)
-async def atualizar_forma_pagamento(forma_id: int, forma: FormaPagamentoIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def atualizar_forma_pagamento(forma_id: int, forma: FormaPagamentoIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     """Atualiza uma forma de pagamento existente"""
     db_forma = db.query(FormaPagamento).filter(
         FormaPagamento.id == forma_id,
@@ -1565,7 +1452,7 @@ async def atualizar_forma_pagamento(forma_id: int, forma: FormaPagamentoIn, curr
         raise HTTPException(status_code=500, detail=f"Erro ao atualizar forma de pagamento: {str(e)}")
 
 @app.delete("/api/formas-pagamento/{forma_id}")
-async def excluir_forma_pagamento(forma_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def excluir_forma_pagamento(forma_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     """Exclui uma forma de pagamento (se não estiver em uso)"""
     # Verifica se a forma está sendo usada em alguma parcela paga
     parcelas_com_forma = db.query(Parcela).filter(Parcela.forma_pagamento_id == forma_id).count()
@@ -1592,7 +1479,7 @@ async def excluir_forma_pagamento(forma_id: int, current_user: User = Depends(en
         raise HTTPException(status_code=500, detail=f"Erro ao excluir forma de pagamento: {str(e)}")
 
 @app.patch("/api/formas-pagamento/{forma_id}/toggle")
-async def toggle_forma_pagamento(forma_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def toggle_forma_pagamento(forma_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     """Ativa/desativa uma forma de pagamento"""
     forma = db.query(FormaPagamento).filter(
         FormaPagamento.id == forma_id,
@@ -1613,7 +1500,7 @@ async def toggle_forma_pagamento(forma_id: int, current_user: User = Depends(ens
         raise HTTPException(status_code=500, detail=f"Erro ao alternar status: {str(e)}")
 
 @app.get("/api/formas-pagamento/{forma_id}/usage")
-async def obter_uso_forma_pagamento(forma_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def obter_uso_forma_pagamento(forma_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     """Retorna quantas parcelas estão usando esta forma de pagamento"""
     forma = db.query(FormaPagamento).filter(
         FormaPagamento.id == forma_id,
@@ -1636,7 +1523,7 @@ async def obter_uso_forma_pagamento(forma_id: int, current_user: User = Depends(
     }
 
 @app.get("/api/tipos", response_model=List[TipoLancamentoOut])
-async def listar_tipos(current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
+def listar_tipos(current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
     try:
         tipos = (
             db.query(TipoLancamento)
@@ -1660,7 +1547,7 @@ async def listar_tipos(current_user: User = Depends(get_current_active_user), db
         raise
 
 @app.post("/api/tipos", response_model=TipoLancamentoOut)
-async def criar_tipo(tipo: TipoLancamentoIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def criar_tipo(tipo: TipoLancamentoIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     from datetime import date, timedelta
     
     # Verificar se já existe um tipo com o mesmo nome e natureza para este usuário
@@ -1688,7 +1575,7 @@ async def criar_tipo(tipo: TipoLancamentoIn, current_user: User = Depends(ensure
     return TipoLancamentoOut.from_orm(db_tipo)
 
 @app.delete("/api/tipos/{tipo_id}")
-async def excluir_tipo(tipo_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def excluir_tipo(tipo_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     # Verifica se o tipo está sendo usado em algum lançamento
     if db.query(Lancamento).filter(Lancamento.tipo_lancamento_id == tipo_id).first():
         raise HTTPException(
@@ -1712,7 +1599,7 @@ async def excluir_tipo(tipo_id: int, current_user: User = Depends(ensure_subscri
 # ======================
 
 @app.get("/api/tipos/{tipo_id}/subtipos", response_model=List[SubtipoLancamentoOut])
-async def listar_subtipos(tipo_id: int, current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
+def listar_subtipos(tipo_id: int, current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
     """Lista todos os subtipos de um tipo específico"""
     # Verifica se o tipo existe
     tipo = db.query(TipoLancamento).filter(
@@ -1730,7 +1617,7 @@ async def listar_subtipos(tipo_id: int, current_user: User = Depends(get_current
     return [SubtipoLancamentoOut.model_validate(s) for s in subtipos]
 
 @app.get("/api/subtipos", response_model=List[SubtipoLancamentoOut])
-async def listar_todos_subtipos(current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
+def listar_todos_subtipos(current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
     """Lista todos os subtipos (de todos os tipos)"""
     subtipos = (
         db.query(SubtipoLancamento)
@@ -1742,7 +1629,7 @@ async def listar_todos_subtipos(current_user: User = Depends(get_current_active_
     return [SubtipoLancamentoOut.model_validate(s) for s in subtipos]
 
 @app.post("/api/tipos/{tipo_id}/subtipos", response_model=SubtipoLancamentoOut, status_code=201)
-async def criar_subtipo(tipo_id: int, subtipo: SubtipoLancamentoIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def criar_subtipo(tipo_id: int, subtipo: SubtipoLancamentoIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     """Cria um novo subtipo para um tipo específico"""
     from datetime import date
     
@@ -1788,7 +1675,7 @@ async def criar_subtipo(tipo_id: int, subtipo: SubtipoLancamentoIn, current_user
     return SubtipoLancamentoOut.model_validate(db_subtipo)
 
 @app.patch("/api/subtipos/{subtipo_id}", response_model=SubtipoLancamentoOut)
-async def atualizar_subtipo(subtipo_id: int, subtipo_update: SubtipoLancamentoIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def atualizar_subtipo(subtipo_id: int, subtipo_update: SubtipoLancamentoIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     """Atualiza um subtipo existente"""
     db_subtipo = db.query(SubtipoLancamento).filter(
         SubtipoLancamento.id == subtipo_id,
@@ -1823,7 +1710,7 @@ async def atualizar_subtipo(subtipo_id: int, subtipo_update: SubtipoLancamentoIn
     return SubtipoLancamentoOut.model_validate(db_subtipo)
 
 @app.delete("/api/subtipos/{subtipo_id}")
-async def excluir_subtipo(subtipo_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def excluir_subtipo(subtipo_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     """Exclui um subtipo (se não estiver em uso)"""
     # Verifica se o subtipo está sendo usado em algum lançamento
     if db.query(Lancamento).filter(Lancamento.subtipo_lancamento_id == subtipo_id).first():
@@ -1845,7 +1732,7 @@ async def excluir_subtipo(subtipo_id: int, current_user: User = Depends(ensure_s
 
 # Rotas da API
 @app.post("/api/lancamentos")
-async def criar_lancamento(
+def criar_lancamento(
     lancamento: LancamentoIn,
     current_user: User = Depends(ensure_subscription),
     db: Session = Depends(get_db)
@@ -1913,50 +1800,19 @@ async def criar_lancamento(
             db.add(db_lancamento)
             # Use flush to obtain the ID without committing; commit only after creating parcels (atomic operation)
             db.flush()
-            db.refresh(db_lancamento)
             print(f"✓ Lançamento preparado (ID obtido) para criar parcelas. ID: {db_lancamento.id}")
             
-            # Gerar parcelas automaticamente
-            from dateutil.relativedelta import relativedelta
-            from decimal import Decimal
-            data_venc = date.fromisoformat(lancamento.data_primeiro_vencimento)
-            parcelas_criadas = []
-            
-            # Calcular valores com precisão
-            valor_total_decimal = Decimal(str(lancamento.valor_total))
-            valor_parcela_base = valor_total_decimal / lancamento.numero_parcelas
-            valor_parcela_arredondado = valor_parcela_base.quantize(Decimal('0.01'))
-            
-            # Calcular diferença (centavos restantes)
-            soma_parcelas = valor_parcela_arredondado * lancamento.numero_parcelas
-            diferenca = valor_total_decimal - soma_parcelas
-            centavos_restantes = int(diferenca * 100)  # Converter para centavos
-            
-            print(f"Valor total: {valor_total_decimal}, Parcela base: {valor_parcela_arredondado}, Diferença: {diferenca} ({centavos_restantes} centavos)")
-            
-            for i in range(lancamento.numero_parcelas):
-                valor_parcela = valor_parcela_arredondado
-                
-                # Distribuir centavos restantes nas últimas parcelas
-                if centavos_restantes != 0:
-                    parcelas_faltantes = lancamento.numero_parcelas - i
-                    if parcelas_faltantes <= abs(centavos_restantes):
-                        ajuste = Decimal('0.01') if centavos_restantes > 0 else Decimal('-0.01')
-                        valor_parcela += ajuste
-                        centavos_restantes -= (1 if centavos_restantes > 0 else -1)
-                
-                parcela = Parcela(
-                    usuario_id=current_user.id,
-                    lancamento_id=db_lancamento.id,
-                    numero_parcela=i + 1,
-                    data_vencimento=data_venc + relativedelta(months=i),
-                    valor="{:.2f}".format(valor_parcela),
-                    paga=0,
-                    data_pagamento=None
-                )
-                db.add(parcela)
-                parcelas_criadas.append(parcela)
+            # Gerar parcelas automaticamente (valores exatos em centavos, um INSERT em lote)
+            cronograma = gerar_cronograma(
+                lancamento.valor_total,
+                date.fromisoformat(lancamento.data_primeiro_vencimento),
+                lancamento.numero_parcelas
+            )
+            parcelas_criadas = inserir_parcelas(db, current_user.id, db_lancamento.id, cronograma)
             
+            recalcular_meses(db, current_user.id, meses_de(
+                db_lancamento.data_lancamento, *[p.data_vencimento for p in parcelas_criadas]
+            ))
             db.commit()
             print(f"✓ {len(parcelas_criadas)} parcelas criadas!")
             print(f"=== Fim da criação ===\n")
@@ -1980,54 +1836,119 @@ async def criar_lancamento(
         print(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Erro ao processar lançamento: {error_msg}")
 
+# Chaves de ordenação da listagem; cada uma tem índice (usuario_id, coluna) e o id desempata
+ORDENACOES_LANCAMENTOS = {
+    "id": Lancamento.id,
+    "data_lancamento": Lancamento.data_lancamento,
+    "valor_total": Lancamento.valor_total,
+}
+LIMITE_MAXIMO_LANCAMENTOS = 500
+
 @app.get("/api/lancamentos", response_model=List[LancamentoOut])
-async def listar_lancamentos(
+def listar_lancamentos(
+    response: Response,
     tipo: Optional[str] = None,
     tipo_lancamento_id: Optional[int] = None,
     subtipo_lancamento_id: Optional[int] = None,
     fornecedor: Optional[str] = None,
     data_inicio: Optional[str] = None,
     data_fim: Optional[str] = None,
+    ordenar: str = "id",
+    ordem: str = "desc",
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    contar: bool = False,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    try:
-        print(f"Listando lançamentos do usuário {current_user.id}...")
-        query = db.query(Lancamento).filter(Lancamento.usuario_id == current_user.id)
-        
-        # Aplicar filtros
-        if tipo:
-            query = query.filter(Lancamento.tipo == tipo)
-        if tipo_lancamento_id:
-            query = query.filter(Lancamento.tipo_lancamento_id == tipo_lancamento_id)
-        if subtipo_lancamento_id:
-            query = query.filter(Lancamento.subtipo_lancamento_id == subtipo_lancamento_id)
-        if fornecedor:
-            query = query.filter(Lancamento.fornecedor.ilike(f"%{fornecedor}%"))
-        if data_inicio:
-            from datetime import date
-            query = query.filter(Lancamento.data_lancamento >= date.fromisoformat(data_inicio))
-        if data_fim:
-            from datetime import date
-            query = query.filter(Lancamento.data_lancamento <= date.fromisoformat(data_fim))
-        
-        lancamentos = []
-        for l in query.order_by(Lancamento.id.desc()).all():
-            try:
-                lancamento_out = LancamentoOut.from_orm(l)
-                lancamentos.append(lancamento_out)
-            except Exception as e:
-                print(f"Erro ao processar lançamento {l.id}: {str(e)}")
-                print(f"Traceback: {traceback.format_exc()}")
-                raise
-        print(f"Total de lançamentos: {len(lancamentos)}")
-        return lancamentos
-    except Exception as e:
-        print(f"Erro ao listar lançamentos: {str(e)}")
-        raise
+    """
+    Lista os lançamentos do usuário.
+    - Sem `limit`, retorna todos (compatibilidade).
+    - Paginação por cursor: `limit` (máx. 500) e `after_id` (id do último item da página anterior).
+      O cabeçalho X-Next-After-Id traz o cursor da próxima página (ausente na última).
+    - ordenar: 'id' (padrão), 'data_lancamento' ou 'valor_total'; ordem: 'desc' (padrão) ou 'asc'.
+    - contar=true: cabeçalho X-Total-Count com o total que atende aos filtros.
+    """
+    if ordenar not in ORDENACOES_LANCAMENTOS:
+        raise HTTPException(status_code=400, detail=f"ordenar deve ser um de: {', '.join(ORDENACOES_LANCAMENTOS)}")
+    if ordem not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="ordem deve ser 'asc' ou 'desc'")
+    if limit is not None and not 1 <= limit <= LIMITE_MAXIMO_LANCAMENTOS:
+        raise HTTPException(status_code=400, detail=f"limit deve estar entre 1 e {LIMITE_MAXIMO_LANCAMENTOS}")
+
+    query = db.query(Lancamento).filter(Lancamento.usuario_id == current_user.id)
+
+    # Aplicar filtros
+    if tipo:
+        query = query.filter(Lancamento.tipo == tipo)
+    if tipo_lancamento_id:
+        query = query.filter(Lancamento.tipo_lancamento_id == tipo_lancamento_id)
+    if subtipo_lancamento_id:
+        query = query.filter(Lancamento.subtipo_lancamento_id == subtipo_lancamento_id)
+    if fornecedor:
+        # Índice de busca (FTS5 trigram/prefixo no SQLite, trigram no PostgreSQL)
+        query = filtrar_fornecedor(db, query, fornecedor)
+    if data_inicio:
+        query = query.filter(Lancamento.data_lancamento >= date.fromisoformat(data_inicio))
+    if data_fim:
+        query = query.filter(Lancamento.data_lancamento <= date.fromisoformat(data_fim))
+
+    if contar:
+        response.headers["X-Total-Count"] = str(
+            query.with_entities(func.count(Lancamento.id)).order_by(None).scalar() or 0
+        )
+
+    coluna = ORDENACOES_LANCAMENTOS[ordenar]
+    decrescente = ordem == "desc"
+
+    # Keyset: continua depois de (valor da coluna, id) do último item já entregue
+    if after_id is not None:
+        if coluna is Lancamento.id:
+            query = query.filter(Lancamento.id < after_id if decrescente else Lancamento.id > after_id)
+        else:
+            referencia = db.query(coluna).filter(
+                Lancamento.id == after_id,
+                Lancamento.usuario_id == current_user.id
+            ).first()
+            if referencia is None:
+                raise HTTPException(status_code=400, detail="after_id inválido")
+            valor = referencia[0]
+            if decrescente:
+                query = query.filter((coluna < valor) | ((coluna == valor) & (Lancamento.id < after_id)))
+            else:
+                query = query.filter((coluna > valor) | ((coluna == valor) & (Lancamento.id > after_id)))
+
+    criterios = [coluna, Lancamento.id] if coluna is not Lancamento.id else [Lancamento.id]
+    query = query.order_by(*[c.desc() if decrescente else c.asc() for c in criterios])
+
+    if limit is None:
+        return [LancamentoOut.from_orm(l) for l in query.all()]
+
+    # Busca um item a mais para saber se há próxima página
+    linhas = query.limit(limit + 1).all()
+    pagina = linhas[:limit]
+    if len(linhas) > limit:
+        response.headers["X-Next-After-Id"] = str(pagina[-1].id)
+    return [LancamentoOut.from_orm(l) for l in pagina]
+
+@app.get("/api/busca")
+def buscar_textual(
+    q: str,
+    limit: int = 20,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Busca por fornecedor/observação em lançamentos, observações de pagamento das
+    parcelas e lançamentos recorrentes, ordenada por relevância.
+    Cada palavra casa por prefixo ("merc liv" encontra "Mercado Livre"), sem acentos.
+    """
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit deve estar entre 1 e 100")
+    return buscar(db, current_user.id, q, limit)
 
 @app.get("/api/lancamentos/{lancamento_id}", response_model=LancamentoOut)
-async def obter_lancamento(lancamento_id: int, incluir_parcelas: bool = False, current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
+def obter_lancamento(lancamento_id: int, incluir_parcelas: bool = False, current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
     lancamento = db.query(Lancamento).filter(
         Lancamento.id == lancamento_id,
         Lancamento.usuario_id == current_user.id
@@ -2043,7 +1964,7 @@ async def obter_lancamento(lancamento_id: int, incluir_parcelas: bool = False, c
     return LancamentoOut.from_orm(lancamento)
 
 @app.get("/api/lancamentos/{lancamento_id}/parcelas", response_model=List[ParcelaOut])
-async def listar_parcelas(lancamento_id: int, current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
+def listar_parcelas(lancamento_id: int, current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
     # Verificar se o lançamento existe
     lancamento = db.query(Lancamento).filter(
         Lancamento.id == lancamento_id,
@@ -2058,24 +1979,101 @@ async def listar_parcelas(lancamento_id: int, current_user: User = Depends(get_c
     ).order_by(Parcela.numero_parcela).all()
     return [ParcelaOut.from_orm(p) for p in parcelas]
 
+LIMITE_MAXIMO_PARCELAS = 500
+
 @app.get("/api/parcelas/a-vencer")
-async def parcelas_a_vencer(
+def parcelas_a_vencer(
     data_inicio: str,
     data_fim: str,
     tipo: Optional[str] = None,
     status: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
+    """
+    Parcelas não pagas do usuário, com estatísticas por faixa (vencidas / vence hoje /
+    a vencer) x natureza, calculadas por uma única consulta agrupada.
+    - status: 'vencidas', 'vence_hoje', 'a_vencer' ou vazio (vencidas + próximos 30 dias)
+    - limit/after_id: paginação por cursor (ordem vencimento, lançamento, id);
+      `paginacao.proximo_after_id` traz o cursor da próxima página. Sem limit, retorna tudo.
+    - stats: totais do filtro completo (não só da página)
+    - stats_globais: vencidas e vence hoje de todas as parcelas, independente do filtro
+    """
     from datetime import date as dt_date, timedelta
-    
+    from sqlalchemy import case, tuple_, and_, or_
+
+    if limit is not None and not 1 <= limit <= LIMITE_MAXIMO_PARCELAS:
+        raise HTTPException(status_code=400, detail=f"limit deve estar entre 1 e {LIMITE_MAXIMO_PARCELAS}")
+
     # Converter datas
     data_inicio_obj = dt_date.fromisoformat(data_inicio)
     data_fim_obj = dt_date.fromisoformat(data_fim)
     hoje = dt_date.today()
 
-    # Query base: parcelas não pagas do usuário
-    from sqlalchemy import func
+    # Filtro da listagem conforme tipo e status
+    condicoes = []
+    if tipo:
+        condicoes.append(Lancamento.tipo == tipo)
+    if status == "vencidas":
+        # Mostrar todas as vencidas até hoje (ou até data_fim, se menor). Ignora limite inferior
+        condicoes.append(Parcela.data_vencimento <= min(data_fim_obj, hoje))
+    elif status == "vence_hoje":
+        condicoes.append(Parcela.data_vencimento == hoje)
+    elif status == "a_vencer":
+        # Apenas futuras a partir de amanhã ou do data_inicio, o que for maior
+        inicio_avencer = data_inicio_obj if data_inicio_obj > hoje else hoje + timedelta(days=1)
+        condicoes.append(Parcela.data_vencimento >= inicio_avencer)
+        condicoes.append(Parcela.data_vencimento <= data_fim_obj)
+    else:
+        # Sem status (Todos): todas vencidas + hoje + próximos 30 dias
+        condicoes.append(Parcela.data_vencimento <= hoje + timedelta(days=30))
+    no_filtro = and_(*condicoes)
+
+    # Estatísticas: uma consulta agrupada por (faixa, natureza, dentro do filtro).
+    # O domínio é o filtro mais as vencidas/de hoje, para os contadores globais.
+    faixa = case(
+        (Parcela.data_vencimento < hoje, "vencidas"),
+        (Parcela.data_vencimento == hoje, "vence_hoje"),
+        else_="a_vencer"
+    )
+    dentro = case((no_filtro, 1), else_=0)
+    grupos = db.query(
+        faixa, Lancamento.tipo, dentro, func.count(Parcela.id), func.sum(Parcela.valor)
+    ).join(
+        Lancamento, Parcela.lancamento_id == Lancamento.id
+    ).filter(
+        Parcela.paga == 0,
+        Parcela.usuario_id == current_user.id,
+        or_(no_filtro, Parcela.data_vencimento <= hoje)
+    ).group_by(faixa, Lancamento.tipo, dentro).all()
+
+    stats = {
+        "total": 0, "receitas": 0, "despesas": 0,
+        "vencidas": 0, "vence_hoje": 0, "a_vencer": 0,
+        "valor_vencidas": 0.0, "valor_vence_hoje": 0.0, "valor_a_vencer": 0.0,
+        "valor_receitas_a_vencer": 0.0, "valor_despesas_a_vencer": 0.0
+    }
+    stats_globais = {"vencidas": 0, "valor_vencidas": 0.0, "vence_hoje": 0, "valor_vence_hoje": 0.0}
+    for nome_faixa, natureza, no_filtro_grupo, quantidade, valor in grupos:
+        valor = float(valor or 0)
+        if nome_faixa in ("vencidas", "vence_hoje"):
+            stats_globais[nome_faixa] += quantidade
+            stats_globais[f"valor_{nome_faixa}"] += valor
+        if not no_filtro_grupo:
+            continue
+        stats["total"] += quantidade
+        if natureza == "receita":
+            stats["receitas"] += quantidade
+        elif natureza == "despesa":
+            stats["despesas"] += quantidade
+        stats[nome_faixa] += quantidade
+        stats[f"valor_{nome_faixa}"] += valor
+        if nome_faixa == "a_vencer" and natureza in ("receita", "despesa"):
+            stats[f"valor_{natureza}s_a_vencer"] += valor
+
+    # Listagem (página)
     query = db.query(
         Parcela.id,
         Parcela.lancamento_id,
@@ -2096,74 +2094,50 @@ async def parcelas_a_vencer(
         SubtipoLancamento, Lancamento.subtipo_lancamento_id == SubtipoLancamento.id
     ).filter(
         Parcela.paga == 0,
-        Parcela.usuario_id == current_user.id
+        Parcela.usuario_id == current_user.id,
+        no_filtro
     )
 
-    # Filtro por tipo
-    if tipo:
-        query = query.filter(Lancamento.tipo == tipo)
-
-    # Regras de data conforme status
-    if status == "vencidas":
-        # Mostrar todas as vencidas até hoje (ou até data_fim, se menor). Ignora limite inferior
-        limite_superior = data_fim_obj if data_fim_obj <= hoje else hoje - timedelta(days=0)
-        query = query.filter(Parcela.data_vencimento <= limite_superior)
-    elif status == "vence_hoje":
-        query = query.filter(Parcela.data_vencimento == hoje)
-    elif status == "a_vencer":
-        # Apenas futuras a partir de amanhã ou do data_inicio, o que for maior
-        inicio_avencer = data_inicio_obj if data_inicio_obj > hoje else hoje + timedelta(days=1)
-        query = query.filter(
-            Parcela.data_vencimento >= inicio_avencer,
-            Parcela.data_vencimento <= data_fim_obj
-        )
-    else:
-        # Sem status (Todos): todas vencidas + hoje + próximos 30 dias
-        limite_futuro = hoje + timedelta(days=30)
-        query = query.filter(Parcela.data_vencimento <= limite_futuro)
+    chave_ordem = (Parcela.data_vencimento, Parcela.lancamento_id, Parcela.id)
+    if after_id is not None:
+        referencia = db.query(*chave_ordem).filter(
+            Parcela.id == after_id,
+            Parcela.usuario_id == current_user.id
+        ).first()
+        if referencia is None:
+            raise HTTPException(status_code=400, detail="after_id inválido")
+        query = query.filter(tuple_(*chave_ordem) > tuple_(*referencia))
+    query = query.order_by(*chave_ordem)
+
+    results = query.limit(limit + 1).all() if limit is not None else query.all()
+    proximo_after_id = None
+    if limit is not None and len(results) > limit:
+        results = results[:limit]
+        proximo_after_id = results[-1].id
+
+    parcelas = [{
+        "id": r.id,
+        "lancamento_id": r.lancamento_id,
+        "numero_parcela": r.numero_parcela,
+        "data_vencimento": r.data_vencimento.isoformat(),
+        "valor": float(r.valor),
+        "tipo": r.tipo,
+        "fornecedor": r.fornecedor,
+        "tipo_lancamento_id": r.tipo_lancamento_id,
+        "subtipo_lancamento_id": r.subtipo_lancamento_id,
+        "tipo_nome": r.tipo_nome,
+        "subtipo_nome": r.subtipo_nome
+    } for r in results]
 
-    # Ordenar por data de vencimento
-    results = query.order_by(Parcela.data_vencimento, Parcela.lancamento_id).all()
-    
-    # Formatar resultados
-    parcelas = []
-    for r in results:
-        parcelas.append({
-            "id": r.id,
-            "lancamento_id": r.lancamento_id,
-            "numero_parcela": r.numero_parcela,
-            "data_vencimento": r.data_vencimento.isoformat(),
-            "valor": float(r.valor),
-            "tipo": r.tipo,
-            "fornecedor": r.fornecedor,
-            "tipo_lancamento_id": r.tipo_lancamento_id,
-            "subtipo_lancamento_id": r.subtipo_lancamento_id,
-            "tipo_nome": r.tipo_nome,
-            "subtipo_nome": r.subtipo_nome
-        })
-    
-    # Calcular estatísticas
-    stats = {
-        "total": len(parcelas),
-        "receitas": sum(1 for p in parcelas if p["tipo"] == "receita"),
-        "despesas": sum(1 for p in parcelas if p["tipo"] == "despesa"),
-        "vencidas": sum(1 for p in parcelas if p["data_vencimento"] < hoje.isoformat()),
-        "vence_hoje": sum(1 for p in parcelas if p["data_vencimento"] == hoje.isoformat()),
-        "a_vencer": sum(1 for p in parcelas if p["data_vencimento"] > hoje.isoformat()),
-        "valor_vencidas": sum(p["valor"] for p in parcelas if p["data_vencimento"] < hoje.isoformat()),
-        "valor_vence_hoje": sum(p["valor"] for p in parcelas if p["data_vencimento"] == hoje.isoformat()),
-        "valor_a_vencer": sum(p["valor"] for p in parcelas if p["data_vencimento"] > hoje.isoformat()),
-        "valor_receitas_a_vencer": sum(p["valor"] for p in parcelas if p["data_vencimento"] > hoje.isoformat() and p["tipo"] == "receita"),
-        "valor_despesas_a_vencer": sum(p["valor"] for p in parcelas if p["data_vencimento"] > hoje.isoformat() and p["tipo"] == "despesa")
-    }
-    
     return {
         "parcelas": parcelas,
-        "stats": stats
+        "stats": stats,
+        "stats_globais": stats_globais,
+        "paginacao": {"limit": limit, "proximo_after_id": proximo_after_id}
     }
 
 @app.get("/api/parcelas/pagas")
-async def parcelas_pagas(
+def parcelas_pagas(
     data_inicio: Optional[str] = None,
     data_fim: Optional[str] = None,
     tipo: Optional[str] = None,
@@ -2254,7 +2228,7 @@ async def parcelas_pagas(
     }
 
 @app.get("/api/notificacoes")
-async def obter_notificacoes(current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def obter_notificacoes(current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     """
     Retorna notificações de parcelas vencidas e a vencer
     """
@@ -2341,85 +2315,47 @@ async def obter_notificacoes(current_user: User = Depends(ensure_subscription),
     }
 
 @app.get("/api/fluxo-caixa")
-async def obter_fluxo_caixa(
+def obter_fluxo_caixa(
     data_inicio: str,
     data_fim: str,
     saldo_inicial: Optional[float] = 0.0,
+    granularidade: str = "dia",
+    incluir_recorrentes: bool = False,
     current_user: User = Depends(ensure_subscription),
     db: Session = Depends(get_db)
 ):
-    from datetime import date as dt_date, timedelta
-    from collections import defaultdict
-    from decimal import Decimal
-    
+    """
+    Fluxo de caixa das parcelas não pagas em séries colunares (uma lista por série),
+    agrupado por dia, semana ou mês. Com incluir_recorrentes, soma a projeção dos
+    recorrentes ativos que ainda não viraram parcelas.
+    """
+    from datetime import date as dt_date
+    from app.fluxo_caixa import GRANULARIDADES, calcular_fluxo
+
     try:
         inicio = dt_date.fromisoformat(data_inicio)
         fim = dt_date.fromisoformat(data_fim)
     except ValueError:
         raise HTTPException(status_code=400, detail="Datas inválidas")
-    
-    # Buscar todas as parcelas não pagas no período
-    parcelas_query = db.query(
-        Parcela.data_vencimento,
-        Parcela.valor,
-        Lancamento.tipo
-    ).join(
-        Lancamento, Parcela.lancamento_id == Lancamento.id
-    ).filter(
-        Parcela.paga == 0,
-        Parcela.data_vencimento >= inicio,
-        Parcela.data_vencimento <= fim,
-        Parcela.usuario_id == current_user.id
-    ).all()
-    
-    # Agrupar por data
-    fluxo_por_data = defaultdict(lambda: {"receitas": Decimal(0), "despesas": Decimal(0)})
-    
-    for data_venc, valor, tipo in parcelas_query:
-        if tipo == "receita":
-            fluxo_por_data[data_venc]["receitas"] += Decimal(str(valor))
-        else:
-            fluxo_por_data[data_venc]["despesas"] += Decimal(str(valor))
-    
-    # Gerar série temporal dia a dia
-    resultado = []
-    saldo_acumulado = Decimal(str(saldo_inicial))
-    data_atual = inicio
-    
-    while data_atual <= fim:
-        fluxo = fluxo_por_data.get(data_atual, {"receitas": Decimal(0), "despesas": Decimal(0)})
-        receitas = float(fluxo["receitas"])
-        despesas = float(fluxo["despesas"])
-        saldo_dia = receitas - despesas
-        saldo_acumulado += Decimal(str(saldo_dia))
-        
-        resultado.append({
-            "data": data_atual.isoformat(),
-            "receitas": receitas,
-            "despesas": despesas,
-            "saldo_dia": saldo_dia,
-            "saldo_acumulado": float(saldo_acumulado)
-        })
-        
-        data_atual += timedelta(days=1)
-    
-    # Calcular totais
-    total_receitas = sum(d["receitas"] for d in resultado)
-    total_despesas = sum(d["despesas"] for d in resultado)
-    
-    return {
-        "fluxo": resultado,
-        "resumo": {
-            "total_receitas": total_receitas,
-            "total_despesas": total_despesas,
-            "saldo_final": float(saldo_acumulado),
-            "saldo_inicial": saldo_inicial
-        }
-    }
+    if fim < inicio:
+        raise HTTPException(status_code=400, detail="data_fim deve ser posterior a data_inicio")
+    if granularidade not in GRANULARIDADES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Granularidade inválida. Use: {', '.join(GRANULARIDADES)}"
+        )
+
+    return calcular_fluxo(
+        db, current_user.id, inicio, fim,
+        saldo_inicial=saldo_inicial or 0.0,
+        granularidade=granularidade,
+        incluir_recorrentes=incluir_recorrentes
+    )
 
 @app.put("/api/lancamentos/{lancamento_id}")
-async def atualizar_lancamento(lancamento_id: int, lancamento: LancamentoIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def atualizar_lancamento(lancamento_id: int, lancamento: LancamentoIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     from datetime import date
+    from decimal import Decimal
     
     db_lancamento = db.query(Lancamento).filter(
         Lancamento.id == lancamento_id,
@@ -2446,69 +2382,55 @@ async def atualizar_lancamento(lancamento_id: int, lancamento: LancamentoIn, cur
         if lancamento.tipo_lancamento_id and subtipo.tipo_lancamento_id != lancamento.tipo_lancamento_id:
             raise HTTPException(status_code=400, detail="O subtipo não pertence ao tipo selecionado")
     
+    # Meses afetados antes da alteração (para o resumo mensal)
+    meses_afetados = meses_do_lancamento(db, db_lancamento)
+
+    # Parcelas só são recalculadas quando muda o que define o cronograma; editar
+    # fornecedor, tipo ou observação não toca nelas (nem nas edições individuais)
+    valor_total = Decimal("{:.2f}".format(lancamento.valor_total))
+    primeiro_vencimento = date.fromisoformat(lancamento.data_primeiro_vencimento)
+    cronograma_alterado = (
+        Decimal(str(db_lancamento.valor_total)) != valor_total
+        or db_lancamento.data_primeiro_vencimento != primeiro_vencimento
+        or db_lancamento.numero_parcelas != lancamento.numero_parcelas
+    )
+
     # Atualizar campos do lançamento
     db_lancamento.data_lancamento = date.fromisoformat(lancamento.data_lancamento)
     db_lancamento.tipo = lancamento.tipo
     db_lancamento.tipo_lancamento_id = lancamento.tipo_lancamento_id
     db_lancamento.subtipo_lancamento_id = lancamento.subtipo_lancamento_id
     db_lancamento.fornecedor = lancamento.fornecedor
-    db_lancamento.valor_total = "{:.2f}".format(lancamento.valor_total)
-    db_lancamento.data_primeiro_vencimento = date.fromisoformat(lancamento.data_primeiro_vencimento)
+    db_lancamento.valor_total = valor_total
+    db_lancamento.data_primeiro_vencimento = primeiro_vencimento
     db_lancamento.numero_parcelas = lancamento.numero_parcelas
     db_lancamento.valor_medio_parcelas = "{:.2f}".format(lancamento.valor_medio_parcelas)
     db_lancamento.observacao = lancamento.observacao
 
     try:
-        # Excluir parcelas antigas
-        db.query(Parcela).filter(Parcela.lancamento_id == lancamento_id).delete()
-        db.commit()
-        db.refresh(db_lancamento)
-
-        # Recriar parcelas com distribuição de centavos
-        from dateutil.relativedelta import relativedelta
-        from decimal import Decimal
-        data_venc = date.fromisoformat(lancamento.data_primeiro_vencimento)
-        parcelas_criadas = []
-
-        valor_total_decimal = Decimal(str(lancamento.valor_total))
-        valor_parcela_base = valor_total_decimal / lancamento.numero_parcelas
-        valor_parcela_arredondado = valor_parcela_base.quantize(Decimal('0.01'))
-        soma_parcelas = valor_parcela_arredondado * lancamento.numero_parcelas
-        diferenca = valor_total_decimal - soma_parcelas
-        centavos_restantes = int(diferenca * 100)
-
-        for i in range(lancamento.numero_parcelas):
-            valor_parcela = valor_parcela_arredondado
-            if (centavos_restantes != 0):
-                parcelas_faltantes = lancamento.numero_parcelas - i
-                if parcelas_faltantes <= abs(centavos_restantes):
-                    ajuste = Decimal('0.01') if centavos_restantes > 0 else Decimal('-0.01')
-                    valor_parcela += ajuste
-                    centavos_restantes -= (1 if centavos_restantes > 0 else -1)
-
-            parcela = Parcela(
-                usuario_id=current_user.id,
-                lancamento_id=db_lancamento.id,
-                numero_parcela=i + 1,
-                data_vencimento=data_venc + relativedelta(months=i),
-                valor="{:.2f}".format(valor_parcela),
-                paga=0,
-                data_pagamento=None
-            )
-            db.add(parcela)
-            parcelas_criadas.append(parcela)
+        if cronograma_alterado:
+            # Só as parcelas que mudaram (ids e pagamentos preservados), na mesma transação
+            cronograma = gerar_cronograma(valor_total, primeiro_vencimento, lancamento.numero_parcelas)
+            parcelas, _ = sincronizar_parcelas(db, current_user.id, db_lancamento.id, cronograma)
+        else:
+            parcelas = parcelas_do_lancamento(db, db_lancamento.id)
 
+        meses_afetados |= meses_de(db_lancamento.data_lancamento, *[p.data_vencimento for p in parcelas])
+        recalcular_meses(db, current_user.id, meses_afetados)
         db.commit()
 
         # Atribuir para resposta
-        db_lancamento._parcelas = parcelas_criadas
+        db_lancamento._parcelas = parcelas
         return LancamentoOut.from_orm(db_lancamento, incluir_parcelas=True).model_dump()
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Erro ao atualizar lançamento: {str(e)}")
 
 @app.delete("/api/lancamentos/{lancamento_id}")
-async def excluir_lancamento(lancamento_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def excluir_lancamento(lancamento_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     lancamento = db.query(Lancamento).filter(
         Lancamento.id == lancamento_id,
         Lancamento.usuario_id == current_user.id
@@ -2517,11 +2439,14 @@ async def excluir_lancamento(lancamento_id: int, current_user: User = Depends(en
         raise HTTPException(status_code=404, detail="Lançamento não encontrado")
     
     try:
+        meses_afetados = meses_do_lancamento(db, lancamento)
+
         # Excluir parcelas associadas
         db.query(Parcela).filter(Parcela.lancamento_id == lancamento_id).delete()
         
         # Excluir lançamento
         db.delete(lancamento)
+        recalcular_meses(db, current_user.id, meses_afetados)
         db.commit()
         return {"status": "ok", "message": "Lançamento e parcelas excluídos com sucesso"}
     except Exception as e:
@@ -2614,14 +2539,27 @@ class MetaOut(BaseModel):
     model_config = {
         "from_attributes": True
     }
-
-@app.patch("/api/parcelas/{parcela_id}/pagar")
-async def marcar_parcela_paga(parcela_id: int, dados: ParcelaPagamentoIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
-    from datetime import date as dt_date
     
-    parcela = db.query(Parcela).filter(
-        Parcela.id == parcela_id,
-        Parcela.usuario_id == current_user.id
+    @classmethod
+    def from_orm(cls, obj):
+        return cls(
+            id=obj.id,
+            ano=obj.ano,
+            mes=obj.mes,
+            tipo_lancamento_id=obj.tipo_lancamento_id,
+            valor_planejado=float(obj.valor_planejado),
+            descricao=obj.descricao,
+            created_at=obj.created_at.isoformat() if hasattr(obj.created_at, 'isoformat') else obj.created_at,
+            updated_at=obj.updated_at.isoformat() if obj.updated_at and hasattr(obj.updated_at, 'isoformat') else obj.updated_at
+        )
+
+@app.patch("/api/parcelas/{parcela_id}/pagar")
+def marcar_parcela_paga(parcela_id: int, dados: ParcelaPagamentoIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+    from datetime import date as dt_date
+    
+    parcela = db.query(Parcela).filter(
+        Parcela.id == parcela_id,
+        Parcela.usuario_id == current_user.id
     ).first()
     if not parcela:
         raise HTTPException(status_code=404, detail="Parcela não encontrada")
@@ -2638,6 +2576,7 @@ async def marcar_parcela_paga(parcela_id: int, dados: ParcelaPagamentoIn, curren
             raise HTTPException(status_code=400, detail=f"A forma de pagamento '{forma.nome}' está inativa")
     
     try:
+        meses_afetados = meses_de(parcela.data_pagamento)
         parcela.paga = 1 if dados.paga else 0
         
         if dados.paga:
@@ -2663,6 +2602,7 @@ async def marcar_parcela_paga(parcela_id: int, dados: ParcelaPagamentoIn, curren
             parcela.forma_pagamento_id = None
             parcela.observacao_pagamento = None
         
+        recalcular_meses(db, current_user.id, meses_afetados | meses_de(parcela.data_pagamento))
         db.commit()
         db.refresh(parcela)
         return ParcelaOut.from_orm(parcela)
@@ -2671,7 +2611,7 @@ async def marcar_parcela_paga(parcela_id: int, dados: ParcelaPagamentoIn, curren
         raise HTTPException(status_code=500, detail=f"Erro ao atualizar parcela: {str(e)}")
 
 @app.put("/api/parcelas/{parcela_id}")
-async def editar_parcela(parcela_id: int, dados: ParcelaEdicaoIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def editar_parcela(parcela_id: int, dados: ParcelaEdicaoIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     from datetime import date as dt_date
     
     parcela = db.query(Parcela).filter(
@@ -2682,12 +2622,15 @@ async def editar_parcela(parcela_id: int, dados: ParcelaEdicaoIn, current_user:
         raise HTTPException(status_code=404, detail="Parcela não encontrada")
     
     try:
+        meses_afetados = meses_de(parcela.data_vencimento, parcela.data_pagamento)
+
         # Atualiza data de vencimento
         parcela.data_vencimento = dt_date.fromisoformat(dados.data_vencimento)
         
         # Atualiza valor
         parcela.valor = "{:.2f}".format(dados.valor)
         
+        recalcular_meses(db, current_user.id, meses_afetados | meses_de(parcela.data_vencimento))
         db.commit()
         db.refresh(parcela)
         return ParcelaOut.from_orm(parcela)
@@ -2700,14 +2643,14 @@ async def editar_parcela(parcela_id: int, dados: ParcelaEdicaoIn, current_user:
 
 # Endpoints de Lançamentos Recorrentes
 @app.get("/api/recorrentes", response_model=List[LancamentoRecorrenteOut])
-async def listar_recorrentes(current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def listar_recorrentes(current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     recorrentes = db.query(LancamentoRecorrente).filter(
         LancamentoRecorrente.usuario_id == current_user.id
     ).order_by(LancamentoRecorrente.fornecedor).all()
     return [LancamentoRecorrenteOut.from_orm(r) for r in recorrentes]
 
 @app.post("/api/recorrentes", response_model=LancamentoRecorrenteOut)
-async def criar_recorrente(recorrente: LancamentoRecorrenteIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def criar_recorrente(recorrente: LancamentoRecorrenteIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     from datetime import date as dt_date
     
     # Validar tipo_lancamento_id se fornecido
@@ -2745,7 +2688,7 @@ async def criar_recorrente(recorrente: LancamentoRecorrenteIn, current_user: Use
         raise HTTPException(status_code=500, detail=f"Erro ao criar recorrente: {str(e)}")
 
 @app.put("/api/recorrentes/{recorrente_id}", response_model=LancamentoRecorrenteOut)
-async def atualizar_recorrente(recorrente_id: int, recorrente: LancamentoRecorrenteIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def atualizar_recorrente(recorrente_id: int, recorrente: LancamentoRecorrenteIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     from datetime import date as dt_date
     
     db_recorrente = db.query(LancamentoRecorrente).filter(
@@ -2783,7 +2726,7 @@ async def atualizar_recorrente(recorrente_id: int, recorrente: LancamentoRecorre
         raise HTTPException(status_code=500, detail=f"Erro ao atualizar recorrente: {str(e)}")
 
 @app.delete("/api/recorrentes/{recorrente_id}")
-async def excluir_recorrente(recorrente_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def excluir_recorrente(recorrente_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     recorrente = db.query(LancamentoRecorrente).filter(
         LancamentoRecorrente.id == recorrente_id,
         LancamentoRecorrente.usuario_id == current_user.id
@@ -2800,7 +2743,7 @@ async def excluir_recorrente(recorrente_id: int, current_user: User = Depends(en
         raise HTTPException(status_code=500, detail=f"Erro ao excluir recorrente: {str(e)}")
 
 @app.patch("/api/recorrentes/{recorrente_id}/toggle")
-async def toggle_recorrente(recorrente_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def toggle_recorrente(recorrente_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     recorrente = db.query(LancamentoRecorrente).filter(
         LancamentoRecorrente.id == recorrente_id,
         LancamentoRecorrente.usuario_id == current_user.id
@@ -2817,14 +2760,17 @@ async def toggle_recorrente(recorrente_id: int, current_user: User = Depends(ens
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Erro ao alternar recorrente: {str(e)}")
 
-@app.post("/api/recorrentes/{recorrente_id}/gerar")
-async def gerar_lancamento_recorrente(recorrente_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def gerar_de_recorrente(db: Session, usuario_id: int, recorrente_id: int) -> Lancamento:
+    """
+    Cria o lançamento (com parcelas) do próximo vencimento de um recorrente ativo
+    e atualiza o resumo mensal. Não faz commit: vale junto com a transação de
+    quem chama (endpoint ou job).
+    """
     from datetime import date as dt_date
-    from dateutil.relativedelta import relativedelta
     
     recorrente = db.query(LancamentoRecorrente).filter(
         LancamentoRecorrente.id == recorrente_id,
-        LancamentoRecorrente.usuario_id == current_user.id
+        LancamentoRecorrente.usuario_id == usuario_id
     ).first()
     if not recorrente:
         raise HTTPException(status_code=404, detail="Recorrente não encontrado")
@@ -2832,67 +2778,41 @@ async def gerar_lancamento_recorrente(recorrente_id: int, current_user: User = D
     if recorrente.ativo == 0:
         raise HTTPException(status_code=400, detail="Recorrente está inativo")
     
+    hoje = dt_date.today()
+    # Mesmas regras da geração agendada e da projeção do fluxo de caixa
+    cronograma = cronograma_da_geracao(recorrente, hoje)
+    
+    # Criar lançamento
+    novo_lancamento = Lancamento(
+        usuario_id=usuario_id,
+        data_lancamento=hoje,
+        tipo=recorrente.tipo,
+        tipo_lancamento_id=recorrente.tipo_lancamento_id,
+        fornecedor=recorrente.fornecedor,
+        valor_total=recorrente.valor_total,
+        data_primeiro_vencimento=cronograma[0].data_vencimento,
+        numero_parcelas=len(cronograma),
+        valor_medio_parcelas=valor_medio(recorrente.valor_total, len(cronograma)),
+        observacao=f"[AUTO-GERADO] {recorrente.observacao or ''}"
+    )
+    
+    db.add(novo_lancamento)
+    db.flush()
+    
+    # Gerar parcelas
+    inserir_parcelas(db, usuario_id, novo_lancamento.id, cronograma)
+    meses_afetados = meses_de(hoje, *[p.data_vencimento for p in cronograma])
+    
+    # Atualizar ultima_geracao
+    recorrente.ultima_geracao = hoje
+    
+    recalcular_meses(db, usuario_id, meses_afetados)
+    return novo_lancamento
+
+@app.post("/api/recorrentes/{recorrente_id}/gerar")
+def gerar_lancamento_recorrente(recorrente_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     try:
-        hoje = dt_date.today()
-        
-        # Calcular data do primeiro vencimento baseado na frequência
-        if recorrente.frequencia == "mensal":
-            # Próximo mês, no dia especificado
-            data_venc = dt_date(hoje.year, hoje.month, min(recorrente.dia_vencimento, 28))
-            if data_venc <= hoje:
-                data_venc = data_venc + relativedelta(months=1)
-        elif recorrente.frequencia == "trimestral":
-            # Próximo trimestre
-            data_venc = dt_date(hoje.year, hoje.month, min(recorrente.dia_vencimento, 28))
-            if data_venc <= hoje:
-                data_venc = data_venc + relativedelta(months=3)
-        else:  # anual
-            # Próximo ano
-            data_venc = dt_date(hoje.year, hoje.month, min(recorrente.dia_vencimento, 28))
-            if data_venc <= hoje:
-                data_venc = data_venc + relativedelta(years=1)
-        
-        # Criar lançamento
-        valor_medio = float(recorrente.valor_total) / recorrente.numero_parcelas
-        
-        novo_lancamento = Lancamento(
-            usuario_id=current_user.id,
-            data_lancamento=hoje,
-            tipo=recorrente.tipo,
-            tipo_lancamento_id=recorrente.tipo_lancamento_id,
-            fornecedor=recorrente.fornecedor,
-            valor_total=recorrente.valor_total,
-            data_primeiro_vencimento=data_venc,
-            numero_parcelas=recorrente.numero_parcelas,
-            valor_medio_parcelas="{:.2f}".format(valor_medio),
-            observacao=f"[AUTO-GERADO] {recorrente.observacao or ''}"
-        )
-        
-        db.add(novo_lancamento)
-        db.flush()
-        
-        # Gerar parcelas
-        for i in range(recorrente.numero_parcelas):
-            if recorrente.frequencia == "mensal":
-                data_parcela = data_venc + relativedelta(months=i)
-            elif recorrente.frequencia == "trimestral":
-                data_parcela = data_venc + relativedelta(months=i*3)
-            else:  # anual
-                data_parcela = data_venc + relativedelta(years=i)
-            
-            parcela = Parcela(
-                usuario_id=current_user.id,
-                lancamento_id=novo_lancamento.id,
-                numero_parcela=i + 1,
-                data_vencimento=data_parcela,
-                valor="{:.2f}".format(valor_medio),
-                paga=0
-            )
-            db.add(parcela)
-        
-        # Atualizar ultima_geracao
-        recorrente.ultima_geracao = hoje
-        
+        novo_lancamento = gerar_de_recorrente(db, current_user.id, recorrente_id)
         db.commit()
         db.refresh(novo_lancamento)
         
@@ -2900,12 +2820,15 @@ async def gerar_lancamento_recorrente(recorrente_id: int, current_user: User = D
             "message": "Lançamento gerado com sucesso",
             "lancamento_id": novo_lancamento.id
         }
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Erro ao gerar lançamento: {str(e)}")
 
 @app.get("/api/dashboard")
-async def obter_dashboard(
+@cache_por_versao("/api/dashboard")
+def obter_dashboard(
     tipo_data: Optional[str] = "vencimento",
     data_inicio: Optional[str] = None,
     data_fim: Optional[str] = None,
@@ -2943,257 +2866,81 @@ async def obter_dashboard(
             query = query.filter(Lancamento.tipo_lancamento_id.in_(tipos_ids))
         return query
     
-    # Se filtrar por data de pagamento, consultar as PARCELAS pagas
+    # Uma única agregação por modo: soma e contagem agrupadas por natureza e nome do
+    # tipo. Os totalizadores são o "rollup" desses grupos (cada lançamento pertence a
+    # um único tipo, então a soma das contagens distintas por grupo é a contagem total).
+    from sqlalchemy import literal
+    inicio = date.fromisoformat(data_inicio)
+    fim = date.fromisoformat(data_fim)
+    nome_tipo_coalesce = func.coalesce(TipoLancamento.nome, literal('Sem tipo'))
+
     if tipo_data == "pagamento":
-        # Totalizadores por parcelas PAGAS (usando valor_pago)
-        query_receitas = db.query(func.sum(Parcela.valor_pago)).join(
-            Lancamento, Parcela.lancamento_id == Lancamento.id
-        ).filter(
-            Lancamento.tipo == "receita",
-            Parcela.paga == 1,
-            Parcela.usuario_id == current_user.id,
-            Lancamento.usuario_id == current_user.id,
-            Parcela.data_pagamento >= date.fromisoformat(data_inicio),
-            Parcela.data_pagamento <= date.fromisoformat(data_fim)
-        )
-        query_receitas = aplicar_filtros_adicionais(query_receitas)
-        total_receitas = query_receitas.scalar() or 0
-        
-        query_despesas = db.query(func.sum(Parcela.valor_pago)).join(
-            Lancamento, Parcela.lancamento_id == Lancamento.id
-        ).filter(
-            Lancamento.tipo == "despesa",
-            Parcela.paga == 1,
-            Parcela.usuario_id == current_user.id,
-            Lancamento.usuario_id == current_user.id,
-            Parcela.data_pagamento >= date.fromisoformat(data_inicio),
-            Parcela.data_pagamento <= date.fromisoformat(data_fim)
-        )
-        query_despesas = aplicar_filtros_adicionais(query_despesas)
-        total_despesas = query_despesas.scalar() or 0
-        
-        # Contar parcelas únicas (por lançamento)
-        query_qtd_receitas = db.query(func.count(func.distinct(Parcela.lancamento_id))).join(
-            Lancamento, Parcela.lancamento_id == Lancamento.id
-        ).filter(
-            Lancamento.tipo == "receita",
-            Parcela.paga == 1,
-            Parcela.usuario_id == current_user.id,
-            Lancamento.usuario_id == current_user.id,
-            Parcela.data_pagamento >= date.fromisoformat(data_inicio),
-            Parcela.data_pagamento <= date.fromisoformat(data_fim)
-        )
-        query_qtd_receitas = aplicar_filtros_adicionais(query_qtd_receitas)
-        qtd_receitas = query_qtd_receitas.scalar() or 0
-        
-        query_qtd_despesas = db.query(func.count(func.distinct(Parcela.lancamento_id))).join(
-            Lancamento, Parcela.lancamento_id == Lancamento.id
-        ).filter(
-            Lancamento.tipo == "despesa",
-            Parcela.paga == 1,
-            Parcela.usuario_id == current_user.id,
-            Lancamento.usuario_id == current_user.id,
-            Parcela.data_pagamento >= date.fromisoformat(data_inicio),
-            Parcela.data_pagamento <= date.fromisoformat(data_fim)
-        )
-        query_qtd_despesas = aplicar_filtros_adicionais(query_qtd_despesas)
-        qtd_despesas = query_qtd_despesas.scalar() or 0
-        
-        # Despesas por tipo (somando parcelas pagas)
-        from sqlalchemy import literal
-        nome_tipo_coalesce = func.coalesce(TipoLancamento.nome, literal('Sem tipo'))
-        query_despesas_tipo = db.query(
-            nome_tipo_coalesce.label('nome'),
-            func.sum(Parcela.valor_pago).label("total")
-        ).join(
-            Lancamento, Parcela.lancamento_id == Lancamento.id
-        ).outerjoin(
-            TipoLancamento, Lancamento.tipo_lancamento_id == TipoLancamento.id
-        ).filter(
-            Lancamento.tipo == "despesa",
-            Parcela.paga == 1,
-            Parcela.usuario_id == current_user.id,
-            Lancamento.usuario_id == current_user.id,
-            Parcela.data_pagamento >= date.fromisoformat(data_inicio),
-            Parcela.data_pagamento <= date.fromisoformat(data_fim)
-        )
-        query_despesas_tipo = aplicar_filtros_adicionais(query_despesas_tipo)
-        despesas_por_tipo = query_despesas_tipo.group_by(nome_tipo_coalesce).all()
-        
-        # Receitas por tipo (somando parcelas pagas)
-        query_receitas_tipo = db.query(
+        # Parcelas PAGAS pela data de pagamento (usando valor_pago)
+        query = db.query(
+            Lancamento.tipo,
             nome_tipo_coalesce.label('nome'),
-            func.sum(Parcela.valor_pago).label("total")
-        ).join(
+            func.sum(Parcela.valor_pago).label('total'),
+            func.count(func.distinct(Parcela.lancamento_id)).label('qtd')
+        ).select_from(Parcela).join(
             Lancamento, Parcela.lancamento_id == Lancamento.id
-        ).outerjoin(
-            TipoLancamento, Lancamento.tipo_lancamento_id == TipoLancamento.id
         ).filter(
-            Lancamento.tipo == "receita",
             Parcela.paga == 1,
             Parcela.usuario_id == current_user.id,
             Lancamento.usuario_id == current_user.id,
-            Parcela.data_pagamento >= date.fromisoformat(data_inicio),
-            Parcela.data_pagamento <= date.fromisoformat(data_fim)
+            Parcela.data_pagamento >= inicio,
+            Parcela.data_pagamento <= fim
         )
-        query_receitas_tipo = aplicar_filtros_adicionais(query_receitas_tipo)
-        receitas_por_tipo = query_receitas_tipo.group_by(nome_tipo_coalesce).all()
-    
-    # Se filtrar por vencimento, consultar as PARCELAS
     elif tipo_data == "vencimento":
-        # Totalizadores por parcelas
-        query_rec_venc = db.query(func.sum(Parcela.valor)).join(
-            Lancamento, Parcela.lancamento_id == Lancamento.id
-        ).filter(
-            Lancamento.tipo == "receita",
-            Parcela.usuario_id == current_user.id,
-            Lancamento.usuario_id == current_user.id,
-            Parcela.data_vencimento >= date.fromisoformat(data_inicio),
-            Parcela.data_vencimento <= date.fromisoformat(data_fim)
-        )
-        query_rec_venc = aplicar_filtros_adicionais(query_rec_venc)
-        total_receitas = query_rec_venc.scalar() or 0
-        
-        query_desp_venc = db.query(func.sum(Parcela.valor)).join(
-            Lancamento, Parcela.lancamento_id == Lancamento.id
-        ).filter(
-            Lancamento.tipo == "despesa",
-            Parcela.usuario_id == current_user.id,
-            Lancamento.usuario_id == current_user.id,
-            Parcela.data_vencimento >= date.fromisoformat(data_inicio),
-            Parcela.data_vencimento <= date.fromisoformat(data_fim)
-        )
-        query_desp_venc = aplicar_filtros_adicionais(query_desp_venc)
-        total_despesas = query_desp_venc.scalar() or 0
-        
-        # Contar parcelas únicas (por lançamento)
-        query_qtd_rec_venc = db.query(func.count(func.distinct(Parcela.lancamento_id))).join(
-            Lancamento, Parcela.lancamento_id == Lancamento.id
-        ).filter(
-            Lancamento.tipo == "receita",
-            Parcela.usuario_id == current_user.id,
-            Lancamento.usuario_id == current_user.id,
-            Parcela.data_vencimento >= date.fromisoformat(data_inicio),
-            Parcela.data_vencimento <= date.fromisoformat(data_fim)
-        )
-        query_qtd_rec_venc = aplicar_filtros_adicionais(query_qtd_rec_venc)
-        qtd_receitas = query_qtd_rec_venc.scalar() or 0
-        
-        query_qtd_desp_venc = db.query(func.count(func.distinct(Parcela.lancamento_id))).join(
-            Lancamento, Parcela.lancamento_id == Lancamento.id
-        ).filter(
-            Lancamento.tipo == "despesa",
-            Parcela.usuario_id == current_user.id,
-            Lancamento.usuario_id == current_user.id,
-            Parcela.data_vencimento >= date.fromisoformat(data_inicio),
-            Parcela.data_vencimento <= date.fromisoformat(data_fim)
-        )
-        query_qtd_desp_venc = aplicar_filtros_adicionais(query_qtd_desp_venc)
-        qtd_despesas = query_qtd_desp_venc.scalar() or 0
-        
-        # Despesas por tipo (somando parcelas)
-        from sqlalchemy import literal
-        nome_tipo_coalesce = func.coalesce(TipoLancamento.nome, literal('Sem tipo'))
-        query_desp_tipo_venc = db.query(
-            nome_tipo_coalesce.label('nome'),
-            func.sum(Parcela.valor).label("total")
-        ).select_from(Parcela).join(
-            Lancamento, Parcela.lancamento_id == Lancamento.id
-        ).outerjoin(
-            TipoLancamento, Lancamento.tipo_lancamento_id == TipoLancamento.id
-        ).filter(
-            Lancamento.tipo == "despesa",
-            Parcela.usuario_id == current_user.id,
-            Lancamento.usuario_id == current_user.id,
-            Parcela.data_vencimento >= date.fromisoformat(data_inicio),
-            Parcela.data_vencimento <= date.fromisoformat(data_fim)
-        )
-        query_desp_tipo_venc = aplicar_filtros_adicionais(query_desp_tipo_venc)
-        despesas_por_tipo = query_desp_tipo_venc.group_by(nome_tipo_coalesce).all()
-        
-        # Receitas por tipo (somando parcelas)
-        query_rec_tipo_venc = db.query(
+        # Todas as parcelas pela data de vencimento
+        query = db.query(
+            Lancamento.tipo,
             nome_tipo_coalesce.label('nome'),
-            func.sum(Parcela.valor).label("total")
+            func.sum(Parcela.valor).label('total'),
+            func.count(func.distinct(Parcela.lancamento_id)).label('qtd')
         ).select_from(Parcela).join(
             Lancamento, Parcela.lancamento_id == Lancamento.id
-        ).outerjoin(
-            TipoLancamento, Lancamento.tipo_lancamento_id == TipoLancamento.id
         ).filter(
-            Lancamento.tipo == "receita",
             Parcela.usuario_id == current_user.id,
             Lancamento.usuario_id == current_user.id,
-            Parcela.data_vencimento >= date.fromisoformat(data_inicio),
-            Parcela.data_vencimento <= date.fromisoformat(data_fim)
+            Parcela.data_vencimento >= inicio,
+            Parcela.data_vencimento <= fim
         )
-        query_rec_tipo_venc = aplicar_filtros_adicionais(query_rec_tipo_venc)
-        receitas_por_tipo = query_rec_tipo_venc.group_by(nome_tipo_coalesce).all()
-    
     else:  # Filtrar por data de lançamento
-        campo_data = Lancamento.data_lancamento
-        
-        query = db.query(Lancamento).filter(
-            Lancamento.usuario_id == current_user.id,
-            campo_data >= date.fromisoformat(data_inicio),
-            campo_data <= date.fromisoformat(data_fim)
-        )
-        query = aplicar_filtros_adicionais(query)
-        
-        # Totalizadores
-        query_rec_lanc = db.query(func.sum(Lancamento.valor_total)).filter(
-            Lancamento.tipo == "receita",
-            Lancamento.usuario_id == current_user.id,
-            campo_data >= date.fromisoformat(data_inicio),
-            campo_data <= date.fromisoformat(data_fim)
-        )
-        query_rec_lanc = aplicar_filtros_adicionais(query_rec_lanc)
-        total_receitas = query_rec_lanc.scalar() or 0
-        
-        query_desp_lanc = db.query(func.sum(Lancamento.valor_total)).filter(
-            Lancamento.tipo == "despesa",
-            Lancamento.usuario_id == current_user.id,
-            campo_data >= date.fromisoformat(data_inicio),
-            campo_data <= date.fromisoformat(data_fim)
-        )
-        query_desp_lanc = aplicar_filtros_adicionais(query_desp_lanc)
-        total_despesas = query_desp_lanc.scalar() or 0
-        
-        # Contar lançamentos
-        qtd_receitas = query.filter(Lancamento.tipo == "receita").count()
-        qtd_despesas = query.filter(Lancamento.tipo == "despesa").count()
-        
-        # Despesas por tipo
-        from sqlalchemy import literal
-        nome_tipo_coalesce = func.coalesce(TipoLancamento.nome, literal('Sem tipo'))
-        query_desp_tipo_lanc = db.query(
-            nome_tipo_coalesce.label('nome'),
-            func.sum(Lancamento.valor_total).label("total")
-        ).outerjoin(
-            TipoLancamento, Lancamento.tipo_lancamento_id == TipoLancamento.id
-        ).filter(
-            Lancamento.tipo == "despesa",
-            Lancamento.usuario_id == current_user.id,
-            campo_data >= date.fromisoformat(data_inicio),
-            campo_data <= date.fromisoformat(data_fim)
-        )
-        query_desp_tipo_lanc = aplicar_filtros_adicionais(query_desp_tipo_lanc)
-        despesas_por_tipo = query_desp_tipo_lanc.group_by(nome_tipo_coalesce).all()
-        
-        # Receitas por tipo
-        query_rec_tipo_lanc = db.query(
+        query = db.query(
+            Lancamento.tipo,
             nome_tipo_coalesce.label('nome'),
-            func.sum(Lancamento.valor_total).label("total")
-        ).outerjoin(
-            TipoLancamento, Lancamento.tipo_lancamento_id == TipoLancamento.id
-        ).filter(
-            Lancamento.tipo == "receita",
+            func.sum(Lancamento.valor_total).label('total'),
+            func.count(Lancamento.id).label('qtd')
+        ).select_from(Lancamento).filter(
             Lancamento.usuario_id == current_user.id,
-            campo_data >= date.fromisoformat(data_inicio),
-            campo_data <= date.fromisoformat(data_fim)
+            Lancamento.data_lancamento >= inicio,
+            Lancamento.data_lancamento <= fim
         )
-        query_rec_tipo_lanc = aplicar_filtros_adicionais(query_rec_tipo_lanc)
-        receitas_por_tipo = query_rec_tipo_lanc.group_by(nome_tipo_coalesce).all()
-    
+
+    query = query.outerjoin(
+        TipoLancamento, Lancamento.tipo_lancamento_id == TipoLancamento.id
+    ).filter(
+        Lancamento.tipo.in_(("receita", "despesa"))
+    )
+    query = aplicar_filtros_adicionais(query)
+    grupos = query.group_by(Lancamento.tipo, nome_tipo_coalesce).order_by(
+        Lancamento.tipo, nome_tipo_coalesce
+    ).all()
+
+    total_receitas = total_despesas = 0
+    qtd_receitas = qtd_despesas = 0
+    receitas_por_tipo = []
+    despesas_por_tipo = []
+    for natureza_grupo, nome, total, qtd in grupos:
+        if natureza_grupo == "receita":
+            total_receitas += total or 0
+            qtd_receitas += qtd
+            receitas_por_tipo.append((nome, total))
+        else:
+            total_despesas += total or 0
+            qtd_despesas += qtd
+            despesas_por_tipo.append((nome, total))
+
     return {
         "periodo": {
             "tipo_data": tipo_data,
@@ -3212,7 +2959,8 @@ async def obter_dashboard(
     }
 
 @app.get("/api/dashboard/tabela-anual")
-async def obter_tabela_anual(
+@cache_por_versao("/api/dashboard/tabela-anual")
+def obter_tabela_anual(
     ano: int,
     tipo_data: Optional[str] = "vencimento",
     current_user: User = Depends(ensure_subscription),
@@ -3224,56 +2972,28 @@ async def obter_tabela_anual(
     - vencimento: considera todas as parcelas pela data de vencimento
     - pagamento: considera apenas parcelas pagas pela data de pagamento
     """
-    from datetime import date
-    from sqlalchemy import func, extract
-    
-    # Definir campo de data e filtros baseado no tipo_data
-    if tipo_data == "pagamento":
-        # Usar data de pagamento, apenas parcelas pagas
-        campo_data = Parcela.data_pagamento
-        campo_valor = Parcela.valor_pago
-        query = db.query(
-            TipoLancamento.id,
-            TipoLancamento.nome,
-            TipoLancamento.natureza,
-            extract('month', campo_data).label('mes'),
-            func.sum(campo_valor).label('total')
-        ).join(
-            Lancamento, Parcela.lancamento_id == Lancamento.id
-        ).join(
-            TipoLancamento, Lancamento.tipo_lancamento_id == TipoLancamento.id
-        ).filter(
-            Parcela.paga == 1,
-            Parcela.usuario_id == current_user.id,
-            Lancamento.usuario_id == current_user.id,
-            extract('year', campo_data) == ano
-        )
-    else:
-        # Usar data de vencimento, todas as parcelas
-        campo_data = Parcela.data_vencimento
-        campo_valor = Parcela.valor
-        query = db.query(
-            TipoLancamento.id,
-            TipoLancamento.nome,
-            TipoLancamento.natureza,
-            extract('month', campo_data).label('mes'),
-            func.sum(campo_valor).label('total')
-        ).join(
-            Lancamento, Parcela.lancamento_id == Lancamento.id
-        ).join(
-            TipoLancamento, Lancamento.tipo_lancamento_id == TipoLancamento.id
-        ).filter(
-            Parcela.usuario_id == current_user.id,
-            Lancamento.usuario_id == current_user.id,
-            extract('year', campo_data) == ano
-        )
+    from sqlalchemy import func
     
-    # Finalizar query
-    query = query.group_by(
+    # Lê do resumo mensal materializado (O(meses x tipos) linhas em vez de O(parcelas))
+    base = "pagamento" if tipo_data == "pagamento" else "vencimento"
+    garantir_resumo(db, current_user.id)
+    query = db.query(
+        TipoLancamento.id,
+        TipoLancamento.nome,
+        TipoLancamento.natureza,
+        ResumoMensal.mes,
+        func.sum(ResumoMensal.total).label('total')
+    ).select_from(ResumoMensal).join(
+        TipoLancamento, ResumoMensal.tipo_lancamento_id == TipoLancamento.id
+    ).filter(
+        ResumoMensal.usuario_id == current_user.id,
+        ResumoMensal.base == base,
+        ResumoMensal.ano == ano
+    ).group_by(
         TipoLancamento.id,
         TipoLancamento.nome,
         TipoLancamento.natureza,
-        extract('month', campo_data)
+        ResumoMensal.mes
     ).order_by(
         TipoLancamento.natureza.desc(),  # receitas primeiro
         TipoLancamento.nome
@@ -3291,7 +3011,7 @@ async def obter_tabela_anual(
                 "natureza": natureza,
                 "meses": {}
             }
-        tipos_dict[tipo_id]["meses"][int(mes)] = float(total)
+        tipos_dict[tipo_id]["meses"][int(mes)] = round(float(total), 2)
     
     # Converter para lista
     tipos_list = list(tipos_dict.values())
@@ -3303,7 +3023,8 @@ async def obter_tabela_anual(
     }
 
 @app.get("/api/relatorios/tabela-anual-pdf")
-async def exportar_tabela_anual_pdf(
+def exportar_tabela_anual_pdf(
+    request: Request,
     ano: int,
     tipo_data: Optional[str] = "vencimento",
     current_user: User = Depends(ensure_subscription),
@@ -3311,210 +3032,50 @@ async def exportar_tabela_anual_pdf(
 ):
     """
     Exporta a tabela anual em formato PDF.
+    O PDF é gerado no pool de processos e guardado em cache por versão dos dados
+    (ver app/relatorios_pdf.py); downloads repetidos saem do cache, com ETag.
     """
-    from reportlab.lib import colors
-    from reportlab.lib.pagesizes import A4, landscape
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import cm
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-    from io import BytesIO
-    
-    # Obter dados da tabela anual
-    dados_tabela = await obter_tabela_anual(ano, tipo_data, current_user, db)
-    
-    if not dados_tabela["tipos"]:
-        raise HTTPException(status_code=404, detail="Nenhum dado encontrado para este ano")
-    
-    # Criar buffer para o PDF
-    buffer = BytesIO()
-    
-    # Configurar documento PDF em paisagem (landscape)
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=landscape(A4),
-        rightMargin=1*cm,
-        leftMargin=1*cm,
-        topMargin=1.5*cm,
-        bottomMargin=1.5*cm
-    )
-    
-    # Elementos do PDF
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Título
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#0f172a'),
-        spaceAfter=12,
-        alignment=1  # Center
-    )
-    
-    tipo_data_label = "Pagamento" if tipo_data == "pagamento" else "Vencimento"
-    titulo = f"Resumo Anual {ano} - Por Data de {tipo_data_label}"
-    elements.append(Paragraph(titulo, title_style))
-    elements.append(Spacer(1, 0.5*cm))
-    
-    # Subtítulo com informação do tipo de data
-    subtitle_style = ParagraphStyle(
-        'Subtitle',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#64748b'),
-        spaceAfter=20,
-        alignment=1
-    )
-    
-    info_text = "Valores baseados na data de pagamento (apenas parcelas pagas)" if tipo_data == "pagamento" else "Valores baseados na data de vencimento (todas as parcelas)"
-    elements.append(Paragraph(info_text, subtitle_style))
-    elements.append(Spacer(1, 0.5*cm))
-    
-    # Preparar dados da tabela
-    meses = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
-    
-    # Cabeçalho da tabela
-    table_data = [['Tipo'] + meses + ['Total']]
-    
-    receitas = [t for t in dados_tabela["tipos"] if t["natureza"] == "receita"]
-    despesas = [t for t in dados_tabela["tipos"] if t["natureza"] == "despesa"]
-    
-    def formatar_valor(valor):
-        if valor == 0:
-            return "-"
-        return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-    
-    # Adicionar receitas
-    if receitas:
-        table_data.append(['RECEITAS'] + [''] * 13)
-        for tipo in receitas:
-            row = [tipo["nome"]]
-            total_tipo = 0
-            for mes in range(1, 13):
-                valor = tipo["meses"].get(mes, 0)
-                total_tipo += valor
-                row.append(formatar_valor(valor))
-            row.append(formatar_valor(total_tipo))
-            table_data.append(row)
-    
-    # Adicionar despesas
-    if despesas:
-        table_data.append(['DESPESAS'] + [''] * 13)
-        for tipo in despesas:
-            row = [tipo["nome"]]
-            total_tipo = 0
-            for mes in range(1, 13):
-                valor = tipo["meses"].get(mes, 0)
-                total_tipo += valor
-                row.append(formatar_valor(valor))
-            row.append(formatar_valor(total_tipo))
-            table_data.append(row)
-    
-    # Calcular totais mensais
-    totais_row = ['TOTAL GERAL']
-    total_geral = 0
-    for mes in range(1, 13):
-        total_mes = 0
-        for tipo in dados_tabela["tipos"]:
-            valor = tipo["meses"].get(mes, 0)
-            if tipo["natureza"] == "receita":
-                total_mes += valor
-            else:
-                total_mes -= valor
-        total_geral += total_mes
-        totais_row.append(formatar_valor(total_mes))
-    totais_row.append(formatar_valor(total_geral))
-    table_data.append(totais_row)
-    
-    # Criar tabela
-    table = Table(table_data, repeatRows=1)
-    
-    # Estilo da tabela
-    table_style = TableStyle([
-        # Cabeçalho
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#22d3ee')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#0f172a')),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-        
-        # Primeira coluna (nomes)
-        ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 1), (0, -1), 8),
-        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
+    chave = (current_user.id, "tabela-anual", ano, tipo_data, obter_versao(db, current_user.id))
+    etag = relatorios_pdf.CacheRelatorios.etag(chave)
+    cabecalhos = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_confere(request, etag):
+        return Response(status_code=304, headers=cabecalhos)
+    
+    conteudo = CACHE_PDF.obter(chave)
+    if conteudo is None:
+        # Obter dados da tabela anual
+        dados_tabela = obter_tabela_anual(ano, tipo_data, current_user, db)
         
-        # Valores numéricos
-        ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (1, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (1, 1), (-1, -1), 7),
+        if not dados_tabela["tipos"]:
+            raise HTTPException(status_code=404, detail="Nenhum dado encontrado para este ano")
         
-        # Última coluna (Total) em destaque
-        ('BACKGROUND', (-1, 1), (-1, -1), colors.HexColor('#f0f9ff')),
-        ('FONTNAME', (-1, 1), (-1, -1), 'Helvetica-Bold'),
-        
-        # Grid
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('TOPPADDING', (0, 1), (-1, -1), 4),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
-        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-    ])
-    
-    # Destacar linhas de seção (RECEITAS, DESPESAS)
-    row_idx = 1
-    if receitas:
-        table_style.add('BACKGROUND', (0, row_idx), (-1, row_idx), colors.HexColor('#dcfce7'))
-        table_style.add('FONTNAME', (0, row_idx), (-1, row_idx), 'Helvetica-Bold')
-        table_style.add('FONTSIZE', (0, row_idx), (-1, row_idx), 9)
-        row_idx += len(receitas) + 1
-    
-    if despesas:
-        table_style.add('BACKGROUND', (0, row_idx), (-1, row_idx), colors.HexColor('#fee2e2'))
-        table_style.add('FONTNAME', (0, row_idx), (-1, row_idx), 'Helvetica-Bold')
-        table_style.add('FONTSIZE', (0, row_idx), (-1, row_idx), 9)
-    
-    # Destacar linha de total geral
-    table_style.add('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#e0f2fe'))
-    table_style.add('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold')
-    table_style.add('FONTSIZE', (0, -1), (-1, -1), 9)
-    table_style.add('LINEABOVE', (0, -1), (-1, -1), 2, colors.HexColor('#22d3ee'))
-    
-    table.setStyle(table_style)
-    elements.append(table)
-    
-    # Adicionar rodapé
-    elements.append(Spacer(1, 0.5*cm))
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.HexColor('#94a3b8'),
-        alignment=1
-    )
-    footer_text = f"Relatório gerado em {datetime.now().strftime('%d/%m/%Y às %H:%M')} - Sistema Financeiro Pessoal"
-    elements.append(Paragraph(footer_text, footer_style))
-    
-    # Gerar PDF
-    doc.build(elements)
-    buffer.seek(0)
+        try:
+            conteudo = relatorios_pdf.renderizar(
+                current_user.id, relatorios_pdf.renderizar_tabela_anual, dados_tabela, ano, tipo_data
+            )
+        except relatorios_pdf.LimiteExcedido as e:
+            if e.motivo == "usuario":
+                raise HTTPException(status_code=429, detail="Já existe um relatório sendo gerado. Aguarde.",
+                                    headers={"Retry-After": "5"})
+            raise HTTPException(status_code=503, detail="Muitos relatórios em geração. Tente novamente.",
+                                headers={"Retry-After": "10"})
+        except TimeoutError:
+            raise HTTPException(status_code=504, detail="Tempo esgotado ao gerar o relatório")
+        CACHE_PDF.guardar(chave, conteudo)
     
     # Retornar PDF como resposta
     filename = f"relatorio_anual_{ano}_{tipo_data}.pdf"
-    return StreamingResponse(
-        buffer,
+    return Response(
+        content=conteudo,
         media_type="application/pdf",
         headers={
-            "Content-Disposition": f"attachment; filename={filename}"
+            "Content-Disposition": f"attachment; filename={filename}",
+            **cabecalhos
         }
     )
 
 @app.get("/api/relatorios/lancamentos-excel")
-async def exportar_lancamentos_excel(
+def exportar_lancamentos_excel(
     data_inicio: Optional[str] = None,
     data_fim: Optional[str] = None,
     tipo: Optional[str] = None,
@@ -3526,10 +3087,6 @@ async def exportar_lancamentos_excel(
     Exporta lançamentos financeiros em formato Excel (.xlsx).
     Permite filtrar por período, tipo (receita/despesa) e tipo de lançamento.
     """
-    import pandas as pd
-    from io import BytesIO
-    from datetime import datetime
-    
     # Query base
     query = db.query(
         Lancamento.id,
@@ -3561,90 +3118,53 @@ async def exportar_lancamentos_excel(
     if tipo_lancamento_id:
         query = query.filter(Lancamento.tipo_lancamento_id == tipo_lancamento_id)
     
-    query = query.order_by(Lancamento.data_lancamento.desc())
-    
-    lancamentos = query.all()
-    
-    if not lancamentos:
+    query = query.order_by(Lancamento.data_lancamento.desc()).yield_per(planilhas.TAMANHO_LOTE)
+    
+    colunas = [
+        planilhas.Coluna('ID', 8),
+        planilhas.Coluna('Data Lançamento', 18, planilhas.FORMATO_DATA),
+        planilhas.Coluna('Tipo', 15),
+        planilhas.Coluna('Categoria', 25),
+        planilhas.Coluna('Subcategoria', 20),
+        planilhas.Coluna('Fornecedor/Cliente', 30),
+        planilhas.Coluna('Valor Total', 15, planilhas.FORMATO_MOEDA),
+        planilhas.Coluna('Nº Parcelas', 12),
+        planilhas.Coluna('Valor Médio Parcela', 18, planilhas.FORMATO_MOEDA),
+        planilhas.Coluna('Primeiro Vencimento', 18, planilhas.FORMATO_DATA),
+        planilhas.Coluna('Observação', 40)
+    ]
+    linhas = ((
+        lanc.id,
+        lanc.data_lancamento,
+        '📈 Receita' if lanc.tipo == 'receita' else '📉 Despesa',
+        lanc.tipo_lancamento_nome or 'Sem categoria',
+        lanc.subtipo_lancamento_nome or '-',
+        lanc.fornecedor,
+        float(lanc.valor_total),
+        lanc.numero_parcelas,
+        float(lanc.valor_medio_parcelas),
+        lanc.data_primeiro_vencimento,
+        lanc.observacao or ''
+    ) for lanc in query)
+    
+    caminho, total = planilhas.gerar_xlsx('Lançamentos', colunas, linhas)
+    if total == 0:
+        caminho.unlink(missing_ok=True)
         raise HTTPException(status_code=404, detail="Nenhum lançamento encontrado com os filtros aplicados")
     
-    # Converter para DataFrame
-    data = []
-    for lanc in lancamentos:
-        data.append({
-            'ID': lanc.id,
-            'Data Lançamento': lanc.data_lancamento.strftime('%d/%m/%Y'),
-            'Tipo': '📈 Receita' if lanc.tipo == 'receita' else '📉 Despesa',
-            'Categoria': lanc.tipo_lancamento_nome or 'Sem categoria',
-            'Subcategoria': lanc.subtipo_lancamento_nome or '-',
-            'Fornecedor/Cliente': lanc.fornecedor,
-            'Valor Total': float(lanc.valor_total),
-            'Nº Parcelas': lanc.numero_parcelas,
-            'Valor Médio Parcela': float(lanc.valor_medio_parcelas),
-            'Primeiro Vencimento': lanc.data_primeiro_vencimento.strftime('%d/%m/%Y'),
-            'Observação': lanc.observacao or ''
-        })
-    
-    df = pd.DataFrame(data)
-    
-    # Criar arquivo Excel
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Lançamentos', index=False)
-        
-        # Formatar planilha
-        workbook = writer.book
-        worksheet = writer.sheets['Lançamentos']
-        
-        # Ajustar largura das colunas
-        column_widths = {
-            'A': 8,   # ID
-            'B': 18,  # Data Lançamento
-            'C': 15,  # Tipo
-            'D': 25,  # Categoria
-            'E': 20,  # Subcategoria
-            'F': 30,  # Fornecedor
-            'G': 15,  # Valor Total
-            'H': 12,  # Nº Parcelas
-            'I': 18,  # Valor Médio
-            'J': 18,  # Primeiro Venc
-            'K': 40   # Observação
-        }
-        for col, width in column_widths.items():
-            worksheet.column_dimensions[col].width = width
-        
-        # Formatar valores monetários
-        from openpyxl.styles import numbers
-        for row in range(2, len(df) + 2):
-            worksheet[f'G{row}'].number_format = 'R$ #,##0.00'
-            worksheet[f'I{row}'].number_format = 'R$ #,##0.00'
-        
-        # Estilo do cabeçalho
-        from openpyxl.styles import Font, PatternFill, Alignment
-        header_fill = PatternFill(start_color='22D3EE', end_color='22D3EE', fill_type='solid')
-        header_font = Font(bold=True, color='0F172A')
-        
-        for cell in worksheet[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    output.seek(0)
-    
     # Nome do arquivo
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     filename = f"lancamentos_{timestamp}.xlsx"
     
-    return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}"
-        }
+    return FileResponse(
+        path=str(caminho),
+        filename=filename,
+        media_type=planilhas.MEDIA_TYPE,
+        background=BackgroundTask(caminho.unlink, missing_ok=True)
     )
 
 @app.get("/api/relatorios/parcelas-excel")
-async def exportar_parcelas_excel(
+def exportar_parcelas_excel(
     data_inicio: Optional[str] = None,
     data_fim: Optional[str] = None,
     status: Optional[str] = None,  # "todas", "pagas", "pendentes"
@@ -3655,10 +3175,6 @@ async def exportar_parcelas_excel(
     Exporta parcelas em formato Excel (.xlsx).
     Permite filtrar por período e status de pagamento.
     """
-    import pandas as pd
-    from io import BytesIO
-    from datetime import datetime
-    
     # Query base
     query = db.query(
         Parcela.id,
@@ -3693,90 +3209,54 @@ async def exportar_parcelas_excel(
     elif status == "pendentes":
         query = query.filter(Parcela.paga == 0)
     
-    query = query.order_by(Parcela.data_vencimento.asc())
-    
-    parcelas = query.all()
-    
-    if not parcelas:
+    query = query.order_by(Parcela.data_vencimento.asc()).yield_per(planilhas.TAMANHO_LOTE)
+    
+    colunas = [
+        planilhas.Coluna('ID', 8),
+        planilhas.Coluna('Fornecedor/Cliente', 30),
+        planilhas.Coluna('Tipo', 15),
+        planilhas.Coluna('Categoria', 25),
+        planilhas.Coluna('Nº Parcela', 12),
+        planilhas.Coluna('Data Vencimento', 18, planilhas.FORMATO_DATA),
+        planilhas.Coluna('Valor', 15, planilhas.FORMATO_MOEDA),
+        planilhas.Coluna('Status', 15),
+        planilhas.Coluna('Data Pagamento', 18, planilhas.FORMATO_DATA),
+        planilhas.Coluna('Valor Pago', 15, planilhas.FORMATO_MOEDA),
+        planilhas.Coluna('Forma de Pagamento', 25)
+    ]
+    linhas = ((
+        parc.id,
+        parc.fornecedor,
+        '📈 Receita' if parc.tipo == 'receita' else '📉 Despesa',
+        parc.tipo_lancamento_nome or 'Sem categoria',
+        parc.numero_parcela,
+        parc.data_vencimento,
+        float(parc.valor),
+        '✅ Paga' if parc.paga else '⏳ Pendente',
+        parc.data_pagamento,
+        float(parc.valor_pago) if parc.valor_pago else 0.0,
+        parc.forma_pagamento_nome or ''
+    ) for parc in query)
+    
+    caminho, total = planilhas.gerar_xlsx('Parcelas', colunas, linhas)
+    if total == 0:
+        caminho.unlink(missing_ok=True)
         raise HTTPException(status_code=404, detail="Nenhuma parcela encontrada com os filtros aplicados")
     
-    # Converter para DataFrame
-    data = []
-    for parc in parcelas:
-        data.append({
-            'ID': parc.id,
-            'Fornecedor/Cliente': parc.fornecedor,
-            'Tipo': '📈 Receita' if parc.tipo == 'receita' else '📉 Despesa',
-            'Categoria': parc.tipo_lancamento_nome or 'Sem categoria',
-            'Nº Parcela': parc.numero_parcela,
-            'Data Vencimento': parc.data_vencimento.strftime('%d/%m/%Y'),
-            'Valor': float(parc.valor),
-            'Status': '✅ Paga' if parc.paga else '⏳ Pendente',
-            'Data Pagamento': parc.data_pagamento.strftime('%d/%m/%Y') if parc.data_pagamento else '',
-            'Valor Pago': float(parc.valor_pago) if parc.valor_pago else 0.0,
-            'Forma de Pagamento': parc.forma_pagamento_nome or ''
-        })
-    
-    df = pd.DataFrame(data)
-    
-    # Criar arquivo Excel
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Parcelas', index=False)
-        
-        # Formatar planilha
-        workbook = writer.book
-        worksheet = writer.sheets['Parcelas']
-        
-        # Ajustar largura das colunas
-        column_widths = {
-            'A': 8,   # ID
-            'B': 30,  # Fornecedor
-            'C': 15,  # Tipo
-            'D': 25,  # Categoria
-            'E': 12,  # Nº Parcela
-            'F': 18,  # Data Vencimento
-            'G': 15,  # Valor
-            'H': 15,  # Status
-            'I': 18,  # Data Pagamento
-            'J': 15,  # Valor Pago
-            'K': 25   # Forma de Pagamento
-        }
-        for col, width in column_widths.items():
-            worksheet.column_dimensions[col].width = width
-        
-        # Formatar valores monetários
-        from openpyxl.styles import numbers
-        for row in range(2, len(df) + 2):
-            worksheet[f'G{row}'].number_format = 'R$ #,##0.00'
-            worksheet[f'J{row}'].number_format = 'R$ #,##0.00'
-        
-        # Estilo do cabeçalho
-        from openpyxl.styles import Font, PatternFill, Alignment
-        header_fill = PatternFill(start_color='22D3EE', end_color='22D3EE', fill_type='solid')
-        header_font = Font(bold=True, color='0F172A')
-        
-        for cell in worksheet[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    output.seek(0)
-    
     # Nome do arquivo
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     filename = f"parcelas_{timestamp}.xlsx"
     
-    return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}"
-        }
+    return FileResponse(
+        path=str(caminho),
+        filename=filename,
+        media_type=planilhas.MEDIA_TYPE,
+        background=BackgroundTask(caminho.unlink, missing_ok=True)
     )
 
 @app.get("/api/dashboard/evolucao")
-async def obter_evolucao_mensal(
+@cache_por_versao("/api/dashboard/evolucao")
+def obter_evolucao_mensal(
     meses: int = 6,
     tipo_data: Optional[str] = "pagamento",
     natureza: Optional[str] = None,
@@ -3791,7 +3271,7 @@ async def obter_evolucao_mensal(
     - tipos: lista de ids separados por vírgula (opcional)
     """
     from datetime import date
-    from sqlalchemy import func, extract
+    from sqlalchemy import func
 
     if meses < 1:
         meses = 1
@@ -3823,65 +3303,30 @@ async def obter_evolucao_mensal(
     anos_meses.reverse()
     labels.reverse()
 
-    # Função auxiliar para construir query base
+    # Lê do resumo mensal materializado; o filtro por ano usa o índice e o
+    # filtro por ano*100+mes recorta os meses exatos do período.
+    base = tipo_data if tipo_data in ("pagamento", "vencimento") else "lancamento"
+    garantir_resumo(db, current_user.id)
+    chave_inicio = anos_meses[0][0] * 100 + anos_meses[0][1]
+    chave_fim = anos_meses[-1][0] * 100 + anos_meses[-1][1]
+
     def build_query(natureza_alvo: str):
-        if tipo_data == "pagamento":
-            campo_data = Parcela.data_pagamento
-            campo_valor = Parcela.valor_pago
-            q = db.query(
-                extract('year', campo_data).label('ano'),
-                extract('month', campo_data).label('mes'),
-                func.sum(campo_valor).label('total')
-            ).join(
-                Lancamento, Parcela.lancamento_id == Lancamento.id
-            ).filter(
-                Parcela.paga == 1,
-                Lancamento.tipo == natureza_alvo,
-                Parcela.usuario_id == current_user.id,
-                extract('year', campo_data) * 100 + extract('month', campo_data)
-                >= (anos_meses[0][0] * 100 + anos_meses[0][1]),
-                extract('year', campo_data) * 100 + extract('month', campo_data)
-                <= (anos_meses[-1][0] * 100 + anos_meses[-1][1])
-            )
-            if tipos_ids:
-                q = q.filter(Lancamento.tipo_lancamento_id.in_(tipos_ids))
-        elif tipo_data == "vencimento":
-            campo_data = Parcela.data_vencimento
-            campo_valor = Parcela.valor
-            q = db.query(
-                extract('year', campo_data).label('ano'),
-                extract('month', campo_data).label('mes'),
-                func.sum(campo_valor).label('total')
-            ).join(
-                Lancamento, Parcela.lancamento_id == Lancamento.id
-            ).filter(
-                Lancamento.tipo == natureza_alvo,
-                Parcela.usuario_id == current_user.id,
-                extract('year', campo_data) * 100 + extract('month', campo_data)
-                >= (anos_meses[0][0] * 100 + anos_meses[0][1]),
-                extract('year', campo_data) * 100 + extract('month', campo_data)
-                <= (anos_meses[-1][0] * 100 + anos_meses[-1][1])
-            )
-            if tipos_ids:
-                q = q.filter(Lancamento.tipo_lancamento_id.in_(tipos_ids))
-        else:  # lancamento
-            campo_data = Lancamento.data_lancamento
-            campo_valor = Lancamento.valor_total
-            q = db.query(
-                extract('year', campo_data).label('ano'),
-                extract('month', campo_data).label('mes'),
-                func.sum(campo_valor).label('total')
-            ).filter(
-                Lancamento.tipo == natureza_alvo,
-                Lancamento.usuario_id == current_user.id,
-                extract('year', campo_data) * 100 + extract('month', campo_data)
-                >= (anos_meses[0][0] * 100 + anos_meses[0][1]),
-                extract('year', campo_data) * 100 + extract('month', campo_data)
-                <= (anos_meses[-1][0] * 100 + anos_meses[-1][1])
-            )
-            if tipos_ids:
-                q = q.filter(Lancamento.tipo_lancamento_id.in_(tipos_ids))
-        return q.group_by('ano', 'mes').order_by('ano', 'mes')
+        q = db.query(
+            ResumoMensal.ano,
+            ResumoMensal.mes,
+            func.sum(ResumoMensal.total).label('total')
+        ).filter(
+            ResumoMensal.usuario_id == current_user.id,
+            ResumoMensal.base == base,
+            ResumoMensal.ano >= anos_meses[0][0],
+            ResumoMensal.ano <= anos_meses[-1][0],
+            ResumoMensal.ano * 100 + ResumoMensal.mes >= chave_inicio,
+            ResumoMensal.ano * 100 + ResumoMensal.mes <= chave_fim,
+            ResumoMensal.natureza == natureza_alvo
+        )
+        if tipos_ids:
+            q = q.filter(ResumoMensal.tipo_lancamento_id.in_(tipos_ids))
+        return q.group_by(ResumoMensal.ano, ResumoMensal.mes).order_by(ResumoMensal.ano, ResumoMensal.mes)
 
     # Executar queries
     receitas_rows = []
@@ -3892,8 +3337,8 @@ async def obter_evolucao_mensal(
         despesas_rows = build_query("despesa").all()
 
     # Mapear resultados (ano,mes) -> total
-    rec_map = {(int(a), int(m)): float(t or 0) for a, m, t in receitas_rows}
-    desp_map = {(int(a), int(m)): float(t or 0) for a, m, t in despesas_rows}
+    rec_map = {(int(a), int(m)): round(float(t or 0), 2) for a, m, t in receitas_rows}
+    desp_map = {(int(a), int(m)): round(float(t or 0), 2) for a, m, t in despesas_rows}
 
     receitas_series = []
     despesas_series = []
@@ -3909,10 +3354,13 @@ async def obter_evolucao_mensal(
     }
 
 @app.get("/api/dashboard/top-formas")
-async def obter_top_formas_pagamento(
+@cache_por_versao("/api/dashboard/top-formas")
+def obter_top_formas_pagamento(
     data_inicio: Optional[str] = None,
     data_fim: Optional[str] = None,
     limit: int = 3,
+    completo: bool = False,
+    meses_serie: int = 6,
     current_user: User = Depends(ensure_subscription),
     db: Session = Depends(get_db)
 ):
@@ -3921,6 +3369,12 @@ async def obter_top_formas_pagamento(
     
     - data_inicio/data_fim: período de análise (YYYY-MM-DD)
     - limit: número de formas a retornar (padrão 3)
+    - completo: retorna o ranking inteiro (ignora limit) e, para cada forma, a
+      série mensal dos últimos `meses_serie` meses até data_fim (sparkline)
+    
+    Os totais do período e do mês anterior saem de uma única consulta agrupada
+    (somas condicionais sobre o intervalo combinado); a série mensal, quando
+    pedida, de uma segunda. O custo não depende de limit.
     
     Retorna:
     {
@@ -3930,99 +3384,131 @@ async def obter_top_formas_pagamento(
                 "forma_nome": "Nubank",
                 "total_pago": 5000.50,
                 "quantidade_pagamentos": 25,
-                "variacao_mes_anterior": 15.5  # Percentual de variação
+                "total_mes_anterior": 4329.00,
+                "variacao_mes_anterior": 15.5,  # Percentual de variação
+                "serie": [...]  # só com completo=true
             },
             ...
         ],
         "periodo": {
             "data_inicio": "2025-10-01",
             "data_fim": "2025-10-31"
-        }
+        },
+        "serie_labels": ["2025-05", ...]  # só com completo=true
     }
     """
-    from sqlalchemy import func, extract
-    from datetime import date, timedelta
+    from sqlalchemy import func, extract, case, and_
+    from datetime import date
     from dateutil.relativedelta import relativedelta
     
     # Definir período padrão (mês atual)
-    if not data_fim:
-        data_fim = date.today().isoformat()
-    if not data_inicio:
-        fim_date = date.fromisoformat(data_fim)
-        inicio_date = fim_date.replace(day=1)
-        data_inicio = inicio_date.isoformat()
-    else:
-        inicio_date = date.fromisoformat(data_inicio)
+    try:
+        if not data_fim:
+            data_fim = date.today().isoformat()
         fim_date = date.fromisoformat(data_fim)
+        if not data_inicio:
+            inicio_date = fim_date.replace(day=1)
+            data_inicio = inicio_date.isoformat()
+        else:
+            inicio_date = date.fromisoformat(data_inicio)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datas inválidas")
     
     # Calcular período anterior para comparação
     mes_anterior_inicio = inicio_date - relativedelta(months=1)
     mes_anterior_fim = fim_date - relativedelta(months=1)
     
-    # Query principal: formas mais usadas no período atual
+    no_periodo = and_(Parcela.data_pagamento >= inicio_date, Parcela.data_pagamento <= fim_date)
+    no_mes_anterior = and_(Parcela.data_pagamento >= mes_anterior_inicio, Parcela.data_pagamento <= mes_anterior_fim)
+    total_pago = func.sum(case((no_periodo, Parcela.valor_pago), else_=0))
+    quantidade = func.sum(case((no_periodo, 1), else_=0))
+    
+    # Uma consulta: período atual e anterior como somas condicionais
     top_formas_query = db.query(
         FormaPagamento.id.label('forma_id'),
         FormaPagamento.nome.label('forma_nome'),
-        func.sum(Parcela.valor_pago).label('total_pago'),
-        func.count(Parcela.id).label('quantidade_pagamentos')
+        total_pago.label('total_pago'),
+        quantidade.label('quantidade_pagamentos'),
+        func.sum(case((no_mes_anterior, Parcela.valor_pago), else_=0)).label('total_anterior')
     ).join(
         Parcela, FormaPagamento.id == Parcela.forma_pagamento_id
     ).filter(
         Parcela.paga == 1,
-        Parcela.data_pagamento >= data_inicio,
-        Parcela.data_pagamento <= data_fim,
         Parcela.usuario_id == current_user.id,
+        Parcela.data_pagamento >= min(inicio_date, mes_anterior_inicio),
+        Parcela.data_pagamento <= fim_date,
         FormaPagamento.usuario_id == current_user.id
     ).group_by(
         FormaPagamento.id, FormaPagamento.nome
+    ).having(
+        quantidade > 0
     ).order_by(
-        func.sum(Parcela.valor_pago).desc()
-    ).limit(limit)
+        total_pago.desc(), FormaPagamento.id
+    )
+    if not completo:
+        top_formas_query = top_formas_query.limit(limit)
     
     top_formas = top_formas_query.all()
     
-    # Calcular variação para cada forma
     resultado = []
     for forma in top_formas:
-        # Valor do mês anterior
-        valor_mes_anterior = db.query(
-            func.sum(Parcela.valor_pago)
-        ).join(
-            FormaPagamento, FormaPagamento.id == Parcela.forma_pagamento_id
-        ).filter(
-            Parcela.paga == 1,
-            Parcela.forma_pagamento_id == forma.forma_id,
-            Parcela.data_pagamento >= mes_anterior_inicio.isoformat(),
-            Parcela.data_pagamento <= mes_anterior_fim.isoformat(),
-            Parcela.usuario_id == current_user.id,
-            FormaPagamento.usuario_id == current_user.id
-        ).scalar() or 0
+        total = float(forma.total_pago or 0)
+        valor_mes_anterior = float(forma.total_anterior or 0)
         
         # Calcular variação percentual
         variacao = 0
         if valor_mes_anterior > 0:
-            variacao = ((float(forma.total_pago) - float(valor_mes_anterior)) / float(valor_mes_anterior)) * 100
-        elif forma.total_pago > 0:
+            variacao = ((total - valor_mes_anterior) / valor_mes_anterior) * 100
+        elif total > 0:
             variacao = 100  # Novo (não existia no mês anterior)
         
         resultado.append({
             "forma_id": forma.forma_id,
             "forma_nome": forma.forma_nome,
-            "total_pago": float(forma.total_pago),
-            "quantidade_pagamentos": forma.quantidade_pagamentos,
+            "total_pago": total,
+            "quantidade_pagamentos": int(forma.quantidade_pagamentos),
+            "total_mes_anterior": valor_mes_anterior,
             "variacao_mes_anterior": round(variacao, 1)
         })
     
-    return {
+    resposta = {
         "top_formas": resultado,
         "periodo": {
             "data_inicio": data_inicio,
             "data_fim": data_fim
         }
     }
+    
+    if completo:
+        meses_serie = max(1, min(meses_serie, 24))
+        primeiro_mes = fim_date.replace(day=1) - relativedelta(months=meses_serie - 1)
+        anos_meses = [
+            ((primeiro_mes + relativedelta(months=i)).year, (primeiro_mes + relativedelta(months=i)).month)
+            for i in range(meses_serie)
+        ]
+        # Segunda consulta: totais mensais de todas as formas de uma vez
+        ano_col = extract('year', Parcela.data_pagamento)
+        mes_col = extract('month', Parcela.data_pagamento)
+        linhas = db.query(
+            Parcela.forma_pagamento_id, ano_col, mes_col, func.sum(Parcela.valor_pago)
+        ).filter(
+            Parcela.paga == 1,
+            Parcela.usuario_id == current_user.id,
+            Parcela.forma_pagamento_id.isnot(None),
+            Parcela.data_pagamento >= primeiro_mes,
+            Parcela.data_pagamento <= fim_date
+        ).group_by(Parcela.forma_pagamento_id, ano_col, mes_col).all()
+        
+        totais = {(fid, int(a), int(m)): round(float(t or 0), 2) for fid, a, m, t in linhas}
+        for item in resultado:
+            item["serie"] = [totais.get((item["forma_id"], a, m), 0.0) for a, m in anos_meses]
+        resposta["serie_labels"] = [f"{a}-{m:02d}" for a, m in anos_meses]
+    
+    return resposta
 
 @app.get("/api/dashboard/por-tipo-subtipo")
-async def obter_analise_hierarquica(
+@cache_por_versao("/api/dashboard/por-tipo-subtipo")
+def obter_analise_hierarquica(
     tipo_data: Optional[str] = "vencimento",
     data_inicio: Optional[str] = None,
     data_fim: Optional[str] = None,
@@ -4269,7 +3755,7 @@ async def obter_analise_hierarquica(
 # ========== ENDPOINTS DE BACKUP E VALIDAÇÃO ==========
 
 @app.post("/api/backup/criar")
-async def endpoint_criar_backup():
+def endpoint_criar_backup():
     """Cria um novo backup do banco de dados"""
     resultado = criar_backup()
     
@@ -4283,16 +3769,21 @@ async def endpoint_criar_backup():
     return resultado
 
 @app.get("/api/backup/listar")
-async def endpoint_listar_backups():
-    """Lista todos os backups disponíveis"""
-    backups = listar_backups()
+def endpoint_listar_backups(limite: int = 50, offset: int = 0):
+    """Lista os backups disponíveis (catálogo paginado, mais recentes primeiro)"""
+    limite = max(1, min(limite, 500))
+    offset = max(0, offset)
+    pagina = listar_backups(limite, offset)
     return {
-        "total": len(backups),
-        "backups": backups
+        "total": pagina["total"],
+        "tamanho_total": pagina["tamanho_total"],
+        "limite": limite,
+        "offset": offset,
+        "backups": pagina["backups"]
     }
 
 @app.post("/api/backup/restaurar/{filename}")
-async def endpoint_restaurar_backup(filename: str):
+def endpoint_restaurar_backup(filename: str):
     """Restaura banco de dados de um backup específico"""
     resultado = restaurar_backup(filename)
     
@@ -4302,7 +3793,7 @@ async def endpoint_restaurar_backup(filename: str):
     return resultado
 
 @app.delete("/api/backup/remover/{filename}")
-async def endpoint_remover_backup(filename: str):
+def endpoint_remover_backup(filename: str):
     """Remove um backup específico"""
     try:
         backup_path = BACKUP_DIR / filename
@@ -4310,7 +3801,7 @@ async def endpoint_remover_backup(filename: str):
         if not backup_path.exists():
             raise HTTPException(status_code=404, detail="Backup não encontrado")
         
-        backup_path.unlink()
+        backups_sqlite.remover_backup(backup_path)
         
         return {
             "success": True,
@@ -4321,8 +3812,46 @@ async def endpoint_remover_backup(filename: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/backup/snapshot")
+def endpoint_criar_snapshot(current_user: User = Depends(get_current_admin_user)):
+    """Cria snapshot incremental (só os blocos alterados são gravados) e aplica a retenção GFS"""
+    try:
+        resultado = DEPOSITO.criar_snapshot(Path(DB_PATH))
+        resultado["retencao"] = DEPOSITO.aplicar_retencao()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return resultado
+
+@app.get("/api/backup/snapshots")
+def endpoint_listar_snapshots(current_user: User = Depends(get_current_admin_user)):
+    """Lista os snapshots do depósito incremental"""
+    snapshots = [{
+        "nome": m["nome"],
+        "created_at": m["created_at"],
+        "tamanho": m["tamanho"],
+        "total_blocos": len(m["blocos"]),
+        "blocos_novos": m["blocos_novos"],
+        "bytes_novos": m["bytes_novos"],
+        "sha256": m["sha256"]
+    } for m in DEPOSITO.listar_manifestos()]
+    return {
+        "total": len(snapshots),
+        "snapshots": snapshots,
+        "deposito": DEPOSITO.estatisticas()
+    }
+
+@app.post("/api/backup/snapshots/{nome}/restaurar")
+def endpoint_restaurar_snapshot(nome: str, current_user: User = Depends(get_current_admin_user)):
+    """Remonta um snapshot e restaura o banco a partir dele"""
+    resultado = restaurar_snapshot(nome)
+    
+    if not resultado.get("success"):
+        raise HTTPException(status_code=500, detail=resultado.get("error"))
+    
+    return resultado
+
 @app.get("/api/backup/download/{filename}")
-async def endpoint_download_backup(filename: str):
+def endpoint_download_backup(filename: str):
     """Faz download de um backup específico"""
     backup_path = BACKUP_DIR / filename
     
@@ -4336,52 +3865,220 @@ async def endpoint_download_backup(filename: str):
     )
 
 @app.get("/api/exportar/json")
-async def endpoint_exportar_json(db: Session = Depends(get_db)):
-    """Exporta todos os dados em formato JSON"""
-    dados = exportar_dados_json(db)
-    
-    # Salvar arquivo JSON no diretório de backups
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    json_filename = f"export_{timestamp}.json"
-    json_path = BACKUP_DIR / json_filename
+def endpoint_exportar_json(
+    formato: str = "ndjson",
+    current_user: User = Depends(ensure_subscription),
+    db: Session = Depends(get_db)
+):
+    """
+    Exporta os dados do usuário em streaming (ver app/exportacao.py).
     
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(dados, f, indent=2, ensure_ascii=False)
+    - formato: "ndjson" (um registro JSON por linha) ou "zip" (um .ndjson por tabela + manifest.json)
+    """
+    if formato not in exportacao.FORMATOS:
+        raise HTTPException(status_code=400, detail="formato deve ser 'ndjson' ou 'zip'")
     
-    return {
-        "success": True,
-        "data": dados,
-        "saved_to": json_filename,
-        "path": str(json_path)
-    }
+    filename, media_type = exportacao.nome_arquivo(current_user.id, formato)
+    return StreamingResponse(
+        exportacao.exportar(db.get_bind(), current_user.id, formato),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}"
+        }
+    )
+
+# ========== JOBS EM SEGUNDO PLANO ==========
+
+class JobIn(BaseModel):
+    tipo: str = Field(..., description="exportacao | backup | integridade | recorrentes | recorrentes_agendados")
+    parametros: Dict[str, Any] = Field(default_factory=dict)
+
+def _buscar_job(db: Session, usuario_id: int, job_id: str) -> Job:
+    job = db.query(Job).filter(Job.id == job_id, Job.usuario_id == usuario_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+@app.post("/api/jobs")
+def criar_job(payload: JobIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+    """
+    Enfileira um trabalho longo e responde 202 na hora (ver app/jobs.py).
+    O andamento é consultado em /api/jobs/{id} (cabeçalho Location).
+    """
+    job = jobs.enfileirar(db, current_user, payload.tipo, payload.parametros)
+    return JSONResponse(
+        status_code=202,
+        content=jobs.job_out(job),
+        headers={"Location": f"/api/jobs/{job.id}"}
+    )
+
+@app.get("/api/jobs")
+def listar_jobs(limite: int = 20, current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
+    """Jobs recentes do usuário (mais novos primeiro)"""
+    limite = max(1, min(limite, 100))
+    registros = db.query(Job).filter(Job.usuario_id == current_user.id).order_by(
+        Job.criado_em.desc()
+    ).limit(limite).all()
+    return [jobs.job_out(job) for job in registros]
+
+@app.get("/api/jobs/{job_id}")
+def obter_job(job_id: str, current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
+    """Status, progresso e resultado de um job"""
+    return jobs.job_out(_buscar_job(db, current_user.id, job_id))
+
+@app.get("/api/jobs/{job_id}/artefato")
+def baixar_artefato_job(job_id: str, current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
+    """Download do arquivo gerado pelo job (até a expiração)"""
+    job = _buscar_job(db, current_user.id, job_id)
+    if job.status != "concluido" or not job.artefato:
+        raise HTTPException(status_code=404, detail="Job sem arquivo disponível")
+    caminho = Path(job.artefato)
+    if not caminho.exists():
+        raise HTTPException(status_code=410, detail="Arquivo do job expirado")
+    return FileResponse(
+        path=caminho,
+        filename=job.artefato_nome,
+        media_type=job.artefato_media_type or "application/octet-stream"
+    )
 
 @app.get("/api/diagnostico")
-async def endpoint_diagnostico(db: Session = Depends(get_db)):
-    """Executa diagnóstico de integridade dos dados"""
-    resultado = validar_integridade(db)
-    return resultado
+def endpoint_diagnostico(
+    incremental: bool = False,
+    current_user: User = Depends(ensure_subscription),
+    db: Session = Depends(get_db)
+):
+    """
+    Executa diagnóstico de integridade dos dados do usuário.
+    
+    - incremental: verifica só os lançamentos alterados desde o último diagnóstico
+    """
+    try:
+        return verificar_integridade(db, current_user.id, incremental=incremental)
+    except Exception as e:
+        db.rollback()
+        return {
+            "status": "erro",
+            "error": str(e)
+        }
 
 # ========== ENDPOINTS DE METAS E ORÇAMENTO ==========
 
+def status_meta(percentual: float) -> str:
+    """Classifica a realização de uma meta: até 90% dentro, até 100% atenção, acima excedido."""
+    if percentual <= 90:
+        return "dentro"
+    if percentual <= 100:
+        return "atencao"
+    return "excedido"
+
+def consultar_metas(db: Session, usuario_id: int, *filtros):
+    """Metas do usuário com nome/natureza do tipo na mesma consulta: [(Meta, TipoLancamento|None)]."""
+    from sqlalchemy import and_
+
+    return db.query(Meta, TipoLancamento).outerjoin(
+        TipoLancamento,
+        and_(TipoLancamento.id == Meta.tipo_lancamento_id, TipoLancamento.usuario_id == usuario_id)
+    ).filter(Meta.usuario_id == usuario_id, *filtros)
+
+def calcular_realizados(db: Session, usuario_id: int, periodos) -> Dict[tuple, float]:
+    """Valores realizados (pagos) de vários meses em uma consulta agrupada.
+
+    Lê o resumo mensal (base 'pagamento') agrupado por (ano, mes, tipo), juntando
+    os tipos para aplicar a mesma regra de calcular_valor_realizado: meta de um
+    tipo conta só a natureza do tipo; meta geral (tipo None) soma tudo.
+    Retorna {(ano, mes, tipo_lancamento_id ou None): valor}.
+    """
+    from sqlalchemy import case, or_
+
+    periodos = set(periodos)
+    if not periodos:
+        return {}
+    garantir_resumo(db, usuario_id)
+    anos = {ano for ano, _ in periodos}
+    chaves = {ano * 100 + mes for ano, mes in periodos}
+
+    mesma_natureza = or_(
+        TipoLancamento.natureza.notin_(("despesa", "receita")),
+        TipoLancamento.natureza.is_(None),
+        ResumoMensal.natureza == TipoLancamento.natureza
+    )
+    linhas = db.query(
+        ResumoMensal.ano,
+        ResumoMensal.mes,
+        ResumoMensal.tipo_lancamento_id,
+        func.sum(ResumoMensal.total),
+        func.sum(case((mesma_natureza, ResumoMensal.total), else_=0))
+    ).outerjoin(
+        TipoLancamento, TipoLancamento.id == ResumoMensal.tipo_lancamento_id
+    ).filter(
+        ResumoMensal.usuario_id == usuario_id,
+        ResumoMensal.base == "pagamento",
+        ResumoMensal.ano.in_(anos),
+        (ResumoMensal.ano * 100 + ResumoMensal.mes).in_(chaves)
+    ).group_by(ResumoMensal.ano, ResumoMensal.mes, ResumoMensal.tipo_lancamento_id).all()
+
+    realizados: Dict[tuple, float] = {}
+    for ano, mes, tipo_id, total, total_tipo in linhas:
+        geral = (int(ano), int(mes), None)
+        realizados[geral] = realizados.get(geral, 0.0) + float(total or 0)
+        if tipo_id is not None:
+            realizados[(int(ano), int(mes), tipo_id)] = float(total_tipo or 0)
+    return {chave: round(valor, 2) for chave, valor in realizados.items()}
+
+def montar_meta_out(meta: Meta, tipo: Optional[TipoLancamento], valor_realizado: float) -> dict:
+    """MetaOut com tipo, realizado, percentual e status."""
+    meta_dict = MetaOut.from_orm(meta).model_dump()
+    if meta.tipo_lancamento_id:
+        if tipo:
+            meta_dict["tipo_nome"] = tipo.nome
+            meta_dict["tipo_natureza"] = tipo.natureza
+    else:
+        meta_dict["tipo_nome"] = "Geral"
+        meta_dict["tipo_natureza"] = "ambos"
+
+    meta_dict["valor_realizado"] = valor_realizado
+    if float(meta.valor_planejado) > 0:
+        percentual = (valor_realizado / float(meta.valor_planejado)) * 100
+        meta_dict["percentual_realizado"] = round(percentual, 2)
+        meta_dict["status"] = status_meta(percentual)
+    else:
+        meta_dict["percentual_realizado"] = 0
+        meta_dict["status"] = "dentro"
+    return meta_dict
+
+def enriquecer_metas(db: Session, usuario_id: int, linhas) -> List[dict]:
+    """Aplica montar_meta_out a [(Meta, TipoLancamento)] com uma única consulta de realizados."""
+    realizados = calcular_realizados(db, usuario_id, {(meta.ano, meta.mes) for meta, _ in linhas})
+    return [
+        montar_meta_out(meta, tipo, realizados.get((meta.ano, meta.mes, meta.tipo_lancamento_id or None), 0.0))
+        for meta, tipo in linhas
+    ]
+
+def verificar_meta_duplicada(db: Session, usuario_id: int, meta: "MetaIn", ignorar_id: Optional[int] = None):
+    query = db.query(Meta.id).filter(
+        Meta.usuario_id == usuario_id,
+        Meta.ano == meta.ano,
+        Meta.mes == meta.mes,
+        Meta.tipo_lancamento_id == meta.tipo_lancamento_id
+    )
+    if ignorar_id is not None:
+        query = query.filter(Meta.id != ignorar_id)
+    return query.first() is not None
+
 @app.post("/api/metas", response_model=MetaOut)
-async def criar_meta(meta: MetaIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def criar_meta(meta: MetaIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     """Cria uma nova meta mensal"""
     from datetime import date as dt_date
     
     # Verificar se já existe meta para este mês/ano/tipo
-    meta_existente = db.query(Meta).filter(
-        Meta.ano == meta.ano,
-        Meta.mes == meta.mes,
-        Meta.tipo_lancamento_id == meta.tipo_lancamento_id
-    ).first()
-    
-    if meta_existente:
+    if verificar_meta_duplicada(db, current_user.id, meta):
         raise HTTPException(
             status_code=400, 
             detail=f"Já existe uma meta para {meta.mes}/{meta.ano} neste tipo de lançamento"
         )
     
     nova_meta = Meta(
+        usuario_id=current_user.id,
         ano=meta.ano,
         mes=meta.mes,
         tipo_lancamento_id=meta.tipo_lancamento_id,
@@ -4395,9 +4092,9 @@ async def criar_meta(meta: MetaIn, current_user: User = Depends(ensure_subscript
     db.refresh(nova_meta)
     
     # Carregar informações do tipo
-    meta_out = MetaOut.model_validate(nova_meta)
+    meta_out = MetaOut.from_orm(nova_meta)
     if nova_meta.tipo_lancamento_id:
-        tipo = db.query(TipoLancamento).filter(TipoLancamento.id == nova_meta.tipo_lancamento_id).first()
+        tipo = get_user_record(db, TipoLancamento, nova_meta.tipo_lancamento_id, current_user.id)
         if tipo:
             meta_out.tipo_nome = tipo.nome
             meta_out.tipo_natureza = tipo.natureza
@@ -4405,119 +4102,47 @@ async def criar_meta(meta: MetaIn, current_user: User = Depends(ensure_subscript
     return meta_out
 
 @app.get("/api/metas")
-async def listar_metas(
+def listar_metas(
     ano: Optional[int] = None,
     mes: Optional[int] = None,
     tipo_lancamento_id: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Lista metas com filtros opcionais"""
-    query = db.query(Meta)
-    
+    """Lista metas com filtros opcionais (tipo e realizado calculados em lote)"""
+    filtros = []
     if ano:
-        query = query.filter(Meta.ano == ano)
+        filtros.append(Meta.ano == ano)
     if mes:
-        query = query.filter(Meta.mes == mes)
+        filtros.append(Meta.mes == mes)
     if tipo_lancamento_id:
-        query = query.filter(Meta.tipo_lancamento_id == tipo_lancamento_id)
-    
-    metas = query.order_by(Meta.ano.desc(), Meta.mes.desc()).all()
-    
-    # Enriquecer com informações de tipo e realização
-    resultado = []
-    for meta in metas:
-        meta_dict = MetaOut.model_validate(meta).model_dump()
-        
-        # Adicionar nome do tipo
-        if meta.tipo_lancamento_id:
-            tipo = db.query(TipoLancamento).filter(TipoLancamento.id == meta.tipo_lancamento_id).first()
-            if tipo:
-                meta_dict["tipo_nome"] = tipo.nome
-                meta_dict["tipo_natureza"] = tipo.natureza
-        else:
-            meta_dict["tipo_nome"] = "Geral"
-            meta_dict["tipo_natureza"] = "ambos"
-        
-        # Calcular valor realizado
-        valor_realizado = calcular_valor_realizado(
-            db, meta.ano, meta.mes, meta.tipo_lancamento_id
-        )
-        meta_dict["valor_realizado"] = valor_realizado
-        
-        # Calcular percentual e status
-        if float(meta.valor_planejado) > 0:
-            percentual = (valor_realizado / float(meta.valor_planejado)) * 100
-            meta_dict["percentual_realizado"] = round(percentual, 2)
-            
-            if percentual <= 90:
-                meta_dict["status"] = "dentro"
-            elif percentual <= 100:
-                meta_dict["status"] = "atencao"
-            else:
-                meta_dict["status"] = "excedido"
-        else:
-            meta_dict["percentual_realizado"] = 0
-            meta_dict["status"] = "dentro"
-        
-        resultado.append(meta_dict)
+        filtros.append(Meta.tipo_lancamento_id == tipo_lancamento_id)
     
-    return resultado
+    linhas = consultar_metas(db, current_user.id, *filtros).order_by(Meta.ano.desc(), Meta.mes.desc()).all()
+    return enriquecer_metas(db, current_user.id, linhas)
 
 @app.get("/api/metas/{meta_id}")
-async def obter_meta(meta_id: int, db: Session = Depends(get_db)):
+def obter_meta(meta_id: int, current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
     """Obtém uma meta específica com progresso"""
-    meta = db.query(Meta).filter(Meta.id == meta_id).first()
+    linha = consultar_metas(db, current_user.id, Meta.id == meta_id).first()
     
-    if not meta:
+    if not linha:
         raise HTTPException(status_code=404, detail="Meta não encontrada")
     
-    meta_dict = MetaOut.model_validate(meta).model_dump()
-    
-    # Adicionar informações do tipo
-    if meta.tipo_lancamento_id:
-        tipo = db.query(TipoLancamento).filter(TipoLancamento.id == meta.tipo_lancamento_id).first()
-        if tipo:
-            meta_dict["tipo_nome"] = tipo.nome
-            meta_dict["tipo_natureza"] = tipo.natureza
-    
-    # Calcular realização
-    valor_realizado = calcular_valor_realizado(
-        db, meta.ano, meta.mes, meta.tipo_lancamento_id
-    )
-    meta_dict["valor_realizado"] = valor_realizado
-    
-    if float(meta.valor_planejado) > 0:
-        percentual = (valor_realizado / float(meta.valor_planejado)) * 100
-        meta_dict["percentual_realizado"] = round(percentual, 2)
-        
-        if percentual <= 90:
-            meta_dict["status"] = "dentro"
-        elif percentual <= 100:
-            meta_dict["status"] = "atencao"
-        else:
-            meta_dict["status"] = "excedido"
-    
-    return meta_dict
+    return enriquecer_metas(db, current_user.id, [linha])[0]
 
 @app.put("/api/metas/{meta_id}")
-async def atualizar_meta(meta_id: int, meta: MetaIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def atualizar_meta(meta_id: int, meta: MetaIn, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     """Atualiza uma meta existente"""
     from datetime import date as dt_date
     
-    meta_db = db.query(Meta).filter(Meta.id == meta_id).first()
+    meta_db = get_user_record(db, Meta, meta_id, current_user.id)
     
     if not meta_db:
         raise HTTPException(status_code=404, detail="Meta não encontrada")
     
     # Verificar duplicação (exceto a própria meta)
-    meta_duplicada = db.query(Meta).filter(
-        Meta.id != meta_id,
-        Meta.ano == meta.ano,
-        Meta.mes == meta.mes,
-        Meta.tipo_lancamento_id == meta.tipo_lancamento_id
-    ).first()
-    
-    if meta_duplicada:
+    if verificar_meta_duplicada(db, current_user.id, meta, ignorar_id=meta_id):
         raise HTTPException(
             status_code=400,
             detail="Já existe outra meta para este período e tipo"
@@ -4533,12 +4158,12 @@ async def atualizar_meta(meta_id: int, meta: MetaIn, current_user: User = Depend
     db.commit()
     db.refresh(meta_db)
     
-    return MetaOut.model_validate(meta_db)
+    return MetaOut.from_orm(meta_db)
 
 @app.delete("/api/metas/{meta_id}")
-async def deletar_meta(meta_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
+def deletar_meta(meta_id: int, current_user: User = Depends(ensure_subscription), db: Session = Depends(get_db)):
     """Deleta uma meta"""
-    meta = db.query(Meta).filter(Meta.id == meta_id).first()
+    meta = get_user_record(db, Meta, meta_id, current_user.id)
     
     if not meta:
         raise HTTPException(status_code=404, detail="Meta não encontrada")
@@ -4549,11 +4174,11 @@ async def deletar_meta(meta_id: int, current_user: User = Depends(ensure_subscri
     return {"success": True, "message": "Meta deletada com sucesso"}
 
 @app.get("/api/metas/progresso/{ano}/{mes}")
-async def obter_progresso_mes(ano: int, mes: int, db: Session = Depends(get_db)):
+def obter_progresso_mes(ano: int, mes: int, current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
     """Obtém progresso geral do mês comparando metas vs realizado"""
-    metas = db.query(Meta).filter(Meta.ano == ano, Meta.mes == mes).all()
+    linhas = consultar_metas(db, current_user.id, Meta.ano == ano, Meta.mes == mes).all()
     
-    if not metas:
+    if not linhas:
         return {
             "ano": ano,
             "mes": mes,
@@ -4568,33 +4193,21 @@ async def obter_progresso_mes(ano: int, mes: int, db: Session = Depends(get_db))
     total_realizado = 0
     metas_detalhes = []
     
-    for meta in metas:
-        valor_realizado = calcular_valor_realizado(
-            db, meta.ano, meta.mes, meta.tipo_lancamento_id
-        )
-        
-        planejado = float(meta.valor_planejado)
+    for meta_dict in enriquecer_metas(db, current_user.id, linhas):
+        planejado = meta_dict["valor_planejado"]
+        valor_realizado = meta_dict["valor_realizado"]
         total_planejado += planejado
         total_realizado += valor_realizado
-        
         percentual = (valor_realizado / planejado * 100) if planejado > 0 else 0
         
-        tipo_nome = "Geral"
-        tipo_natureza = "ambos"
-        if meta.tipo_lancamento_id:
-            tipo = db.query(TipoLancamento).filter(TipoLancamento.id == meta.tipo_lancamento_id).first()
-            if tipo:
-                tipo_nome = tipo.nome
-                tipo_natureza = tipo.natureza
-        
         metas_detalhes.append({
-            "id": meta.id,
-            "tipo_nome": tipo_nome,
-            "tipo_natureza": tipo_natureza,
+            "id": meta_dict["id"],
+            "tipo_nome": meta_dict["tipo_nome"] or "Geral",
+            "tipo_natureza": meta_dict["tipo_natureza"] or "ambos",
             "valor_planejado": planejado,
             "valor_realizado": valor_realizado,
             "percentual": round(percentual, 2),
-            "status": "dentro" if percentual <= 90 else "atencao" if percentual <= 100 else "excedido"
+            "status": status_meta(percentual)
         })
     
     percentual_geral = (total_realizado / total_planejado * 100) if total_planejado > 0 else 0
@@ -4606,35 +4219,109 @@ async def obter_progresso_mes(ano: int, mes: int, db: Session = Depends(get_db))
         "total_planejado": total_planejado,
         "total_realizado": total_realizado,
         "percentual_geral": round(percentual_geral, 2),
-        "status_geral": "dentro" if percentual_geral <= 90 else "atencao" if percentual_geral <= 100 else "excedido",
+        "status_geral": status_meta(percentual_geral),
         "metas": metas_detalhes
     }
 
-def calcular_valor_realizado(db: Session, ano: int, mes: int, tipo_lancamento_id: Optional[int]) -> float:
-    """Calcula valor realizado (pago) para um período e tipo"""
-    from sqlalchemy import extract
+@app.get("/api/metas/progresso/{ano}")
+def obter_progresso_ano(ano: int, current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
+    """
+    Grade planejado vs realizado do ano inteiro em uma chamada.
     
-    query = db.query(func.sum(Parcela.valor_pago)).join(
-        Lancamento, Parcela.lancamento_id == Lancamento.id
-    ).filter(
-        Parcela.paga == 1,
-        extract('year', Parcela.data_pagamento) == ano,
-        extract('month', Parcela.data_pagamento) == mes
-    )
+    Uma linha por tipo com meta no ano (ou "Geral"), com as listas de 12 meses
+    `planejado` (None sem meta no mês), `realizado` e `percentual`; e os
+    totais de cada mês considerando só os meses/tipos que têm meta.
+    """
+    linhas = consultar_metas(db, current_user.id, Meta.ano == ano).order_by(Meta.mes).all()
+    realizados = calcular_realizados(db, current_user.id, {(ano, m) for m in range(1, 13)})
+    
+    grade: Dict[Optional[int], dict] = {}
+    for meta, tipo in linhas:
+        tipo_id = meta.tipo_lancamento_id or None
+        if tipo_id not in grade:
+            grade[tipo_id] = {
+                "tipo_lancamento_id": tipo_id,
+                "tipo_nome": (tipo.nome if tipo else None) if tipo_id else "Geral",
+                "tipo_natureza": (tipo.natureza if tipo else None) if tipo_id else "ambos",
+                "meta_ids": [None] * 12,
+                "planejado": [None] * 12,
+                "realizado": [realizados.get((ano, m, tipo_id), 0.0) for m in range(1, 13)],
+                "percentual": [None] * 12,
+            }
+        linha = grade[tipo_id]
+        i = meta.mes - 1
+        planejado = float(meta.valor_planejado)
+        linha["meta_ids"][i] = meta.id
+        linha["planejado"][i] = planejado
+        linha["percentual"][i] = round(linha["realizado"][i] / planejado * 100, 2) if planejado > 0 else 0
+    
+    meses = []
+    for i in range(12):
+        planejado = sum(l["planejado"][i] for l in grade.values() if l["planejado"][i] is not None)
+        realizado = sum(l["realizado"][i] for l in grade.values() if l["planejado"][i] is not None)
+        percentual = (realizado / planejado * 100) if planejado > 0 else 0
+        meses.append({
+            "mes": i + 1,
+            "total_planejado": round(planejado, 2),
+            "total_realizado": round(realizado, 2),
+            "percentual": round(percentual, 2),
+            "status": status_meta(percentual) if planejado > 0 else None
+        })
+    
+    total_planejado = sum(m["total_planejado"] for m in meses)
+    total_realizado = sum(m["total_realizado"] for m in meses)
+    percentual_geral = (total_realizado / total_planejado * 100) if total_planejado > 0 else 0
+    
+    return {
+        "ano": ano,
+        "tem_metas": bool(linhas),
+        "linhas": list(grade.values()),
+        "meses": meses,
+        "total_planejado": round(total_planejado, 2),
+        "total_realizado": round(total_realizado, 2),
+        "percentual_geral": round(percentual_geral, 2)
+    }
+
+def calcular_valor_realizado(
+    db: Session, ano: int, mes: int, tipo_lancamento_id: Optional[int], usuario_id: Optional[int] = None
+) -> float:
+    """Calcula valor realizado (pago) para um período e tipo.
+
+    Com usuario_id, lê do resumo mensal materializado (base 'pagamento').
+    """
+    if usuario_id is not None:
+        garantir_resumo(db, usuario_id)
+        query = db.query(func.sum(ResumoMensal.total)).filter(
+            ResumoMensal.usuario_id == usuario_id,
+            ResumoMensal.base == "pagamento",
+            ResumoMensal.ano == ano,
+            ResumoMensal.mes == mes
+        )
+        coluna_tipo, coluna_natureza = ResumoMensal.tipo_lancamento_id, ResumoMensal.natureza
+    else:
+        inicio_mes, fim_mes = intervalo_meses(ano, mes, ano, mes)
+        query = db.query(func.sum(Parcela.valor_pago)).join(
+            Lancamento, Parcela.lancamento_id == Lancamento.id
+        ).filter(
+            Parcela.paga == 1,
+            Parcela.data_pagamento >= inicio_mes,
+            Parcela.data_pagamento < fim_mes
+        )
+        coluna_tipo, coluna_natureza = Lancamento.tipo_lancamento_id, Lancamento.tipo
     
     if tipo_lancamento_id:
         # Meta específica para um tipo
-        query = query.filter(Lancamento.tipo_lancamento_id == tipo_lancamento_id)
+        query = query.filter(coluna_tipo == tipo_lancamento_id)
         
         # Verificar se é despesa ou receita para considerar apenas um lado
         tipo = db.query(TipoLancamento).filter(TipoLancamento.id == tipo_lancamento_id).first()
         if tipo and tipo.natureza == "despesa":
-            query = query.filter(Lancamento.tipo == "despesa")
+            query = query.filter(coluna_natureza == "despesa")
         elif tipo and tipo.natureza == "receita":
-            query = query.filter(Lancamento.tipo == "receita")
+            query = query.filter(coluna_natureza == "receita")
     
     total = query.scalar() or 0
-    return float(total)
+    return round(float(total), 2)
 
 @app.get("/health")
 def health():
@@ -2,7 +2,7 @@
 Middleware de Autenticação
 Dependências para proteger rotas
 """
-from fastapi import Depends, HTTPException, status, Cookie
+from fastapi import Depends, HTTPException, status, Cookie, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from typing import Optional, Any
@@ -17,7 +17,12 @@ security = HTTPBearer(auto_error=False)
 # ============================================================================
 
 def get_db():
-    """Fornece uma sessão de banco via import tardio para evitar importação circular."""
+    """Fornece uma sessão de banco via import tardio para evitar importação circular.
+
+    É a única dependência de sessão da aplicação (app.main reexporta esta função):
+    o FastAPI a resolve uma vez por requisição, então guard de assinatura,
+    autenticação e handler compartilham a mesma sessão.
+    """
     from app.main import SessionLocal  # import local
     db = SessionLocal()
     try:
@@ -28,11 +33,31 @@ def get_db():
 # ============================================================================
 # DEPENDÊNCIAS DE AUTENTICAÇÃO
 # ============================================================================
+# As dependências que consultam o banco são síncronas (def): o FastAPI as
+# executa no pool de threads, sem bloquear o event loop.
+# usuario_da_requisicao é a única que decodifica o token e carrega o usuário,
+# uma vez por requisição (memorizado em request.state); as demais dependências
+# recebem o usuário via get_current_user_from_token, e o guard de assinatura só
+# o carrega em métodos de escrita.
 
-async def get_current_user_from_token(
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    token: Optional[str] = Cookie(None, alias="access_token"),
-    db: Session = Depends(get_db)
+_NAO_CARREGADO = object()
+
+def usuario_da_requisicao(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials],
+    token: Optional[str],
+    db: Session
+) -> Optional[Any]:
+    """Usuário do token (None se ausente ou inválido), carregado uma vez por requisição."""
+    user = getattr(request.state, "usuario", _NAO_CARREGADO)
+    if user is _NAO_CARREGADO:
+        user = request.state.usuario = _carregar_usuario(credentials, token, db)
+    return user
+
+def _carregar_usuario(
+    credentials: Optional[HTTPAuthorizationCredentials],
+    token: Optional[str],
+    db: Session
 ) -> Optional[Any]:
     """
     Obtém usuário atual do token JWT
@@ -65,17 +90,22 @@ async def get_current_user_from_token(
     
     return user
 
-async def get_current_user(
+def get_current_user_from_token(
+    request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
     token: Optional[str] = Cookie(None, alias="access_token"),
     db: Session = Depends(get_db)
+) -> Optional[Any]:
+    """Obtém usuário atual do token JWT (header Authorization: Bearer ou cookie access_token)"""
+    return usuario_da_requisicao(request, credentials, token, db)
+
+def get_current_user(
+    user: Optional[Any] = Depends(get_current_user_from_token)
 ) -> Any:
     """
     Obtém usuário atual (obrigatório)
     Retorna 401 se não autenticado
     """
-    user = await get_current_user_from_token(credentials, token, db)
-    
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -115,20 +145,15 @@ async def get_current_admin_user(
     
     return current_user
 
-async def get_optional_user(
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    token: Optional[str] = Cookie(None, alias="access_token"),
-    db: Session = Depends(get_db)
+def get_optional_user(
+    user: Optional[Any] = Depends(get_current_user_from_token)
 ) -> Optional[Any]:
     """
     Obtém usuário se autenticado, senão retorna None
     Não retorna erro se não autenticado
     Útil para rotas que funcionam com ou sem autenticação
     """
-    try:
-        return await get_current_user_from_token(credentials, token, db)
-    except:
-        return None
+    return user
 
 # ============================================================================
 # DECORATORS AUXILIARES (para usar em funções)
@@ -156,28 +181,33 @@ def require_admin(func):
 # COBRANÇA / ASSINATURA
 # ============================================================================
 
-async def ensure_subscription(
-    current_user: Any = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-) -> Any:
+# Rotas de escrita que não passam pelo bloqueio de assinatura
+ROTAS_LIVRES_ASSINATURA = (
+    "/auth", "/api/billing", "/api/health", "/health", "/api/debug",
+    "/static", "/offline", "/sw.js"
+)
+
+def carregar_assinatura(db: Session, usuario_id: int, request: Optional[Request] = None) -> Any:
     """
-    Garante que o usuário possui assinatura em dia para operações de escrita.
-    - Se não houver assinatura, cria uma de avaliação (trial) de 14 dias a partir de hoje.
-    - Se vencida, retorna 402 Payment Required com detalhes do status.
+    Retorna a assinatura do usuário, criando uma de avaliação (trial) de 14 dias se não existir.
+    Quando `request` é informado, a assinatura fica memorizada em request.state e é
+    carregada uma única vez por requisição.
     """
     # Import local para evitar ciclo
     from app.main import Assinatura
 
-    # Buscar assinatura do usuário
-    sub = db.query(Assinatura).filter(Assinatura.usuario_id == current_user.id).first()
+    if request is not None:
+        sub = getattr(request.state, "assinatura", None)
+        if sub is not None and sub.usuario_id == usuario_id:
+            return sub
 
-    hoje = date.today()
+    sub = db.query(Assinatura).filter(Assinatura.usuario_id == usuario_id).first()
 
     if not sub:
-        # Criar assinatura em TRIAL de 14 dias
+        hoje = date.today()
         trial_ate = hoje + timedelta(days=14)
         sub = Assinatura(
-            usuario_id=current_user.id,
+            usuario_id=usuario_id,
             status="trial",
             data_inicio=hoje,
             proximo_vencimento=trial_ate,
@@ -189,7 +219,13 @@ async def ensure_subscription(
         db.commit()
         db.refresh(sub)
 
-    # Verificar vencimento
+    if request is not None:
+        request.state.assinatura = sub
+    return sub
+
+def verificar_assinatura(db: Session, sub: Any) -> None:
+    """Levanta 402 Payment Required se a assinatura estiver vencida (e não cancelada)."""
+    hoje = date.today()
     if sub.proximo_vencimento and sub.proximo_vencimento < hoje and sub.status not in ("cancelada",):
         # Marcar como inadimplente caso ainda não esteja
         if sub.status != "inadimplente":
@@ -205,6 +241,46 @@ async def ensure_subscription(
             }
         )
 
+def billing_subscription_guard(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    token: Optional[str] = Cookie(None, alias="access_token"),
+    db: Session = Depends(get_db)
+) -> None:
+    """
+    Dependência global: bloqueia métodos de escrita de usuários autenticados com
+    assinatura vencida (402). Usa a mesma sessão e o mesmo usuário do handler.
+    O usuário só é carregado em métodos de escrita: leituras não pagam a consulta.
+    Sem token não bloqueia (modo legado).
+    """
+    if request.method not in ("POST", "PUT", "PATCH", "DELETE"):
+        return
+    if request.url.path.startswith(ROTAS_LIVRES_ASSINATURA):
+        return
+    user = usuario_da_requisicao(request, credentials, token, db)
+    if user is None:
+        return
+    try:
+        sub = carregar_assinatura(db, user.id, request)
+    except Exception:
+        # Em caso de erro no guard, não derruba a app, apenas prossegue
+        db.rollback()
+        return
+    verificar_assinatura(db, sub)
+
+def ensure_subscription(
+    request: Request,
+    current_user: Any = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+) -> Any:
+    """
+    Garante que o usuário possui assinatura em dia para operações de escrita.
+    - Se não houver assinatura, cria uma de avaliação (trial) de 14 dias a partir de hoje.
+    - Se vencida, retorna 402 Payment Required com detalhes do status.
+    A assinatura já carregada pelo guard na mesma requisição é reaproveitada.
+    """
+    sub = carregar_assinatura(db, current_user.id, request)
+    verificar_assinatura(db, sub)
     return current_user
 
 def require_subscription(func):
@@ -0,0 +1,91 @@
+"""
+Planilhas Excel
+Exportações .xlsx no modo write-only do openpyxl: as linhas vêm da consulta em
+lotes (yield_per) e vão direto para o XML da planilha, sem DataFrame e sem a
+planilha inteira em memória.
+
+Os estilos são definidos uma vez por coluna (largura, formato de moeda/data e o
+cabeçalho): cada coluna formatada tem uma única célula estilizada, reaproveitada
+em todas as linhas trocando só o valor (o write-only serializa a linha no append).
+
+O .xlsx é um zip com o diretório central no fim, então é montado em um arquivo
+temporário e enviado em pedaços (FileResponse), que é apagado depois do envio.
+"""
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+FORMATO_MOEDA = 'R$ #,##0.00'
+FORMATO_DATA = 'DD/MM/YYYY'
+
+TAMANHO_LOTE = 1000
+
+class Coluna(NamedTuple):
+    titulo: str
+    largura: int
+    formato: Optional[str] = None
+
+def _cabecalho(planilha, colunas: Sequence[Coluna]) -> List[WriteOnlyCell]:
+    preenchimento = PatternFill(start_color='22D3EE', end_color='22D3EE', fill_type='solid')
+    fonte = Font(bold=True, color='0F172A')
+    alinhamento = Alignment(horizontal='center', vertical='center')
+    celulas = []
+    for coluna in colunas:
+        celula = WriteOnlyCell(planilha, value=coluna.titulo)
+        celula.fill = preenchimento
+        celula.font = fonte
+        celula.alignment = alinhamento
+        celulas.append(celula)
+    return celulas
+
+def escrever_xlsx(destino: Path, titulo: str, colunas: Sequence[Coluna], linhas: Iterable[Sequence[Any]]) -> int:
+    """Escreve a planilha em `destino`, uma linha por item de `linhas`. Retorna o total de linhas de dados."""
+    livro = Workbook(write_only=True)
+    planilha = livro.create_sheet(titulo)
+    for indice, coluna in enumerate(colunas, start=1):
+        planilha.column_dimensions[get_column_letter(indice)].width = coluna.largura
+    planilha.append(_cabecalho(planilha, colunas))
+
+    # Uma célula estilizada por coluna formatada; as demais recebem o valor puro
+    formatadas = []
+    for coluna in colunas:
+        if coluna.formato:
+            celula = WriteOnlyCell(planilha)
+            celula.number_format = coluna.formato
+            formatadas.append(celula)
+        else:
+            formatadas.append(None)
+
+    total = 0
+    for linha in linhas:
+        valores = []
+        for celula, valor in zip(formatadas, linha):
+            if celula is None:
+                valores.append(valor)
+            else:
+                celula.value = valor
+                valores.append(celula)
+        planilha.append(valores)
+        total += 1
+
+    livro.save(destino)
+    return total
+
+def gerar_xlsx(titulo: str, colunas: Sequence[Coluna], linhas: Iterable[Sequence[Any]]) -> Tuple[Path, int]:
+    """Gera a planilha em um arquivo temporário. Retorna (caminho, total de linhas); quem chama apaga o arquivo."""
+    descritor, caminho = tempfile.mkstemp(prefix="planilha_", suffix=".xlsx")
+    os.close(descritor)
+    caminho = Path(caminho)
+    try:
+        return caminho, escrever_xlsx(caminho, titulo, colunas, linhas)
+    except Exception:
+        caminho.unlink(missing_ok=True)
+        raise
@@ -0,0 +1,222 @@
+"""
+Lançamentos recorrentes
+Regras de ocorrência dos recorrentes (usadas pela geração manual, pela projeção do
+fluxo de caixa e pela geração agendada) e a geração em lote de todos os
+recorrentes ativos com ocorrências devidas.
+
+Cada geração cria um lançamento com `numero_parcelas` parcelas espaçadas pela
+frequência (valores e vencimentos pelo cronograma compartilhado, ver
+app.cronograma), a partir do primeiro vencimento (dia até 28) após a data da geração,
+que fica em `ultima_geracao`. A geração seguinte fica devida quando o último
+vencimento da anterior chega, e é feita "na data" desse vencimento: assim os
+períodos perdidos (servidor parado, recorrente criado com data retroativa) são
+recuperados um a um, sem buracos nem sobreposição, e a projeção do fluxo de
+caixa continua exatamente de onde a última geração parou.
+
+A geração em lote (gerar_devidos) roda diariamente como job do sistema (ver
+app.jobs): percorre os recorrentes em lotes de RECORRENTES_LOTE, cada lote em uma
+transação, com INSERTs em lote de lançamentos e parcelas. Como esses INSERTs não
+passam pelo flush do ORM, versão dos dados, pendentes de integridade e resumo
+mensal são atualizados explicitamente. Com simular=True apenas calcula o que
+seria gerado.
+
+Configuração (variáveis de ambiente):
+- RECORRENTES_LOTE: recorrentes por transação (padrão 500)
+- RECORRENTES_MAX_GERACOES: gerações por recorrente em uma execução (padrão 120),
+  limita a recuperação de recorrentes muito antigos (o restante sai nos dias seguintes)
+- RECORRENTES_HORA: hora do dia a partir da qual o job diário é enfileirado (padrão 3)
+"""
+import os
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Callable, Dict, List, Optional
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.cronograma import CENTAVO, ParcelaPrevista, gerar_cronograma, linhas_de_parcelas
+
+RECORRENTES_LOTE = int(os.getenv("RECORRENTES_LOTE", "500"))
+RECORRENTES_MAX_GERACOES = int(os.getenv("RECORRENTES_MAX_GERACOES", "120"))
+RECORRENTES_HORA = int(os.getenv("RECORRENTES_HORA", "3"))
+
+# Meses entre ocorrências de cada frequência de recorrente
+MESES_POR_FREQUENCIA = {"mensal": 1, "trimestral": 3, "anual": 12}
+
+# Itens detalhados na prévia (simular=True)
+MAX_PREVIA = 100
+
+# ============================================================================
+# OCORRÊNCIAS
+# ============================================================================
+
+def primeiro_vencimento_apos(referencia: date, dia: int, meses: int) -> date:
+    """Dia (até 28) no mês da referência, ou um passo da frequência adiante se já passou."""
+    vencimento = date(referencia.year, referencia.month, min(dia, 28))
+    if vencimento <= referencia:
+        vencimento += relativedelta(months=meses)
+    return vencimento
+
+def cronograma_da_geracao(recorrente, geracao: date) -> List[ParcelaPrevista]:
+    """Parcelas (vencimentos e valores exatos) criadas por uma geração feita na data `geracao`."""
+    meses = MESES_POR_FREQUENCIA.get(recorrente.frequencia, 12)
+    primeiro = primeiro_vencimento_apos(geracao, recorrente.dia_vencimento, meses)
+    return gerar_cronograma(recorrente.valor_total, primeiro, max(1, recorrente.numero_parcelas or 1), meses)
+
+def vencimentos_da_geracao(recorrente, geracao: date) -> List[date]:
+    """Vencimentos das parcelas criadas por uma geração feita na data `geracao`."""
+    return [parcela.data_vencimento for parcela in cronograma_da_geracao(recorrente, geracao)]
+
+def valor_medio(valor_total, quantidade: int) -> Decimal:
+    return (Decimal(str(valor_total)) / quantidade).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+
+def geracoes_devidas(recorrente, hoje: date, limite: int = RECORRENTES_MAX_GERACOES) -> List[date]:
+    """
+    Datas das gerações devidas até `hoje`: a primeira na véspera de data_inicio
+    (se nunca gerado) ou no último vencimento da geração anterior; cada uma
+    seguinte no último vencimento da que a precede.
+    """
+    if recorrente.ultima_geracao:
+        geracao = vencimentos_da_geracao(recorrente, recorrente.ultima_geracao)[-1]
+    else:
+        geracao = recorrente.data_inicio - timedelta(days=1)
+    devidas = []
+    while geracao <= hoje and len(devidas) < limite:
+        devidas.append(geracao)
+        geracao = vencimentos_da_geracao(recorrente, geracao)[-1]
+    return devidas
+
+# ============================================================================
+# GERAÇÃO EM LOTE
+# ============================================================================
+
+def _gravar_lote(db: Session, planos: List[tuple]) -> Dict[str, int]:
+    """INSERTs em lote de um lote de recorrentes. Não faz commit."""
+    from app.main import Lancamento, Parcela, LancamentoRecorrente  # import local para evitar ciclo
+    from app.integridade import marcar_pendentes
+    from app.resumo_mensal import meses_de, recalcular_meses
+    from app.versao_dados import incrementar_versao
+
+    lancamentos = []
+    for recorrente, geracao, cronograma in planos:
+        lancamentos.append({
+            "usuario_id": recorrente.usuario_id,
+            "data_lancamento": geracao,
+            "tipo": recorrente.tipo,
+            "tipo_lancamento_id": recorrente.tipo_lancamento_id,
+            "fornecedor": recorrente.fornecedor,
+            "valor_total": recorrente.valor_total,
+            "data_primeiro_vencimento": cronograma[0].data_vencimento,
+            "numero_parcelas": len(cronograma),
+            "valor_medio_parcelas": valor_medio(recorrente.valor_total, len(cronograma)),
+            "observacao": f"[AUTO-GERADO] {recorrente.observacao or ''}",
+        })
+    ids = db.scalars(
+        insert(Lancamento).returning(Lancamento.id, sort_by_parameter_order=True), lancamentos
+    ).all()
+
+    parcelas = []
+    pares = set()
+    meses_por_usuario = defaultdict(set)
+    for lancamento_id, (recorrente, geracao, cronograma) in zip(ids, planos):
+        usuario_id = recorrente.usuario_id
+        pares.add((usuario_id, lancamento_id))
+        meses_por_usuario[usuario_id] |= meses_de(geracao, *[p.data_vencimento for p in cronograma])
+        parcelas.extend(linhas_de_parcelas(usuario_id, lancamento_id, cronograma))
+    db.execute(insert(Parcela), parcelas)
+
+    # Última geração de cada recorrente (os planos de um recorrente vêm em ordem)
+    ultimas = {recorrente.id: geracao for recorrente, geracao, _ in planos}
+    db.execute(
+        update(LancamentoRecorrente),
+        [{"id": recorrente_id, "ultima_geracao": geracao} for recorrente_id, geracao in ultimas.items()]
+    )
+
+    marcar_pendentes(db, pares)
+    for usuario_id, meses in meses_por_usuario.items():
+        incrementar_versao(db, usuario_id)
+        recalcular_meses(db, usuario_id, meses)
+    return {"lancamentos": len(lancamentos), "parcelas": len(parcelas), "usuarios": len(meses_por_usuario)}
+
+def gerar_devidos(db: Session, hoje: Optional[date] = None, simular: bool = False,
+                  lote: int = RECORRENTES_LOTE, progresso: Optional[Callable] = None) -> Dict[str, Any]:
+    """
+    Gera as ocorrências devidas de todos os recorrentes ativos, de todos os usuários.
+    Cada lote de recorrentes é gravado e confirmado em uma transação (faz commit).
+    Retorna as contagens e a vazão; com simular=True não grava e inclui uma prévia.
+    """
+    from app.main import LancamentoRecorrente  # import local para evitar ciclo
+
+    hoje = hoje or date.today()
+    inicio = time.perf_counter()
+    # Linhas simples (sem objetos ORM): a sessão não acumula os recorrentes já processados
+    tabela = LancamentoRecorrente.__table__
+    filtro = (tabela.c.ativo == 1) & (tabela.c.data_inicio <= hoje + timedelta(days=1))
+    total = db.execute(select(func.count()).select_from(tabela).where(filtro)).scalar()
+    metricas = {"recorrentes": 0, "geracoes": 0, "lancamentos": 0, "parcelas": 0, "usuarios": 0, "lotes": 0}
+    usuarios = set()
+    previa = []
+    processados = 0
+    ultimo_id = 0
+    while True:
+        recorrentes = db.execute(
+            select(tabela).where(filtro, tabela.c.id > ultimo_id).order_by(tabela.c.id).limit(lote)
+        ).all()
+        if not recorrentes:
+            break
+        ultimo_id = recorrentes[-1].id
+
+        planos = []
+        for recorrente in recorrentes:
+            devidas = geracoes_devidas(recorrente, hoje)
+            if devidas:
+                metricas["recorrentes"] += 1
+            for geracao in devidas:
+                planos.append((recorrente, geracao, cronograma_da_geracao(recorrente, geracao)))
+
+        if planos:
+            metricas["lotes"] += 1
+            metricas["geracoes"] += len(planos)
+            usuarios.update(recorrente.usuario_id for recorrente, _, _ in planos)
+            if simular:
+                metricas["lancamentos"] += len(planos)
+                metricas["parcelas"] += sum(len(cronograma) for _, _, cronograma in planos)
+                for recorrente, geracao, cronograma in planos[:MAX_PREVIA - len(previa)]:
+                    previa.append({
+                        "recorrente_id": recorrente.id,
+                        "usuario_id": recorrente.usuario_id,
+                        "fornecedor": recorrente.fornecedor,
+                        "data_geracao": geracao.isoformat(),
+                        "vencimentos": [p.data_vencimento.isoformat() for p in cronograma],
+                    })
+            else:
+                try:
+                    gravados = _gravar_lote(db, planos)
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    raise
+                metricas["lancamentos"] += gravados["lancamentos"]
+                metricas["parcelas"] += gravados["parcelas"]
+        processados += len(recorrentes)
+        if progresso:
+            progresso(100 * processados // max(total, 1), f"{processados}/{total} recorrentes")
+
+    segundos = time.perf_counter() - inicio
+    linhas = metricas["lancamentos"] + metricas["parcelas"]
+    metricas.update(
+        usuarios=len(usuarios),
+        data=hoje.isoformat(),
+        simulado=simular,
+        segundos=round(segundos, 3),
+        linhas_por_segundo=round(linhas / segundos, 1) if segundos > 0 else None,
+    )
+    if simular:
+        metricas["previa"] = previa
+    else:
+        print(f"✓ Recorrentes: {metricas['lancamentos']} lançamento(s), {metricas['parcelas']} parcela(s) "
+              f"em {segundos:.2f}s ({metricas['linhas_por_segundo']} linhas/s)")
+    return metricas
@@ -0,0 +1,398 @@
+"""
+Relatórios PDF
+A montagem do PDF (ReportLab) é CPU pura e segura o GIL: feita no processo da
+API, um relatório anual grande trava as demais requisições do worker. Aqui ela
+roda em um pool de processos limitado:
+
+- PDF_WORKERS processos (0 renderiza no próprio processo, ex.: ambientes sem
+  multiprocessing); a fila de espera aceita até PDF_FILA relatórios, além disso
+  a API responde 503 com Retry-After.
+- Cada usuário tem no máximo PDF_MAX_POR_USUARIO relatórios em andamento
+  (429 acima disso).
+
+Os bytes gerados ficam em um cache em disco (CacheRelatorios) com chave
+(usuário, ano, tipo_data, versão dos dados): enquanto os dados não mudam, o
+download é servido do cache, com ETag e Content-Length. O tamanho total do
+cache é limitado, removendo os arquivos usados há mais tempo (LRU por mtime).
+
+Configuração (variáveis de ambiente):
+- PDF_WORKERS (padrão 2), PDF_FILA (padrão 8), PDF_MAX_POR_USUARIO (padrão 1)
+- PDF_TIMEOUT: segundos de espera por um relatório (padrão 60)
+- PDF_CACHE_DIR / PDF_CACHE_MAX_MB: diretório e tamanho máximo do cache (padrão 200 MB)
+"""
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+PDF_FILA = int(os.getenv("PDF_FILA", "8"))
+PDF_MAX_POR_USUARIO = int(os.getenv("PDF_MAX_POR_USUARIO", "1"))
+PDF_TIMEOUT = float(os.getenv("PDF_TIMEOUT", "60"))
+PDF_CACHE_MAX_MB = int(os.getenv("PDF_CACHE_MAX_MB", "200"))
+
+class LimiteExcedido(Exception):
+    """Relatório recusado: usuário com relatórios demais em andamento ou fila cheia."""
+
+    def __init__(self, motivo: str):
+        super().__init__(motivo)
+        self.motivo = motivo  # "usuario" | "fila"
+
+# ============================================================================
+# RENDERIZAÇÃO (executa no processo do pool)
+# ============================================================================
+
+def formatar_valor(valor):
+    if valor == 0:
+        return "-"
+    return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+def renderizar_tabela_anual(dados_tabela: Dict[str, Any], ano: int, tipo_data: str) -> bytes:
+    """Monta o PDF da tabela anual (paisagem, um tipo por linha, meses nas colunas). Retorna os bytes."""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import cm
+
+    # Criar buffer para o PDF
+    buffer = BytesIO()
+
+    # Configurar documento PDF em paisagem (landscape)
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=landscape(A4),
+        rightMargin=1*cm,
+        leftMargin=1*cm,
+        topMargin=1.5*cm,
+        bottomMargin=1.5*cm
+    )
+
+    # Elementos do PDF
+    elements = []
+    styles = getSampleStyleSheet()
+
+    # Título
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        textColor=colors.HexColor('#0f172a'),
+        spaceAfter=12,
+        alignment=1  # Center
+    )
+
+    tipo_data_label = "Pagamento" if tipo_data == "pagamento" else "Vencimento"
+    titulo = f"Resumo Anual {ano} - Por Data de {tipo_data_label}"
+    elements.append(Paragraph(titulo, title_style))
+    elements.append(Spacer(1, 0.5*cm))
+
+    # Subtítulo com informação do tipo de data
+    subtitle_style = ParagraphStyle(
+        'Subtitle',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.HexColor('#64748b'),
+        spaceAfter=20,
+        alignment=1
+    )
+
+    info_text = "Valores baseados na data de pagamento (apenas parcelas pagas)" if tipo_data == "pagamento" else "Valores baseados na data de vencimento (todas as parcelas)"
+    elements.append(Paragraph(info_text, subtitle_style))
+    elements.append(Spacer(1, 0.5*cm))
+
+    # Preparar dados da tabela
+    meses = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+
+    # Cabeçalho da tabela
+    table_data = [['Tipo'] + meses + ['Total']]
+
+    # Meses como int (o nível compartilhado do cache de respostas devolve as chaves do JSON como texto)
+    tipos = [{**t, "meses": {int(m): v for m, v in t["meses"].items()}} for t in dados_tabela["tipos"]]
+    receitas = [t for t in tipos if t["natureza"] == "receita"]
+    despesas = [t for t in tipos if t["natureza"] == "despesa"]
+
+    # Adicionar receitas
+    if receitas:
+        table_data.append(['RECEITAS'] + [''] * 13)
+        for tipo in receitas:
+            row = [tipo["nome"]]
+            total_tipo = 0
+            for mes in range(1, 13):
+                valor = tipo["meses"].get(mes, 0)
+                total_tipo += valor
+                row.append(formatar_valor(valor))
+            row.append(formatar_valor(total_tipo))
+            table_data.append(row)
+
+    # Adicionar despesas
+    if despesas:
+        table_data.append(['DESPESAS'] + [''] * 13)
+        for tipo in despesas:
+            row = [tipo["nome"]]
+            total_tipo = 0
+            for mes in range(1, 13):
+                valor = tipo["meses"].get(mes, 0)
+                total_tipo += valor
+                row.append(formatar_valor(valor))
+            row.append(formatar_valor(total_tipo))
+            table_data.append(row)
+
+    # Calcular totais mensais
+    totais_row = ['TOTAL GERAL']
+    total_geral = 0
+    for mes in range(1, 13):
+        total_mes = 0
+        for tipo in tipos:
+            valor = tipo["meses"].get(mes, 0)
+            if tipo["natureza"] == "receita":
+                total_mes += valor
+            else:
+                total_mes -= valor
+        total_geral += total_mes
+        totais_row.append(formatar_valor(total_mes))
+    totais_row.append(formatar_valor(total_geral))
+    table_data.append(totais_row)
+
+    # Criar tabela
+    table = Table(table_data, repeatRows=1)
+
+    # Estilo da tabela
+    table_style = TableStyle([
+        # Cabeçalho
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#22d3ee')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#0f172a')),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+
+        # Primeira coluna (nomes)
+        ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 1), (0, -1), 8),
+        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
+
+        # Valores numéricos
+        ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (1, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (1, 1), (-1, -1), 7),
+
+        # Última coluna (Total) em destaque
+        ('BACKGROUND', (-1, 1), (-1, -1), colors.HexColor('#f0f9ff')),
+        ('FONTNAME', (-1, 1), (-1, -1), 'Helvetica-Bold'),
+
+        # Grid
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('TOPPADDING', (0, 1), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
+        ('LEFTPADDING', (0, 0), (-1, -1), 6),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ])
+
+    # Destacar linhas de seção (RECEITAS, DESPESAS)
+    row_idx = 1
+    if receitas:
+        table_style.add('BACKGROUND', (0, row_idx), (-1, row_idx), colors.HexColor('#dcfce7'))
+        table_style.add('FONTNAME', (0, row_idx), (-1, row_idx), 'Helvetica-Bold')
+        table_style.add('FONTSIZE', (0, row_idx), (-1, row_idx), 9)
+        row_idx += len(receitas) + 1
+
+    if despesas:
+        table_style.add('BACKGROUND', (0, row_idx), (-1, row_idx), colors.HexColor('#fee2e2'))
+        table_style.add('FONTNAME', (0, row_idx), (-1, row_idx), 'Helvetica-Bold')
+        table_style.add('FONTSIZE', (0, row_idx), (-1, row_idx), 9)
+
+    # Destacar linha de total geral
+    table_style.add('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#e0f2fe'))
+    table_style.add('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold')
+    table_style.add('FONTSIZE', (0, -1), (-1, -1), 9)
+    table_style.add('LINEABOVE', (0, -1), (-1, -1), 2, colors.HexColor('#22d3ee'))
+
+    table.setStyle(table_style)
+    elements.append(table)
+
+    # Adicionar rodapé
+    elements.append(Spacer(1, 0.5*cm))
+    footer_style = ParagraphStyle(
+        'Footer',
+        parent=styles['Normal'],
+        fontSize=8,
+        textColor=colors.HexColor('#94a3b8'),
+        alignment=1
+    )
+    footer_text = f"Relatório gerado em {datetime.now().strftime('%d/%m/%Y às %H:%M')} - Sistema Financeiro Pessoal"
+    elements.append(Paragraph(footer_text, footer_style))
+
+    # Gerar PDF
+    doc.build(elements)
+    return buffer.getvalue()
+
+# ============================================================================
+# POOL DE PROCESSOS
+# ============================================================================
+
+_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+_em_andamento: Dict[int, int] = defaultdict(int)
+_total_em_andamento = 0
+
+def _obter_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn: o processo da API tem threads (pool do anyio, verificação de backups)
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+def _reservar(usuario_id: int) -> None:
+    global _total_em_andamento
+    with _lock:
+        if _em_andamento.get(usuario_id, 0) >= PDF_MAX_POR_USUARIO:
+            raise LimiteExcedido("usuario")
+        if _total_em_andamento >= max(PDF_WORKERS, 1) + PDF_FILA:
+            raise LimiteExcedido("fila")
+        _em_andamento[usuario_id] += 1
+        _total_em_andamento += 1
+
+def _liberar(usuario_id: int) -> None:
+    global _total_em_andamento
+    with _lock:
+        _em_andamento[usuario_id] -= 1
+        if _em_andamento[usuario_id] <= 0:
+            del _em_andamento[usuario_id]
+        _total_em_andamento -= 1
+
+def renderizar(usuario_id: int, funcao, *args) -> bytes:
+    """
+    Executa `funcao(*args)` no pool, respeitando os limites por usuário e da fila
+    (LimiteExcedido). Bloqueia a thread da requisição até o PDF ficar pronto;
+    levanta TimeoutError após PDF_TIMEOUT segundos.
+    """
+    global _pool
+    _reservar(usuario_id)
+    if PDF_WORKERS <= 0:
+        try:
+            return funcao(*args)
+        finally:
+            _liberar(usuario_id)
+
+    try:
+        futuro = _obter_pool().submit(funcao, *args)
+    except BaseException:
+        _liberar(usuario_id)
+        raise
+    # A vaga só volta quando o relatório termina de fato (pronto, erro ou cancelado),
+    # não quando a requisição desiste de esperar
+    futuro.add_done_callback(lambda _: _liberar(usuario_id))
+    try:
+        return futuro.result(timeout=PDF_TIMEOUT)
+    except TimeoutError:
+        # Ainda na fila: sai sem ocupar um processo. Já em execução não há como
+        # interromper; a vaga segue ocupada até o processo terminar.
+        futuro.cancel()
+        raise
+    except BrokenProcessPool:
+        # Um worker morreu (ex.: falta de memória): o próximo relatório recria o pool
+        with _lock:
+            _pool = None
+        raise
+
+def encerrar() -> None:
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# ============================================================================
+# CACHE EM DISCO
+# ============================================================================
+
+class CacheRelatorios:
+    """PDFs gerados em disco, por (usuário, relatório, parâmetros, versão dos dados), com LRU por tamanho."""
+
+    def __init__(self, diretorio: Path, max_bytes: int):
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prefixo(usuario_id: int, *parametros) -> str:
+        # Parâmetros vêm da query string: o nome do arquivo usa só o hash
+        chave = ":".join(str(p) for p in (usuario_id,) + parametros)
+        return hashlib.sha1(chave.encode("utf-8")).hexdigest()[:24]
+
+    def _caminho(self, chave: Tuple) -> Path:
+        usuario_id, *parametros, versao = chave
+        return self.diretorio / f"{self._prefixo(usuario_id, *parametros)}_{versao}.pdf"
+
+    @staticmethod
+    def etag(chave: Tuple) -> str:
+        usuario_id, *parametros, versao = chave
+        return f'"pdf-{versao}-{CacheRelatorios._prefixo(usuario_id, *parametros)[:16]}"'
+
+    def obter(self, chave: Tuple) -> Optional[bytes]:
+        caminho = self._caminho(chave)
+        try:
+            conteudo = caminho.read_bytes()
+            os.utime(caminho)  # marca como usado agora (LRU)
+            return conteudo
+        except FileNotFoundError:
+            return None
+
+    def guardar(self, chave: Tuple, conteudo: bytes) -> None:
+        if self.max_bytes <= 0:
+            return
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        destino = self._caminho(chave)
+        temporario = destino.with_name(f"{destino.name}.{threading.get_ident()}.tmp")
+        temporario.write_bytes(conteudo)
+        os.replace(temporario, destino)
+        with self._lock:
+            self._remover_versoes_antigas(destino)
+            self._aplicar_limite()
+
+    def _remover_versoes_antigas(self, destino: Path) -> None:
+        # A versão dos dados só cresce: versões anteriores do mesmo relatório não serão mais pedidas
+        prefixo = destino.name.rsplit("_", 1)[0]
+        for arquivo in self.diretorio.glob(f"{prefixo}_*.pdf"):
+            if arquivo != destino:
+                arquivo.unlink(missing_ok=True)
+
+    def _aplicar_limite(self) -> None:
+        arquivos = []
+        for arquivo in self.diretorio.glob("*.pdf"):
+            try:
+                stat = arquivo.stat()
+            except FileNotFoundError:
+                continue
+            arquivos.append((stat.st_mtime, stat.st_size, arquivo))
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, arquivo in sorted(arquivos, key=lambda a: a[0]):
+            if total <= self.max_bytes:
+                break
+            arquivo.unlink(missing_ok=True)
+            total -= tamanho
+
+    def limpar(self) -> None:
+        with self._lock:
+            for arquivo in self.diretorio.glob("*.pdf"):
+                arquivo.unlink(missing_ok=True)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        arquivos = list(self.diretorio.glob("*.pdf")) if self.diretorio.exists() else []
+        return {
+            "arquivos": len(arquivos),
+            "bytes": sum(a.stat().st_size for a in arquivos),
+            "max_bytes": self.max_bytes
+        }
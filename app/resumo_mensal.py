@@ -0,0 +1,174 @@
+"""
+Resumo Mensal Materializado
+Mantém a tabela resumo_mensal (totais por usuário, mês, tipo, subtipo, natureza e base)
+usada pelos relatórios anuais/mensais em vez de somar as parcelas a cada requisição.
+
+- Escritas (criar/atualizar/excluir lançamento, pagar/editar parcela, gerar recorrente)
+  chamam recalcular_meses() com os meses afetados, antes do commit da própria operação.
+- Leituras chamam garantir_resumo(), que constrói o resumo do usuário na primeira vez.
+- reconstruir_todos() refaz tudo (usado por rebuild_resumo_mensal.py).
+"""
+from datetime import date, datetime
+from typing import Iterable, Optional, Set, Tuple
+
+from sqlalchemy import func, extract, insert
+from sqlalchemy.orm import Session
+
+BASES = ("vencimento", "pagamento", "lancamento")
+
+Mes = Tuple[int, int]
+
+# ============================================================================
+# MESES AFETADOS
+# ============================================================================
+
+def meses_de(*datas: Optional[date]) -> Set[Mes]:
+    """Converte datas em conjunto de (ano, mes), ignorando valores nulos."""
+    return {(d.year, d.month) for d in datas if d is not None}
+
+def meses_do_lancamento(db: Session, lancamento) -> Set[Mes]:
+    """Meses em que o lançamento e suas parcelas aparecem, em qualquer base."""
+    from app.main import Parcela  # import local para evitar ciclo
+
+    meses = meses_de(lancamento.data_lancamento)
+    datas = db.query(Parcela.data_vencimento, Parcela.data_pagamento).filter(
+        Parcela.lancamento_id == lancamento.id
+    ).all()
+    for vencimento, pagamento in datas:
+        meses |= meses_de(vencimento, pagamento)
+    return meses
+
+# ============================================================================
+# CÁLCULO
+# ============================================================================
+
+def _consultas_agregadas(db: Session, usuario_id: int, inicio: Optional[date], fim: Optional[date]):
+    """Gera (base, query) com os totais agrupados por mês/tipo/subtipo/natureza no intervalo [inicio, fim)."""
+    from app.main import Lancamento, Parcela  # import local para evitar ciclo
+
+    colunas_chave = (Lancamento.tipo_lancamento_id, Lancamento.subtipo_lancamento_id, Lancamento.tipo)
+
+    def _montar(campo_data, campo_valor, contagem, filtros, com_parcelas=True):
+        ano = extract('year', campo_data)
+        mes = extract('month', campo_data)
+        q = db.query(ano, mes, *colunas_chave, func.sum(campo_valor), contagem)
+        if com_parcelas:
+            q = q.select_from(Parcela).join(Lancamento, Parcela.lancamento_id == Lancamento.id)
+        q = q.filter(*filtros)
+        if inicio is not None:
+            q = q.filter(campo_data >= inicio)
+        if fim is not None:
+            q = q.filter(campo_data < fim)
+        return q.group_by(ano, mes, *colunas_chave)
+
+    yield "vencimento", _montar(
+        Parcela.data_vencimento, Parcela.valor, func.count(Parcela.id),
+        (Parcela.usuario_id == usuario_id, Lancamento.usuario_id == usuario_id)
+    )
+    yield "pagamento", _montar(
+        Parcela.data_pagamento, Parcela.valor_pago, func.count(Parcela.id),
+        (Parcela.paga == 1, Parcela.data_pagamento.isnot(None),
+         Parcela.usuario_id == usuario_id, Lancamento.usuario_id == usuario_id)
+    )
+    yield "lancamento", _montar(
+        Lancamento.data_lancamento, Lancamento.valor_total, func.count(Lancamento.id),
+        (Lancamento.usuario_id == usuario_id,), com_parcelas=False
+    )
+
+def _inserir_agregados(db: Session, usuario_id: int, inicio, fim, meses: Optional[Set[Mes]] = None) -> int:
+    from app.main import ResumoMensal  # import local para evitar ciclo
+
+    linhas = []
+    for base, query in _consultas_agregadas(db, usuario_id, inicio, fim):
+        for ano, mes, tipo_id, subtipo_id, natureza, total, quantidade in query.all():
+            ano, mes = int(ano), int(mes)
+            if meses is not None and (ano, mes) not in meses:
+                continue
+            linhas.append({
+                "usuario_id": usuario_id,
+                "base": base,
+                "ano": ano,
+                "mes": mes,
+                "tipo_lancamento_id": tipo_id,
+                "subtipo_lancamento_id": subtipo_id,
+                "natureza": natureza,
+                "total": "{:.2f}".format(total or 0),
+                "quantidade": quantidade,
+            })
+    if linhas:
+        db.execute(insert(ResumoMensal), linhas)
+    return len(linhas)
+
+# ============================================================================
+# MANUTENÇÃO
+# ============================================================================
+
+def resumo_construido(db: Session, usuario_id: int) -> bool:
+    from app.main import ResumoMensalEstado  # import local para evitar ciclo
+    return db.get(ResumoMensalEstado, usuario_id) is not None
+
+def recalcular_meses(db: Session, usuario_id: int, meses: Iterable[Mes]) -> None:
+    """
+    Recalcula, para todas as bases, os meses informados do usuário.
+    Não faz commit: roda na mesma transação da escrita que alterou os dados.
+    Se o resumo do usuário ainda não foi construído, nada a fazer (será construído na leitura).
+    """
+    from app.main import ResumoMensal  # import local para evitar ciclo
+
+    meses = set(meses)
+    if not meses or not resumo_construido(db, usuario_id):
+        return
+
+    db.flush()
+    chaves = [ano * 100 + mes for ano, mes in meses]
+    db.query(ResumoMensal).filter(
+        ResumoMensal.usuario_id == usuario_id,
+        (ResumoMensal.ano * 100 + ResumoMensal.mes).in_(chaves)
+    ).delete(synchronize_session=False)
+
+    primeiro = min(meses)
+    ultimo = max(meses)
+    inicio = date(primeiro[0], primeiro[1], 1)
+    fim = date(ultimo[0] + 1, 1, 1) if ultimo[1] == 12 else date(ultimo[0], ultimo[1] + 1, 1)
+    _inserir_agregados(db, usuario_id, inicio, fim, meses)
+
+def reconstruir_usuario(db: Session, usuario_id: int) -> int:
+    """Refaz todo o resumo do usuário e marca como construído. Não faz commit."""
+    from app.main import ResumoMensal, ResumoMensalEstado  # import local para evitar ciclo
+
+    db.query(ResumoMensal).filter(ResumoMensal.usuario_id == usuario_id).delete(synchronize_session=False)
+    linhas = _inserir_agregados(db, usuario_id, None, None)
+
+    estado = db.get(ResumoMensalEstado, usuario_id)
+    if estado is None:
+        db.add(ResumoMensalEstado(usuario_id=usuario_id, atualizado_em=datetime.utcnow()))
+    else:
+        estado.atualizado_em = datetime.utcnow()
+    db.flush()
+    return linhas
+
+def garantir_resumo(db: Session, usuario_id: int) -> None:
+    """Constrói o resumo do usuário se ainda não existir (primeira leitura)."""
+    if resumo_construido(db, usuario_id):
+        return
+    try:
+        reconstruir_usuario(db, usuario_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+def reconstruir_todos(db: Session, usuario_id: Optional[int] = None) -> dict:
+    """Refaz o resumo de todos os usuários (ou de um) com commit por usuário."""
+    from app.main import User  # import local para evitar ciclo
+
+    if usuario_id is not None:
+        ids = [usuario_id]
+    else:
+        ids = [row[0] for row in db.query(User.id).order_by(User.id).all()]
+
+    resultado = {}
+    for uid in ids:
+        resultado[uid] = reconstruir_usuario(db, uid)
+        db.commit()
+    return resultado
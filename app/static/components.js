@@ -206,6 +206,53 @@ const KeyboardShortcuts = {
   }
 };
 
+// ============================================
+// CACHE DE RESPOSTAS COM ETAG (requisições condicionais)
+// ============================================
+// A API responde os GETs com ETag (versão dos dados do usuário). Guardamos
+// corpo + ETag por URL no sessionStorage e reenviamos If-None-Match: se nada
+// mudou, o servidor devolve 304 sem consultar o banco e sem corpo.
+
+const EtagCache = {
+  prefix: 'etag:',
+
+  get(url) {
+    try {
+      const raw = sessionStorage.getItem(this.prefix + url);
+      return raw ? JSON.parse(raw) : null;
+    } catch {
+      return null;
+    }
+  },
+
+  set(url, etag, data) {
+    try {
+      sessionStorage.setItem(this.prefix + url, JSON.stringify({ etag, data }));
+    } catch {
+      // Cota excedida: apenas não guarda
+      this.remove(url);
+    }
+  },
+
+  remove(url) {
+    try {
+      sessionStorage.removeItem(this.prefix + url);
+    } catch {
+      // ignore
+    }
+  },
+
+  clear() {
+    try {
+      Object.keys(sessionStorage)
+        .filter((key) => key.startsWith(this.prefix))
+        .forEach((key) => sessionStorage.removeItem(key));
+    } catch {
+      // ignore
+    }
+  }
+};
+
 // ============================================
 // FETCH COM LOADING E TRATAMENTO DE ERROS
 // ============================================
@@ -230,8 +277,21 @@ async function fetchWithLoading(url, options = {}, showOverlay = false) {
       timeoutId = setTimeout(() => controller.abort(), timeoutMs);
     }
 
+    // GET condicional: reaproveita o corpo em cache quando o servidor responde 304
+    const isGet = !fetchOptions.method || fetchOptions.method.toUpperCase() === 'GET';
+    const cached = isGet ? EtagCache.get(url) : null;
+    if (cached) {
+      const headers = new Headers(fetchOptions.headers || {});
+      headers.set('If-None-Match', cached.etag);
+      fetchOptions.headers = headers;
+    }
+
     const response = await fetch(url, { ...fetchOptions, signal: effectiveSignal });
     
+    if (response.status === 304 && cached) {
+      return cached.data;
+    }
+    
     if (!response.ok) {
       let errorMessage = `Erro ${response.status}`;
       try {
@@ -249,7 +309,14 @@ async function fetchWithLoading(url, options = {}, showOverlay = false) {
     
     // Tentar JSON; se falhar, retornar texto
     try {
-      return await response.json();
+      const data = await response.json();
+      const etag = isGet ? response.headers.get('ETag') : null;
+      if (etag) {
+        EtagCache.set(url, etag, data);
+      } else if (isGet) {
+        EtagCache.remove(url);
+      }
+      return data;
     } catch {
       return await response.text();
     }
@@ -912,6 +979,7 @@ window.Toast = Toast;
 window.ButtonLoader = ButtonLoader;
 window.KeyboardShortcuts = KeyboardShortcuts;
 window.fetchWithLoading = fetchWithLoading;
+window.EtagCache = EtagCache;
 window.ConfirmDialog = ConfirmDialog;
 window.PromptDialog = PromptDialog;
 window.PaymentDialog = PaymentDialog;
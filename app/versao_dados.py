@@ -0,0 +1,181 @@
+"""
+Versão dos Dados por Usuário
+Contador monotônico (tabela versoes_dados) incrementado a cada escrita nos dados
+do usuário, usado para responder às leituras com ETag forte e 304 Not Modified.
+
+- Escritas via ORM (db.add / alteração / db.delete) incrementam a versão
+  automaticamente no before_flush, na mesma transação da escrita.
+- Escritas em massa (query.delete(), insert() em lote) não passam pelo flush:
+  quem as usa chama incrementar_versao() explicitamente.
+- Leituras GET em /api/* passam pela dependência etag_condicional: com a versão
+  em mãos (uma consulta por chave primária), um If-None-Match igual devolve 304
+  antes de o handler executar qualquer consulta.
+"""
+import hashlib
+from datetime import date
+from typing import Dict, Optional
+
+from fastapi import Cookie, Depends, HTTPException, Request, Response
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+from app.middleware import get_db, security, usuario_da_requisicao
+
+# Tabelas derivadas/de controle: escrever nelas não muda os dados vistos pelo usuário
+TABELAS_IGNORADAS = {
+    "resumo_mensal", "resumo_mensal_estado", "versoes_dados",
+    "verificacoes_integridade", "integridade_pendentes", "jobs"
+}
+
+# Leituras que não usam ETag (administração, arquivos, diagnóstico)
+ROTAS_SEM_ETAG = (
+    "/api/health", "/api/debug", "/api/admin", "/api/backup",
+    "/api/relatorios", "/api/exportar", "/api/diagnostico", "/api/jobs"
+)
+
+# ============================================================================
+# VERSÃO
+# ============================================================================
+
+def obter_versao(db: Session, usuario_id: int) -> int:
+    """
+    Versão atual dos dados do usuário (0 se nunca houve escrita).
+    Fica memorizada na sessão (uma por requisição): ETag e cache de respostas
+    fazem uma única consulta. Escritas e rollback descartam o valor memorizado.
+    """
+    from app.main import VersaoDados  # import local para evitar ciclo
+
+    memo = db.info.setdefault("versoes_dados", {})
+    if usuario_id not in memo:
+        versao = db.query(VersaoDados.versao).filter(VersaoDados.usuario_id == usuario_id).scalar()
+        memo[usuario_id] = versao or 0
+    return memo[usuario_id]
+
+def incrementar_versao(db: Session, usuario_id: int) -> None:
+    """
+    Incrementa a versão do usuário (upsert atômico). Não faz commit:
+    vale junto com a transação da escrita.
+    """
+    from app.main import VersaoDados  # import local para evitar ciclo
+
+    db.info.get("versoes_dados", {}).pop(usuario_id, None)
+    tabela = VersaoDados.__table__
+    conn = db.connection()
+    dialeto = conn.dialect.name
+    if dialeto in ("sqlite", "postgresql"):
+        if dialeto == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as insert_dialeto
+        else:
+            from sqlalchemy.dialects.postgresql import insert as insert_dialeto
+        stmt = insert_dialeto(tabela).values(usuario_id=usuario_id, versao=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[tabela.c.usuario_id],
+            set_={"versao": tabela.c.versao + 1}
+        )
+        conn.execute(stmt)
+        return
+
+    # Outros bancos: UPDATE e, se não havia linha, INSERT
+    resultado = conn.execute(
+        update(tabela).where(tabela.c.usuario_id == usuario_id).values(versao=tabela.c.versao + 1)
+    )
+    if resultado.rowcount == 0:
+        conn.execute(tabela.insert().values(usuario_id=usuario_id, versao=1))
+
+def listar_versoes(db: Session) -> Dict[int, int]:
+    """Versões de todos os usuários ({usuario_id: versao})."""
+    from app.main import VersaoDados  # import local para evitar ciclo
+    return dict(db.query(VersaoDados.usuario_id, VersaoDados.versao).all())
+
+def avancar_versoes(db: Session, anteriores: Dict[int, int]) -> None:
+    """
+    Após restaurar um backup, leva cada usuário para além da maior versão já
+    vista (anterior ou restaurada): ETags emitidos antes da restauração não
+    podem coincidir com os dados restaurados. Faz commit.
+    """
+    from app.main import VersaoDados  # import local para evitar ciclo
+
+    db.info.pop("versoes_dados", None)
+    restauradas = listar_versoes(db)
+    for usuario_id in set(anteriores) | set(restauradas):
+        nova = max(anteriores.get(usuario_id, 0), restauradas.get(usuario_id, 0)) + 1
+        registro = db.get(VersaoDados, usuario_id)
+        if registro is None:
+            db.add(VersaoDados(usuario_id=usuario_id, versao=nova))
+        else:
+            registro.versao = nova
+    db.commit()
+
+@event.listens_for(Session, "before_flush")
+def _incrementar_no_flush(session: Session, flush_context, instances) -> None:
+    """Incrementa a versão de cada usuário dono de objetos novos, alterados ou removidos."""
+    usuarios = set()
+    for obj in list(session.new) + list(session.deleted):
+        usuarios.add(_dono(obj))
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            usuarios.add(_dono(obj))
+    usuarios.discard(None)
+    for usuario_id in sorted(usuarios):
+        incrementar_versao(session, usuario_id)
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_memo(session: Session) -> None:
+    session.info.pop("versoes_dados", None)
+
+def _dono(obj) -> Optional[int]:
+    if getattr(obj, "__tablename__", None) in TABELAS_IGNORADAS:
+        return None
+    return getattr(obj, "usuario_id", None)
+
+# ============================================================================
+# ETAG / 304
+# ============================================================================
+
+def calcular_etag(usuario_id: int, versao: int, request: Request) -> str:
+    """
+    ETag forte da leitura: usuário + versão + rota/parâmetros + data do dia
+    (várias leituras dependem de date.today(), ex.: parcelas a vencer).
+    """
+    chave = f"{usuario_id}:{versao}:{date.today().isoformat()}:{request.url.path}?{request.url.query}"
+    resumo = hashlib.sha1(chave.encode("utf-8")).hexdigest()[:20]
+    return f'"{versao}-{resumo}"'
+
+def etag_confere(request: Request, etag: str) -> bool:
+    """Compara com If-None-Match (comparação fraca, como pede a RFC 9110 para GET)."""
+    cabecalho = request.headers.get("if-none-match")
+    if not cabecalho:
+        return False
+    if cabecalho.strip() == "*":
+        return True
+    candidatos = [c.strip() for c in cabecalho.split(",")]
+    return any(c.removeprefix("W/") == etag for c in candidatos)
+
+def etag_condicional(
+    request: Request,
+    response: Response,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    token: Optional[str] = Cookie(None, alias="access_token"),
+    db: Session = Depends(get_db)
+) -> None:
+    """
+    Dependência global: para GET autenticado em /api/*, responde 304 se o cliente
+    já tem a versão atual; senão anota ETag e Cache-Control na resposta do handler.
+    Handlers que devolvem um Response próprio (arquivos, streaming) ficam sem ETag.
+    O usuário só é carregado nas rotas com ETag.
+    """
+    if request.method != "GET":
+        return
+    caminho = request.url.path
+    if not caminho.startswith("/api/") or caminho.startswith(ROTAS_SEM_ETAG):
+        return
+    user = usuario_da_requisicao(request, credentials, token, db)
+    if user is None:
+        return
+
+    etag = calcular_etag(user.id, obter_versao(db, user.id), request)
+    cabecalhos = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_confere(request, etag):
+        raise HTTPException(status_code=304, headers=cabecalhos)
+    response.headers.update(cabecalhos)
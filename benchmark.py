@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Benchmarks de desempenho da API (executados em processo, sobre um banco SQLite temporário).
+
+Cenários:
+- event-loop: latência de /api/tipos (p50/p95/p99) enquanto requisições pesadas
+  de /api/dashboard rodam em paralelo no mesmo worker.
+- dashboard: latência de /api/dashboard em cada tipo_data (vencimento, pagamento,
+  lancamento) sobre um ano de dados. Repetições idênticas são atendidas pelo cache
+  de respostas; use RESPONSE_CACHE_MAX=0 para medir as consultas.
+- excel: tempo e pico de memória (RSS) das exportações .xlsx de parcelas e de
+  lançamentos. O pico de RSS é do processo inteiro, então cada exportação roda
+  em um subprocesso próprio sobre o banco já preparado.
+- financiamento: latência de criar (POST) e editar (PUT) lançamentos de 360
+  parcelas (financiamento de 30 anos) por /api/lancamentos; a edição é medida
+  mudando só a observação e mudando o valor total.
+
+Uso:
+    python benchmark.py event-loop [--parcelas 100000] [--concorrencia 8] [--amostras 200]
+    python benchmark.py dashboard [--parcelas 120000] [--repeticoes 20]
+    python benchmark.py excel [--parcelas 100000]
+    python benchmark.py financiamento [--parcelas 10000] [--numero-parcelas 360] [--repeticoes 30]
+    RESPONSE_CACHE_MAX=0 python benchmark.py dashboard   # sem cache de respostas
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+# O banco precisa ser definido antes de importar a aplicação
+_TMP_DIR = tempfile.mkdtemp(prefix="bench_")
+os.environ.setdefault("DB_PATH", str(Path(_TMP_DIR) / "bench.db"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app.main import (  # noqa: E402
+    app, SessionLocal, User, TipoLancamento, Lancamento, Parcela
+)
+from app.auth import create_access_token  # noqa: E402
+
+
+# ============================================================================
+# PREPARAÇÃO DE DADOS
+# ============================================================================
+
+def preparar_banco(n_parcelas: int, parcelas_por_lancamento: int = 12, seed: int = 42):
+    """Cria um usuário com `n_parcelas` parcelas distribuídas em ~5 anos. Retorna (user_id, token)."""
+    rnd = random.Random(seed)
+    db = SessionLocal()
+    try:
+        user = User(email=f"bench{rnd.randint(0, 10**9)}@example.com", nome="Benchmark",
+                    senha_hash="x", ativo=True, admin=False)
+        db.add(user)
+        db.flush()
+
+        tipos = []
+        for i in range(10):
+            natureza = "receita" if i < 3 else "despesa"
+            tipo = TipoLancamento(usuario_id=user.id, nome=f"Tipo {i}", natureza=natureza,
+                                  created_at=date.today())
+            db.add(tipo)
+            tipos.append(tipo)
+        db.flush()
+
+        inicio = date.today() - timedelta(days=365 * 4)
+        n_lancamentos = max(1, n_parcelas // parcelas_por_lancamento)
+        lanc_rows = []
+        for _ in range(n_lancamentos):
+            tipo = rnd.choice(tipos)
+            d = inicio + timedelta(days=rnd.randint(0, 365 * 4))
+            lanc_rows.append({
+                "usuario_id": user.id, "data_lancamento": d, "tipo": tipo.natureza,
+                "tipo_lancamento_id": tipo.id, "fornecedor": f"Fornecedor {rnd.randint(1, 500)}",
+                "valor_total": parcelas_por_lancamento * 100, "data_primeiro_vencimento": d,
+                "numero_parcelas": parcelas_por_lancamento, "valor_medio_parcelas": 100,
+                "observacao": None,
+            })
+        db.execute(insert(Lancamento), lanc_rows)
+        lanc_ids = [r[0] for r in db.query(Lancamento.id).filter(Lancamento.usuario_id == user.id)
+                    .order_by(Lancamento.id).all()]
+
+        parc_rows = []
+        for lanc_id, lanc in zip(lanc_ids, lanc_rows):
+            for i in range(parcelas_por_lancamento):
+                venc = lanc["data_primeiro_vencimento"] + timedelta(days=30 * i)
+                paga = 1 if venc < date.today() and rnd.random() < 0.8 else 0
+                parc_rows.append({
+                    "usuario_id": user.id, "lancamento_id": lanc_id, "numero_parcela": i + 1,
+                    "data_vencimento": venc, "valor": 100, "paga": paga,
+                    "data_pagamento": venc if paga else None, "valor_pago": 100 if paga else None,
+                })
+        for i in range(0, len(parc_rows), 5000):
+            db.execute(insert(Parcela), parc_rows[i:i + 5000])
+        db.commit()
+
+        token = create_access_token(data={"sub": str(user.id), "email": user.email})
+        return user.id, token
+    finally:
+        db.close()
+
+
+def percentil(valores, p: float) -> float:
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    idx = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[idx]
+
+
+def imprimir_latencias(titulo: str, latencias_ms):
+    print(f"{titulo}: n={len(latencias_ms)} "
+          f"p50={percentil(latencias_ms, 50):.1f}ms "
+          f"p95={percentil(latencias_ms, 95):.1f}ms "
+          f"p99={percentil(latencias_ms, 99):.1f}ms "
+          f"max={max(latencias_ms):.1f}ms")
+
+
+# ============================================================================
+# CENÁRIOS
+# ============================================================================
+
+async def cenario_event_loop(args):
+    _, token = preparar_banco(args.parcelas)
+    headers = {"Authorization": f"Bearer {token}"}
+    inicio = (date.today() - timedelta(days=365 * 4)).isoformat()
+    fim = (date.today() + timedelta(days=365)).isoformat()
+    url_dashboard = f"/api/dashboard?tipo_data=vencimento&data_inicio={inicio}&data_fim={fim}"
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+            # Aquecimento
+            await client.get("/api/tipos")
+            t0 = time.perf_counter()
+            await client.get(url_dashboard)
+            print(f"Dashboard isolado: {(time.perf_counter() - t0) * 1000:.1f}ms")
+
+            parar = asyncio.Event()
+            dashboards = []
+
+            async def carga():
+                while not parar.is_set():
+                    t = time.perf_counter()
+                    await client.get(url_dashboard)
+                    dashboards.append((time.perf_counter() - t) * 1000)
+
+            async def amostrar_tipos():
+                lat = []
+                for _ in range(args.amostras):
+                    t = time.perf_counter()
+                    r = await client.get("/api/tipos")
+                    assert r.status_code == 200, r.text
+                    lat.append((time.perf_counter() - t) * 1000)
+                    await asyncio.sleep(0.005)
+                return lat
+
+            tarefas = [asyncio.create_task(carga()) for _ in range(args.concorrencia)]
+            latencias = await amostrar_tipos()
+            parar.set()
+            await asyncio.gather(*tarefas)
+
+    print(f"Parcelas: {args.parcelas} | Dashboards concorrentes: {args.concorrencia}")
+    imprimir_latencias("/api/tipos sob carga", latencias)
+    if dashboards:
+        imprimir_latencias("/api/dashboard", dashboards)
+
+
+async def cenario_dashboard(args):
+    _, token = preparar_banco(args.parcelas)
+    headers = {"Authorization": f"Bearer {token}"}
+    inicio = (date.today() - timedelta(days=365)).isoformat()
+    fim = date.today().isoformat()
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+            print(f"Parcelas: {args.parcelas}")
+            for tipo_data in ("vencimento", "pagamento", "lancamento"):
+                url = f"/api/dashboard?tipo_data={tipo_data}&data_inicio={inicio}&data_fim={fim}"
+                await client.get(url)  # aquecimento
+                latencias = []
+                for _ in range(args.repeticoes):
+                    t = time.perf_counter()
+                    r = await client.get(url)
+                    assert r.status_code == 200, r.text
+                    latencias.append((time.perf_counter() - t) * 1000)
+                imprimir_latencias(f"/api/dashboard tipo_data={tipo_data}", latencias)
+
+
+def _rss_mb() -> float:
+    # ru_maxrss vem em KB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def medir_exportacao_excel(url: str, usuario_id: int):
+    """Executado no subprocesso: baixa uma exportação e imprime tempo, tamanho e RSS."""
+    # A chave do JWT pode ser gerada por processo: o token é criado aqui
+    with SessionLocal() as db:
+        user = db.get(User, usuario_id)
+        token = create_access_token(data={"sub": str(user.id), "email": user.email})
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 headers={"Authorization": f"Bearer {token}"}) as client:
+        rss_inicial = _rss_mb()
+        t = time.perf_counter()
+        r = await client.get(url)
+        assert r.status_code == 200, r.text
+        duracao = time.perf_counter() - t
+    print(f"{url}: {duracao:.2f}s | {len(r.content) / (1024 * 1024):.1f} MB | "
+          f"RSS pico {_rss_mb():.0f} MB (+{_rss_mb() - rss_inicial:.0f} MB na exportação)")
+
+
+def cenario_excel(args):
+    usuario_id, _ = preparar_banco(args.parcelas)
+    print(f"Parcelas: {args.parcelas}")
+    for url in ("/api/relatorios/parcelas-excel", "/api/relatorios/lancamentos-excel"):
+        subprocess.run(
+            [sys.executable, __file__, "_excel", "--url", url, "--usuario", str(usuario_id)],
+            env={**os.environ, "DB_PATH": os.environ["DB_PATH"]}, check=True
+        )
+
+
+async def cenario_financiamento(args):
+    _, token = preparar_banco(args.parcelas)
+    headers = {"Authorization": f"Bearer {token}"}
+    dados = {
+        "data_lancamento": date.today().isoformat(), "tipo": "despesa", "fornecedor": "Financiamento",
+        "valor_total": 350_000.00, "data_primeiro_vencimento": (date.today() + timedelta(days=31)).isoformat(),
+        "numero_parcelas": args.numero_parcelas, "valor_medio_parcelas": round(350_000 / args.numero_parcelas, 2),
+    }
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+            print(f"Parcelas de fundo: {args.parcelas} | Parcelas por lançamento: {args.numero_parcelas}")
+            criados, criacao = [], []
+            for _ in range(args.repeticoes):
+                t = time.perf_counter()
+                r = await client.post("/api/lancamentos", json=dados)
+                assert r.status_code == 200, r.text
+                criacao.append((time.perf_counter() - t) * 1000)
+                criados.append(r.json()["id"])
+            imprimir_latencias("POST /api/lancamentos", criacao)
+
+            # Só a observação (parcelas intactas) e depois o valor (todas as parcelas mudam)
+            for titulo, alteracao in (("observacao", {"observacao": "Editado"}),
+                                      ("valor_total", {"valor_total": 360_000.00})):
+                edicao = []
+                for lancamento_id in criados:
+                    t = time.perf_counter()
+                    r = await client.put(f"/api/lancamentos/{lancamento_id}", json={**dados, **alteracao})
+                    assert r.status_code == 200, r.text
+                    edicao.append((time.perf_counter() - t) * 1000)
+                imprimir_latencias(f"PUT /api/lancamentos/{{id}} ({titulo})", edicao)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks da API")
+    sub = parser.add_subparsers(dest="cenario", required=True)
+
+    p = sub.add_parser("event-loop", help="Latência de /api/tipos sob carga de /api/dashboard")
+    p.add_argument("--parcelas", type=int, default=100_000)
+    p.add_argument("--concorrencia", type=int, default=8)
+    p.add_argument("--amostras", type=int, default=200)
+
+    p = sub.add_parser("dashboard", help="Latência de /api/dashboard por tipo_data")
+    p.add_argument("--parcelas", type=int, default=120_000)
+    p.add_argument("--repeticoes", type=int, default=20)
+
+    p = sub.add_parser("excel", help="Tempo e pico de RSS das exportações Excel")
+    p.add_argument("--parcelas", type=int, default=100_000)
+
+    p = sub.add_parser("financiamento", help="Criação e edição de lançamentos com muitas parcelas")
+    p.add_argument("--parcelas", type=int, default=10_000)
+    p.add_argument("--numero-parcelas", type=int, default=360)
+    p.add_argument("--repeticoes", type=int, default=30)
+
+    # Uso interno do cenário excel (uma exportação por processo)
+    p = sub.add_parser("_excel")
+    p.add_argument("--url", required=True)
+    p.add_argument("--usuario", type=int, required=True)
+
+    args = parser.parse_args()
+    if args.cenario == "event-loop":
+        asyncio.run(cenario_event_loop(args))
+    elif args.cenario == "dashboard":
+        asyncio.run(cenario_dashboard(args))
+    elif args.cenario == "excel":
+        cenario_excel(args)
+    elif args.cenario == "financiamento":
+        asyncio.run(cenario_financiamento(args))
+    elif args.cenario == "_excel":
+        asyncio.run(medir_exportacao_excel(args.url, args.usuario))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Script de migração para criar os índices compostos dos caminhos quentes
+(parcelas/lancamentos). Idempotente: pode ser executado várias vezes.
+
+Os nomes e colunas são os mesmos declarados nos modelos (app/main.py), de modo
+que bancos novos (create_all) e bancos migrados fiquem com o mesmo conjunto.
+
+Uso:
+    python migrate_add_indices.py            # cria os índices que faltarem
+    python migrate_add_indices.py --explain  # mostra o EXPLAIN QUERY PLAN por endpoint
+"""
+import os
+import sqlite3
+import sys
+
+DB_PATH = os.getenv("DB_PATH", "lancamentos.db")
+
+# (nome, tabela, colunas)
+INDICES = [
+    ("ix_parcelas_lancamento_id", "parcelas", ("lancamento_id",)),
+    ("ix_parcelas_usuario_paga_vencimento", "parcelas", ("usuario_id", "paga", "data_vencimento")),
+    ("ix_parcelas_usuario_vencimento", "parcelas", ("usuario_id", "data_vencimento")),
+    ("ix_parcelas_usuario_pagamento", "parcelas", ("usuario_id", "data_pagamento")),
+    ("ix_lancamentos_usuario_data_lancamento", "lancamentos", ("usuario_id", "data_lancamento")),
+    ("ix_lancamentos_usuario_valor_total", "lancamentos", ("usuario_id", "valor_total")),
+    ("ix_lancamentos_tipo_lancamento_id", "lancamentos", ("tipo_lancamento_id",)),
+]
+
+# Consultas representativas de cada endpoint (mesma forma do SQL gerado pelo ORM)
+CONSULTAS = {
+    "GET /api/parcelas/a-vencer": """
+        SELECT parcelas.id, parcelas.data_vencimento, parcelas.valor, lancamentos.fornecedor
+        FROM parcelas JOIN lancamentos ON parcelas.lancamento_id = lancamentos.id
+        WHERE parcelas.paga = 0 AND parcelas.usuario_id = 1 AND parcelas.data_vencimento <= '2025-12-31'
+        ORDER BY parcelas.data_vencimento, parcelas.lancamento_id
+    """,
+    "GET /api/dashboard (vencimento)": """
+        SELECT sum(parcelas.valor)
+        FROM parcelas JOIN lancamentos ON parcelas.lancamento_id = lancamentos.id
+        WHERE lancamentos.tipo = 'despesa' AND parcelas.usuario_id = 1 AND lancamentos.usuario_id = 1
+          AND parcelas.data_vencimento >= '2025-01-01' AND parcelas.data_vencimento <= '2025-01-31'
+    """,
+    "GET /api/dashboard (pagamento)": """
+        SELECT sum(parcelas.valor_pago)
+        FROM parcelas JOIN lancamentos ON parcelas.lancamento_id = lancamentos.id
+        WHERE lancamentos.tipo = 'despesa' AND parcelas.paga = 1 AND parcelas.usuario_id = 1
+          AND lancamentos.usuario_id = 1
+          AND parcelas.data_pagamento >= '2025-01-01' AND parcelas.data_pagamento <= '2025-01-31'
+    """,
+    "GET /api/dashboard (lancamento)": """
+        SELECT sum(lancamentos.valor_total) FROM lancamentos
+        WHERE lancamentos.tipo = 'despesa' AND lancamentos.usuario_id = 1
+          AND lancamentos.data_lancamento >= '2025-01-01' AND lancamentos.data_lancamento <= '2025-01-31'
+    """,
+    "GET /api/parcelas/pagas": """
+        SELECT parcelas.id FROM parcelas JOIN lancamentos ON parcelas.lancamento_id = lancamentos.id
+        WHERE parcelas.paga = 1 AND parcelas.usuario_id = 1
+          AND parcelas.data_pagamento >= '2025-01-01' AND parcelas.data_pagamento <= '2025-12-31'
+        ORDER BY parcelas.data_pagamento DESC
+    """,
+    "PUT/DELETE /api/lancamentos/{id}": """
+        DELETE FROM parcelas WHERE parcelas.lancamento_id = 1
+    """,
+    "GET /api/lancamentos/{id}/parcelas": """
+        SELECT parcelas.id FROM parcelas
+        WHERE parcelas.lancamento_id = 1 AND parcelas.usuario_id = 1
+        ORDER BY parcelas.numero_parcela
+    """,
+    "DELETE /api/tipos/{id}": """
+        SELECT count(*) FROM lancamentos
+        WHERE lancamentos.tipo_lancamento_id = 1 AND lancamentos.usuario_id = 1
+    """,
+    "GET /api/lancamentos?ordenar=valor_total&after_id=": """
+        SELECT lancamentos.id FROM lancamentos
+        WHERE lancamentos.usuario_id = 1
+          AND (lancamentos.valor_total < 100 OR (lancamentos.valor_total = 100 AND lancamentos.id < 50))
+        ORDER BY lancamentos.valor_total DESC, lancamentos.id DESC LIMIT 101
+    """,
+    "GET /api/diagnostico (soma das parcelas)": """
+        SELECT lancamentos.id FROM lancamentos
+        LEFT OUTER JOIN parcelas ON parcelas.lancamento_id = lancamentos.id
+        WHERE lancamentos.usuario_id = 1
+        GROUP BY lancamentos.id, lancamentos.valor_total
+        HAVING abs(lancamentos.valor_total - coalesce(sum(parcelas.valor), 0)) > 0.01
+    """,
+}
+
+
+def migrate():
+    """Cria os índices que ainda não existem e atualiza as estatísticas do planejador"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='index'")
+        existentes = {row[0] for row in cursor.fetchall()}
+
+        criados = 0
+        for nome, tabela, colunas in INDICES:
+            if nome in existentes:
+                print(f"✓ Índice {nome} já existe")
+                continue
+            print(f"Criando índice {nome} em {tabela}({', '.join(colunas)})...")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {nome} ON {tabela} ({', '.join(colunas)})")
+            criados += 1
+
+        if criados:
+            # Estatísticas ajudam o planejador a escolher entre índices compostos
+            cursor.execute("ANALYZE")
+        conn.commit()
+        print(f"✓ Migração concluída com sucesso! ({criados} índice(s) criado(s))")
+
+    except Exception as e:
+        print(f"✗ Erro na migração: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def explicar():
+    """Imprime o plano de execução das consultas representativas de cada endpoint"""
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        for endpoint, sql in CONSULTAS.items():
+            print(f"\n{endpoint}")
+            for row in conn.execute("EXPLAIN QUERY PLAN " + sql):
+                print(f"  {row[-1]}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    if "--explain" in sys.argv:
+        explicar()
+        sys.exit(0)
+    print("=" * 60)
+    print("MIGRAÇÃO: Índices compostos de parcelas e lançamentos")
+    print("=" * 60)
+    migrate()
+    print("=" * 60)
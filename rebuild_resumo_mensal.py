@@ -0,0 +1,39 @@
+"""
+Reconstrói a tabela resumo_mensal (totais mensais materializados) a partir das
+parcelas e lançamentos. Use após importar dados diretamente no banco ou restaurar
+um backup antigo.
+
+Uso:
+    python rebuild_resumo_mensal.py              # todos os usuários
+    python rebuild_resumo_mensal.py <usuario_id> # apenas um usuário
+"""
+import sys
+import time
+
+from app.main import SessionLocal
+from app.resumo_mensal import reconstruir_todos
+
+
+def main():
+    usuario_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    db = SessionLocal()
+    try:
+        inicio = time.perf_counter()
+        resultado = reconstruir_todos(db, usuario_id)
+        duracao = time.perf_counter() - inicio
+        for uid, linhas in resultado.items():
+            print(f"✓ Usuário {uid}: {linhas} linha(s) de resumo")
+        print(f"✓ Resumo mensal reconstruído para {len(resultado)} usuário(s) em {duracao:.2f}s")
+    except Exception as e:
+        print(f"✗ Erro ao reconstruir resumo mensal: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("RESUMO MENSAL: Reconstrução")
+    print("=" * 60)
+    main()
+    print("=" * 60)
@@ -21,6 +21,7 @@ from app.main import (
     Lancamento, Parcela
 )
 from app.auth import get_password_hash
+from app.resumo_mensal import reconstruir_usuario
 
 
 def get_or_create_user(db, email: str | None):
@@ -184,6 +185,10 @@ def main():
             created += 1
 
         print(f"✓ {created} lançamentos criados com parcelas distribuídas (incluindo vencimentos até 2027)")
+
+        # Dados inseridos diretamente: refazer o resumo mensal do usuário
+        reconstruir_usuario(db, user.id)
+        db.commit()
     finally:
         db.close()
 
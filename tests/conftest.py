@@ -13,8 +13,17 @@ from fastapi.testclient import TestClient
 # Adicionar diretório raiz ao path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+# PDFs gerados nos testes não vão para o cache do projeto
+import tempfile
+os.environ.setdefault("PDF_CACHE_DIR", tempfile.mkdtemp(prefix="cache_pdf_testes_"))
+# Sem threads de jobs: os testes processam a fila com jobs.processar_proximo
+os.environ.setdefault("JOBS_WORKERS", "0")
+os.environ.setdefault("JOBS_DIR", tempfile.mkdtemp(prefix="jobs_testes_"))
+
 from app.main import app, Base, get_db, TipoLancamento, Lancamento, Parcela, User
 from app.middleware import get_current_active_user, get_current_admin_user, get_db as middleware_get_db
+from app.cache_respostas import CACHE as CACHE_RESPOSTAS
+from app.main import CACHE_PDF
 
 # Banco de dados de teste em arquivo temporário
 TEST_DATABASE_URL = "sqlite:///./test.db"
@@ -92,6 +101,10 @@ def client(db_session, test_user):
     app.dependency_overrides[get_current_active_user] = override_active_user
     app.dependency_overrides[get_current_admin_user] = override_admin_user
 
+    # Cada teste usa um banco novo (mesmos ids e versões): o cache de respostas não pode vazar
+    CACHE_RESPOSTAS.limpar()
+    CACHE_PDF.limpar()
+
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
@@ -0,0 +1,126 @@
+"""
+Testes dos backups online (API de backup do SQLite + compressão + verificação)
+"""
+import sqlite3
+import threading
+from contextlib import closing
+
+import pytest
+
+from app import backup
+
+
+def _banco(caminho, linhas=2000):
+    with closing(sqlite3.connect(str(caminho))) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, valor TEXT)")
+        conn.executemany("INSERT INTO t (valor) VALUES (?)", [(f"linha {i}" * 5,) for i in range(linhas)])
+        conn.commit()
+
+
+def _contar(caminho):
+    with closing(sqlite3.connect(str(caminho))) as conn:
+        return conn.execute("SELECT count(*) FROM t").fetchone()[0]
+
+
+@pytest.mark.parametrize("compressao", ["gzip", "none"])
+def test_backup_comprimido_e_verificado(tmp_path, compressao):
+    db = tmp_path / "dados.db"
+    _banco(db)
+    destino = tmp_path / "backups"
+    destino.mkdir()
+
+    resultado = backup.criar_backup_online(db, destino, compressao=compressao)
+    assert resultado["success"] is True
+    assert resultado["filename"].endswith(backup.EXTENSOES[compressao])
+    assert resultado["paginas"] > 0
+    assert resultado["throughput_mb_s"] is not None
+    if compressao == "gzip":
+        assert resultado["size"] < resultado["tamanho_original"]
+
+    arquivo = destino / resultado["filename"]
+    assert backup.sha256_arquivo(arquivo) == resultado["sha256"]
+
+    backup.aguardar_verificacoes()
+    assert backup.ler_metadados(arquivo)["verificacao"]["status"] == "ok"
+    # Sem temporários sobrando no diretório de backups
+    assert sorted(p.name for p in destino.iterdir()) == sorted([arquivo.name, arquivo.name + ".json", backup.CATALOGO])
+
+
+def test_verificacao_detecta_arquivo_alterado(tmp_path):
+    db = tmp_path / "dados.db"
+    _banco(db)
+    resultado = backup.criar_backup_online(db, tmp_path, compressao="gzip")
+    backup.aguardar_verificacoes()
+
+    arquivo = tmp_path / resultado["filename"]
+    conteudo = bytearray(arquivo.read_bytes())
+    conteudo[len(conteudo) // 2] ^= 0xFF
+    arquivo.write_bytes(bytes(conteudo))
+
+    assert backup.verificar_backup(arquivo)["status"] == "falhou"
+    assert backup.ler_metadados(arquivo)["verificacao"]["detalhe"] == "checksum não confere"
+
+
+def test_backup_com_escritas_concorrentes_e_restauracao(tmp_path):
+    db = tmp_path / "dados.db"
+    _banco(db)
+    parar = threading.Event()
+
+    def _escrever():
+        with closing(sqlite3.connect(str(db), timeout=10)) as conn:
+            while not parar.is_set():
+                conn.execute("INSERT INTO t (valor) VALUES ('concorrente')")
+                conn.commit()
+
+    escritor = threading.Thread(target=_escrever)
+    escritor.start()
+    try:
+        resultado = backup.criar_backup_online(db, tmp_path, compressao="gzip", prefixo="backup")
+    finally:
+        parar.set()
+        escritor.join()
+
+    backup.aguardar_verificacoes()
+    arquivo = tmp_path / resultado["filename"]
+    assert backup.ler_metadados(arquivo)["verificacao"]["status"] == "ok"
+
+    # Restaurar sobre o banco com uma conexão aberta: ela passa a ver os dados do backup
+    with closing(sqlite3.connect(str(db))) as aberta:
+        aberta.execute("DELETE FROM t")
+        aberta.commit()
+        backup.restaurar_online(arquivo, db)
+        assert aberta.execute("SELECT count(*) FROM t").fetchone()[0] >= 2000
+    assert _contar(db) >= 2000
+
+
+def test_catalogo_paginado_e_reconstruido(tmp_path):
+    db = tmp_path / "dados.db"
+    _banco(db, linhas=200)
+    with closing(sqlite3.connect(str(db))) as conn:
+        conn.execute("CREATE TABLE versoes_dados (usuario_id INTEGER PRIMARY KEY, versao INTEGER)")
+        conn.executemany("INSERT INTO versoes_dados VALUES (?, ?)", [(1, 3), (2, 4)])
+        conn.commit()
+    destino = tmp_path / "backups"
+    destino.mkdir()
+
+    criados = [backup.criar_backup_online(db, destino, compressao="gzip")["filename"] for _ in range(5)]
+    backup.aguardar_verificacoes()
+
+    pagina = backup.consultar_catalogo(destino, limite=2, offset=1)
+    assert pagina["total"] == 5
+    assert [b["filename"] for b in pagina["backups"]] == criados[::-1][1:3]
+    registro = pagina["backups"][0]
+    assert registro["versao_dados"] == 7
+    assert registro["verificacao"] == "ok"
+    assert 0 < registro["taxa_compressao"] < 1
+
+    backup.remover_backup(destino / criados[0])
+    assert backup.consultar_catalogo(destino)["total"] == 4
+
+    # Catálogo perdido: reconstruído a partir dos metadados ao lado de cada backup
+    (destino / backup.CATALOGO).unlink()
+    reconstruido = backup.consultar_catalogo(destino)
+    assert [b["filename"] for b in reconstruido["backups"]] == criados[:0:-1]
+    assert reconstruido["tamanho_total"] == sum((destino / nome).stat().st_size for nome in criados[1:])
+    assert {b["verificacao"] for b in reconstruido["backups"]} == {"ok"}
@@ -87,3 +87,98 @@ def test_overdue_blocks_write_then_payment_allows_write(client, db_session):
     assert body["nome"] == "Cartão Teste"
 
     app.dependency_overrides.pop(get_current_active_user, None)
+
+
+def test_write_request_loads_user_and_subscription_once(client, db_session, db_engine, test_user):
+    from sqlalchemy import event
+    from app.auth import create_access_token
+
+    # Autenticação real via token (sem override), para exercitar guard + dependências
+    app.dependency_overrides.pop(get_current_active_user, None)
+    token = create_access_token(data={"sub": str(test_user.id), "email": test_user.email})
+    db_session.add(Assinatura(
+        usuario_id=test_user.id,
+        status="ativa",
+        data_inicio=date.today(),
+        proximo_vencimento=date.today() + timedelta(days=30),
+        valor_mensal="29.90",
+        trial_ate=None,
+        created_at=date.today(),
+    ))
+    db_session.commit()
+
+    statements = []
+
+    def _capturar(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", _capturar)
+    try:
+        r = client.post(
+            "/api/tipos",
+            json={"nome": "Salário", "natureza": "receita"},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+    finally:
+        event.remove(db_engine, "before_cursor_execute", _capturar)
+
+    assert r.status_code == 200, r.text
+    selects_users = [s for s in statements if s.lstrip().upper().startswith("SELECT") and "FROM users" in s]
+    selects_assinaturas = [s for s in statements if s.lstrip().upper().startswith("SELECT") and "FROM assinaturas" in s]
+    assert len(selects_users) == 1
+    assert len(selects_assinaturas) == 1
+
+
+def test_read_requests_only_load_user_when_route_needs_it(client, db_session, db_engine, test_user):
+    from sqlalchemy import event
+    from app.auth import create_access_token
+
+    app.dependency_overrides.pop(get_current_active_user, None)
+    token = create_access_token(data={"sub": str(test_user.id), "email": test_user.email})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    statements = []
+
+    def _capturar(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    def _selects_users():
+        return [s for s in statements if s.lstrip().upper().startswith("SELECT") and "FROM users" in s]
+
+    event.listen(db_engine, "before_cursor_execute", _capturar)
+    try:
+        # Rota sem usuário: guard de assinatura e ETag não carregam o usuário
+        assert client.get("/health", headers=headers).status_code == 200
+        assert _selects_users() == []
+
+        # Rota autenticada: uma consulta de usuário, nenhuma de assinatura
+        assert client.get("/api/metas", headers=headers).status_code == 200
+        assert len(_selects_users()) == 1
+        assert not any("FROM assinaturas" in s for s in statements)
+    finally:
+        event.remove(db_engine, "before_cursor_execute", _capturar)
+
+
+def test_overdue_blocks_write_with_bearer_token(client, db_session, test_user):
+    from app.auth import create_access_token
+
+    app.dependency_overrides.pop(get_current_active_user, None)
+    token = create_access_token(data={"sub": str(test_user.id), "email": test_user.email})
+    db_session.add(Assinatura(
+        usuario_id=test_user.id,
+        status="ativa",
+        data_inicio=date.today() - timedelta(days=40),
+        proximo_vencimento=date.today() - timedelta(days=5),
+        valor_mensal="29.90",
+        trial_ate=None,
+        created_at=date.today() - timedelta(days=40),
+    ))
+    db_session.commit()
+
+    r = client.post(
+        "/api/tipos",
+        json={"nome": "Salário", "natureza": "receita"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert r.status_code == 402
+    assert r.json()["detail"]["status"] == "inadimplente"
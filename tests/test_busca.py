@@ -0,0 +1,151 @@
+"""
+Testes da busca textual (FTS5 no SQLite) e do filtro de fornecedor
+"""
+from datetime import date
+
+from sqlalchemy import event
+
+from app.main import Lancamento, LancamentoRecorrente, Parcela
+
+
+def _lancamento(db_session, test_user, tipo, fornecedor, observacao=None, valor=100):
+    hoje = date.today()
+    l = Lancamento(
+        usuario_id=test_user.id, data_lancamento=hoje, tipo="despesa", tipo_lancamento_id=tipo.id,
+        fornecedor=fornecedor, valor_total=valor, data_primeiro_vencimento=hoje,
+        numero_parcelas=1, valor_medio_parcelas=valor, observacao=observacao
+    )
+    db_session.add(l)
+    db_session.commit()
+    return l
+
+
+def test_busca_prefixo_sem_acentos_e_ranqueada(client, db_session, test_user, tipo_despesa):
+    _lancamento(db_session, test_user, tipo_despesa, "Mercado Livre", "fone de ouvido")
+    _lancamento(db_session, test_user, tipo_despesa, "Padaria", "pão e café do mercado")
+    _lancamento(db_session, test_user, tipo_despesa, "Companhia de Água")
+
+    r = client.get("/api/busca?q=merc")
+    assert r.status_code == 200
+    data = r.json()
+    assert data["motor"] == "fts5"
+    titulos = [x["titulo"] for x in data["resultados"]]
+    # Fornecedor pesa mais que observação
+    assert titulos == ["Mercado Livre", "Padaria"]
+
+    r = client.get("/api/busca?q=agua")
+    assert [x["titulo"] for x in r.json()["resultados"]] == ["Companhia de Água"]
+
+    r = client.get("/api/busca?q=merc liv")
+    assert [x["titulo"] for x in r.json()["resultados"]] == ["Mercado Livre"]
+
+
+def test_busca_acompanha_alteracoes_e_exclusoes(client, db_session, test_user, tipo_despesa):
+    l = _lancamento(db_session, test_user, tipo_despesa, "Farmácia Central")
+    assert client.get("/api/busca?q=farmacia").json()["total"] == 1
+
+    l.fornecedor = "Drogaria Central"
+    db_session.commit()
+    assert client.get("/api/busca?q=farmacia").json()["total"] == 0
+    assert client.get("/api/busca?q=drogaria").json()["total"] == 1
+
+    db_session.delete(l)
+    db_session.commit()
+    assert client.get("/api/busca?q=central").json()["total"] == 0
+
+
+def test_busca_abrange_parcelas_e_recorrentes(client, db_session, test_user, tipo_despesa):
+    l = _lancamento(db_session, test_user, tipo_despesa, "Escola")
+    db_session.add(Parcela(
+        usuario_id=test_user.id, lancamento_id=l.id, numero_parcela=1, data_vencimento=date.today(),
+        valor=100, paga=1, data_pagamento=date.today(), valor_pago=100,
+        observacao_pagamento="pago via boleto bancário"
+    ))
+    db_session.add(LancamentoRecorrente(
+        usuario_id=test_user.id, tipo="despesa", fornecedor="Academia", valor_total=90,
+        dia_vencimento=5, numero_parcelas=1, frequencia="mensal", ativo=1,
+        data_inicio=date.today(), observacao="plano anual com boleto", created_at=date.today()
+    ))
+    db_session.commit()
+
+    resultados = client.get("/api/busca?q=boleto").json()["resultados"]
+    origens = {(x["origem"], x["lancamento_id"]) for x in resultados}
+    assert ("parcela", l.id) in origens
+    assert ("recorrente", None) in origens
+
+
+def test_busca_isola_usuarios(client, db_session, test_user, tipo_despesa):
+    db_session.add(Lancamento(
+        usuario_id=test_user.id + 1, data_lancamento=date.today(), tipo="despesa",
+        fornecedor="Fornecedor Secreto", valor_total=10, data_primeiro_vencimento=date.today(),
+        numero_parcelas=1, valor_medio_parcelas=10
+    ))
+    db_session.commit()
+    assert client.get("/api/busca?q=secreto").json()["total"] == 0
+
+
+def test_busca_ignora_operadores(client, db_session, test_user, tipo_despesa):
+    _lancamento(db_session, test_user, tipo_despesa, "Posto Shell")
+    r = client.get('/api/busca?q="posto" (*')
+    assert r.status_code == 200
+    assert r.json()["total"] == 1
+    assert client.get("/api/busca?q=%20").json()["total"] == 0
+
+
+def test_filtro_fornecedor_usa_indice_fts(client, db_session, db_engine, test_user, tipo_despesa):
+    _lancamento(db_session, test_user, tipo_despesa, "Mercado Livre", "compra")
+    _lancamento(db_session, test_user, tipo_despesa, "Padaria", "mercado")
+
+    statements = []
+
+    def _capturar(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", _capturar)
+    try:
+        r = client.get("/api/lancamentos?fornecedor=mercado")
+    finally:
+        event.remove(db_engine, "before_cursor_execute", _capturar)
+
+    # Só o fornecedor conta no filtro (observação não)
+    assert [l["fornecedor"] for l in r.json()] == ["Mercado Livre"]
+    assert any("busca_fornecedores MATCH" in s for s in statements)
+    assert not any("lower(lancamentos.fornecedor) LIKE" in s for s in statements)
+
+
+def test_filtro_fornecedor_acha_trecho_no_meio_da_palavra(client, db_session, test_user, tipo_despesa):
+    _lancamento(db_session, test_user, tipo_despesa, "Supermercado Extra")
+    _lancamento(db_session, test_user, tipo_despesa, "Hipermercado Água Branca")
+    _lancamento(db_session, test_user, tipo_despesa, "Padaria")
+
+    def _fornecedores(filtro):
+        r = client.get("/api/lancamentos", params={"fornecedor": filtro})
+        assert r.status_code == 200
+        return sorted(l["fornecedor"] for l in r.json())
+
+    assert _fornecedores("mercado") == ["Hipermercado Água Branca", "Supermercado Extra"]
+    # O texto inteiro é um trecho só (espaços inclusive)
+    assert _fornecedores("RMERCADO ex") == ["Supermercado Extra"]
+    assert _fornecedores("mercado xtr") == []
+    # Palavras como prefixo sem acentos continuam valendo
+    assert _fornecedores("agua bran") == ["Hipermercado Água Branca"]
+    # Textos curtos (abaixo do trigram) caem no ILIKE
+    assert _fornecedores("ri") == ["Padaria"]
+
+
+def test_filtro_fornecedor_mantem_pontuacao(client, db_session, test_user, tipo_despesa):
+    for nome in ["C&A Modas", "Casa Bahia", "Amazon.com", "Água & Cia"]:
+        _lancamento(db_session, test_user, tipo_despesa, nome)
+
+    def _fornecedores(filtro):
+        r = client.get("/api/lancamentos", params={"fornecedor": filtro})
+        assert r.status_code == 200
+        return sorted(l["fornecedor"] for l in r.json())
+
+    assert _fornecedores("C&A") == ["C&A Modas"]
+    assert _fornecedores("c&a mod") == ["C&A Modas"]
+    assert _fornecedores(".com") == ["Amazon.com"]
+    # Com pontuação, só o trecho literal (maiúsculas/minúsculas à parte)
+    assert _fornecedores("água & cia") == ["Água & Cia"]
+    assert _fornecedores("agua & cia") == []
+    assert _fornecedores("agua cia") == ["Água & Cia"]
@@ -0,0 +1,94 @@
+"""
+Testes do cache de respostas dos relatórios (LRU + TTL + nível compartilhado)
+"""
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app.cache_respostas import CACHE, CacheCompartilhado, CacheRespostas, montar_chave
+
+
+def test_lru_remove_a_entrada_menos_usada():
+    cache = CacheRespostas(max_entradas=2, ttl=60)
+    cache.guardar("a", 1)
+    cache.guardar("b", 2)
+    assert cache.obter("a") == (True, 1)
+    cache.guardar("c", 3)  # "b" é a menos usada
+
+    assert cache.obter("b") == (False, None)
+    assert cache.obter("a") == (True, 1)
+    assert cache.obter("c") == (True, 3)
+    stats = cache.estatisticas()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+
+
+def test_ttl_expira_entrada():
+    cache = CacheRespostas(max_entradas=10, ttl=0.01)
+    cache.guardar("a", 1)
+    time.sleep(0.02)
+    assert cache.obter("a") == (False, None)
+    assert cache.estatisticas()["expiracoes"] == 1
+
+
+def test_nivel_compartilhado_entre_instancias(tmp_path):
+    caminho = str(tmp_path / "cache.db")
+    worker1 = CacheRespostas(max_entradas=10, ttl=60, compartilhado=CacheCompartilhado(caminho, 100))
+    worker2 = CacheRespostas(max_entradas=10, ttl=60, compartilhado=CacheCompartilhado(caminho, 100))
+
+    worker1.guardar("chave", {"total": "10.00"})
+    assert worker2.obter("chave") == (True, {"total": "10.00"})
+    assert worker2.estatisticas()["hits_compartilhado"] == 1
+    # Agora também está na memória do worker2
+    assert worker2.obter("chave") == (True, {"total": "10.00"})
+    assert worker2.estatisticas()["hits"] == 1
+
+
+def test_chave_normaliza_parametros():
+    a = montar_chave("/api/dashboard", 1, 3, {"tipos": "3,1", "natureza": None})
+    b = montar_chave("/api/dashboard", 1, 3, {"tipos": "1, 3"})
+    assert a == b
+    assert a != montar_chave("/api/dashboard", 1, 4, {"tipos": "1,3"})
+    assert a != montar_chave("/api/dashboard", 2, 3, {"tipos": "1,3"})
+
+
+def test_dashboard_repetido_nao_consulta_parcelas(client, db_engine, lancamento_receita):
+    inicio = date.today().isoformat()
+    fim = (date.today() + timedelta(days=30)).isoformat()
+    url = f"/api/dashboard?data_inicio={inicio}&data_fim={fim}"
+
+    primeiro = client.get(url)
+    assert primeiro.status_code == 200
+
+    statements = []
+
+    def _capturar(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", _capturar)
+    try:
+        segundo = client.get(url)
+    finally:
+        event.remove(db_engine, "before_cursor_execute", _capturar)
+
+    assert segundo.json() == primeiro.json()
+    assert not [s for s in statements if "FROM parcelas" in s]
+    assert CACHE.estatisticas()["hits"] >= 1
+
+
+def test_escrita_invalida_cache(client, lancamento_receita):
+    inicio = date.today().isoformat()
+    fim = (date.today() + timedelta(days=30)).isoformat()
+    url = f"/api/dashboard?data_inicio={inicio}&data_fim={fim}&tipo_data=pagamento"
+
+    antes = client.get(url).json()
+    parcelas = client.get(f"/api/lancamentos/{lancamento_receita.id}/parcelas").json()
+    r = client.patch(f"/api/parcelas/{parcelas[0]['id']}/pagar", json={
+        "paga": True, "data_pagamento": date.today().isoformat(), "valor_pago": 5000
+    })
+    assert r.status_code == 200, r.text
+
+    depois = client.get(url).json()
+    assert depois != antes
@@ -0,0 +1,123 @@
+"""
+Testes do cronograma de parcelas (valores exatos e INSERT em lote)
+"""
+from datetime import date
+from decimal import Decimal
+
+from app.cronograma import datas_de_vencimento, dividir_valor, gerar_cronograma
+from app.main import IntegridadePendente, Lancamento, Parcela
+
+
+def test_dividir_valor_exato_em_centavos():
+    assert dividir_valor(100, 3) == [Decimal("33.33"), Decimal("33.33"), Decimal("33.34")]
+    # Arredondamento para cima: o ajuste negativo vai para as últimas
+    assert dividir_valor(200, 3) == [Decimal("66.67"), Decimal("66.67"), Decimal("66.66")]
+    valores = dividir_valor(350000, 360)
+    assert sum(valores) == Decimal("350000.00")
+    assert max(valores) - min(valores) <= Decimal("0.01")
+
+
+def test_vencimentos_no_fim_do_mes():
+    assert datas_de_vencimento(date(2024, 1, 31), 4) == [
+        date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)
+    ]
+    assert datas_de_vencimento(date(2026, 11, 10), 3, meses=3) == [
+        date(2026, 11, 10), date(2027, 2, 10), date(2027, 5, 10)
+    ]
+    assert [p.numero_parcela for p in gerar_cronograma(10, date(2026, 1, 1), 3)] == [1, 2, 3]
+
+
+def test_financiamento_360_parcelas(client, db_session, test_user):
+    payload = {
+        "data_lancamento": "2026-01-05", "tipo": "despesa", "fornecedor": "Financiamento",
+        "valor_total": 350000.00, "data_primeiro_vencimento": "2026-02-05",
+        "numero_parcelas": 360, "valor_medio_parcelas": 972.22,
+    }
+    response = client.post("/api/lancamentos", json=payload)
+    assert response.status_code == 200
+    dados = response.json()
+    assert len(dados["parcelas"]) == 360
+    assert all(p["id"] for p in dados["parcelas"])
+    assert dados["parcelas"][-1]["data_vencimento"] == "2056-01-05"
+
+    lancamento_id = dados["id"]
+    parcelas = db_session.query(Parcela).filter(Parcela.lancamento_id == lancamento_id).all()
+    assert sum(p.valor for p in parcelas) == Decimal("350000.00")
+    assert db_session.query(IntegridadePendente).filter(
+        IntegridadePendente.lancamento_id == lancamento_id).count() == 1
+
+    # Edição com menos parcelas: só a cauda é removida
+    response = client.put(f"/api/lancamentos/{lancamento_id}", json={**payload, "numero_parcelas": 12})
+    assert response.status_code == 200
+    db_session.expire_all()
+    assert db_session.query(Parcela).filter(Parcela.lancamento_id == lancamento_id).count() == 12
+
+
+def _financiamento(client, **campos):
+    payload = {
+        "data_lancamento": "2026-01-05", "tipo": "despesa", "fornecedor": "Carro",
+        "valor_total": 1200.00, "data_primeiro_vencimento": "2026-02-05",
+        "numero_parcelas": 12, "valor_medio_parcelas": 100.00,
+    }
+    payload.update(campos)
+    return payload, client.post("/api/lancamentos", json=payload).json()
+
+
+def _parcelas(db_session, lancamento_id):
+    db_session.expire_all()
+    return db_session.query(Parcela).filter(
+        Parcela.lancamento_id == lancamento_id).order_by(Parcela.numero_parcela).all()
+
+
+def test_edicao_sem_mudar_cronograma_nao_toca_parcelas(client, db_session):
+    payload, criado = _financiamento(client)
+    parcela = _parcelas(db_session, criado["id"])[0]
+    # Edição individual e pagamento da primeira parcela
+    parcela.valor = Decimal("150.00")
+    parcela.paga, parcela.data_pagamento, parcela.valor_pago = 1, date(2026, 2, 5), Decimal("150.00")
+    db_session.commit()
+    ids = [p.id for p in _parcelas(db_session, criado["id"])]
+
+    response = client.put(f"/api/lancamentos/{criado['id']}", json={**payload, "observacao": "Quitar em 2027"})
+    assert response.status_code == 200
+    assert response.json()["parcelas"][0]["paga"] is True
+
+    parcelas = _parcelas(db_session, criado["id"])
+    assert [p.id for p in parcelas] == ids
+    assert parcelas[0].valor == Decimal("150.00") and parcelas[0].valor_pago == Decimal("150.00")
+
+
+def test_edicao_do_cronograma_por_diferenca(client, db_session):
+    payload, criado = _financiamento(client)
+    primeira = _parcelas(db_session, criado["id"])[0]
+    primeira.paga, primeira.data_pagamento, primeira.valor_pago = 1, date(2026, 2, 5), Decimal("100.00")
+    db_session.commit()
+    ids = [p.id for p in _parcelas(db_session, criado["id"])]
+
+    # Mais parcelas: as 12 existentes são atualizadas (mesmos ids), só a cauda é inserida
+    response = client.put(f"/api/lancamentos/{criado['id']}", json={
+        **payload, "valor_total": 1800.00, "numero_parcelas": 18})
+    assert response.status_code == 200
+    parcelas = _parcelas(db_session, criado["id"])
+    assert [p.id for p in parcelas[:12]] == ids
+    assert len(parcelas) == 18 and {p.valor for p in parcelas} == {Decimal("100.00")}
+    assert parcelas[0].paga == 1 and parcelas[0].valor_pago == Decimal("100.00")
+
+    # Menos parcelas: só a cauda é removida
+    response = client.put(f"/api/lancamentos/{criado['id']}", json={
+        **payload, "valor_total": 600.00, "numero_parcelas": 6})
+    assert response.status_code == 200
+    parcelas = _parcelas(db_session, criado["id"])
+    assert [p.id for p in parcelas] == ids[:6]
+
+    # Remover uma parcela paga é recusado, sem alterar nada
+    sexta = parcelas[5]
+    sexta.paga, sexta.data_pagamento, sexta.valor_pago = 1, date(2026, 7, 5), Decimal("100.00")
+    db_session.commit()
+    response = client.put(f"/api/lancamentos/{criado['id']}", json={
+        **payload, "valor_total": 300.00, "numero_parcelas": 3})
+    assert response.status_code == 400
+    parcelas = _parcelas(db_session, criado["id"])
+    assert [p.id for p in parcelas] == ids[:6]
+    db_session.expire_all()
+    assert db_session.get(Lancamento, criado["id"]).numero_parcelas == 6
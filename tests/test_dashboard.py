@@ -3,6 +3,7 @@ Testes para endpoints de Dashboard e Relatórios
 """
 import pytest
 from datetime import date, timedelta
+from app.main import Lancamento, Parcela
 
 def test_dashboard_totalizadores(client, lancamento_receita, lancamento_despesa):
     """Teste: Obter totalizadores do dashboard"""
@@ -61,6 +62,36 @@ def test_dashboard_tipo_data_vencimento(client, lancamento_receita):
     data = response.json()
     assert data["periodo"]["tipo_data"] == "vencimento"
 
+def test_dashboard_vencimento_totais_e_consulta_unica(client, db_engine, lancamento_receita, lancamento_despesa):
+    """Teste: Dashboard por vencimento soma parcelas em uma única consulta agregada"""
+    from sqlalchemy import event
+
+    hoje = date.today()
+    fim = hoje + timedelta(days=45)
+    consultas = []
+
+    def _capturar(conn, cursor, statement, parameters, context, executemany):
+        if "FROM parcelas" in statement:
+            consultas.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", _capturar)
+    try:
+        response = client.get(f"/api/dashboard?tipo_data=vencimento&data_inicio={hoje.isoformat()}&data_fim={fim.isoformat()}")
+    finally:
+        event.remove(db_engine, "before_cursor_execute", _capturar)
+
+    assert response.status_code == 200
+    data = response.json()
+    # Receita: 1 parcela de 5000; despesa: 2 das 3 parcelas de 200 dentro do período
+    assert data["totalizadores"]["receitas"] == 5000.0
+    assert data["totalizadores"]["despesas"] == 400.0
+    assert data["totalizadores"]["saldo"] == 4600.0
+    assert data["totalizadores"]["qtd_receitas"] == 1
+    assert data["totalizadores"]["qtd_despesas"] == 1
+    assert data["receitas_por_tipo"] == [{"nome": "Salário", "total": 5000.0}]
+    assert data["despesas_por_tipo"] == [{"nome": "Supermercado", "total": 400.0}]
+    assert len(consultas) == 1
+
 def test_dashboard_tipo_data_pagamento(client, lancamento_receita, db_session):
     """Teste: Dashboard com tipo de data = pagamento"""
     from app.main import Parcela
@@ -159,3 +190,72 @@ def test_exportar_sem_dados(client):
     
     response = client.get(f"/api/relatorios/parcelas-excel?data_inicio={inicio.isoformat()}&data_fim={fim.isoformat()}")
     assert response.status_code == 404
+
+def _pagamentos_por_forma(db_session, test_user):
+    """Cria 3 formas com pagamentos em mar/2030 e fev/2030"""
+    from app.main import FormaPagamento
+
+    formas = []
+    for nome in ("Nubank", "Itaú", "Dinheiro"):
+        forma = FormaPagamento(usuario_id=test_user.id, nome=nome, tipo="conta", ativo=True, created_at=date.today())
+        db_session.add(forma)
+        formas.append(forma)
+    db_session.flush()
+
+    lanc = Lancamento(
+        usuario_id=test_user.id, data_lancamento=date(2030, 2, 1), tipo="despesa", fornecedor="Vários",
+        valor_total=0, data_primeiro_vencimento=date(2030, 2, 1), numero_parcelas=1, valor_medio_parcelas=0
+    )
+    db_session.add(lanc)
+    db_session.flush()
+
+    pagamentos = [
+        (formas[0], date(2030, 3, 5), 300), (formas[0], date(2030, 3, 20), 200), (formas[0], date(2030, 2, 10), 250),
+        (formas[1], date(2030, 3, 8), 400),
+        (formas[2], date(2030, 3, 9), 100), (formas[2], date(2030, 2, 9), 100),
+    ]
+    for i, (forma, data_pag, valor) in enumerate(pagamentos, start=1):
+        db_session.add(Parcela(
+            usuario_id=test_user.id, lancamento_id=lanc.id, numero_parcela=i, data_vencimento=data_pag,
+            valor=valor, paga=1, data_pagamento=data_pag, valor_pago=valor, forma_pagamento_id=forma.id
+        ))
+    db_session.commit()
+    return formas
+
+def test_top_formas_variacao_em_uma_consulta(client, db_session, db_engine, test_user):
+    """Teste: Top formas com variação M/M sem uma consulta por forma"""
+    from sqlalchemy import event
+
+    _pagamentos_por_forma(db_session, test_user)
+
+    statements = []
+
+    def _capturar(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", _capturar)
+    try:
+        response = client.get("/api/dashboard/top-formas?data_inicio=2030-03-01&data_fim=2030-03-31&limit=3")
+    finally:
+        event.remove(db_engine, "before_cursor_execute", _capturar)
+
+    assert response.status_code == 200
+    top = response.json()["top_formas"]
+    assert [f["forma_nome"] for f in top] == ["Nubank", "Itaú", "Dinheiro"]
+    assert top[0]["total_pago"] == 500
+    assert top[0]["quantidade_pagamentos"] == 2
+    assert top[0]["variacao_mes_anterior"] == 100.0  # 250 -> 500
+    assert top[1]["variacao_mes_anterior"] == 100  # novo
+    assert top[2]["variacao_mes_anterior"] == 0
+    assert len([s for s in statements if "FROM formas_pagamento" in s]) == 1
+
+def test_top_formas_completo_com_serie(client, db_session, test_user):
+    """Teste: Ranking completo com série mensal por forma"""
+    _pagamentos_por_forma(db_session, test_user)
+
+    response = client.get("/api/dashboard/top-formas?data_inicio=2030-03-01&data_fim=2030-03-31&limit=1&completo=true&meses_serie=3")
+    data = response.json()
+    assert data["serie_labels"] == ["2030-01", "2030-02", "2030-03"]
+    assert len(data["top_formas"]) == 3
+    assert data["top_formas"][0]["serie"] == [0.0, 250.0, 500.0]
+    assert data["top_formas"][1]["serie"] == [0.0, 0.0, 400.0]
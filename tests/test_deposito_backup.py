@@ -0,0 +1,105 @@
+"""
+Testes do depósito incremental de backups (blocos deduplicados + retenção GFS)
+"""
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+
+from app.deposito_backup import Deposito, selecionar_gfs
+from app.main import app
+from app.middleware import get_current_active_user, get_current_admin_user
+
+
+def _banco(caminho, linhas=5000):
+    with closing(sqlite3.connect(str(caminho))) as conn:
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, valor TEXT)")
+        conn.executemany("INSERT INTO t (valor) VALUES (?)", [(f"linha {i} " * 10,) for i in range(linhas)])
+        conn.commit()
+
+
+def _linhas(caminho):
+    with closing(sqlite3.connect(str(caminho))) as conn:
+        return conn.execute("SELECT id, valor FROM t ORDER BY id").fetchall()
+
+
+def test_snapshot_grava_so_blocos_alterados_e_restaura(tmp_path):
+    db = tmp_path / "dados.db"
+    _banco(db)
+    deposito = Deposito(tmp_path / "deposito")
+    originais = _linhas(db)
+
+    primeiro = deposito.criar_snapshot(db, compressao="gzip", paginas_por_bloco=4)
+    assert primeiro["blocos_novos"] == primeiro["blocos_unicos"] > 10
+
+    # Sem alterações: nenhum bloco novo
+    assert deposito.criar_snapshot(db, compressao="gzip", paginas_por_bloco=4)["blocos_novos"] == 0
+
+    with closing(sqlite3.connect(str(db))) as conn:
+        conn.execute("UPDATE t SET valor = 'alterado' WHERE id = 1")
+        conn.commit()
+    terceiro = deposito.criar_snapshot(db, compressao="gzip", paginas_por_bloco=4)
+    assert 0 < terceiro["blocos_novos"] <= 2
+    assert deposito.estatisticas()["snapshots"] == 3
+
+    deposito.restaurar(primeiro["nome"], db)
+    assert _linhas(db) == originais
+    deposito.restaurar(terceiro["nome"], db)
+    assert _linhas(db)[0] == (1, "alterado")
+
+
+def test_selecao_gfs():
+    agora = datetime(2026, 3, 31, 23, 0)
+    # Um snapshot por hora durante 90 dias
+    snapshots = [(f"snapshot_{i:05d}", agora - timedelta(hours=i)) for i in range(90 * 24)]
+    manter = selecionar_gfs(snapshots, {"recentes": 24, "diarios": 7, "semanais": 4, "mensais": 3})
+
+    horas = sorted(int(nome.split("_")[1]) for nome in manter)
+    assert horas[:24] == list(range(24))
+    # Mais antigos: fim de cada dia/semana/mês anterior, não uma fatia contínua
+    antigos = [agora - timedelta(hours=h) for h in horas[24:]]
+    assert all(d.hour == 23 for d in antigos)
+    assert datetime(2026, 1, 31, 23, 0) in antigos
+    assert len(manter) < 24 + 7 + 4 + 3
+
+
+def test_retencao_remove_snapshots_e_blocos_orfaos(tmp_path):
+    db = tmp_path / "dados.db"
+    _banco(db, linhas=2000)
+    deposito = Deposito(tmp_path / "deposito")
+
+    antigo = deposito.criar_snapshot(db, compressao="gzip", paginas_por_bloco=4)
+    with closing(sqlite3.connect(str(db))) as conn:
+        conn.execute("UPDATE t SET valor = 'novo'")
+        conn.commit()
+    recente = deposito.criar_snapshot(db, compressao="gzip", paginas_por_bloco=4)
+
+    resultado = deposito.aplicar_retencao({"recentes": 1})
+    assert resultado["snapshots_removidos"] == [antigo["nome"]]
+    assert resultado["blocos_removidos"] > 0
+    assert [m["nome"] for m in deposito.listar_manifestos()] == [recente["nome"]]
+
+    # O snapshot mantido continua completo
+    deposito.restaurar(recente["nome"], db)
+    assert {valor for _, valor in _linhas(db)} == {"novo"}
+
+
+def test_endpoints_de_snapshot_restritos_a_admin(client, monkeypatch):
+    restauracoes = []
+    monkeypatch.setattr("app.main.restaurar_snapshot", lambda nome: restauracoes.append(nome))
+    rotas = [
+        ("post", "/api/backup/snapshot"),
+        ("get", "/api/backup/snapshots"),
+        ("post", "/api/backup/snapshots/snapshot_x/restaurar"),
+    ]
+
+    # Usuário comum: 403
+    app.dependency_overrides.pop(get_current_admin_user)
+    for metodo, rota in rotas:
+        assert getattr(client, metodo)(rota).status_code == 403
+
+    # Sem autenticação: 401
+    app.dependency_overrides.pop(get_current_active_user)
+    for metodo, rota in rotas:
+        assert getattr(client, metodo)(rota).status_code == 401
+
+    assert restauracoes == []
@@ -0,0 +1,89 @@
+"""
+Testes de ETag / 304 nas leituras (versão dos dados por usuário)
+"""
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.main import app, Assinatura, TipoLancamento
+from app.middleware import get_current_active_user
+from app.versao_dados import obter_versao
+
+
+@pytest.fixture
+def auth_headers(client, db_session, test_user):
+    """Autenticação real via token (sem override), com assinatura ativa"""
+    from app.auth import create_access_token
+
+    app.dependency_overrides.pop(get_current_active_user, None)
+    db_session.add(Assinatura(
+        usuario_id=test_user.id,
+        status="ativa",
+        data_inicio=date.today(),
+        proximo_vencimento=date.today() + timedelta(days=30),
+        valor_mensal="29.90",
+        trial_ate=None,
+        created_at=date.today(),
+    ))
+    db_session.commit()
+    token = create_access_token(data={"sub": str(test_user.id), "email": test_user.email})
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_leitura_retorna_etag_e_304_sem_consultar(client, db_engine, auth_headers):
+    r = client.get("/api/tipos", headers=auth_headers)
+    assert r.status_code == 200
+    etag = r.headers["etag"]
+    assert etag.startswith('"') and etag.endswith('"')
+    assert "no-cache" in r.headers["cache-control"]
+
+    statements = []
+
+    def _capturar(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", _capturar)
+    try:
+        r = client.get("/api/tipos", headers={**auth_headers, "If-None-Match": etag})
+    finally:
+        event.remove(db_engine, "before_cursor_execute", _capturar)
+
+    assert r.status_code == 304
+    assert r.content == b""
+    assert r.headers["etag"] == etag
+    assert not [s for s in statements if "FROM tipos_lancamentos" in s]
+
+
+def test_escrita_muda_etag(client, db_session, test_user, auth_headers):
+    etag = client.get("/api/tipos", headers=auth_headers).headers["etag"]
+    versao = obter_versao(db_session, test_user.id)
+
+    r = client.post("/api/tipos", json={"nome": "Salário", "natureza": "receita"}, headers=auth_headers)
+    assert r.status_code == 200
+    assert obter_versao(db_session, test_user.id) > versao
+
+    r = client.get("/api/tipos", headers={**auth_headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["etag"] != etag
+    assert [t["nome"] for t in r.json()] == ["Salário"]
+
+
+def test_etag_depende_dos_parametros(client, auth_headers):
+    a = client.get("/api/lancamentos?tipo=receita", headers=auth_headers)
+    b = client.get("/api/lancamentos?tipo=despesa", headers=auth_headers)
+    assert a.headers["etag"] != b.headers["etag"]
+
+    r = client.get("/api/lancamentos?tipo=despesa", headers={**auth_headers, "If-None-Match": a.headers["etag"]})
+    assert r.status_code == 200
+
+
+def test_escrita_de_outro_usuario_nao_invalida(client, db_session, test_user, auth_headers):
+    etag = client.get("/api/tipos", headers=auth_headers).headers["etag"]
+
+    db_session.add(TipoLancamento(usuario_id=test_user.id + 1, nome="Outro", natureza="despesa",
+                                  created_at=date.today()))
+    db_session.commit()
+
+    r = client.get("/api/tipos", headers={**auth_headers, "If-None-Match": etag})
+    assert r.status_code == 304
@@ -0,0 +1,73 @@
+"""
+Testes da exportação em streaming (NDJSON e zip por usuário)
+"""
+import io
+import json
+import zipfile
+from datetime import date
+
+from app import exportacao
+from app.main import Lancamento, Parcela
+
+
+def _dados(db_session, usuario_id, fornecedor, parcelas=2):
+    lanc = Lancamento(
+        usuario_id=usuario_id, data_lancamento=date(2026, 1, 10), tipo="despesa", fornecedor=fornecedor,
+        valor_total=100 * parcelas, data_primeiro_vencimento=date(2026, 2, 10),
+        numero_parcelas=parcelas, valor_medio_parcelas=100
+    )
+    db_session.add(lanc)
+    db_session.flush()
+    for i in range(1, parcelas + 1):
+        db_session.add(Parcela(
+            usuario_id=usuario_id, lancamento_id=lanc.id, numero_parcela=i,
+            data_vencimento=date(2026, 1 + i, 10), valor=100, paga=0
+        ))
+    db_session.commit()
+
+
+def test_exportacao_ndjson_somente_do_usuario(client, db_session, test_user, monkeypatch):
+    _dados(db_session, test_user.id, "Meu", parcelas=3)
+    _dados(db_session, test_user.id + 1, "Outro")
+    # Lotes e pedaços pequenos: a resposta sai em vários pedaços
+    monkeypatch.setattr(exportacao, "TAMANHO_LOTE", 2)
+    monkeypatch.setattr(exportacao, "TAMANHO_PEDACO", 200)
+
+    response = client.get("/api/exportar/json")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert "attachment" in response.headers["content-disposition"]
+
+    linhas = [json.loads(l) for l in response.text.splitlines()]
+    assert linhas[0]["tipo"] == "cabecalho" and linhas[0]["usuario_id"] == test_user.id
+    assert linhas[-1]["stats"]["lancamentos"] == 1
+    assert linhas[-1]["stats"]["parcelas"] == 3
+
+    registros = linhas[1:-1]
+    lancamentos = [r["dados"] for r in registros if r["tabela"] == "lancamentos"]
+    assert [l["fornecedor"] for l in lancamentos] == ["Meu"]
+    assert lancamentos[0]["valor_total"] == 300.0
+    assert lancamentos[0]["data_lancamento"] == "2026-01-10"
+    assert "usuario_id" not in lancamentos[0]
+    assert [r["dados"]["numero_parcela"] for r in registros if r["tabela"] == "parcelas"] == [1, 2, 3]
+
+
+def test_exportacao_zip_um_arquivo_por_tabela(client, db_session, test_user):
+    _dados(db_session, test_user.id, "Meu")
+
+    response = client.get("/api/exportar/json?formato=zip")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+
+    with zipfile.ZipFile(io.BytesIO(response.content)) as arquivo:
+        assert arquivo.testzip() is None
+        nomes = set(arquivo.namelist())
+        assert {"manifest.json", "lancamentos.ndjson", "parcelas.ndjson", "metas.ndjson"} <= nomes
+        manifesto = json.loads(arquivo.read("manifest.json"))
+        parcelas = arquivo.read("parcelas.ndjson").decode().splitlines()
+    assert manifesto["stats"]["parcelas"] == len(parcelas) == 2
+    assert json.loads(parcelas[1])["data_vencimento"] == "2026-03-10"
+
+
+def test_exportacao_formato_invalido(client):
+    assert client.get("/api/exportar/json?formato=xml").status_code == 400
@@ -0,0 +1,119 @@
+"""
+Testes do fluxo de caixa (séries por dia/semana/mês e projeção de recorrentes)
+"""
+from datetime import date, timedelta
+
+import numpy as np
+
+from app.fluxo_caixa import periodos, projetar_recorrentes
+from app.main import Lancamento, LancamentoRecorrente, Parcela
+
+
+def _parcela(db_session, test_user, tipo, vencimento, valor, paga=0):
+    l = Lancamento(
+        usuario_id=test_user.id, data_lancamento=vencimento, tipo=tipo, fornecedor="Teste",
+        valor_total=valor, data_primeiro_vencimento=vencimento, numero_parcelas=1,
+        valor_medio_parcelas=valor
+    )
+    db_session.add(l)
+    db_session.flush()
+    db_session.add(Parcela(
+        usuario_id=test_user.id, lancamento_id=l.id, numero_parcela=1,
+        data_vencimento=vencimento, valor=valor, paga=paga
+    ))
+    db_session.commit()
+
+
+def test_fluxo_diario_soma_e_acumula(client, db_session, test_user):
+    _parcela(db_session, test_user, "receita", date(2030, 1, 2), 1000)
+    _parcela(db_session, test_user, "despesa", date(2030, 1, 2), 250.10)
+    _parcela(db_session, test_user, "despesa", date(2030, 1, 2), 49.90)
+    _parcela(db_session, test_user, "despesa", date(2030, 1, 4), 100)
+    _parcela(db_session, test_user, "despesa", date(2030, 1, 4), 999, paga=1)
+
+    r = client.get("/api/fluxo-caixa?data_inicio=2030-01-01&data_fim=2030-01-05&saldo_inicial=10")
+    assert r.status_code == 200, r.text
+    data = r.json()
+    series = data["series"]
+    assert series["data"] == ["2030-01-01", "2030-01-02", "2030-01-03", "2030-01-04", "2030-01-05"]
+    assert series["receitas"] == [0, 1000, 0, 0, 0]
+    assert series["despesas"] == [0, 300, 0, 100, 0]
+    assert series["saldo_acumulado"] == [10, 710, 710, 610, 610]
+    assert data["resumo"]["saldo_final"] == 610
+    assert data["resumo"]["total_despesas"] == 400
+    assert "receitas_projetadas" not in series
+
+
+def test_periodos_semana_e_mes():
+    # 01/01/2030 é uma terça-feira: a primeira semana começa na segunda anterior
+    periodo_do_dia, rotulos = periodos(date(2030, 1, 1), date(2030, 1, 14), "semana")
+    assert rotulos == ["2029-12-31", "2030-01-07", "2030-01-14"]
+    assert periodo_do_dia.tolist() == [0] * 6 + [1] * 7 + [2]
+
+    periodo_do_dia, rotulos = periodos(date(2030, 1, 30), date(2030, 3, 1), "mes")
+    assert rotulos == ["2030-01-01", "2030-02-01", "2030-03-01"]
+    assert np.bincount(periodo_do_dia).tolist() == [2, 28, 1]
+
+
+def test_fluxo_mensal(client, db_session, test_user):
+    _parcela(db_session, test_user, "despesa", date(2030, 1, 10), 100)
+    _parcela(db_session, test_user, "despesa", date(2030, 1, 31), 50)
+    _parcela(db_session, test_user, "receita", date(2030, 2, 5), 500)
+
+    r = client.get("/api/fluxo-caixa?data_inicio=2030-01-01&data_fim=2030-03-31&granularidade=mes")
+    series = r.json()["series"]
+    assert series["data"] == ["2030-01-01", "2030-02-01", "2030-03-01"]
+    assert series["despesas"] == [150, 0, 0]
+    assert series["saldo_periodo"] == [-150, 500, 0]
+    assert series["saldo_acumulado"] == [-150, 350, 350]
+
+
+def test_projecao_continua_apos_ultima_geracao(db_session, test_user):
+    db_session.add(LancamentoRecorrente(
+        usuario_id=test_user.id, tipo="despesa", fornecedor="Aluguel", valor_total=1200,
+        dia_vencimento=15, numero_parcelas=1, frequencia="mensal", ativo=1,
+        data_inicio=date(2029, 1, 1), ultima_geracao=date(2030, 1, 10), created_at=date(2029, 1, 1)
+    ))
+    db_session.add(LancamentoRecorrente(
+        usuario_id=test_user.id, tipo="receita", fornecedor="Inativo", valor_total=99,
+        dia_vencimento=1, numero_parcelas=1, frequencia="mensal", ativo=0,
+        data_inicio=date(2029, 1, 1), created_at=date(2029, 1, 1)
+    ))
+    db_session.commit()
+
+    inicio = date(2030, 1, 1)
+    projetadas = projetar_recorrentes(db_session, test_user.id, inicio, date(2030, 4, 30), hoje=date(2030, 1, 10))
+    deslocamentos, centavos = projetadas["despesa"]
+    # A parcela de 15/01 já foi gerada; a projeção começa em 15/02
+    datas = [inicio + timedelta(days=int(d)) for d in deslocamentos]
+    assert datas == [date(2030, 2, 15), date(2030, 3, 15), date(2030, 4, 15)]
+    assert centavos.tolist() == [120000] * 3
+    assert len(projetadas["receita"][0]) == 0
+
+
+def test_fluxo_com_recorrentes(client, db_session, test_user):
+    hoje = date.today()
+    db_session.add(LancamentoRecorrente(
+        usuario_id=test_user.id, tipo="despesa", fornecedor="Internet", valor_total=100,
+        dia_vencimento=10, numero_parcelas=1, frequencia="mensal", ativo=1,
+        data_inicio=hoje, created_at=hoje
+    ))
+    db_session.commit()
+
+    fim = hoje + timedelta(days=92)
+    r = client.get(
+        f"/api/fluxo-caixa?data_inicio={hoje.isoformat()}&data_fim={fim.isoformat()}"
+        "&granularidade=semana&incluir_recorrentes=true"
+    )
+    data = r.json()
+    esperado = 100 * sum(1 for i in range(1, 93) if (hoje + timedelta(days=i)).day == 10)
+    projetadas = data["series"]["despesas_projetadas"]
+    assert sum(projetadas) == data["resumo"]["total_despesas_projetadas"] == esperado
+    assert data["resumo"]["saldo_final"] == -esperado
+
+
+def test_granularidade_invalida(client):
+    r = client.get("/api/fluxo-caixa?data_inicio=2030-01-01&data_fim=2030-01-31&granularidade=ano")
+    assert r.status_code == 400
+    r = client.get("/api/fluxo-caixa?data_inicio=2030-01-31&data_fim=2030-01-01")
+    assert r.status_code == 400
@@ -0,0 +1,45 @@
+"""
+Testes dos índices compostos (modelos + migrate_add_indices.py)
+"""
+import sqlite3
+
+import migrate_add_indices
+from app.main import Base
+
+
+def _indices_sqlite(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    finally:
+        conn.close()
+
+
+def test_modelos_declaram_indices_da_migracao():
+    nomes_modelos = {
+        idx.name
+        for tabela in ("parcelas", "lancamentos")
+        for idx in Base.metadata.tables[tabela].indexes
+    }
+    for nome, _, _ in migrate_add_indices.INDICES:
+        assert nome in nomes_modelos
+
+
+def test_migracao_idempotente(tmp_path, monkeypatch):
+    db_file = tmp_path / "legado.db"
+    conn = sqlite3.connect(db_file)
+    conn.executescript("""
+        CREATE TABLE lancamentos (id INTEGER PRIMARY KEY, usuario_id INTEGER, data_lancamento DATE, valor_total NUMERIC,
+                                  tipo_lancamento_id INTEGER);
+        CREATE TABLE parcelas (id INTEGER PRIMARY KEY, usuario_id INTEGER, lancamento_id INTEGER,
+                               paga INTEGER, data_vencimento DATE, data_pagamento DATE);
+    """)
+    conn.close()
+    monkeypatch.setattr(migrate_add_indices, "DB_PATH", str(db_file))
+
+    migrate_add_indices.migrate()
+    migrate_add_indices.migrate()
+
+    existentes = _indices_sqlite(db_file)
+    for nome, _, _ in migrate_add_indices.INDICES:
+        assert nome in existentes
@@ -0,0 +1,98 @@
+"""
+Testes do diagnóstico de integridade (verificações por conjunto e modo incremental)
+"""
+from datetime import date
+
+from sqlalchemy import event
+
+from app.main import IntegridadePendente, Lancamento, Parcela
+
+
+def _lancamento(db_session, test_user, valor_total, parcelas):
+    lanc = Lancamento(
+        usuario_id=test_user.id, data_lancamento=date.today(), tipo="despesa", fornecedor="Teste",
+        valor_total=valor_total, data_primeiro_vencimento=date.today(),
+        numero_parcelas=len(parcelas), valor_medio_parcelas=valor_total
+    )
+    db_session.add(lanc)
+    db_session.flush()
+    for i, valor in enumerate(parcelas, start=1):
+        db_session.add(Parcela(
+            usuario_id=test_user.id, lancamento_id=lanc.id, numero_parcela=i,
+            data_vencimento=date.today(), valor=valor, paga=0
+        ))
+    db_session.commit()
+    return lanc
+
+
+def test_diagnostico_por_conjunto_com_ids(client, db_session, db_engine, test_user):
+    ok = _lancamento(db_session, test_user, 300, [100, 100, 100])
+    errado = _lancamento(db_session, test_user, 300, [100, 100])
+    sem_parcelas = _lancamento(db_session, test_user, 50, [])
+    db_session.add(Parcela(
+        usuario_id=test_user.id, lancamento_id=ok.id, numero_parcela=9,
+        data_vencimento=date.today(), valor=0, paga=1
+    ))
+    db_session.commit()
+    # Dados de outro usuário não entram no diagnóstico
+    db_session.add(Lancamento(
+        usuario_id=test_user.id + 1, data_lancamento=date.today(), tipo="despesa", fornecedor="Outro",
+        valor_total=-10, data_primeiro_vencimento=date.today(), numero_parcelas=1, valor_medio_parcelas=-10
+    ))
+    db_session.commit()
+
+    statements = []
+
+    def _capturar(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", _capturar)
+    try:
+        response = client.get("/api/diagnostico")
+    finally:
+        event.remove(db_engine, "before_cursor_execute", _capturar)
+
+    data = response.json()
+    assert data["status"] == "problemas_encontrados"
+    assert data["modo"] == "completo"
+    problemas = {p["tipo"]: p for p in data["problemas"]}
+    assert set(problemas) == {"inconsistencia_valores", "parcelas_pagas_invalidas"}
+    assert problemas["inconsistencia_valores"]["ids"] == sorted([errado.id, sem_parcelas.id])
+    assert problemas["parcelas_pagas_invalidas"]["quantidade"] == 1
+    assert data["estatisticas"]["total_lancamentos"] == 3
+    assert data["estatisticas"]["parcelas_pagas"] == 1
+    # Sem uma consulta de parcelas por lançamento
+    assert len([s for s in statements if "FROM parcelas" in s or "JOIN parcelas" in s]) <= 5
+
+
+def test_diagnostico_incremental(client, db_session, test_user):
+    errado = _lancamento(db_session, test_user, 300, [100, 100])
+    client.get("/api/diagnostico")
+    assert db_session.query(IntegridadePendente).count() == 0
+
+    # Sem alterações: nada a verificar, resultado anterior mantido
+    data = client.get("/api/diagnostico?incremental=true").json()
+    assert data["modo"] == "incremental"
+    assert data["lancamentos_verificados"] == 0
+    assert data["problemas"][0]["ids"] == [errado.id]
+
+    # Corrigir o lançamento e criar outro inconsistente: só os dois são verificados
+    db_session.add(Parcela(
+        usuario_id=test_user.id, lancamento_id=errado.id, numero_parcela=3,
+        data_vencimento=date.today(), valor=100, paga=0
+    ))
+    db_session.commit()
+    novo = _lancamento(db_session, test_user, 80, [40])
+
+    data = client.get("/api/diagnostico?incremental=true").json()
+    assert data["lancamentos_verificados"] == 2
+    assert data["problemas"][0]["ids"] == [novo.id]
+
+    db_session.delete(novo)
+    db_session.commit()
+    data = client.get("/api/diagnostico?incremental=true").json()
+    # As parcelas do lançamento excluído ficaram órfãs
+    problemas = {p["tipo"]: p for p in data["problemas"]}
+    assert set(problemas) == {"parcelas_orfas"}
+    assert data == {**client.get("/api/diagnostico").json(), "data_verificacao": data["data_verificacao"],
+                    "modo": "incremental", "lancamentos_verificados": 1}
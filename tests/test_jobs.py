@@ -0,0 +1,135 @@
+"""
+Testes da fila de jobs em segundo plano
+"""
+import io
+import json
+import zipfile
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import jobs
+from app.main import Assinatura, Job, Lancamento, LancamentoRecorrente
+
+
+@pytest.fixture
+def processar(db_engine, tmp_path):
+    """Executa o próximo job da fila (como uma thread de trabalho faria)"""
+    fabrica = sessionmaker(bind=db_engine, autoflush=False)
+    return lambda: jobs.processar_proximo(fabrica, tmp_path)
+
+
+def test_exportacao_em_job_com_artefato(client, db_session, lancamento_despesa, processar):
+    response = client.post("/api/jobs", json={"tipo": "exportacao", "parametros": {"formato": "zip"}})
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    assert response.headers["location"] == f"/api/jobs/{job_id}"
+    assert response.json()["status"] == "pendente"
+
+    assert processar() == job_id
+    assert processar() is None
+
+    status = client.get(f"/api/jobs/{job_id}").json()
+    assert status["status"] == "concluido"
+    assert status["progresso"] == 100
+    assert status["artefato"] == f"/api/jobs/{job_id}/artefato"
+
+    download = client.get(status["artefato"])
+    assert download.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(download.content)) as arquivo:
+        manifesto = json.loads(arquivo.read("manifest.json"))
+    assert manifesto["stats"]["lancamentos"] == 1
+
+
+def test_assinatura_vencida_acompanha_e_baixa_job(client, db_session, test_user, lancamento_despesa, processar):
+    job_id = client.post("/api/jobs", json={"tipo": "exportacao", "parametros": {"formato": "zip"}}).json()["id"]
+    processar()
+
+    # Assinatura vence depois de pedir a exportação
+    assinatura = db_session.query(Assinatura).filter(Assinatura.usuario_id == test_user.id).one()
+    assinatura.proximo_vencimento = date.today() - timedelta(days=5)
+    db_session.commit()
+
+    assert client.get("/api/jobs").status_code == 200
+    assert client.get(f"/api/jobs/{job_id}").json()["status"] == "concluido"
+    assert client.get(f"/api/jobs/{job_id}/artefato").status_code == 200
+    # Novos jobs exigem assinatura em dia
+    assert client.post("/api/jobs", json={"tipo": "integridade"}).status_code == 402
+
+
+def test_job_recorrentes_gera_lancamentos(client, db_session, test_user, tipo_despesa, processar):
+    recorrente = LancamentoRecorrente(
+        usuario_id=test_user.id, tipo="despesa", tipo_lancamento_id=tipo_despesa.id,
+        fornecedor="Aluguel", valor_total=1200, numero_parcelas=1, dia_vencimento=10,
+        frequencia="mensal", ativo=1, data_inicio=date.today(), created_at=date.today()
+    )
+    db_session.add(recorrente)
+    db_session.commit()
+
+    job_id = client.post("/api/jobs", json={
+        "tipo": "recorrentes", "parametros": {"recorrente_ids": [recorrente.id]}
+    }).json()["id"]
+    processar()
+
+    status = client.get(f"/api/jobs/{job_id}").json()
+    assert status["status"] == "concluido"
+    db_session.expire_all()
+    lancamento = db_session.get(Lancamento, status["resultado"]["lancamentos"][0])
+    assert lancamento.fornecedor == "Aluguel"
+
+
+def test_job_falha_com_retentativas(client, db_session, processar, monkeypatch):
+    chamadas = []
+
+    def _falhar(db, contexto, parametros):
+        chamadas.append(1)
+        raise RuntimeError("indisponível")
+
+    monkeypatch.setitem(jobs.TAREFAS, "teste", jobs.Tarefa(_falhar, False))
+    job_id = client.post("/api/jobs", json={"tipo": "teste"}).json()["id"]
+
+    for tentativa in range(1, jobs.JOBS_MAX_TENTATIVAS + 1):
+        assert processar() == job_id
+        db_session.expire_all()
+        job = db_session.get(Job, job_id)
+        if tentativa < jobs.JOBS_MAX_TENTATIVAS:
+            # Volta para a fila com espera; antecipamos para não aguardar no teste
+            assert job.status == "pendente" and job.disponivel_em > datetime.now()
+            job.disponivel_em = datetime.now() - timedelta(seconds=1)
+            db_session.commit()
+
+    status = client.get(f"/api/jobs/{job_id}").json()
+    assert status["status"] == "falhou"
+    assert "indisponível" in status["erro"]
+    assert len(chamadas) == jobs.JOBS_MAX_TENTATIVAS
+
+
+def test_job_parametro_invalido_falha_sem_repetir(client, processar):
+    job_id = client.post("/api/jobs", json={"tipo": "exportacao", "parametros": {"formato": "xml"}}).json()["id"]
+    processar()
+    status = client.get(f"/api/jobs/{job_id}").json()
+    assert status["status"] == "falhou" and status["tentativas"] == 1
+
+
+def test_jobs_tipo_invalido_admin_e_isolamento(client, db_session, test_user):
+    assert client.post("/api/jobs", json={"tipo": "inexistente"}).status_code == 400
+    assert client.post("/api/jobs", json={"tipo": "backup"}).status_code == 403
+
+    job = jobs.enfileirar(db_session, type("Outro", (), {"id": test_user.id + 1})(), "integridade")
+    assert client.get(f"/api/jobs/{job.id}").status_code == 404
+    assert client.get("/api/jobs").json() == []
+
+
+def test_limpar_expirados_remove_job_e_artefato(db_session, test_user, tmp_path):
+    job = jobs.enfileirar(db_session, test_user, "exportacao")
+    artefatos = tmp_path / job.id
+    artefatos.mkdir()
+    (artefatos / "dados.zip").write_bytes(b"x")
+    job.status = "concluido"
+    job.expira_em = datetime.now() - timedelta(minutes=1)
+    db_session.commit()
+
+    assert jobs.limpar_expirados(db_session, tmp_path) == 1
+    assert db_session.query(Job).count() == 0
+    assert not artefatos.exists()
@@ -168,3 +168,55 @@ def test_filtrar_lancamentos_por_periodo(client, lancamento_receita):
     assert response.status_code == 200
     data = response.json()
     assert len(data) >= 1
+
+def _criar_varios(db_session, test_user, tipo, valores):
+    from app.main import Lancamento
+    hoje = date.today()
+    for i, valor in enumerate(valores):
+        db_session.add(Lancamento(
+            usuario_id=test_user.id, data_lancamento=hoje - timedelta(days=i % 3), tipo="despesa",
+            tipo_lancamento_id=tipo.id, fornecedor=f"Fornecedor {i}", valor_total=valor,
+            data_primeiro_vencimento=hoje, numero_parcelas=1, valor_medio_parcelas=valor
+        ))
+    db_session.commit()
+
+@pytest.mark.parametrize("ordenar,ordem", [
+    ("id", "desc"), ("id", "asc"),
+    ("data_lancamento", "desc"), ("valor_total", "asc"), ("valor_total", "desc"),
+])
+def test_paginacao_por_cursor_percorre_tudo(client, db_session, test_user, tipo_despesa, ordenar, ordem):
+    """Teste: páginas via after_id cobrem a listagem completa, na mesma ordem e sem repetição"""
+    _criar_varios(db_session, test_user, tipo_despesa, [100, 50, 100, 75, 50, 100, 20])
+
+    completa = client.get(f"/api/lancamentos?ordenar={ordenar}&ordem={ordem}").json()
+    ids_paginados = []
+    url = f"/api/lancamentos?ordenar={ordenar}&ordem={ordem}&limit=3"
+    cursor = None
+    while True:
+        r = client.get(url + (f"&after_id={cursor}" if cursor else ""))
+        assert r.status_code == 200
+        ids_paginados += [l["id"] for l in r.json()]
+        cursor = r.headers.get("x-next-after-id")
+        if not cursor:
+            break
+
+    assert ids_paginados == [l["id"] for l in completa]
+    assert len(ids_paginados) == 7
+
+def test_paginacao_contagem_opcional(client, db_session, test_user, tipo_despesa):
+    """Teste: contar=true devolve o total filtrado em X-Total-Count"""
+    _criar_varios(db_session, test_user, tipo_despesa, [10, 20, 30, 40])
+
+    r = client.get("/api/lancamentos?limit=2&contar=true")
+    assert r.headers["x-total-count"] == "4"
+    assert len(r.json()) == 2
+
+    r = client.get("/api/lancamentos?limit=2")
+    assert "x-total-count" not in r.headers
+
+def test_paginacao_parametros_invalidos(client):
+    """Teste: ordenação, limite e cursor inválidos retornam 400"""
+    assert client.get("/api/lancamentos?ordenar=fornecedor").status_code == 400
+    assert client.get("/api/lancamentos?ordem=cima").status_code == 400
+    assert client.get("/api/lancamentos?limit=0").status_code == 400
+    assert client.get("/api/lancamentos?limit=10&ordenar=valor_total&after_id=999").status_code == 400
@@ -0,0 +1,132 @@
+"""
+Testes para endpoints de Metas e Orçamento
+"""
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app.main import Assinatura, Lancamento, Meta, Parcela, TipoLancamento
+
+
+def _pago(db_session, test_user, tipo, natureza, data_pagamento, valor):
+    """Cria um lançamento com uma parcela paga"""
+    lanc = Lancamento(
+        usuario_id=test_user.id, data_lancamento=data_pagamento, tipo=natureza,
+        tipo_lancamento_id=tipo.id if tipo else None, fornecedor="Teste", valor_total=valor,
+        data_primeiro_vencimento=data_pagamento, numero_parcelas=1, valor_medio_parcelas=valor
+    )
+    db_session.add(lanc)
+    db_session.flush()
+    db_session.add(Parcela(
+        usuario_id=test_user.id, lancamento_id=lanc.id, numero_parcela=1, data_vencimento=data_pagamento,
+        valor=valor, paga=1, data_pagamento=data_pagamento, valor_pago=valor
+    ))
+    db_session.commit()
+
+
+def _meta(db_session, usuario_id, mes, valor, tipo=None, ano=2030):
+    meta = Meta(
+        usuario_id=usuario_id, ano=ano, mes=mes, tipo_lancamento_id=tipo.id if tipo else None,
+        valor_planejado=valor, created_at=date.today()
+    )
+    db_session.add(meta)
+    db_session.commit()
+    return meta
+
+
+def test_criar_meta_associa_usuario(client, db_session, test_user, tipo_despesa):
+    """Teste: Criar meta grava o usuário e bloqueia duplicadas só dele"""
+    payload = {"ano": 2030, "mes": 5, "tipo_lancamento_id": tipo_despesa.id, "valor_planejado": 800}
+    response = client.post("/api/metas", json=payload)
+    assert response.status_code == 200, response.text
+    assert response.json()["tipo_nome"] == "Supermercado"
+    assert db_session.query(Meta).one().usuario_id == test_user.id
+
+    response = client.post("/api/metas", json=payload)
+    assert response.status_code == 400
+
+
+def test_metas_isoladas_por_usuario(client, db_session, test_user):
+    """Teste: Metas de outro usuário não aparecem nem podem ser alteradas"""
+    outra = _meta(db_session, test_user.id + 1, 1, 100)
+
+    assert client.get("/api/metas").json() == []
+    assert client.get(f"/api/metas/{outra.id}").status_code == 404
+    assert client.delete(f"/api/metas/{outra.id}").status_code == 404
+    assert client.get("/api/metas/progresso/2030/1").json()["tem_metas"] is False
+
+
+def test_listar_metas_realizado_em_lote(client, db_session, db_engine, test_user, tipo_despesa, tipo_receita):
+    """Teste: Realizado por tipo/natureza com número de consultas fixo"""
+    _pago(db_session, test_user, tipo_despesa, "despesa", date(2030, 1, 10), 450)
+    _pago(db_session, test_user, tipo_receita, "receita", date(2030, 1, 5), 3000)
+    _pago(db_session, test_user, tipo_despesa, "despesa", date(2030, 2, 10), 900)
+    for mes in (1, 2, 3):
+        _meta(db_session, test_user.id, mes, 500, tipo_despesa)
+    _meta(db_session, test_user.id, 1, 5000)
+
+    client.get("/api/metas")  # constrói o resumo mensal
+
+    statements = []
+
+    def _capturar(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", _capturar)
+    try:
+        response = client.get("/api/metas")
+    finally:
+        event.remove(db_engine, "before_cursor_execute", _capturar)
+
+    metas = {(m["mes"], m["tipo_nome"]): m for m in response.json()}
+    assert metas[(1, "Supermercado")]["valor_realizado"] == 450
+    assert metas[(1, "Supermercado")]["status"] == "dentro"
+    assert metas[(2, "Supermercado")]["valor_realizado"] == 900
+    assert metas[(2, "Supermercado")]["status"] == "excedido"
+    assert metas[(3, "Supermercado")]["valor_realizado"] == 0
+    assert metas[(1, "Geral")]["valor_realizado"] == 3450
+    assert not [s for s in statements if "FROM tipos_lancamentos" in s and "FROM metas" not in s]
+    assert len([s for s in statements if "resumo_mensal." in s and "sum(" in s]) == 1
+
+
+def test_progresso_ano(client, db_session, test_user, tipo_despesa):
+    """Teste: Grade planejado vs realizado do ano"""
+    _pago(db_session, test_user, tipo_despesa, "despesa", date(2030, 1, 10), 450)
+    _pago(db_session, test_user, tipo_despesa, "despesa", date(2030, 4, 10), 120)
+    _meta(db_session, test_user.id, 1, 500, tipo_despesa)
+    _meta(db_session, test_user.id, 2, 500, tipo_despesa)
+
+    response = client.get("/api/metas/progresso/2030")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["tem_metas"] is True
+    [linha] = data["linhas"]
+    assert linha["tipo_nome"] == "Supermercado"
+    assert linha["planejado"][:3] == [500, 500, None]
+    assert linha["realizado"][:4] == [450, 0, 0, 120]
+    assert linha["percentual"][:2] == [90, 0]
+    assert data["meses"][0]["status"] == "dentro"
+    assert data["meses"][3]["status"] is None
+    assert data["total_planejado"] == 1000
+    assert data["total_realizado"] == 450
+
+
+def test_assinatura_vencida_le_metas_mas_nao_escreve(client, db_session, test_user):
+    meta = _meta(db_session, test_user.id, 3, 500)
+    db_session.add(Assinatura(
+        usuario_id=test_user.id, status="ativa",
+        data_inicio=date.today() - timedelta(days=40),
+        proximo_vencimento=date.today() - timedelta(days=5),
+        valor_mensal="29.90", trial_ate=None,
+        created_at=date.today() - timedelta(days=40),
+    ))
+    db_session.commit()
+
+    # Leitura das próprias metas continua liberada
+    for url in ["/api/metas", f"/api/metas/{meta.id}", "/api/metas/progresso/2030/3", "/api/metas/progresso/2030"]:
+        assert client.get(url).status_code == 200, url
+
+    # Escrita exige assinatura em dia
+    novo = {"ano": 2030, "mes": 4, "valor_planejado": 100}
+    assert client.post("/api/metas", json=novo).status_code == 402
+    assert client.delete(f"/api/metas/{meta.id}").status_code == 402
@@ -143,3 +143,65 @@ def test_estatisticas_parcelas(client, lancamento_receita, lancamento_despesa):
         # Campo "paga" pode não estar presente dependendo do modelo usado
         assert "tipo" in parcela
         assert "fornecedor" in parcela
+
+def _parcelas_a_vencer_cenario(db_session, test_user, tipo_receita, tipo_despesa):
+    """Cria parcelas abertas vencidas, de hoje e futuras, de receita e despesa"""
+    from app.main import Lancamento, Parcela
+    hoje = date.today()
+    casos = [
+        ("despesa", tipo_despesa, -10, 100), ("despesa", tipo_despesa, -1, 50),
+        ("receita", tipo_receita, 0, 300), ("despesa", tipo_despesa, 0, 20),
+        ("receita", tipo_receita, 5, 1000), ("despesa", tipo_despesa, 7, 70),
+        ("despesa", tipo_despesa, 60, 999),  # fora dos 30 dias do filtro padrão
+    ]
+    for natureza, tipo, dias, valor in casos:
+        l = Lancamento(usuario_id=test_user.id, data_lancamento=hoje, tipo=natureza,
+                       tipo_lancamento_id=tipo.id, fornecedor=f"F{dias}", valor_total=valor,
+                       data_primeiro_vencimento=hoje + timedelta(days=dias), numero_parcelas=1,
+                       valor_medio_parcelas=valor)
+        db_session.add(l)
+        db_session.flush()
+        db_session.add(Parcela(usuario_id=test_user.id, lancamento_id=l.id, numero_parcela=1,
+                               data_vencimento=hoje + timedelta(days=dias), valor=valor, paga=0))
+    db_session.commit()
+
+def test_parcelas_a_vencer_stats_agrupadas(client, db_session, test_user, tipo_receita, tipo_despesa):
+    """Teste: estatísticas por faixa x natureza e contadores globais em uma chamada"""
+    _parcelas_a_vencer_cenario(db_session, test_user, tipo_receita, tipo_despesa)
+    hoje = date.today()
+
+    data = client.get(f"/api/parcelas/a-vencer?data_inicio={hoje}&data_fim={hoje + timedelta(days=30)}").json()
+    stats = data["stats"]
+    assert stats["total"] == 6
+    assert (stats["receitas"], stats["despesas"]) == (2, 4)
+    assert (stats["vencidas"], stats["valor_vencidas"]) == (2, 150)
+    assert (stats["vence_hoje"], stats["valor_vence_hoje"]) == (2, 320)
+    assert (stats["a_vencer"], stats["valor_a_vencer"]) == (2, 1070)
+    assert stats["valor_receitas_a_vencer"] == 1000
+    assert stats["valor_despesas_a_vencer"] == 70
+
+    # Com filtro de status, stats seguem o filtro e os contadores globais não
+    data = client.get(f"/api/parcelas/a-vencer?data_inicio={hoje}&data_fim={hoje + timedelta(days=90)}"
+                      f"&status=a_vencer&tipo=despesa").json()
+    assert data["stats"]["total"] == 2
+    assert data["stats"]["vencidas"] == 0
+    assert data["stats_globais"] == {"vencidas": 2, "valor_vencidas": 150.0,
+                                     "vence_hoje": 2, "valor_vence_hoje": 320.0}
+
+def test_parcelas_a_vencer_paginacao(client, db_session, test_user, tipo_receita, tipo_despesa):
+    """Teste: páginas por cursor cobrem a lista completa; stats valem para o filtro todo"""
+    _parcelas_a_vencer_cenario(db_session, test_user, tipo_receita, tipo_despesa)
+    hoje = date.today()
+    base = f"/api/parcelas/a-vencer?data_inicio={hoje}&data_fim={hoje + timedelta(days=30)}"
+
+    completa = [p["id"] for p in client.get(base).json()["parcelas"]]
+    ids, cursor = [], None
+    while True:
+        data = client.get(base + "&limit=4" + (f"&after_id={cursor}" if cursor else "")).json()
+        assert data["stats"]["total"] == 6
+        ids += [p["id"] for p in data["parcelas"]]
+        cursor = data["paginacao"]["proximo_after_id"]
+        if not cursor:
+            break
+    assert ids == completa
+    assert len(ids) == 6
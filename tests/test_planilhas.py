@@ -0,0 +1,48 @@
+"""
+Testes das planilhas Excel em modo write-only
+"""
+from datetime import date
+from io import BytesIO
+
+from openpyxl import load_workbook
+
+from app import planilhas
+
+
+def test_escrever_xlsx_estilos_por_coluna(tmp_path):
+    colunas = [
+        planilhas.Coluna('Nome', 20),
+        planilhas.Coluna('Data', 12, planilhas.FORMATO_DATA),
+        planilhas.Coluna('Valor', 15, planilhas.FORMATO_MOEDA),
+    ]
+    linhas = ((f"Item {i}", date(2026, 1, 1 + i % 28), i * 1.5) for i in range(500))
+    destino = tmp_path / "teste.xlsx"
+
+    assert planilhas.escrever_xlsx(destino, 'Teste', colunas, linhas) == 500
+
+    ws = load_workbook(destino)['Teste']
+    assert [c.value for c in ws[1]] == ['Nome', 'Data', 'Valor']
+    assert ws['A1'].font.bold
+    assert ws.column_dimensions['A'].width == 20
+    assert ws.max_row == 501
+    # Célula estilizada reaproveitada: cada linha mantém o próprio valor e o formato da coluna
+    assert ws['A3'].value == "Item 1"
+    assert ws['B3'].value.date() == date(2026, 1, 2)
+    assert ws['B3'].number_format == planilhas.FORMATO_DATA
+    assert ws['C501'].value == 748.5
+    assert ws['C501'].number_format == planilhas.FORMATO_MOEDA
+    assert ws['A2'].number_format == 'General'
+
+
+def test_exportar_parcelas_excel_valores_e_formatos(client, lancamento_despesa):
+    response = client.get("/api/relatorios/parcelas-excel")
+    assert response.status_code == 200
+    assert int(response.headers["content-length"]) == len(response.content)
+
+    ws = load_workbook(BytesIO(response.content)).active
+    cabecalho = [c.value for c in ws[1]]
+    valor = ws.cell(row=2, column=cabecalho.index('Valor') + 1)
+    vencimento = ws.cell(row=2, column=cabecalho.index('Data Vencimento') + 1)
+    assert valor.value == 200 and valor.number_format == planilhas.FORMATO_MOEDA
+    assert vencimento.is_date and vencimento.number_format == planilhas.FORMATO_DATA
+    assert ws.max_row == 1 + lancamento_despesa.numero_parcelas
@@ -0,0 +1,113 @@
+"""
+Testes de regressão dos planos de consulta: os relatórios por período devem
+usar busca por índice (no resumo mensal, ou por intervalo nos índices de data
+SEARCH ... data_x>? AND data_x<?) em vez de varrer as parcelas do usuário.
+"""
+import pytest
+from datetime import date
+from sqlalchemy import event
+
+
+def capturar_selects(db_engine, func):
+    """Executa func() e retorna os SELECTs (sql, params) emitidos no engine."""
+    capturados = []
+
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            capturados.append((statement, parameters))
+
+    event.listen(db_engine, "before_cursor_execute", _antes)
+    try:
+        func()
+    finally:
+        event.remove(db_engine, "before_cursor_execute", _antes)
+    return capturados
+
+
+def plano(db_engine, statement, parameters):
+    with db_engine.connect() as conn:
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+def assert_busca_por_data(db_engine, selects, tabela, coluna):
+    relevantes = [(s, p) for s, p in selects if f"FROM {tabela}" in s and coluna in s]
+    assert relevantes, f"nenhuma consulta em {tabela}.{coluna} capturada"
+    for statement, parameters in relevantes:
+        detalhes = plano(db_engine, statement, parameters)
+        linhas_tabela = [d for d in detalhes if f" {tabela} " in f"{d} "]
+        assert linhas_tabela, detalhes
+        for d in linhas_tabela:
+            assert d.startswith("SEARCH"), detalhes
+            assert f"{coluna}>" in d and f"{coluna}<" in d, detalhes
+
+
+def assert_busca_no_resumo(db_engine, selects):
+    relevantes = [(s, p) for s, p in selects if "FROM resumo_mensal" in s and "resumo_mensal_estado" not in s]
+    assert relevantes, "nenhuma consulta ao resumo mensal capturada"
+    for statement, parameters in relevantes:
+        detalhes = plano(db_engine, statement, parameters)
+        linhas_tabela = [d for d in detalhes if " resumo_mensal " in f"{d} "]
+        assert linhas_tabela, detalhes
+        for d in linhas_tabela:
+            assert d.startswith("SEARCH"), detalhes
+            assert "usuario_id=? AND base=? AND ano" in d, detalhes
+
+
+@pytest.mark.parametrize("tipo_data", ["vencimento", "pagamento"])
+def test_tabela_anual_usa_indice_do_resumo(client, db_session, db_engine, test_user, lancamento_despesa, tipo_data):
+    from app.resumo_mensal import garantir_resumo
+
+    garantir_resumo(db_session, test_user.id)
+    ano = date.today().year
+    selects = capturar_selects(
+        db_engine,
+        lambda: client.get(f"/api/dashboard/tabela-anual?ano={ano}&tipo_data={tipo_data}")
+    )
+    assert_busca_no_resumo(db_engine, selects)
+    assert not [s for s, _ in selects if "FROM parcelas" in s]
+
+
+@pytest.mark.parametrize("tipo_data", ["vencimento", "pagamento", "lancamento"])
+def test_evolucao_usa_indice_do_resumo(client, db_session, db_engine, test_user, lancamento_despesa, tipo_data):
+    from app.resumo_mensal import garantir_resumo
+
+    garantir_resumo(db_session, test_user.id)
+    selects = capturar_selects(
+        db_engine,
+        lambda: client.get(f"/api/dashboard/evolucao?meses=12&tipo_data={tipo_data}")
+    )
+    assert_busca_no_resumo(db_engine, selects)
+    assert not [s for s, _ in selects if "FROM parcelas" in s]
+
+
+def test_valor_realizado_usa_indice_do_resumo(db_session, db_engine, test_user, lancamento_despesa):
+    from app.main import calcular_valor_realizado
+    from app.resumo_mensal import garantir_resumo
+
+    garantir_resumo(db_session, test_user.id)
+    hoje = date.today()
+    selects = capturar_selects(
+        db_engine,
+        lambda: calcular_valor_realizado(db_session, hoje.year, hoje.month, None, test_user.id)
+    )
+    assert_busca_no_resumo(db_engine, selects)
+
+
+@pytest.mark.parametrize("tabela,coluna", [
+    ("parcelas", "data_vencimento"),
+    ("parcelas", "data_pagamento"),
+    ("lancamentos", "data_lancamento"),
+])
+def test_recalculo_incremental_usa_indice_de_data(client, db_session, db_engine, test_user, lancamento_despesa, tabela, coluna):
+    from app.main import Parcela
+    from app.resumo_mensal import garantir_resumo
+
+    garantir_resumo(db_session, test_user.id)
+    parcela = db_session.query(Parcela).filter_by(lancamento_id=lancamento_despesa.id).first()
+    selects = capturar_selects(
+        db_engine,
+        lambda: client.patch(f"/api/parcelas/{parcela.id}/pagar", json={"paga": True})
+    )
+    selects = [(s, p) for s, p in selects if "GROUP BY" in s]
+    assert_busca_por_data(db_engine, selects, tabela, coluna)
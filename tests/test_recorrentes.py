@@ -0,0 +1,106 @@
+"""
+Testes da geração agendada (em lote) dos lançamentos recorrentes
+"""
+from datetime import date, datetime
+
+from app import jobs
+from app.fluxo_caixa import projetar_recorrentes
+from app.main import (
+    IntegridadePendente, Job, Lancamento, LancamentoRecorrente, Parcela, gerar_de_recorrente
+)
+from app.recorrentes import gerar_devidos, geracoes_devidas
+from app.versao_dados import obter_versao
+
+
+def _recorrente(db_session, usuario_id, **campos):
+    dados = dict(
+        usuario_id=usuario_id, tipo="despesa", fornecedor="Aluguel", valor_total=1200,
+        numero_parcelas=1, dia_vencimento=10, frequencia="mensal", ativo=1,
+        data_inicio=date(2026, 1, 5), created_at=date(2026, 1, 5)
+    )
+    dados.update(campos)
+    recorrente = LancamentoRecorrente(**dados)
+    db_session.add(recorrente)
+    db_session.commit()
+    return recorrente
+
+
+def test_recupera_periodos_perdidos_em_lote(db_session, test_user):
+    mensal = _recorrente(db_session, test_user.id)
+    trimestral = _recorrente(db_session, test_user.id + 1, frequencia="trimestral", numero_parcelas=2,
+                             valor_total=300, data_inicio=date(2026, 1, 20))
+    inativo = _recorrente(db_session, test_user.id, ativo=0)
+    versao_antes = obter_versao(db_session, test_user.id)
+
+    # Lotes de um recorrente: uma transação por lote
+    metricas = gerar_devidos(db_session, hoje=date(2026, 4, 10), lote=1)
+
+    # Mensal: gerações em 04/01 (venc. 10/01), 10/01, 10/02, 10/03 e 10/04 (venc. 10/05)
+    lancs = db_session.query(Lancamento).filter(Lancamento.fornecedor == "Aluguel",
+                                                Lancamento.usuario_id == test_user.id).all()
+    vencimentos = sorted(p.data_vencimento for p in db_session.query(Parcela).filter(
+        Parcela.lancamento_id.in_([l.id for l in lancs])))
+    assert vencimentos == [date(2026, m, 10) for m in range(1, 6)]
+    # Trimestral com 2 parcelas: 19/01 -> 10/04 e 10/07
+    parcelas_tri = db_session.query(Parcela).filter(Parcela.usuario_id == test_user.id + 1).all()
+    assert sorted(p.data_vencimento for p in parcelas_tri) == [date(2026, 4, 10), date(2026, 7, 10)]
+    assert {float(p.valor) for p in parcelas_tri} == {150.0}
+
+    assert metricas["lancamentos"] == 6 and metricas["parcelas"] == 7
+    assert metricas["recorrentes"] == 2 and metricas["usuarios"] == 2
+    assert metricas["linhas_por_segundo"] > 0
+
+    db_session.expire_all()
+    assert db_session.get(LancamentoRecorrente, mensal.id).ultima_geracao == date(2026, 4, 10)
+    assert db_session.get(LancamentoRecorrente, inativo.id).ultima_geracao is None
+    # INSERTs em lote também invalidam ETags e marcam a integridade
+    assert obter_versao(db_session, test_user.id) > versao_antes
+    assert db_session.query(IntegridadePendente).filter(
+        IntegridadePendente.usuario_id == test_user.id).count() == 5
+
+    # Nada mais devido no mesmo dia
+    assert gerar_devidos(db_session, hoje=date(2026, 4, 10))["lancamentos"] == 0
+    assert db_session.get(LancamentoRecorrente, trimestral.id).ultima_geracao == date(2026, 1, 19)
+
+
+def test_simular_nao_grava(db_session, test_user):
+    _recorrente(db_session, test_user.id)
+    metricas = gerar_devidos(db_session, hoje=date(2026, 2, 10), simular=True)
+
+    assert metricas["simulado"] and metricas["lancamentos"] == 3
+    assert [item["vencimentos"] for item in metricas["previa"]] == [["2026-01-10"], ["2026-02-10"], ["2026-03-10"]]
+    assert db_session.query(Lancamento).count() == 0
+    assert db_session.query(LancamentoRecorrente).one().ultima_geracao is None
+
+
+def test_geracao_manual_e_agendada_sem_sobreposicao(db_session, test_user):
+    recorrente = _recorrente(db_session, test_user.id, data_inicio=date.today(), numero_parcelas=3)
+    lancamento = gerar_de_recorrente(db_session, test_user.id, recorrente.id)
+    db_session.commit()
+    ultimo = max(p.data_vencimento for p in db_session.query(Parcela).filter(
+        Parcela.lancamento_id == lancamento.id))
+
+    # A próxima geração só fica devida no último vencimento da manual
+    assert geracoes_devidas(recorrente, ultimo.replace(day=1)) == []
+    assert geracoes_devidas(recorrente, ultimo) == [ultimo]
+
+    # E começa onde a projeção do fluxo de caixa começa
+    gerar_devidos(db_session, hoje=ultimo)
+    proxima = db_session.query(Lancamento).order_by(Lancamento.id.desc()).first()
+    projecao = projetar_recorrentes(db_session, test_user.id, ultimo, proxima.data_primeiro_vencimento, hoje=ultimo)
+    assert (projecao["despesa"][0] == 0).all()
+
+
+def test_job_diario_enfileirado_uma_vez(db_session, test_user):
+    manha = datetime(2026, 10, 17, 9, 0)
+    assert jobs.enfileirar_agendados(db_session, datetime(2026, 10, 17, 0, 30)) == []
+    assert jobs.enfileirar_agendados(db_session, manha) == ["recorrentes_agendados-20261017"]
+    assert jobs.enfileirar_agendados(db_session, manha) == []
+
+    job = db_session.get(Job, "recorrentes_agendados-20261017")
+    assert job.usuario_id == jobs.USUARIO_SISTEMA and job.status == "pendente"
+
+
+def test_previa_por_job_restrita_a_admin(client):
+    resposta = client.post("/api/jobs", json={"tipo": "recorrentes_agendados", "parametros": {"simular": True}})
+    assert resposta.status_code == 403
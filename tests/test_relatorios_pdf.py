@@ -0,0 +1,109 @@
+"""
+Testes do relatório anual em PDF (pool de processos, limites e cache em disco)
+"""
+import os
+import time
+from datetime import date
+
+import pytest
+
+from app import relatorios_pdf
+from app.main import Parcela
+
+
+def _url():
+    return f"/api/relatorios/tabela-anual-pdf?ano={date.today().year}&tipo_data=vencimento"
+
+
+def test_pdf_em_cache_com_etag(client, db_session, lancamento_despesa, monkeypatch):
+    chamadas = []
+    renderizar = relatorios_pdf.renderizar
+
+    def _contar(*args):
+        chamadas.append(args[0])
+        return renderizar(*args)
+
+    monkeypatch.setattr(relatorios_pdf, "renderizar", _contar)
+
+    primeira = client.get(_url())
+    assert primeira.status_code == 200
+    assert primeira.content.startswith(b"%PDF")
+    assert int(primeira.headers["content-length"]) == len(primeira.content)
+    etag = primeira.headers["etag"]
+
+    # Mesmos dados: servido do cache, sem renderizar de novo
+    segunda = client.get(_url())
+    assert segunda.content == primeira.content
+    assert client.get(_url(), headers={"If-None-Match": etag}).status_code == 304
+    assert len(chamadas) == 1
+
+    # Dados alterados: nova versão, novo ETag e o PDF anterior sai do cache
+    parcela = db_session.query(Parcela).filter(Parcela.lancamento_id == lancamento_despesa.id).first()
+    parcela.valor = 999
+    db_session.commit()
+    terceira = client.get(_url(), headers={"If-None-Match": etag})
+    assert terceira.status_code == 200
+    assert terceira.headers["etag"] != etag
+    assert len(chamadas) == 2
+    from app.main import CACHE_PDF
+    assert CACHE_PDF.estatisticas()["arquivos"] == 1
+
+
+def test_pdf_limite_por_usuario(client, test_user, lancamento_despesa, monkeypatch):
+    monkeypatch.setitem(relatorios_pdf._em_andamento, test_user.id, relatorios_pdf.PDF_MAX_POR_USUARIO)
+    monkeypatch.setattr(relatorios_pdf, "_total_em_andamento", relatorios_pdf.PDF_MAX_POR_USUARIO)
+
+    response = client.get(_url())
+    assert response.status_code == 429
+    assert response.headers["retry-after"]
+
+
+def test_cache_relatorios_lru_por_tamanho(tmp_path):
+    cache = relatorios_pdf.CacheRelatorios(tmp_path, max_bytes=250)
+    for ano in (2024, 2025):
+        cache.guardar((1, "tabela-anual", ano, "vencimento", 1), b"x" * 100)
+    # 2024 usado por último: 2025 é o menos recente
+    antigo = time.time() - 60
+    os.utime(cache._caminho((1, "tabela-anual", 2025, "vencimento", 1)), (antigo, antigo))
+    assert cache.obter((1, "tabela-anual", 2024, "vencimento", 1)) == b"x" * 100
+
+    cache.guardar((1, "tabela-anual", 2026, "vencimento", 1), b"x" * 100)
+    assert cache.obter((1, "tabela-anual", 2025, "vencimento", 1)) is None
+    assert cache.obter((1, "tabela-anual", 2024, "vencimento", 1)) is not None
+    assert cache.estatisticas()["bytes"] == 200
+
+
+@pytest.mark.parametrize("workers", [0, 1])
+def test_renderizar_no_pool_ou_no_processo(monkeypatch, workers):
+    monkeypatch.setattr(relatorios_pdf, "PDF_WORKERS", workers)
+    dados = {"tipos": [{"nome": "Salário", "natureza": "receita", "meses": {"1": 1000.0, "2": 1000.0}}]}
+    try:
+        conteudo = relatorios_pdf.renderizar(1, relatorios_pdf.renderizar_tabela_anual, dados, 2026, "pagamento")
+    finally:
+        relatorios_pdf.encerrar()
+    assert conteudo.startswith(b"%PDF")
+    assert relatorios_pdf._em_andamento == {}
+
+
+def test_timeout_mantem_a_vaga_ate_o_relatorio_terminar(monkeypatch):
+    monkeypatch.setattr(relatorios_pdf, "PDF_WORKERS", 1)
+    monkeypatch.setattr(relatorios_pdf, "PDF_FILA", 0)
+    monkeypatch.setattr(relatorios_pdf, "PDF_TIMEOUT", 0.2)
+    try:
+        # Relatório lento: a requisição desiste, mas o processo continua ocupado
+        with pytest.raises(TimeoutError):
+            relatorios_pdf.renderizar(1, time.sleep, 2)
+        with pytest.raises(relatorios_pdf.LimiteExcedido) as erro:
+            relatorios_pdf.renderizar(1, time.sleep, 0)
+        assert erro.value.motivo == "usuario"
+        with pytest.raises(relatorios_pdf.LimiteExcedido) as erro:
+            relatorios_pdf.renderizar(2, time.sleep, 0)
+        assert erro.value.motivo == "fila"
+
+        # Quando o relatório termina, a vaga é liberada
+        limite = time.monotonic() + 30
+        while relatorios_pdf._em_andamento and time.monotonic() < limite:
+            time.sleep(0.05)
+        assert relatorios_pdf._em_andamento == {} and relatorios_pdf._total_em_andamento == 0
+    finally:
+        relatorios_pdf.encerrar()
@@ -0,0 +1,112 @@
+"""
+Testes do resumo mensal materializado (app/resumo_mensal.py)
+"""
+from datetime import date, timedelta
+
+from app.main import ResumoMensal, Parcela
+from app.resumo_mensal import garantir_resumo, reconstruir_usuario
+
+
+def snapshot(db_session, usuario_id):
+    db_session.expire_all()
+    linhas = db_session.query(ResumoMensal).filter(ResumoMensal.usuario_id == usuario_id).all()
+    return sorted(
+        (r.base, r.ano, r.mes, r.tipo_lancamento_id, r.subtipo_lancamento_id, r.natureza,
+         round(float(r.total), 2), r.quantidade)
+        for r in linhas
+    )
+
+
+def assert_igual_reconstrucao(db_session, usuario_id):
+    incremental = snapshot(db_session, usuario_id)
+    reconstruir_usuario(db_session, usuario_id)
+    db_session.commit()
+    assert incremental == snapshot(db_session, usuario_id)
+
+
+def test_resumo_construido_na_primeira_leitura(client, db_session, test_user, lancamento_despesa):
+    ano = date.today().year
+    assert snapshot(db_session, test_user.id) == []
+
+    response = client.get(f"/api/dashboard/tabela-anual?ano={ano}&tipo_data=vencimento")
+    assert response.status_code == 200
+
+    linhas = snapshot(db_session, test_user.id)
+    vencimento = [l for l in linhas if l[0] == "vencimento"]
+    assert sum(l[6] for l in vencimento) == 600.0
+    assert sum(l[7] for l in vencimento) == 3
+    assert [l for l in linhas if l[0] == "lancamento"][0][6] == 600.0
+    assert [l for l in linhas if l[0] == "pagamento"] == []
+
+
+def test_escritas_mantem_resumo_incrementalmente(client, db_session, test_user, tipo_despesa, lancamento_despesa):
+    garantir_resumo(db_session, test_user.id)
+    hoje = date.today()
+
+    # criar_lancamento
+    r = client.post("/api/lancamentos", json={
+        "data_lancamento": hoje.isoformat(),
+        "tipo": "despesa",
+        "tipo_lancamento_id": tipo_despesa.id,
+        "fornecedor": "Loja",
+        "valor_total": 1000.00,
+        "data_primeiro_vencimento": (hoje + timedelta(days=3)).isoformat(),
+        "numero_parcelas": 4,
+        "valor_medio_parcelas": 250.00,
+    })
+    assert r.status_code == 200
+    novo_id = r.json()["id"]
+    assert_igual_reconstrucao(db_session, test_user.id)
+
+    # marcar_parcela_paga (e desmarcar)
+    parcela = db_session.query(Parcela).filter_by(lancamento_id=novo_id, numero_parcela=2).first()
+    r = client.patch(f"/api/parcelas/{parcela.id}/pagar", json={
+        "paga": True, "data_pagamento": (hoje - timedelta(days=40)).isoformat(), "valor_pago": 260.0
+    })
+    assert r.status_code == 200
+    assert_igual_reconstrucao(db_session, test_user.id)
+
+    # editar_parcela (move para outro mês)
+    r = client.put(f"/api/parcelas/{parcela.id}", json={
+        "data_vencimento": (hoje + timedelta(days=200)).isoformat(), "valor": 240.0
+    })
+    assert r.status_code == 200
+    assert_igual_reconstrucao(db_session, test_user.id)
+
+    r = client.patch(f"/api/parcelas/{parcela.id}/pagar", json={"paga": False})
+    assert r.status_code == 200
+    assert_igual_reconstrucao(db_session, test_user.id)
+
+    # atualizar_lancamento (muda datas e número de parcelas)
+    r = client.put(f"/api/lancamentos/{lancamento_despesa.id}", json={
+        "data_lancamento": (hoje - timedelta(days=60)).isoformat(),
+        "tipo": "despesa",
+        "tipo_lancamento_id": tipo_despesa.id,
+        "fornecedor": "Supermercado ABC",
+        "valor_total": 900.00,
+        "data_primeiro_vencimento": (hoje - timedelta(days=30)).isoformat(),
+        "numero_parcelas": 2,
+        "valor_medio_parcelas": 450.00,
+    })
+    assert r.status_code == 200
+    assert_igual_reconstrucao(db_session, test_user.id)
+
+    # excluir_lancamento
+    r = client.delete(f"/api/lancamentos/{novo_id}")
+    assert r.status_code == 200
+    assert_igual_reconstrucao(db_session, test_user.id)
+    assert all(l[6] != 250.0 for l in snapshot(db_session, test_user.id))
+
+
+def test_tabela_anual_reflete_pagamento(client, db_session, test_user, lancamento_receita):
+    ano = date.today().year
+    # Constrói o resumo antes do pagamento
+    client.get(f"/api/dashboard/tabela-anual?ano={ano}&tipo_data=pagamento")
+
+    parcela = db_session.query(Parcela).filter_by(lancamento_id=lancamento_receita.id).first()
+    hoje = date.today()
+    r = client.patch(f"/api/parcelas/{parcela.id}/pagar", json={"paga": True, "valor_pago": 4900.0})
+    assert r.status_code == 200
+
+    data = client.get(f"/api/dashboard/tabela-anual?ano={ano}&tipo_data=pagamento").json()
+    assert data["tipos"][0]["meses"][str(hoje.month)] == 4900.0